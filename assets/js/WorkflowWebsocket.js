@@ -21,7 +21,10 @@ export default class WorkflowWebsocket {
       const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
       const url = `${protocol}//${window.location.host}/workflows/${workflowId}`
       createSocket = () => {
-        return new window.WebSocket(url)
+        // When reconnecting, tell the server what we've seen so it can skip
+        // sending what we already have
+        const query = this.lastDeltaId === null ? '' : `?last_delta_id=${this.lastDeltaId}`
+        return new window.WebSocket(url + query)
       }
     }
 
@@ -33,6 +36,7 @@ export default class WorkflowWebsocket {
     this.hasConnectedBefore = false
     this.reconnectDelay = 1000
     this.lastRequestId = 0
+    this.lastDeltaId = null // updateWorkflow.last_delta_id we last received
 
     this.inflight = {} // { [requestId]: {resolve, reject} callbacks }
   }
@@ -69,6 +73,9 @@ export default class WorkflowWebsocket {
     } else if (data.type) {
       switch (data.type) {
         case 'apply-delta':
+          if (data.data.updateWorkflow && data.data.updateWorkflow.last_delta_id !== undefined) {
+            this.lastDeltaId = data.data.updateWorkflow.last_delta_id
+          }
           this.onDelta(data.data)
           break
         default:
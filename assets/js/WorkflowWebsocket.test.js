@@ -129,4 +129,16 @@ describe('WorkflowWebsocket', () => {
     socket.onmessage({ data: JSON.stringify({ type: 'apply-delta', data: 'data' }) })
     expect(onDelta).toHaveBeenCalled()
   })
+
+  it('should remember the last delta ID the server sent', async () => {
+    const socket = new MockSocket()
+    await tick() // so socket setTimeout finishes
+    const api = new WorkflowWebsocket(1, jest.fn(), () => socket)
+    api.connect() // set api.socket
+    expect(api.lastDeltaId).toBe(null)
+
+    socket.onmessage({ data: JSON.stringify({ type: 'apply-delta', data: { updateWorkflow: { last_delta_id: 12 } } }) })
+    socket.onmessage({ data: JSON.stringify({ type: 'apply-delta', data: { updateWfModules: {} } }) })
+    expect(api.lastDeltaId).toEqual(12)
+  })
 })
@@ -2,7 +2,7 @@ import asyncio
 import functools
 import logging
 import types
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, List
 import aioamqp
 from aioamqp.exceptions import AmqpClosedConnection
 from django.conf import settings
@@ -333,6 +333,16 @@ class RetryingConnection:
             'wf_module_id': wf_module_id,
         })
 
+    async def queue_fetch_batch(self, wf_module_ids: List[int]) -> None:
+        """
+        Publish many fetch messages, in order, without waiting for each one.
+
+        With publisher confirms, awaiting each `publish()` in turn would mean
+        one round-trip per message.
+        """
+        await asyncio.gather(*[self.queue_fetch(wf_module_id)
+                               for wf_module_id in wf_module_ids])
+
     async def queue_handle_upload_DELETEME(self, wf_module_id: int,
                                            uploaded_file_id: int) -> None:
         """
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 
 import os
 import sys
+import tempfile
 import json
 from json.decoder import JSONDecodeError
 from os.path import abspath, dirname, join, normpath
@@ -37,16 +38,30 @@ MAX_COLUMNS_PER_CLIENT_REQUEST = 100
 # How much StoredObject space can each module take up?
 MAX_STORAGE_PER_MODULE = 1024*1024*1024
 
+# How many delta segments (e.g., from accumulating Twitter fetches) may a
+# StoredObject be built from before the cron compacts it into one file?
+MAX_STORED_DELTA_SEGMENTS = 20
+
 # configuration for urlscraper
 SCRAPER_NUM_CONNECTIONS = 8
 SCRAPER_TIMEOUT = 30  # seconds
 
+# configuration for fetch modules' shared HTTP client (server/httpclient.py)
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_CONNECTIONS_PER_HOST = 8
+HTTP_MAX_RETRIES = 3  # when a server responds with 429/503 and Retry-After
+HTTP_MAX_RETRY_AFTER = 60  # seconds -- longer waits mean "fail now"
+
 # Chunk size for chardet file encoding detection
 CHARDET_CHUNK_SIZE = 1024*1024
 
 # Chunk size for separator detection
 SEP_DETECT_CHUNK_SIZE = 1024*1024
 
+# Number of cells to parse at a time when reading CSV. Peak RAM is roughly
+# the output table plus this many cells' worth of text.
+PARSE_CSV_CHUNK_CELLS = 2*1000*1000
+
 # Use categories if file over this size
 CATEGORY_FILE_SIZE_MIN = 250*1024*1024
 
@@ -458,6 +473,27 @@ MINIO_SECRET_KEY = os.environ['MINIO_SECRET_KEY']
 MINIO_BUCKET_PREFIX = os.environ['MINIO_BUCKET_PREFIX']
 MINIO_BUCKET_SUFFIX = os.environ.get('MINIO_BUCKET_SUFFIX', '')
 MINIO_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+# Local copies of immutable minio objects (cached render results, stored
+# objects, module code), shared by all processes on this machine. When the
+# cache grows beyond MINIO_CACHE_MAX_BYTES, we delete the least-recently-used
+# files.
+MINIO_CACHE_DIR = os.environ.get(
+    'MINIO_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'cjworkbench-minio-cache')
+)
+MINIO_CACHE_MAX_BYTES = int(os.environ.get('MINIO_CACHE_MAX_BYTES',
+                                           5 * 1024 * 1024 * 1024))  # 5GB
+# File format we write tables in, per bucket: 'parquet' or 'mmap' (see
+# server/dataframe_mmap.py). Readers detect each file's format, so changing
+# a format leaves existing files readable.
+TABLE_FORMATS = {
+    'cached-render-results': os.environ.get(
+        'CJW_CACHED_RENDER_RESULTS_TABLE_FORMAT',
+        'parquet'
+    ),
+    'stored-objects': os.environ.get('CJW_STORED_OBJECTS_TABLE_FORMAT',
+                                     'parquet'),
+}
 if 'MINIO_STATIC_URL_PATTERN' in os.environ:
     STATIC_URL = os.environ['MINIO_STATIC_URL_PATTERN'] \
         .replace('{MINIO_BUCKET_PREFIX}', MINIO_BUCKET_PREFIX)
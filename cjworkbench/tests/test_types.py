@@ -5,7 +5,7 @@ import numpy as np
 import pandas as pd
 from pandas.testing import assert_series_equal, assert_frame_equal
 from cjworkbench.types import Column, ColumnType, ProcessResult, QuickFix, \
-        TableShape
+        TableShape, snapshot_column_buffers
 
 
 class ColumnTypeTextTests(unittest.TestCase):
@@ -323,6 +323,34 @@ class ProcessResultTests(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, 'unsupported dtype'):
             ProcessResult.coerce(dataframe)
 
+    def test_coerce_validate_skip_unchanged_input_columns(self):
+        table = pd.DataFrame({'A': ['a', 'b'], 'B': [1.0, 2.0]})
+        input_buffers = snapshot_column_buffers(table)
+        table['C'] = ['c', 'd']  # like a module would
+        column_times = {}
+        ProcessResult.coerce(table, input_buffers=input_buffers,
+                             column_times=column_times)
+        self.assertEqual(list(column_times.keys()), ['C'])
+
+    def test_coerce_validate_replaced_input_columns(self):
+        table = pd.DataFrame({'A': ['a', 'b']})
+        input_buffers = snapshot_column_buffers(table)
+        table['A'] = ['a', 1]
+        with self.assertRaisesRegex(ValueError, 'must all be str'):
+            ProcessResult.coerce(table, input_buffers=input_buffers)
+
+    def test_coerce_validate_retyped_input_columns(self):
+        # tz_localize('UTC') may keep the same buffer, with a new dtype
+        table = pd.DataFrame({'A': pd.to_datetime(['2019-05-01'])})
+        input_buffers = snapshot_column_buffers(table)
+        table['A'] = table['A'].dt.tz_localize('UTC')
+        with self.assertRaisesRegex(ValueError, 'unsupported dtype'):
+            ProcessResult.coerce(table, input_buffers=input_buffers)
+
+    def test_coerce_validate_non_str_objects_with_nulls(self):
+        with self.assertRaisesRegex(ValueError, 'invalid value 1 in column'):
+            ProcessResult.coerce(pd.DataFrame({'foo': [None, 'a', np.nan, 1]}))
+
     def test_coerce_validate_colnames_dtype_object(self):
         with self.assertRaisesRegex(ValueError, 'column names'):
             # df.columns is numeric
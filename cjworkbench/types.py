@@ -3,10 +3,12 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, asdict, field
 from string import Formatter
-from typing import Any, Dict, Iterable, List, Optional
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import numpy as np
 import pandas as pd
-from pandas.api.types import is_numeric_dtype, is_datetime64_dtype
+from pandas.api.types import infer_dtype, is_numeric_dtype, \
+        is_datetime64_dtype
 from server import sanitizedataframe  # TODO nix this dependency
 
 
@@ -35,12 +37,17 @@ def validate_series(series: pd.Series) -> None:
       `None`
     * Otherwise, series must be numeric (but not "nullable integer") or
       datetime (without timezone).
+
+    Checks run over whole arrays at once. We only look at individual values
+    to build an error message.
     """
     dtype = series.dtype
     if dtype in SupportedNumberDtypes:
-        infinities = series.isin([np.inf, -np.inf])
+        if dtype.kind != 'f':
+            return  # integers can't be infinite
+        infinities = np.isinf(series.values)
         if infinities.any():
-            idx = series[infinities].index[0]
+            idx = series.index[np.flatnonzero(infinities)[0]]
             raise ValueError(
                 (
                     "invalid value %r in column %r, row %r "
@@ -51,6 +58,9 @@ def validate_series(series: pd.Series) -> None:
     elif is_datetime64_dtype(dtype):  # rejects datetime64ns
         return
     elif dtype == object:
+        # infer_dtype() scans in C, and stops at the first non-str
+        if infer_dtype(series.values, skipna=True) in ('string', 'empty'):
+            return
         nonstr = (series[~series.isnull()].map(type) != str)
         if nonstr.any():
             raise ValueError(
@@ -59,8 +69,8 @@ def validate_series(series: pd.Series) -> None:
             )
     elif hasattr(series, 'cat'):
         categories = series.cat.categories
-        nonstr = (categories.map(type) != str)
-        if nonstr.any():
+        if infer_dtype(categories, skipna=False) not in ('string', 'empty'):
+            nonstr = (categories.map(type) != str)
             raise ValueError(
                 "invalid value %r in column %r (categories must all be str)"
                 % (categories[np.flatnonzero(nonstr)[0]], series.name)
@@ -68,30 +78,71 @@ def validate_series(series: pd.Series) -> None:
 
         # Detect unused categories: they waste space, and since the module
         # author need only .remove_unused_categories() there isn't much reason
-        # to allow them (other than the fact this check might be slow?).
-        codes = np.unique(series.cat.codes)  # retval is sorted
-        if len(codes) and codes[0] == -1:
-            codes = codes[1:]
-        # At this point, if all categories are used, `codes` is an Array of
-        # [0, 1, ..., len(categories)-1]. Otherwise, there's a "hole" somewhere
-        # in `codes` (it may be at the end).
-        if len(codes) != len(categories):
-            # There are unused categories. That means an index into
-            # `categories` is not in `codes`. Raise it.
-            for i, category in enumerate(categories):
-                if i >= len(codes) or codes[i] != i:
-                    raise ValueError(
-                        ('unused category %r in column %r '
-                         '(all categories must be used)')
-                        % (category, series.name)
-                    )
-            assert False  # the for-loop is guaranteed to raise, in theory
+        # to allow them.
+        codes = series.cat.codes.values
+        counts = np.bincount(codes[codes != -1], minlength=len(categories))
+        unused = np.flatnonzero(counts == 0)
+        if len(unused):
+            raise ValueError(
+                ('unused category %r in column %r '
+                 '(all categories must be used)')
+                % (categories[unused[0]], series.name)
+            )
     else:
         raise ValueError('unsupported dtype %r in column %r'
                          % (dtype, series.name))
 
 
-def validate_dataframe(df: pd.DataFrame) -> None:
+ColumnBuffers = Dict[str, Tuple[Any, ...]]
+"""
+Each column's dtype and the numpy arrays that hold its data, by column name.
+
+Holding a reference to an array keeps its memory alive, so as long as a
+`ColumnBuffers` exists, no other array can be allocated at the same address.
+"""
+
+
+def _series_buffers(series: pd.Series) -> Tuple[Any, ...]:
+    values = series.values
+    if isinstance(values, pd.Categorical):
+        return (series.dtype, values.codes, values.categories.values)
+    else:
+        return (series.dtype, values)
+
+
+def snapshot_column_buffers(df: pd.DataFrame) -> ColumnBuffers:
+    """
+    Record which arrays hold `df`'s data, before handing `df` to a module.
+
+    Pass the result to `validate_dataframe()` (or `ProcessResult.coerce()`)
+    along with the module's output: columns the module left untouched won't
+    be validated twice.
+    """
+    if df.columns.duplicated().any():
+        return {}  # ambiguous; but valid tables never have duplicates
+    return dict((column, _series_buffers(df[column]))
+                for column in df.columns)
+
+
+def _same_buffers(a: Tuple[Any, ...], b: Tuple[Any, ...]) -> bool:
+    """
+    True if `a` and `b` have the same dtype and view the same memory.
+
+    `__array_interface__` holds the data pointer, dtype, shape and strides.
+    """
+    return (
+        len(a) == len(b)
+        and a[0] == b[0]
+        and all(isinstance(x, np.ndarray) and isinstance(y, np.ndarray)
+                and x.__array_interface__ == y.__array_interface__
+                for x, y in zip(a[1:], b[1:]))
+    )
+
+
+def validate_dataframe(df: pd.DataFrame,
+                       input_buffers: Optional[ColumnBuffers] = None,
+                       column_times: Optional[Dict[str, float]] = None
+                       ) -> None:
     """
     Ensure `df` is "valid" as per Workbench standards, or raise ValueError.
 
@@ -104,6 +155,14 @@ def validate_dataframe(df: pd.DataFrame) -> None:
       or `None`
     * Otherwise, a column must be numeric (but not "nullable integer") or
       datetime (without timezone).
+
+    If `input_buffers` is set, skip columns whose data is exactly the data
+    snapshotted in `input_buffers` (see `snapshot_column_buffers()`): they
+    were valid on input. (This assumes modules don't write invalid values into
+    their input arrays in place.)
+
+    If `column_times` is set, store in it the time (in seconds) spent
+    validating each column we did not skip.
     """
     if (
         df.columns.dtype != object
@@ -123,7 +182,17 @@ def validate_dataframe(df: pd.DataFrame) -> None:
         raise ValueError('empty column name "" not allowed')
 
     for column in df.columns:
-        validate_series(df[column])
+        series = df[column]
+        if (
+            input_buffers
+            and column in input_buffers
+            and _same_buffers(input_buffers[column], _series_buffers(series))
+        ):
+            continue
+        time1 = time.time()
+        validate_series(series)
+        if column_times is not None:
+            column_times[column] = time.time() - time1
 
 
 class ColumnType(ABC):
@@ -597,6 +666,14 @@ class ProcessResult:
     columns: List[Column] = field(default_factory=list)
     """Columns of `dataframe` (empty if `dataframe` has no columns)."""
 
+    stored_delta: bool = False
+    """
+    If set (by `fetch()`), `dataframe` holds only _new_ rows.
+
+    Workbench stores them as a segment atop the current stored version: the
+    new version's table is `dataframe` followed by the previous version's rows.
+    """
+
     def _fix_columns_silently(self) -> List[Column]:
         dataframe = self.dataframe
         if list(dataframe.columns) != self.column_names:
@@ -621,6 +698,7 @@ class ProcessResult:
             and self.json == other.json
             and self.quick_fixes == other.quick_fixes
             and self.columns == other.columns
+            and self.stored_delta == other.stored_delta
         )
 
     def truncate_in_place_if_too_big(self) -> 'ProcessResult':
@@ -666,7 +744,10 @@ class ProcessResult:
 
     @classmethod
     def coerce(cls, value: Any,
-               try_fallback_columns: Iterable[Column] = []) -> ProcessResult:
+               try_fallback_columns: Iterable[Column] = [],
+               input_buffers: Optional[ColumnBuffers] = None,
+               column_times: Optional[Dict[str, float]] = None
+               ) -> ProcessResult:
         """
         Convert any value to a ProcessResult.
 
@@ -689,6 +770,9 @@ class ProcessResult:
         This trick lets us preserve number formats implicitly -- most modules
         needn't worry about them.
 
+        `input_buffers` and `column_times` are passed to
+        `validate_dataframe()`.
+
         Raise `ValueError` if `value` cannot be coerced -- including if
         `validate_dataframe()` raises an error.
         """
@@ -697,10 +781,10 @@ class ProcessResult:
         elif isinstance(value, ProcessResult):
             # TODO ban `ProcessResult` retvals from `fetch()`, then omit this
             # case. ProcessResult should be internal.
-            validate_dataframe(value.dataframe)
+            validate_dataframe(value.dataframe, input_buffers, column_times)
             return value
         elif isinstance(value, pd.DataFrame):
-            validate_dataframe(value)
+            validate_dataframe(value, input_buffers, column_times)
             columns = _infer_columns(value, {}, try_fallback_columns)
             return cls(dataframe=value, columns=columns)
         elif isinstance(value, str):
@@ -715,7 +799,7 @@ class ProcessResult:
                 pass
 
             dataframe = value.pop('dataframe', pd.DataFrame())
-            validate_dataframe(dataframe)
+            validate_dataframe(dataframe, input_buffers, column_times)
 
             try:
                 column_formats = value.pop('column_formats')
@@ -729,7 +813,8 @@ class ProcessResult:
             except TypeError as err:
                 raise ValueError(
                     ('ProcessResult input must only contain {dataframe, '
-                     'error, json, quick_fixes, column_formats} keys'),
+                     'error, json, quick_fixes, column_formats, '
+                     'stored_delta} keys'),
                 ) from err
         elif isinstance(value, tuple):
             if len(value) == 2:
@@ -745,7 +830,7 @@ class ProcessResult:
                          '(DataFrame, str) return type, got (%s,%s)') %
                         (type(dataframe).__name__, type(error).__name__)
                     ))
-                validate_dataframe(dataframe)
+                validate_dataframe(dataframe, input_buffers, column_times)
                 columns = _infer_columns(dataframe, {}, try_fallback_columns)
                 return cls(dataframe=dataframe, error=error)
             elif len(value) == 3:
@@ -766,7 +851,7 @@ class ProcessResult:
                         (type(dataframe).__name__, type(error).__name__,
                          type(json).__name__)
                     ))
-                validate_dataframe(dataframe)
+                validate_dataframe(dataframe, input_buffers, column_times)
                 columns = _infer_columns(dataframe, {}, try_fallback_columns)
                 return cls(dataframe=dataframe, error=error, json=json,
                            columns=columns)
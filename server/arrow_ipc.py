@@ -0,0 +1,336 @@
+"""
+Encode DataFrames as Apache Arrow IPC streams, for browsers.
+
+https://arrow.apache.org/docs/format/Columnar.html#serialization-and-interprocess-communication-ipc
+
+Compared to JSON, Arrow sends each column as one typed buffer: no per-row
+column names, and no number-to-text conversion on the server. Categorical
+columns are dictionary-encoded: we send each category once.
+
+We don't depend on pyarrow: we only _write_, only a handful of types, and
+the IPC format is simple. Each message's metadata is a Flatbuffer, which we
+build with the tiny `_build_flatbuffer()` below.
+
+Types we write:
+
+* int columns: Int (same width)
+* float columns: FloatingPoint (NaN => null)
+* datetime64[ns] columns: Timestamp (milliseconds, no time zone)
+* categorical columns: Dictionary<Int32, Utf8>
+* everything else: Utf8 (non-str => null)
+"""
+
+import struct
+from typing import Any, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_datetime64_dtype, \
+        is_float_dtype, is_integer_dtype
+
+
+MediaType = 'application/vnd.apache.arrow.stream'
+
+
+# Enums from Arrow's format/Schema.fbs and format/Message.fbs
+_MetadataVersionV4 = 3
+_MessageHeaderSchema = 1
+_MessageHeaderDictionaryBatch = 2
+_MessageHeaderRecordBatch = 3
+_TypeInt = 2
+_TypeFloatingPoint = 3
+_TypeUtf8 = 5
+_TypeTimestamp = 10
+_PrecisionSingle = 1
+_PrecisionDouble = 2
+_TimeUnitMillisecond = 1
+
+
+_Continuation = b'\xff\xff\xff\xff'
+_EndOfStream = _Continuation + b'\0\0\0\0'
+
+
+def _align(n: int, alignment: int) -> int:
+    return (n + alignment - 1) // alignment * alignment
+
+
+# Flatbuffers
+#
+# We describe a message as a tree of _Table, _String and _Vector, then lay it
+# out front-to-back: each object's children come after it, so every uoffset
+# is positive. Each table's vtable comes just before the table.
+
+class _Table:
+    def __init__(self, *fields: Tuple[int, str, Any]):
+        """
+        Build a table from (slot, format, value) fields.
+
+        `format` is a `struct` format character -- or 'offset', meaning
+        `value` is a _Table, _String or _Vector.
+        """
+        self.fields = fields
+
+
+class _String:
+    def __init__(self, s: str):
+        self.data = s.encode('utf-8')
+
+
+class _Vector:
+    def __init__(self, items: List[Any], struct_size: int = 0):
+        """
+        Build a vector of offsets (to `items`) or of structs.
+
+        If `struct_size` is set, each item is `bytes` of that size: a struct,
+        stored inline with 8-byte alignment.
+        """
+        self.items = items
+        self.struct_size = struct_size
+
+
+def _build_flatbuffer(root: _Table) -> bytes:
+    buf = bytearray(4)  # root uoffset
+    pending = [(0, root)]  # (position of uoffset, object)
+
+    def pad_to(alignment: int, extra: int = 0) -> int:
+        """Pad `buf` so `len(buf) + extra` is aligned; return len(buf)."""
+        buf.extend(b'\0' * (_align(len(buf) + extra, alignment)
+                            - len(buf) - extra))
+        return len(buf)
+
+    def write_table(table: _Table) -> int:
+        n_slots = max((slot for slot, _, _ in table.fields), default=-1) + 1
+        vtable_pos = pad_to(2)
+        vtable_size = 4 + 2 * n_slots
+        buf.extend(b'\0' * vtable_size)
+
+        table_pos = pad_to(8)
+        buf.extend(b'\0' * 4)  # soffset to vtable
+        struct.pack_into('<i', buf, table_pos, table_pos - vtable_pos)
+
+        slot_offsets = [0] * n_slots
+        # Largest first, to waste less space on alignment
+        fields = sorted(table.fields,
+                        key=lambda f: -(4 if f[1] == 'offset'
+                                        else struct.calcsize(f[1])))
+        for slot, fmt, value in fields:
+            if fmt == 'offset':
+                pos = pad_to(4)
+                buf.extend(b'\0' * 4)
+                pending.append((pos, value))
+            else:
+                pos = pad_to(struct.calcsize(fmt))
+                buf.extend(struct.pack('<' + fmt, value))
+            slot_offsets[slot] = pos - table_pos
+
+        struct.pack_into('<HH%dH' % n_slots, buf, vtable_pos, vtable_size,
+                         len(buf) - table_pos, *slot_offsets)
+        return table_pos
+
+    def write_string(string: _String) -> int:
+        pos = pad_to(4)
+        buf.extend(struct.pack('<I', len(string.data)))
+        buf.extend(string.data)
+        buf.extend(b'\0')
+        return pos
+
+    def write_vector(vector: _Vector) -> int:
+        if vector.struct_size:
+            pos = pad_to(8, 4)  # so the structs after the length are aligned
+            buf.extend(struct.pack('<I', len(vector.items)))
+            for item in vector.items:
+                buf.extend(item)
+        else:
+            pos = pad_to(4)
+            buf.extend(struct.pack('<I', len(vector.items)))
+            for item in vector.items:
+                pending.append((len(buf), item))
+                buf.extend(b'\0' * 4)
+        return pos
+
+    writers = {
+        _Table: write_table,
+        _String: write_string,
+        _Vector: write_vector,
+    }
+
+    while pending:
+        uoffset_pos, obj = pending.pop(0)
+        pos = writers[type(obj)](obj)
+        struct.pack_into('<I', buf, uoffset_pos, pos - uoffset_pos)
+
+    pad_to(8)
+    return bytes(buf)
+
+
+# Arrow
+
+class _ColumnData:
+    """One column's record-batch data: node, buffers and (maybe) dict."""
+
+    def __init__(self, length: int, null_count: int, buffers: List[bytes],
+                 dictionary: Optional['_ColumnData'] = None):
+        self.length = length
+        self.null_count = null_count
+        self.buffers = buffers
+        self.dictionary = dictionary
+
+
+def _validity_bitmap(valid: np.array) -> bytes:
+    """Pack `valid` (bool array) into Arrow's little-endian bitmap."""
+    n_bytes = (len(valid) + 7) // 8
+    bits = np.zeros(n_bytes * 8, dtype=np.uint8)
+    bits[:len(valid)] = valid
+    # np.packbits() is big-endian: reverse each byte's bits first
+    return np.packbits(bits.reshape(-1, 8)[:, ::-1]).tobytes()
+
+
+def _primitive_column(values: np.array,
+                      valid: Optional[np.array] = None) -> _ColumnData:
+    if valid is None or valid.all():
+        return _ColumnData(len(values), 0,
+                           [b'', np.ascontiguousarray(values).tobytes()])
+    else:
+        return _ColumnData(len(values), int(len(valid) - valid.sum()),
+                           [_validity_bitmap(valid),
+                            np.ascontiguousarray(values).tobytes()])
+
+
+def _utf8_column(values: np.array) -> _ColumnData:
+    blobs = [v.encode('utf-8') if isinstance(v, str) else b''
+             for v in values]
+    valid = np.array([isinstance(v, str) for v in values], dtype=bool)
+    offsets = np.zeros(len(blobs) + 1, dtype='<i4')
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    if valid.all():
+        validity = b''
+    else:
+        validity = _validity_bitmap(valid)
+    return _ColumnData(len(values), int(len(valid) - valid.sum()),
+                       [validity, offsets.tobytes(), b''.join(blobs)])
+
+
+def _int_type(bit_width: int, is_signed: bool) -> _Table:
+    return _Table((0, 'i', bit_width), (1, '?', is_signed))
+
+
+def _encode_column(series: pd.Series) -> Tuple[int, _Table, _ColumnData]:
+    """Return (type_type, type, data) for one column."""
+    dtype = series.dtype
+    if is_categorical_dtype(dtype):
+        codes = series.cat.codes.values.astype('<i4')
+        valid = codes >= 0
+        codes[~valid] = 0
+        data = _primitive_column(codes, valid)
+        data.dictionary = _utf8_column(
+            np.array([str(c) for c in series.cat.categories], dtype=object)
+        )
+        return (_TypeUtf8, _Table(), data)
+    elif is_integer_dtype(dtype):
+        values = series.values.astype(dtype.newbyteorder('<'))
+        return (_TypeInt, _int_type(dtype.itemsize * 8, dtype.kind == 'i'),
+                _primitive_column(values))
+    elif is_float_dtype(dtype) and dtype.itemsize in (4, 8):
+        precision = _PrecisionDouble if dtype.itemsize == 8 \
+            else _PrecisionSingle
+        values = series.values.astype(dtype.newbyteorder('<'))
+        return (_TypeFloatingPoint, _Table((0, 'h', precision)),
+                _primitive_column(values, ~np.isnan(values)))
+    elif is_datetime64_dtype(dtype):
+        valid = series.notna().values
+        millis = series.values.astype('datetime64[ms]').astype('<i8')
+        millis[~valid] = 0
+        return (_TypeTimestamp, _Table((0, 'h', _TimeUnitMillisecond)),
+                _primitive_column(millis, valid))
+    else:
+        return (_TypeUtf8, _Table(), _utf8_column(series.values))
+
+
+def _record_batch_and_body(length: int,
+                           columns: List[_ColumnData]) -> Tuple[_Table,
+                                                                 bytes]:
+    nodes = []
+    buffers = []
+    body = bytearray()
+    for column in columns:
+        nodes.append(struct.pack('<qq', column.length, column.null_count))
+        for blob in column.buffers:
+            buffers.append(struct.pack('<qq', len(body), len(blob)))
+            body.extend(blob)
+            body.extend(b'\0' * (_align(len(body), 8) - len(body)))
+
+    record_batch = _Table(
+        (0, 'q', length),
+        (1, 'offset', _Vector(nodes, struct_size=16)),
+        (2, 'offset', _Vector(buffers, struct_size=16)),
+    )
+    return (record_batch, bytes(body))
+
+
+def _message(header_type: int, header: _Table, body: bytes = b'') -> bytes:
+    metadata = _build_flatbuffer(_Table(
+        (0, 'h', _MetadataVersionV4),
+        (1, 'B', header_type),
+        (2, 'offset', header),
+        (3, 'q', len(body)),
+    ))
+    # _build_flatbuffer() pads to 8 bytes, so the body is aligned
+    return b''.join([_Continuation, struct.pack('<i', len(metadata)),
+                     metadata, body])
+
+
+def encode_dataframe(dataframe: pd.DataFrame,
+                     metadata: Optional[dict] = None) -> bytes:
+    """
+    Encode `dataframe` as an Arrow IPC stream: schema, dictionaries, one
+    record batch, end-of-stream.
+
+    `metadata` (str => str) goes in the schema's `custom_metadata`.
+    """
+    fields = []
+    columns = []
+    dictionary_messages = []
+    for i, name in enumerate(dataframe.columns):
+        type_type, type_table, data = _encode_column(dataframe[name])
+        field_slots = [
+            (0, 'offset', _String(str(name))),
+            (1, '?', True),
+            (2, 'B', type_type),
+            (3, 'offset', type_table),
+            (5, 'offset', _Vector([])),  # children
+        ]
+        if data.dictionary is not None:
+            field_slots.append((4, 'offset', _Table(
+                (0, 'q', i),  # dictionary ID
+                (1, 'offset', _int_type(32, True)),
+            )))
+            dictionary, body = _record_batch_and_body(
+                data.dictionary.length,
+                [data.dictionary]
+            )
+            dictionary_messages.append(_message(
+                _MessageHeaderDictionaryBatch,
+                _Table((0, 'q', i), (1, 'offset', dictionary)),
+                body
+            ))
+        fields.append(_Table(*field_slots))
+        columns.append(data)
+
+    schema_slots = [
+        (0, 'h', 0),  # little-endian
+        (1, 'offset', _Vector(fields)),
+    ]
+    if metadata:
+        schema_slots.append((2, 'offset', _Vector([
+            _Table((0, 'offset', _String(key)),
+                   (1, 'offset', _String(value)))
+            for key, value in metadata.items()
+        ])))
+
+    record_batch, body = _record_batch_and_body(len(dataframe), columns)
+
+    return b''.join([
+        _message(_MessageHeaderSchema, _Table(*schema_slots)),
+        *dictionary_messages,
+        _message(_MessageHeaderRecordBatch, record_batch, body),
+        _EndOfStream,
+    ])
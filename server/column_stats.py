@@ -0,0 +1,117 @@
+"""
+Per-column statistics of a render result.
+
+We compute these when we cache a render result, so the value-counts and
+column-summary endpoints needn't decode the table.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_dtype, is_numeric_dtype
+from cjworkbench.types import Column
+
+
+MaxValueCounts = 1000
+"""
+Most distinct values a column may have for us to store its value counts.
+
+Refine and filter-by-value present low-cardinality columns. Columns with more
+distinct values than this are rarely used that way; we count their values on
+request instead of storing huge counts for every render.
+"""
+
+
+@dataclass(frozen=True)
+class ColumnStats:
+    n_nulls: int
+    """Number of null values."""
+
+    n_distinct: int
+    """Number of distinct non-null values."""
+
+    min: Any = None
+    """Smallest non-null value (JSON-compatible), or None if all are null."""
+
+    max: Any = None
+    """Largest non-null value (JSON-compatible), or None if all are null."""
+
+    value_counts: Optional[Dict[str, int]] = None
+    """
+    Number of times each formatted value appears, or None.
+
+    Keys are formatted with the column's type -- just like the value-counts
+    endpoint presents them. None means there are more than `MaxValueCounts`
+    distinct values.
+    """
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> 'ColumnStats':
+        return cls(**d)
+
+
+def _to_json_value(value: Any, series: pd.Series) -> Any:
+    if is_datetime64_dtype(series.dtype):
+        return pd.Timestamp(value).isoformat() + 'Z'
+    elif isinstance(value, np.generic):
+        return value.item()
+    else:
+        return value
+
+
+def _value_counts(column: Column, unique_counts: pd.Series) -> Dict[str, int]:
+    """
+    Format the values in `unique_counts.index` and sum counts by format.
+
+    We format each _distinct_ value once, instead of once per row. Two values
+    may format the same way (say, 1.001 and 1.002 with format '{:.2f}').
+    """
+    # np.asarray(): a categorical index would groupby() unused categories
+    formatted = column.type.format_series(
+        pd.Series(np.asarray(unique_counts.index))
+    )
+    counts = pd.Series(unique_counts.values, index=formatted.values)
+    counts = counts.groupby(level=0).sum().sort_values(ascending=False)
+    return dict((str(k), int(v)) for k, v in counts.items())
+
+
+def compute_column_stats(series: pd.Series, column: Column) -> ColumnStats:
+    """Compute statistics of `series`, whose type is `column.type`."""
+    n_nulls = int(series.isna().sum())
+
+    unique_counts = series.value_counts(sort=False)  # excludes nulls
+    unique_counts = unique_counts[unique_counts > 0]  # unused categories
+    n_distinct = len(unique_counts)
+
+    if n_distinct == 0:
+        return ColumnStats(n_nulls=n_nulls, n_distinct=0)
+
+    if is_numeric_dtype(series.dtype) or is_datetime64_dtype(series.dtype):
+        min_value = _to_json_value(series.min(), series)
+        max_value = _to_json_value(series.max(), series)
+    else:
+        # Text (maybe categorical). Compare distinct values only.
+        values = unique_counts.index.astype(str)
+        min_value = values.min()
+        max_value = values.max()
+
+    if n_distinct <= MaxValueCounts:
+        value_counts = _value_counts(column, unique_counts)
+    else:
+        value_counts = None
+
+    return ColumnStats(n_nulls=n_nulls, n_distinct=n_distinct,
+                       min=min_value, max=max_value,
+                       value_counts=value_counts)
+
+
+def compute_table_stats(dataframe: pd.DataFrame,
+                        columns: List[Column]) -> Dict[str, ColumnStats]:
+    """Compute `ColumnStats` for every column, keyed by column name."""
+    return dict((column.name, compute_column_stats(dataframe[column.name],
+                                                   column))
+                for column in columns)
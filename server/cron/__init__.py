@@ -4,8 +4,9 @@ import math
 import time
 import warnings
 from django.conf import settings
-from worker.pg_locker import PgLocker
+from server import websockets
 from .autoupdate import queue_fetches
+from .compact import compact_stored_objects
 from .sessions import delete_expired_sessions_and_workflows
 
 
@@ -18,6 +19,9 @@ FetchInterval = 60  # seconds
 ExpiryInterval = 300  # seconds
 
 
+CompactInterval = 300  # seconds
+
+
 async def benchmark(task, message):
     t1 = time.time()
     logger.info(f'Start {message}')
@@ -29,19 +33,18 @@ async def benchmark(task, message):
 
 
 async def queue_fetches_forever():
-    async with PgLocker() as pg_locker:
-        while True:
-            t1 = time.time()
+    while True:
+        t1 = time.time()
 
-            await benchmark(queue_fetches(pg_locker), 'queue_fetches()')
+        await benchmark(queue_fetches(), 'queue_fetches()')
 
-            # Try to fetch at the beginning of each interval. Canonical example
-            # is FetchInterval=60: queue all our fetches as soon as the minute
-            # hand of the clock moves.
+        # Try to fetch at the beginning of each interval. Canonical example
+        # is FetchInterval=60: queue all our fetches as soon as the minute
+        # hand of the clock moves.
 
-            next_t = (math.floor(t1 / FetchInterval) + 1) * FetchInterval
-            delay = max(0, next_t - time.time())
-            await asyncio.sleep(delay)
+        next_t = (math.floor(t1 / FetchInterval) + 1) * FetchInterval
+        delay = max(0, next_t - time.time())
+        await asyncio.sleep(delay)
 
 
 async def delete_expired_sessions_and_workflows_forever():
@@ -65,13 +68,27 @@ async def delete_expired_sessions_and_workflows_forever():
         await asyncio.sleep(ExpiryInterval)
 
 
+async def compact_stored_objects_forever():
+    while True:
+        try:
+            await benchmark(compact_stored_objects(),
+                            'compact_stored_objects()')
+        except:
+            logger.exception('Error compacting stored objects')
+
+        await asyncio.sleep(CompactInterval)
+
+
 async def main():
     """
     Run maintenance tasks in the background.
 
     This should run forever, as a singleton daemon.
     """
+    websockets.coalesce_deltas_on_this_loop()
+
     await asyncio.wait({
         queue_fetches_forever(),
         delete_expired_sessions_and_workflows_forever(),
+        compact_stored_objects_forever(),
     }, return_when=asyncio.FIRST_EXCEPTION)
@@ -1,75 +1,166 @@
+import asyncio
+from collections import defaultdict
 import logging
 from typing import List, Tuple
+from django.db import connection
 from django.utils import timezone
 from cjworkbench.sync import database_sync_to_async
 from server import rabbitmq, websockets
-from server.models import WfModule
-from worker.pg_locker import PgLocker, WorkflowAlreadyLocked
+from server.models import WorkflowViewers
+from worker.fetch import MinFetchInterval
 
 
 logger = logging.getLogger(__name__)
 
 
-@database_sync_to_async
-def load_pending_wf_modules() -> List[Tuple[int, WfModule]]:
-    """Return list of (workflow_id, wf_module) with pending fetches."""
-    now = timezone.now()
-    # WfModule.workflow_id is a database operation
-    return [(wfm.workflow_id, wfm)
-            for wfm in WfModule.objects.filter(
-                is_deleted=False,
-                tab__is_deleted=False,
-                is_busy=False,  # not already scheduled
-                auto_update_data=True,  # user wants auto-update
-                next_update__isnull=False,  # DB isn't inconsistent
-                next_update__lte=now  # enough time has passed
-            )]
+FetchBatchSize = 200
+"""
+Number of fetches we claim (and publish) per database round-trip.
+
+We publish the most urgent fetches first: RabbitMQ delivers them first.
+"""
+
+
+MaxJitter = 300  # seconds
+"""
+Maximum amount we shift each module's next update, in either direction.
+
+We also cap the jitter at 10% of the module's update interval. Jitter spreads
+out modules that would otherwise all update at once (say, because a user
+duplicated a workflow many times). It doesn't drift over time on average.
+"""
+
+
+# Claim due WfModules: set is_busy=True and schedule their next update.
+#
+# We skip workflows that are rendering: that lowers the number of fetches of
+# resource-intensive workflows. (A render holds advisory lock (0, workflow_id)
+# -- see worker.pg_locker.) We'll revisit them next time we query.
+#
+# Priority is "seconds overdue" times (1 + number of viewers): users watching a
+# workflow want to see its fetches first, but fetches nobody watches can't
+# wait forever. Web processes report viewers in server_workflowviewers; we
+# ignore reports from processes that stopped reporting (see WorkflowViewers).
+#
+# SKIP LOCKED: if another transaction is editing a WfModule (say, the user is
+# changing its update interval), we'll revisit it next time.
+_ClaimSql = """
+WITH viewers AS (
+    SELECT workflow_id, SUM(n_viewers) AS n_viewers
+    FROM server_workflowviewers
+    WHERE updated_at >= %(now)s - %(viewers_expiry)s
+    GROUP BY workflow_id
+),
+due AS (
+    SELECT wfm.id,
+           tab.workflow_id,
+           EXTRACT(EPOCH FROM %(now)s - wfm.next_update)
+               * (1 + COALESCE(viewers.n_viewers, 0)) AS priority,
+           GREATEST(wfm.update_interval, %(min_interval)s) AS tick
+    FROM server_wfmodule wfm
+    INNER JOIN server_tab tab ON wfm.tab_id = tab.id
+    LEFT JOIN viewers ON tab.workflow_id = viewers.workflow_id
+    WHERE wfm.auto_update_data
+      AND NOT wfm.is_busy
+      AND NOT wfm.is_deleted
+      AND NOT tab.is_deleted
+      AND wfm.next_update <= %(now)s
+      AND NOT EXISTS (
+          SELECT 1
+          FROM pg_locks
+          WHERE pg_locks.locktype = 'advisory'
+            AND pg_locks.classid = 0
+            AND pg_locks.objid = tab.workflow_id
+            AND pg_locks.objsubid = 2
+      )
+    ORDER BY priority DESC
+    LIMIT %(limit)s
+    FOR UPDATE OF wfm SKIP LOCKED
+)
+UPDATE server_wfmodule
+SET is_busy = TRUE,
+    next_update = GREATEST(
+        -- the next update "on schedule", skipping missed updates ...
+        server_wfmodule.next_update
+            + INTERVAL '1 second' * due.tick * (
+                FLOOR(
+                    EXTRACT(EPOCH FROM %(now)s - server_wfmodule.next_update)
+                    / due.tick
+                ) + 1
+            )
+        -- ... plus or minus jitter ...
+            + INTERVAL '1 second' * (2 * RANDOM() - 1)
+                * LEAST(due.tick * 0.1, %(max_jitter)s),
+        -- ... but never so soon that we'd fetch twice in a row
+        %(now)s + INTERVAL '1 second' * %(min_interval)s
+    )
+FROM due
+WHERE server_wfmodule.id = due.id
+RETURNING server_wfmodule.id, due.workflow_id, due.priority
+"""
 
 
 @database_sync_to_async
-def set_wf_module_busy(wf_module):
-    # Database writes can't be on the event-loop thread
-    wf_module.is_busy = True
-    wf_module.save(update_fields=['is_busy'])
+def claim_pending_wf_modules(limit: int) -> List[Tuple[int, int]]:
+    """
+    Set is_busy=True on up to `limit` WfModules that are due for a fetch.
+
+    Return list of (workflow_id, wf_module_id), most urgent first.
 
+    This is a single `UPDATE ... RETURNING` query. It also sets each WfModule's
+    `next_update`, so the worker won't need to.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_ClaimSql, {
+            'now': timezone.now(),
+            'limit': limit,
+            'min_interval': MinFetchInterval,
+            'max_jitter': MaxJitter,
+            'viewers_expiry': WorkflowViewers.Expiry,
+        })
+        rows = cursor.fetchall()
+
+    # RETURNING doesn't preserve the CTE's ORDER BY
+    rows.sort(key=lambda row: -row[2])
+    return [(workflow_id, wf_module_id)
+            for wf_module_id, workflow_id, _ in rows]
+
+
+async def _send_busy_deltas(claimed: List[Tuple[int, int]]) -> None:
+    """Tell each workflow's users, in one message, which modules are busy."""
+    by_workflow = defaultdict(dict)
+    for workflow_id, wf_module_id in claimed:
+        by_workflow[workflow_id][str(wf_module_id)] = {
+            'is_busy': True,
+            'fetch_error': '',
+        }
+
+    await asyncio.gather(*[
+        websockets.ws_client_send_delta_async(workflow_id, {
+            'updateWfModules': update_wf_modules,
+        })
+        for workflow_id, update_wf_modules in by_workflow.items()
+    ])
 
-async def queue_fetches(pg_locker: PgLocker):
+
+async def queue_fetches():
     """
     Queue all pending fetches in RabbitMQ.
 
-    We'll set is_busy=True as we queue them, so we don't send double-fetches.
+    We'll set is_busy=True as we claim them, so we don't send double-fetches.
+    We claim and publish in batches, most urgent first.
     """
-    wf_modules = await load_pending_wf_modules()
-
-    for workflow_id, wf_module in wf_modules:
-        # Don't schedule a fetch if we're currently rendering.
-        #
-        # This still lets us schedule a fetch if a render is _queued_, so it
-        # doesn't solve any races. But it should lower the number of fetches of
-        # resource-intensive workflows.
-        #
-        # Using pg_locker means we can only queue a fetch _between_ renders.
-        # The render queue may be non-empty (we aren't testing that); but we're
-        # giving the workers a chance to tackle some of the backlog.
-        try:
-            async with pg_locker.render_lock(workflow_id):
-                # At this moment, the workflow isn't rendering. Let's pass
-                # through and queue the fetch.
-                pass
-
-            logger.info('Queue fetch of wf_module(%d, %d)', workflow_id,
-                        wf_module.id)
-            await set_wf_module_busy(wf_module)
-            await websockets.ws_client_send_delta_async(
-                workflow_id,
-                {
-                    'updateWfModules': {
-                        str(wf_module.id): {'is_busy': True, 'fetch_error': ''}
-                    }
-                }
-            )
-            await rabbitmq.queue_fetch(wf_module)
-        except WorkflowAlreadyLocked:
-            # Don't queue a fetch. We'll revisit this WfModule next time we
-            # query for pending fetches.
-            pass
+    while True:
+        claimed = await claim_pending_wf_modules(FetchBatchSize)
+        if not claimed:
+            break
+
+        logger.info('Queue %d fetches: %s', len(claimed),
+                    ', '.join('wf_module(%d, %d)' % pair for pair in claimed))
+
+        await _send_busy_deltas(claimed)
+        await rabbitmq.queue_fetch_batch([wf_module_id
+                                          for _, wf_module_id in claimed])
+
+        if len(claimed) < FetchBatchSize:
+            break
@@ -0,0 +1,54 @@
+import logging
+from typing import List
+from django.conf import settings
+from django.db.models import F
+from cjworkbench.sync import database_sync_to_async
+from server.models import StoredObject
+
+
+logger = logging.getLogger(__name__)
+
+
+@database_sync_to_async
+def compact_stored_objects():
+    compact_stored_objects_sync()
+
+
+def _load_long_chains() -> List[int]:
+    """
+    Return IDs of current StoredObjects built from too many delta segments.
+
+    We only compact each WfModule's current version: that's the one renders
+    read. Other versions may be built from segments, too; but they're rarely
+    read. (`enforce_storage_limits()` compacts any version it keeps atop a
+    version it deletes.)
+    """
+    return list(
+        StoredObject.objects
+        .filter(depth__gte=settings.MAX_STORED_DELTA_SEGMENTS,
+                wf_module__stored_data_version=F('stored_at'))
+        .values_list('id', flat=True)
+    )
+
+
+def compact_stored_objects_sync() -> None:
+    """
+    Rewrite each long chain of delta segments as a single file.
+
+    Reading a version built from delta segments means reading every segment.
+    Compaction keeps those reads short without slowing down fetches.
+    """
+    for stored_object_id in _load_long_chains():
+        try:
+            stored_object = StoredObject.objects.get(id=stored_object_id)
+        except StoredObject.DoesNotExist:
+            continue  # it was deleted
+
+        logger.info('Compacting StoredObject %d (%d segments)',
+                    stored_object.id, stored_object.depth + 1)
+        try:
+            stored_object.compact()
+        except Exception:
+            # Keep going: compaction is an optimization
+            logger.exception('Error compacting StoredObject %d',
+                             stored_object.id)
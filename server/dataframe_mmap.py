@@ -0,0 +1,375 @@
+"""
+Store DataFrames in files that can be read without decoding numbers.
+
+The writer dumps each column's raw buffer into a file; the reader maps that
+file into memory and wraps the buffers in numpy arrays -- one pandas block per
+column, so building the DataFrame doesn't copy them. Numeric, datetime and
+categorical-code columns have no per-value encode/decode step. Text is
+stored in chunks of rows: each chunk is one UTF-8 buffer plus the character
+offset where each row's value starts, so reading a few rows only decodes the
+chunks that hold them.
+
+We use this format to pass tables between processes, and (optionally) to
+store cached render results. Readers on the same machine share the file's
+pages through the OS page cache.
+
+    [column buffers, each 64-byte aligned][footer: JSON metadata][uint64]
+    [magic]
+
+The uint64 is the footer's length. Nothing in the file is pickled unless the
+writer passes `allow_pickle=True` (for a column that isn't text, e.g., while
+passing an unvalidated table between our own processes); readers refuse such
+columns unless they pass `allow_pickle=True`, too.
+
+We aim to keep the file format "stable": all future versions of
+read_dataframe() should support all files written by today's version of
+write_dataframe().
+"""
+
+import io
+import json
+import mmap
+import pickle
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+from pandas.core.internals import BlockManager, make_block
+
+
+_Alignment = 64
+_FooterLength = struct.Struct('<Q')
+Magic = b'CJWDFMM2'
+
+
+def _is_raw_dtype(dtype) -> bool:
+    """True if a column of this dtype is just a numpy buffer."""
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufM'
+
+
+def _is_text(values) -> bool:
+    """True if every value is str or null."""
+    return infer_dtype(values, skipna=True) in ('string', 'empty')
+
+
+def _write_aligned(f: BinaryIO, b) -> Tuple[int, int]:
+    """Write bytes-like `b` at the next aligned offset; return (offset, len)."""
+    offset = f.tell()
+    padding = -offset % _Alignment
+    if padding:
+        f.write(b'\0' * padding)
+        offset += padding
+    nbytes = f.write(b)
+    return (offset, nbytes)
+
+
+def _write_text_chunk(f: BinaryIO, values: np.ndarray,
+                      isnull: np.ndarray) -> List[int]:
+    """
+    Write str `values` as character offsets and UTF-8 text.
+
+    Return [offsets_offset, text_offset, text_nbytes]. Null values are
+    written as "" (the caller records which ones are null).
+    """
+    strings = values.copy()
+    strings[isnull] = ''
+    lengths = np.fromiter(map(len, strings), dtype=np.int64,
+                          count=len(strings))
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    text = ''.join(strings).encode('utf-8', 'surrogatepass')
+    offsets_offset, _ = _write_aligned(f, offsets.view(np.uint8))
+    return [offsets_offset, *_write_aligned(f, text)]
+
+
+def _read_text_chunk(mm: mmap.mmap, chunk: List[int],
+                     nrows: int) -> np.ndarray:
+    """Read `nrows` str values written by `_write_text_chunk()`."""
+    offsets_offset, text_offset, text_nbytes = chunk
+    offsets = np.frombuffer(mm, dtype=np.int64, count=nrows + 1,
+                            offset=offsets_offset).tolist()
+    text = mm[text_offset:text_offset + text_nbytes] \
+        .decode('utf-8', 'surrogatepass')
+    values = np.empty(nrows, dtype=object)
+    values[:] = [text[start:end]
+                 for start, end in zip(offsets[:-1], offsets[1:])]
+    return values
+
+
+def write_dataframe(f: BinaryIO, dataframe: pd.DataFrame,
+                    rows_per_chunk: Optional[int] = None,
+                    allow_pickle: bool = False) -> None:
+    """
+    Write `dataframe` to `f`, which must be a seekable binary file.
+
+    Write from the current file position to the end. Flush before returning.
+
+    If `rows_per_chunk` is set, write text columns in chunks of that many
+    rows, so `read_row_range()` can read a few rows cheaply.
+
+    Raise ValueError if a column holds values that aren't numbers, datetimes
+    or str -- unless `allow_pickle`, in which case we pickle that column.
+    Only pass `allow_pickle` for files that never leave this machine.
+    """
+    nrows = len(dataframe)
+    if not rows_per_chunk:
+        rows_per_chunk = max(nrows, 1)
+
+    columns: List[Dict[str, Any]] = []
+    for i, name in enumerate(dataframe.columns):
+        series = dataframe.iloc[:, i]  # by position: names may repeat
+        dtype = series.dtype
+        if _is_raw_dtype(dtype):
+            values = np.ascontiguousarray(series.values)
+            offset, nbytes = _write_aligned(f, values.view(np.uint8))
+            columns.append({'name': name, 'kind': 'raw', 'dtype': dtype.str,
+                            'offset': offset, 'nbytes': nbytes})
+        elif hasattr(series, 'cat') and _is_text(series.cat.categories):
+            codes = np.ascontiguousarray(series.cat.codes.values)
+            offset, nbytes = _write_aligned(f, codes.view(np.uint8))
+            columns.append({'name': name, 'kind': 'category',
+                            'dtype': codes.dtype.str,
+                            'categories': series.cat.categories.tolist(),
+                            'offset': offset, 'nbytes': nbytes})
+        elif dtype == object and _is_text(series.values):
+            values = series.values
+            isnull = series.isnull().values
+            if isnull.any():
+                nulls = _write_aligned(f, isnull.view(np.uint8))
+            else:
+                nulls = None
+            chunks = [
+                _write_text_chunk(f, values[start:start + rows_per_chunk],
+                                  isnull[start:start + rows_per_chunk])
+                for start in range(0, nrows, rows_per_chunk)
+            ]
+            columns.append({'name': name, 'kind': 'text', 'nulls': nulls,
+                            'chunks': chunks})
+        elif allow_pickle:
+            values = series.values
+            chunks = []
+            for start in range(0, nrows, rows_per_chunk):
+                data = pickle.dumps(values[start:start + rows_per_chunk],
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+                chunks.append(_write_aligned(f, data))
+            columns.append({'name': name, 'kind': 'pickle',
+                            'dtype': dtype.str, 'chunks': chunks})
+        else:
+            raise ValueError(
+                'Column %r has dtype %s and holds values that are not str'
+                % (name, dtype)
+            )
+
+    footer = json.dumps({'nrows': nrows, 'rows_per_chunk': rows_per_chunk,
+                         'columns': columns}).encode('utf-8')
+    f.write(footer)
+    f.write(_FooterLength.pack(len(footer)))
+    f.write(Magic)
+    f.flush()
+
+
+def is_dataframe_mmap_file(f: BinaryIO) -> bool:
+    """
+    True if `f` ends with our magic number.
+
+    Leave `f`'s file position undefined.
+    """
+    f.seek(0, io.SEEK_END)
+    if f.tell() < len(Magic) + _FooterLength.size:
+        return False
+    f.seek(-len(Magic), io.SEEK_END)
+    return f.read(len(Magic)) == Magic
+
+
+def _read_footer(f: BinaryIO) -> Tuple[mmap.mmap, Dict[str, Any]]:
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if mm[-len(Magic):] != Magic:
+        raise ValueError('File was not written by dataframe_mmap')
+    footer_end = len(mm) - len(Magic) - _FooterLength.size
+    (footer_length,) = _FooterLength.unpack_from(mm, footer_end)
+    footer_offset = footer_end - footer_length
+    footer = json.loads(mm[footer_offset:footer_end].decode('utf-8'))
+    return (mm, footer)
+
+
+def _select_columns(footer: Dict[str, Any],
+                    columns: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if columns is None:
+        return footer['columns']
+    else:
+        by_name = {c['name']: c for c in footer['columns']}
+        return [by_name[name] for name in columns if name in by_name]
+
+
+def _build_dataframe(data: Dict[int, Any], selected: List[Dict[str, Any]],
+                     nrows: int) -> pd.DataFrame:
+    """
+    Wrap each column of `data` in its own pandas Block.
+
+    `pd.DataFrame(data)` would consolidate same-dtype columns into one 2-D
+    block, copying every memory-mapped buffer. Separate blocks keep the
+    buffers mapped. (Some pandas operations consolidate later; they copy
+    then, as they would for any DataFrame.)
+    """
+    blocks = []
+    for i, values in enumerate(data.values()):
+        if isinstance(values, np.ndarray):
+            values = values.reshape(1, -1)  # a view, not a copy
+        blocks.append(make_block(values, placement=[i], ndim=2))
+    manager = BlockManager(blocks, [pd.Index([c['name'] for c in selected]),
+                                    pd.RangeIndex(0, nrows)])
+    return pd.DataFrame(manager)
+
+
+def _read_chunk(mm: mmap.mmap, footer: Dict[str, Any],
+                column: Dict[str, Any], chunk_index: int,
+                allow_pickle: bool) -> np.ndarray:
+    """Read all values in chunk `chunk_index` of a text or pickle column."""
+    rows_per_chunk = footer['rows_per_chunk']
+    nrows = min(rows_per_chunk,
+                footer['nrows'] - chunk_index * rows_per_chunk)
+    chunk = column['chunks'][chunk_index]
+    if column['kind'] == 'text':
+        return _read_text_chunk(mm, chunk, nrows)
+    elif allow_pickle:
+        offset, nbytes = chunk
+        return pickle.loads(mm[offset:offset + nbytes])
+    else:
+        raise ValueError('Column %r is pickled; refusing to unpickle it'
+                         % column['name'])
+
+
+def _read_nulls(mm: mmap.mmap, footer: Dict[str, Any],
+                column: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Return a text column's null mask, or None if nothing is null."""
+    if column.get('nulls') is None:
+        return None
+    offset, _ = column['nulls']
+    return np.frombuffer(mm, dtype=np.bool_, count=footer['nrows'],
+                         offset=offset)
+
+
+def _empty_values(column: Dict[str, Any]) -> np.ndarray:
+    if column['kind'] == 'text':
+        return np.array([], dtype=object)
+    else:
+        return np.array([], dtype=np.dtype(column['dtype']))
+
+
+def _read(f: BinaryIO, columns: Optional[List[str]], start_row: int,
+          end_row: Optional[int], allow_pickle: bool) -> pd.DataFrame:
+    mm, footer = _read_footer(f)
+    nrows = footer['nrows']
+    rows_per_chunk = footer['rows_per_chunk']
+
+    start_row = min(start_row, nrows)
+    if end_row is None or end_row > nrows:
+        end_row = nrows
+    end_row = max(start_row, end_row)
+
+    selected = _select_columns(footer, columns)
+
+    data = {}
+    for column in selected:
+        kind = column['kind']
+        if kind == 'raw' or kind == 'category':
+            dtype = np.dtype(column['dtype'])
+            values = np.frombuffer(
+                mm,
+                dtype=dtype,
+                count=end_row - start_row,
+                offset=column['offset'] + start_row * dtype.itemsize
+            )
+            if kind == 'category':
+                values = pd.Categorical.from_codes(values,
+                                                   column['categories'])
+        else:
+            first_chunk = start_row // rows_per_chunk
+            last_chunk = -(-end_row // rows_per_chunk)  # ceil
+            parts = [_read_chunk(mm, footer, column, chunk_index,
+                                 allow_pickle)
+                     for chunk_index in range(first_chunk, last_chunk)]
+            skip = start_row - first_chunk * rows_per_chunk
+            if parts:
+                values = np.concatenate(parts)[skip:
+                                               skip + end_row - start_row]
+            else:
+                values = _empty_values(column)
+            nulls = _read_nulls(mm, footer, column)
+            if nulls is not None:
+                values[nulls[start_row:end_row]] = None
+        data[len(data)] = values
+
+    return _build_dataframe(data, selected, end_row - start_row)
+
+
+def read_dataframe(f: BinaryIO, columns: Optional[List[str]] = None,
+                   allow_pickle: bool = False) -> pd.DataFrame:
+    """
+    Read a DataFrame written by `write_dataframe()` to file `f`.
+
+    `f` must have been written in full from offset 0. The file is mapped into
+    memory copy-on-write, so callers may modify the returned DataFrame without
+    altering the file (or each other's data, if they read it twice).
+
+    Pass `columns` to read only some columns. Raise ValueError if `f` was not
+    written by `write_dataframe()`, or if it holds a pickled column and not
+    `allow_pickle`. (Only allow pickles from files this machine wrote.)
+    """
+    return _read(f, columns, 0, None, allow_pickle)
+
+
+def read_row_range(f: BinaryIO, columns: Optional[List[str]],
+                   start_row: int, end_row: int) -> pd.DataFrame:
+    """
+    Read rows `start_row:end_row` of a DataFrame written to file `f`.
+
+    Numeric columns are sliced without copying; text columns only decode
+    the chunks that overlap the range. The result has a fresh RangeIndex.
+    """
+    return _read(f, columns, start_row, end_row, False)
+
+
+def read_rows(f: BinaryIO, columns: Optional[List[str]],
+              rows: np.array) -> pd.DataFrame:
+    """
+    Read rows `rows` (in that order) of a DataFrame written to file `f`.
+
+    Numeric columns only touch the pages that hold `rows`; text columns only
+    decode the chunks that hold them. Raise IndexError if a row is out of
+    bounds. The result has a fresh RangeIndex.
+    """
+    mm, footer = _read_footer(f)
+    rows_per_chunk = footer['rows_per_chunk']
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) and (rows.min() < 0 or rows.max() >= footer['nrows']):
+        raise IndexError('Rows are out of bounds')
+
+    selected = _select_columns(footer, columns)
+
+    data = {}
+    for column in selected:
+        kind = column['kind']
+        if kind == 'raw' or kind == 'category':
+            dtype = np.dtype(column['dtype'])
+            values = np.frombuffer(mm, dtype=dtype, count=footer['nrows'],
+                                   offset=column['offset'])[rows]
+            if kind == 'category':
+                values = pd.Categorical.from_codes(values,
+                                                   column['categories'])
+        else:
+            values = np.empty(len(rows), dtype=_empty_values(column).dtype)
+            chunk_indexes = rows // rows_per_chunk
+            for chunk_index in np.unique(chunk_indexes):
+                chunk = _read_chunk(mm, footer, column, int(chunk_index),
+                                    False)
+                mask = chunk_indexes == chunk_index
+                values[mask] = chunk[rows[mask]
+                                     - chunk_index * rows_per_chunk]
+            nulls = _read_nulls(mm, footer, column)
+            if nulls is not None:
+                values[nulls[rows]] = None
+        data[len(data)] = values
+
+    return _build_dataframe(data, selected, len(rows))
@@ -0,0 +1,255 @@
+"""
+HTTP client shared by all fetch modules in a process.
+
+Every fetch module should make its HTTP requests through `request()` (or
+`get()`). Compared to a fresh `aiohttp.ClientSession` per request, we:
+
+* Reuse keep-alive connections (and DNS lookups) across fetches.
+* Limit the number of concurrent connections to each host.
+* Respect `Retry-After` on HTTP 429 and 503 responses: we delay _all_ requests
+  to that host, then retry.
+* Collect per-host metrics. See `host_metrics()`.
+"""
+
+import asyncio
+from dataclasses import dataclass, replace
+import email.utils
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional
+import weakref
+import aiohttp
+from django.conf import settings
+import yarl  # aiohttp innards -- yuck!
+
+
+logger = logging.getLogger(__name__)
+
+
+RetryStatuses = frozenset([429, 503])
+
+
+@dataclass
+class HostMetrics:
+    n_requests: int = 0
+    """Number of requests we sent, including retries."""
+
+    n_errors: int = 0
+    """Number of requests that failed before we got a response."""
+
+    n_retries: int = 0
+    """Number of requests we retried because of `Retry-After`."""
+
+    n_bytes: int = 0
+    """Number of response-body bytes we read."""
+
+    total_seconds: float = 0.0
+    """Total time between sending requests and receiving response headers."""
+
+    @property
+    def mean_seconds(self) -> float:
+        """Mean time between sending a request and receiving its headers."""
+        n_responses = self.n_requests - self.n_errors
+        if n_responses <= 0:
+            return 0.0
+        return self.total_seconds / n_responses
+
+
+_metrics: Dict[str, HostMetrics] = {}
+
+
+# host => `time.monotonic()` before which we must not send requests
+_retry_after: Dict[str, float] = {}
+
+
+# event loop => aiohttp.ClientSession. aiohttp sessions are bound to an event
+# loop; unit tests run many loops.
+_sessions = weakref.WeakKeyDictionary()
+
+
+def _host_metrics(host: str) -> HostMetrics:
+    try:
+        return _metrics[host]
+    except KeyError:
+        metrics = HostMetrics()
+        _metrics[host] = metrics
+        return metrics
+
+
+async def _on_request_start(session, context, params):
+    context.host = params.url.host
+    context.start = time.monotonic()
+    _host_metrics(context.host).n_requests += 1
+
+
+async def _on_request_end(session, context, params):
+    _host_metrics(context.host).total_seconds += (
+        time.monotonic() - context.start
+    )
+
+
+async def _on_request_exception(session, context, params):
+    _host_metrics(context.host).n_errors += 1
+
+
+async def _on_response_chunk_received(session, context, params):
+    # aiohttp sends this from `response.read()` (and so from `.text()` and
+    # `.json()`). Streaming readers should use `iter_chunked()`.
+    _host_metrics(context.host).n_bytes += len(params.chunk)
+
+
+def _build_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    trace_config.on_response_chunk_received.append(
+        _on_response_chunk_received
+    )
+    return trace_config
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Return this event loop's session, creating it if needed.
+
+    Call this from within a coroutine.
+    """
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_MAX_CONNECTIONS,
+            limit_per_host=settings.HTTP_MAX_CONNECTIONS_PER_HOST
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[_build_trace_config()]
+        )
+        _sessions[loop] = session
+    return session
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Return number of seconds `Retry-After` asks us to wait, or `None`.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(int(value)))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+async def _wait_for_host(host: str) -> None:
+    delay = _retry_after.get(host, 0) - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def request(method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+    """
+    Send an HTTP request and return the response once headers arrive.
+
+    `url` may be a `str` or `yarl.URL`. We treat a `str` as an _encoded_ URL:
+    aiohttp's URL canonization breaks oauth and users' expectations.
+    https://github.com/aio-libs/aiohttp/issues/3424
+
+    `kwargs` are passed to `aiohttp.ClientSession.request()`.
+
+    If the server responds with 429 or 503 and a `Retry-After` of at most
+    `settings.HTTP_MAX_RETRY_AFTER` seconds, we hold back all requests to the
+    host for that long and then retry, up to `settings.HTTP_MAX_RETRIES`
+    times. Otherwise, we return the response as-is.
+
+    The caller must read or release the response. (`async with response:`
+    releases it.)
+
+    Raise aiohttp.ClientError on generic error. Subclasses of note:
+    * aiohttp.InvalidURL on invalid URL
+    * aiohttp.ClientResponseError if `raise_for_status=True` and the final
+      response has an HTTP error status
+
+    Raise asyncio.TimeoutError when `timeout` expires.
+    """
+    if not isinstance(url, yarl.URL):
+        url = yarl.URL(url, encoded=True)  # prevent magic
+    if url.scheme not in ('http', 'https'):
+        raise aiohttp.InvalidURL('URL must start with http:// or https://')
+    host = url.host
+
+    raise_for_status = kwargs.pop('raise_for_status', False)
+
+    session = _get_session()
+    n_retries = 0
+    while True:
+        await _wait_for_host(host)
+
+        response = await session.request(method, url, **kwargs)
+
+        if response.status in RetryStatuses \
+                and n_retries < settings.HTTP_MAX_RETRIES:
+            delay = _parse_retry_after(response.headers.get('Retry-After'))
+            if delay is not None and delay <= settings.HTTP_MAX_RETRY_AFTER:
+                logger.info('%s asked us to retry %s in %.1fs', host, url,
+                            delay)
+                _retry_after[host] = max(_retry_after.get(host, 0),
+                                         time.monotonic() + delay)
+                response.release()
+                n_retries += 1
+                _host_metrics(host).n_retries += 1
+                continue
+
+        if raise_for_status and response.status >= 400:
+            response.release()
+            response.raise_for_status()
+        return response
+
+
+async def get(url: str, **kwargs) -> aiohttp.ClientResponse:
+    """Send a GET request. See `request()`."""
+    return await request('GET', url, **kwargs)
+
+
+async def iter_chunked(response: aiohttp.ClientResponse,
+                       chunk_size: int) -> AsyncIterator[bytes]:
+    """Yield chunks of `response`'s body, counting them in our metrics."""
+    metrics = _host_metrics(response.url.host)
+    async for chunk in response.content.iter_chunked(chunk_size):
+        metrics.n_bytes += len(chunk)
+        yield chunk
+
+
+def host_metrics() -> Dict[str, HostMetrics]:
+    """Return a copy of the metrics we've collected, by host."""
+    return dict((host, replace(metrics)) for host, metrics in _metrics.items())
+
+
+def log_host_metrics() -> None:
+    """Log a line of metrics for each host we've contacted."""
+    for host, metrics in sorted(host_metrics().items()):
+        logger.info(
+            'HTTP %s: %d requests (%d errors, %d retries), %d bytes, '
+            'mean %dms to headers',
+            host, metrics.n_requests, metrics.n_errors, metrics.n_retries,
+            metrics.n_bytes, int(metrics.mean_seconds * 1000)
+        )
+
+
+async def close() -> None:
+    """Close this event loop's session (and its connections), if any."""
+    session = _sessions.pop(asyncio.get_event_loop(), None)
+    if session is not None:
+        await session.close()
@@ -0,0 +1,94 @@
+from collections import namedtuple
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from server.models import WfModule, Workflow
+from server.serializers import TabSerializer, WfModuleSerializer, \
+        WorkflowSerializer
+from server.workflow_snapshot import load_workflow_snapshot
+
+
+FakeRequest = namedtuple('FakeRequest', ('user', 'session'))
+
+
+def _serialize_per_step(workflow, request):
+    """Serialize the way we did before workflow_snapshot existed."""
+    WorkflowSerializer(workflow, context={'request': request}).data
+    for tab in workflow.live_tabs:
+        TabSerializer(tab).data
+    for wf_module in WfModule.live_in_workflow(workflow):
+        WfModuleSerializer(wf_module).data
+    workflow.are_all_render_results_fresh()
+
+
+def _serialize_snapshot(workflow, request):
+    load_workflow_snapshot(workflow, request)
+
+
+class Command(BaseCommand):
+    help = (
+        'Count queries and time serializing 10-, 100- and 500-step '
+        'workflows, with and without workflow_snapshot. Writes to the '
+        'database and rolls back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100, 500])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _create_workflow(self, n_steps: int) -> Workflow:
+        user = User.objects.create(username=f'benchmark-{n_steps}',
+                                   email=f'benchmark-{n_steps}@example.org')
+        workflow = Workflow.create_and_init(owner=user)
+        tabs = [workflow.tabs.first()] + [
+            workflow.tabs.create(position=i, slug=f'tab-{i + 1}',
+                                 name=f'Tab {i + 1}')
+            for i in range(1, 4)
+        ]
+        for i in range(n_steps):
+            tab = tabs[i % len(tabs)]
+            wf_module = tab.wf_modules.create(
+                order=i // len(tabs),
+                module_id_name='loadurl',
+                last_relevant_delta_id=workflow.last_delta_id,
+                params={'url': f'http://example.com/{i}'}
+            )
+            wf_module.stored_objects.create(stored_at=timezone.now())
+        return workflow
+
+    def _measure(self, serialize, workflow, request, repeat: int):
+        """Return (n_queries, best time in ms)."""
+        with CaptureQueriesContext(connection) as queries:
+            serialize(workflow, request)
+        n_queries = len(queries)
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize(workflow, request)
+            times.append(time.perf_counter() - start)
+        return (n_queries, min(times) * 1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write('steps  per-step queries  per-step ms  '
+                          'snapshot queries  snapshot ms')
+        for n_steps in options['sizes']:
+            with transaction.atomic():
+                workflow = self._create_workflow(n_steps)
+                request = FakeRequest(workflow.owner, None)
+                old_queries, old_ms = self._measure(_serialize_per_step,
+                                                    workflow, request,
+                                                    options['repeat'])
+                new_queries, new_ms = self._measure(_serialize_snapshot,
+                                                    workflow, request,
+                                                    options['repeat'])
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{n_steps:5d}  {old_queries:16d}  {old_ms:11.1f}  '
+                f'{new_queries:16d}  {new_ms:11.1f}'
+            )
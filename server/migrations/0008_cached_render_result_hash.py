@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-05-14 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0007_auto_20190508_1752'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_hash',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_input_hash',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
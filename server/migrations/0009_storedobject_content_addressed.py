@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0008_cached_render_result_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storedobject',
+            name='hash',
+            field=models.CharField(max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='storedobject',
+            name='key',
+            field=models.CharField(blank=True, db_index=True, default='',
+                                   max_length=255),
+        ),
+    ]
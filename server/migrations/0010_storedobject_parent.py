@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0009_storedobject_content_addressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='parent',
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='children',
+                to='server.StoredObject'
+            ),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='depth',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0010_storedobject_parent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflow',
+            name='n_viewers',
+            field=models.IntegerField(default=0),
+        ),
+    ]
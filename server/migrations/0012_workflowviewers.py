@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0011_workflow_n_viewers'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='workflow',
+            name='n_viewers',
+        ),
+        migrations.CreateModel(
+            name='WorkflowViewers',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('process_id', models.CharField(max_length=100)),
+                ('n_viewers', models.IntegerField()),
+                ('updated_at', models.DateTimeField()),
+                ('workflow', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+',
+                    to='server.Workflow'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='workflowviewers',
+            unique_together=set([('process_id', 'workflow')]),
+        ),
+    ]
@@ -1,14 +1,19 @@
 from contextlib import closing, contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import errno
+import fcntl
 import hmac
 import hashlib
 import io
+import json
 import logging
 import math
+import os
 import pathlib
+import shutil
 import tempfile
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Optional
 import urllib3
 from django.conf import settings
 
@@ -146,8 +151,20 @@ def list_file_keys(bucket: str, prefix: str):
     return [o['Key'] for o in response['Contents']]
 
 
-def fput_file(bucket: str, key: str, path: pathlib.Path) -> None:
-    transfer.upload_file(str(path.resolve()), bucket, key)
+def fput_file(bucket: str, key: str, path: pathlib.Path,
+              metadata: Optional[Dict[str, str]] = None) -> None:
+    """
+    Upload a file from the filesystem.
+
+    `metadata` becomes the object's user metadata: `stat()` returns it, and
+    `copy()` copies it.
+    """
+    if metadata:
+        extra_args = {'Metadata': metadata}
+    else:
+        extra_args = None
+    transfer.upload_file(str(path.resolve()), bucket, key,
+                         extra_args=extra_args)
 
 
 def put_bytes(bucket: str, key: str, body: bytes) -> None:
@@ -171,12 +188,15 @@ def exists(bucket: str, key: str) -> bool:
 @dataclass
 class Stat:
     size: int
+    etag: str = ''
+    metadata: Dict[str, str] = field(default_factory=dict)
 
 
 def stat(bucket: str, key: str) -> Stat:
     """Return an object's metadata or raise an error."""
     response = client.head_object(Bucket=bucket, Key=key)
-    return Stat(response['ContentLength'])
+    return Stat(response['ContentLength'], response['ETag'].strip('"'),
+                response.get('Metadata', {}))
 
 
 def fput_directory_contents(bucket: str, prefix: str,
@@ -282,7 +302,29 @@ def temporarily_download(bucket: str, key: str) -> None:
             print(str(path))  # a path on the filesystem
             path.read_bytes()  # returns file contents
         # when you exit the block, the pathlib.Path is deleted
+
+    Files in immutable buckets come from the local cache (see
+    `open_cached()`): the path is a hard link to the cached file, so we
+    don't download it again and it stays readable even if the cache is
+    trimmed. Don't write to it.
     """
+    if bucket in _CacheableBuckets:
+        file_stat = cached_stat(bucket, key)
+        cache_path = _cache_path(file_stat)
+        with open_cached(bucket, key, file_stat) as f:
+            with tempfile.TemporaryDirectory(dir=str(cache_path.parent),
+                                             prefix='.link-') as td:
+                path = pathlib.Path(td) / 'file'
+                try:
+                    os.link(str(cache_path), str(path))
+                except FileNotFoundError:
+                    # Another process trimmed the cache file. `f` is still
+                    # readable; copy it.
+                    with path.open('wb') as out:
+                        shutil.copyfileobj(f, out)
+                yield path
+        return
+
     with tempfile.NamedTemporaryFile(prefix='minio_download') as tf:
         try:
             transfer.download_file(bucket, key, tf.name)
@@ -299,6 +341,258 @@ def temporarily_download(bucket: str, key: str) -> None:
         yield pathlib.Path(tf.name)
 
 
+# --- Local disk cache ---
+#
+# Objects in these buckets are never modified after they're written, and a key
+# never names different contents: stored-object keys are content hashes, and
+# cached-render-result keys include the result's hash. So once we've cached a
+# key's file, we read it without asking S3 for its metadata.
+_CacheableBuckets = frozenset([
+    CachedRenderResultsBucket,
+    StoredObjectsBucket,
+    ExternalModulesBucket,
+])
+_CacheLockStripes = 64
+# A process that dies mid-download leaves its '.download-*' file (or a
+# temporarily_download() '.link-*' directory) behind. Delete those once
+# they're this old: no live reader keeps one that long. We delete '.key-*'
+# index files this old, too, so the index doesn't grow forever; that costs one
+# stat() per key per day.
+_CacheStaleTempSeconds = 24 * 60 * 60
+
+
+def _stat_or_file_not_found(bucket: str, key: str) -> Stat:
+    try:
+        return stat(bucket, key)
+    except error.ClientError as err:
+        if err.response.get('Error', {}).get('Code') == '404':
+            raise FileNotFoundError(errno.ENOENT, f'No file at {bucket}/{key}')
+        raise
+
+
+def _key_index_path(bucket: str, key: str) -> pathlib.Path:
+    """
+    Name the file in which we store `bucket`/`key`'s `Stat`.
+
+    The `Stat` tells us which cache file holds the key's contents (see
+    `_cache_path()`), and its metadata tells callers how to read it.
+    """
+    name = hashlib.sha1(f'{bucket}/{key}'.encode('utf-8')).hexdigest()
+    return _cache_dir() / f'.key-{name}'
+
+
+def _read_key_index(bucket: str, key: str) -> Optional[Stat]:
+    try:
+        with _key_index_path(bucket, key).open('rb') as f:
+            return Stat(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None  # never indexed, expired, or written by a crashed process
+
+
+def _write_key_index(bucket: str, key: str, file_stat: Stat) -> None:
+    """Remember that `bucket`/`key` is cached (if we haven't already)."""
+    if _read_key_index(bucket, key) == file_stat:
+        return
+
+    path = _key_index_path(bucket, key)
+    with tempfile.NamedTemporaryFile('w', dir=str(path.parent),
+                                     prefix='.download-',
+                                     delete=False) as tf:
+        json.dump({'size': file_stat.size, 'etag': file_stat.etag,
+                   'metadata': file_stat.metadata}, tf)
+    os.replace(tf.name, str(path))
+
+
+def cached_stat(bucket: str, key: str) -> Stat:
+    """
+    Return an object's metadata or raise FileNotFoundError.
+
+    In immutable buckets, if the object is in the local cache (see
+    `open_cached()`), we don't make a request.
+    """
+    if bucket in _CacheableBuckets:
+        file_stat = _read_key_index(bucket, key)
+        if file_stat is not None and _cache_path(file_stat).exists():
+            return file_stat
+    return _stat_or_file_not_found(bucket, key)
+
+
+def _cache_dir() -> pathlib.Path:
+    path = pathlib.Path(settings.MINIO_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _cache_path(file_stat: Stat) -> pathlib.Path:
+    """
+    Name a cache file after its contents.
+
+    The ETag is a hash of the object's contents, so copies of an object (such
+    as a duplicated StoredObject) share a cache file.
+    """
+    name = hashlib.sha1(
+        f'{file_stat.etag}/{file_stat.size}'.encode('utf-8')
+    ).hexdigest()
+    return _cache_dir() / name
+
+
+@contextmanager
+def _cache_lock(path: pathlib.Path):
+    """
+    Hold an exclusive lock on `path`, shared by all processes on this machine.
+
+    We lock one of a fixed set of lock files, so we never need to delete a
+    lock file (which would be a race).
+    """
+    stripe = int(path.name[:8], 16) % _CacheLockStripes
+    with open(str(path.parent / f'.lock-{stripe}'), 'wb') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _cache_open(path: pathlib.Path) -> Optional[io.BufferedReader]:
+    """Open a cache file and mark it recently used; or return None."""
+    try:
+        f = path.open('rb')
+    except FileNotFoundError:
+        return None  # not downloaded yet, or trimmed by another process
+    try:
+        os.utime(str(path))  # LRU: mtime is last-use time
+    except FileNotFoundError:
+        pass  # trimmed by another process; `f` is still valid
+    return f
+
+
+def _cache_insert(tmp_path: pathlib.Path, path: pathlib.Path) -> None:
+    """
+    Hard-link a complete file into the cache.
+
+    The caller still owns (and must delete) `tmp_path`. Readers never see a
+    partially-written cache file.
+    """
+    try:
+        os.link(str(tmp_path), str(path))
+    except FileExistsError:
+        pass  # another process beat us to it; its file is identical
+    except FileNotFoundError:
+        return  # _cache_trim() deleted `tmp_path` as stale; don't cache it
+    _cache_trim(path.parent)
+
+
+def _cache_trim(cache_dir: pathlib.Path) -> None:
+    """
+    Delete least-recently-used cache files until the cache fits its limit.
+
+    Also delete temporary files that crashed processes left behind.
+
+    Other processes may be reading the files we delete. That's fine: on
+    POSIX, open (and memory-mapped) files stay readable after unlink.
+    """
+    with open(str(cache_dir / '.trim-lock'), 'wb') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # another process is trimming right now
+
+        stale_time = time.time() - _CacheStaleTempSeconds
+        entries = []
+        for path in cache_dir.iterdir():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if (
+                path.name.startswith('.download-')
+                or path.name.startswith('.key-')
+            ):
+                if st.st_mtime < stale_time:
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+            elif path.name.startswith('.link-'):
+                if st.st_mtime < stale_time:
+                    shutil.rmtree(str(path), ignore_errors=True)
+            elif not path.name.startswith('.'):  # skip lock files
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= settings.MINIO_CACHE_MAX_BYTES:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def open_cached(bucket: str, key: str,
+                file_stat: Optional[Stat] = None) -> io.BufferedReader:
+    """
+    Open a local, read-only copy of a file on S3, downloading it if needed.
+
+    Copies live in `settings.MINIO_CACHE_DIR`, named after the object's
+    contents, and every process on this machine shares them: concurrent
+    readers can share pages by memory-mapping the same file. When the cache
+    grows beyond `settings.MINIO_CACHE_MAX_BYTES`, we delete the
+    least-recently-used files. Never write to the returned file.
+
+    Only use this on objects that are never modified after they're written,
+    in buckets where a key never names different contents.
+
+    Pass `file_stat` if you already called `cached_stat()`, to skip a lookup.
+    If the file is cached, we make no request at all.
+
+    Raise FileNotFoundError if the key is not on S3.
+    """
+    if file_stat is None:
+        file_stat = cached_stat(bucket, key)
+
+    while True:
+        path = _cache_path(file_stat)
+        f = _cache_open(path)
+        if f is not None:
+            _write_key_index(bucket, key, file_stat)
+            return f
+
+        # Lock, so concurrent readers wait for one download instead of
+        # starting their own.
+        with _cache_lock(path):
+            f = _cache_open(path)
+            if f is not None:
+                # another process downloaded it while we waited
+                _write_key_index(bucket, key, file_stat)
+                return f
+
+            with tempfile.NamedTemporaryFile(dir=str(path.parent),
+                                             prefix='.download-') as tf:
+                try:
+                    transfer.download_file(bucket, key, tf.name)
+                except error.ClientError as err:
+                    if err.response.get('Error', {}).get('Code') == '404':
+                        raise FileNotFoundError(errno.ENOENT,
+                                                f'No file at {bucket}/{key}')
+                    raise
+
+                # s3transfer doesn't support IfMatch. Make sure we didn't
+                # download a newer version than `file_stat` describes.
+                new_stat = _stat_or_file_not_found(bucket, key)
+                if new_stat.etag == file_stat.etag:
+                    f = open(tf.name, 'rb')
+                    _cache_insert(pathlib.Path(tf.name), path)
+                    _write_key_index(bucket, key, file_stat)
+                    return f
+
+        # The file changed while we downloaded it. We've deleted our download
+        # and released our lock: the new version's cache file may use the
+        # same lock file.
+        file_stat = new_stat
+
+
 class RandomReadMinioFile(io.RawIOBase):
     """
     A file on S3, cached in a tempfile.
@@ -312,6 +606,11 @@ class RandomReadMinioFile(io.RawIOBase):
     If you intend to read the entire file, `FullReadMinioFile` will be more
     efficient.
 
+    In immutable buckets, we read from the local cache (see `open_cached()`)
+    if the file is there. Otherwise, if we end up fetching every block, we add
+    the file to the cache on close(). Pass `file_stat` if you already called
+    `stat()`, to skip a request.
+
     Usage:
 
         with RandomReadMinioFile(bucket, key) as file:
@@ -319,14 +618,38 @@ class RandomReadMinioFile(io.RawIOBase):
             file.seek(-5, io.SEEK_END)
             file.read(5)  # read from end
     """
-    def __init__(self, bucket: str, key: str, block_size=5*1024*1024):
+    def __init__(self, bucket: str, key: str, block_size=5*1024*1024,
+                 file_stat: Optional[Stat] = None):
         self.bucket = bucket
         self.key = key
         self.block_size = block_size
+        self.file_stat = None  # if set, we'll add our tempfile to the cache
+
+        if bucket in _CacheableBuckets:
+            # Immutable file: read from the local cache if we can; and
+            # fetch with IfMatch, so we can add it to the cache later.
+            if file_stat is None:
+                file_stat = cached_stat(bucket, key)
+            cached_file = _cache_open(_cache_path(file_stat))
+            if cached_file is not None:
+                _write_key_index(bucket, key, file_stat)
+                self.tempfile = cached_file
+                self.size = file_stat.size
+                nblocks = math.ceil(self.size / self.block_size)
+                self.fetched_blocks = [True] * nblocks
+                return
+            self.file_stat = file_stat
+            self.tempfile = tempfile.NamedTemporaryFile(
+                dir=str(_cache_dir()),
+                prefix='.download-'
+            )
+        else:
+            self.tempfile = tempfile.TemporaryFile(
+                prefix='RandomReadMinioFile'
+            )
 
         response = self._request_block(0)
         self.size = int(response['ContentRange'].split('/')[1])
-        self.tempfile = tempfile.TemporaryFile(prefix='RandomReadMinioFile')
         self.tempfile.truncate(self.size)  # allocate disk space
         nblocks = math.ceil(self.size / self.block_size)
         self.fetched_blocks = [False] * nblocks
@@ -350,7 +673,20 @@ class RandomReadMinioFile(io.RawIOBase):
 
     # override io.IOBase
     def close(self):
-        self.tempfile.close()
+        if (
+            self.file_stat is not None
+            and all(self.fetched_blocks)
+            and not self.closed
+        ):
+            # We downloaded the whole file. Cache it.
+            self.tempfile.flush()
+            _cache_insert(pathlib.Path(self.tempfile.name),
+                          _cache_path(self.file_stat))
+            _write_key_index(self.bucket, self.key, self.file_stat)
+        try:
+            self.tempfile.close()
+        except FileNotFoundError:
+            pass  # _cache_trim() deleted our (stale) '.download-*' file
         super().close()
 
     # override io.IOBase
@@ -389,9 +725,14 @@ class RandomReadMinioFile(io.RawIOBase):
         """
         offset = block_number * self.block_size
         http_range = f'bytes={offset}-{offset + self.block_size - 1}'
+        if self.file_stat is not None:
+            # Don't mix blocks from different versions of the file
+            kwargs = {'IfMatch': self.file_stat.etag}
+        else:
+            kwargs = {}
         try:
             return get_object_with_data(self.bucket, self.key,
-                                        Range=http_range)
+                                        Range=http_range, **kwargs)
         except error.NoSuchKey:
             raise FileNotFoundError(
                 errno.ENOENT,
@@ -422,6 +763,10 @@ class FullReadMinioFile(io.RawIOBase):
     If you intend to seek() and run logic that does not depend on the entire
     file contents, `RandomReadMinioFile` might suit your needs better.
 
+    In immutable buckets, `.tempfile` is a file in the local cache (see
+    `open_cached()`), so repeat reads don't download anything. Pass
+    `file_stat` if you already called `stat()`, to skip a request.
+
     Usage:
 
         with FullReadMinioFile(bucket, key) as file:
@@ -429,10 +774,15 @@ class FullReadMinioFile(io.RawIOBase):
             file.seek(-5, io.SEEK_END)
             file.read(5)  # read from end
     """
-    def __init__(self, bucket: str, key: str):
+    def __init__(self, bucket: str, key: str,
+                 file_stat: Optional[Stat] = None):
         self.bucket = bucket
         self.key = key
 
+        if bucket in _CacheableBuckets:
+            self.tempfile = open_cached(bucket, key, file_stat)
+            return
+
         with temporarily_download(bucket, key) as path:
             # POSIX-specific: reopen the file, then delete it from the
             # filesystem (by leaving the context manager).
@@ -1,8 +1,13 @@
+from dataclasses import dataclass
+import hashlib
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
 import pandas as pd
 from cjworkbench.types import ProcessResult, QuickFix, TableShape
 from server import minio, parquet
+from server.column_stats import ColumnStats, compute_table_stats
+from server.pandas_util import fingerprint_table
 
 
 WfModuleFields = [
@@ -13,9 +18,21 @@ WfModuleFields = [
     'cached_render_result_columns',
     'cached_render_result_status',
     'cached_render_result_nrows',
+    'cached_render_result_hash',
+    'cached_render_result_input_hash',
 ]
 
 
+RowGroupSize = 20000
+"""
+Number of rows per Parquet row group (or per text chunk, in 'mmap' format).
+
+Table views read a few hundred rows at a time; smaller row groups mean less
+data to download and decode per request. Larger row groups mean better
+compression and less metadata.
+"""
+
+
 def parquet_prefix(workflow_id: int, wf_module_id: int) -> str:
     """
     "Directory" name in the `minio.CachedRenderResultsBucket` bucket.
@@ -26,6 +43,52 @@ def parquet_prefix(workflow_id: int, wf_module_id: int) -> str:
     return 'wf-%d/wfm-%d/' % (workflow_id, wf_module_id)
 
 
+def hash_process_result(result: ProcessResult) -> str:
+    """
+    Build a hex digest of everything a ProcessResult would present to users.
+
+    Two results with the same hash are indistinguishable: same table, same
+    error, same JSON, same quick fixes and same column formats. We store this
+    alongside a cached result so we can tell whether a re-render changed
+    anything.
+    """
+    h = hashlib.sha1()
+    h.update(fingerprint_table(result.dataframe).encode('ascii'))
+    h.update(json.dumps({
+        'error': result.error,
+        'json': result.json,
+        'quick_fixes': [qf.to_dict() for qf in result.quick_fixes],
+        'columns': [c.to_dict() for c in result.columns],
+    }, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class RenderResultDigest:
+    """
+    What we store about a ProcessResult, besides the result itself.
+
+    Building this reads every value of the table, which can take seconds. So
+    build it before locking the workflow, and pass it to
+    `WfModule.cache_render_result()`.
+    """
+
+    hash: str
+    """`hash_process_result(result)`."""
+
+    column_stats_json: bytes
+    """JSON-encoded `ColumnStats` of each column, keyed by column name."""
+
+    @classmethod
+    def of(cls, result: ProcessResult) -> 'RenderResultDigest':
+        column_stats = compute_table_stats(result.dataframe, result.columns)
+        column_stats_json = json.dumps(dict(
+            (name, stats.to_dict()) for name, stats in column_stats.items()
+        ))
+        return cls(hash_process_result(result),
+                   column_stats_json.encode('utf-8'))
+
+
 class CachedRenderResult:
     """
     Result of a module render() call.
@@ -45,7 +108,8 @@ class CachedRenderResult:
 
     def __init__(self, workflow_id: int, wf_module_id: int, delta_id: int,
                  status: str, error: str, json: Optional[Dict[str, Any]],
-                 quick_fixes: List[QuickFix], table_shape: TableShape):
+                 quick_fixes: List[QuickFix], table_shape: TableShape,
+                 hash: Optional[str] = None, input_hash: Optional[str] = None):
         self.workflow_id = workflow_id
         self.wf_module_id = wf_module_id
         self.delta_id = delta_id
@@ -54,6 +118,8 @@ class CachedRenderResult:
         self.json = json
         self.quick_fixes = quick_fixes
         self.table_shape = table_shape
+        self.hash = hash
+        self.input_hash = input_hash
 
     @property
     def columns(self):
@@ -63,16 +129,51 @@ class CachedRenderResult:
     def nrows(self):
         return self.table_shape.nrows
 
+    @property
+    def column_names(self):
+        return [c.name for c in self.columns]
+
     @property
     def parquet_key(self):
         """
         Path to a file, used by the `parquet` module.
+
+        The name includes our `hash`, so re-rendering at the same delta never
+        writes different contents to the same key. (`minio.open_cached()`
+        relies on that.) Results cached before we stored hashes have none.
+        """
+        prefix = parquet_prefix(self.workflow_id, self.wf_module_id)
+        if self.hash:
+            return '%sdelta-%d-%s.dat' % (prefix, self.delta_id, self.hash)
+        else:
+            return '%sdelta-%d.dat' % (prefix, self.delta_id)
+
+    @property
+    def column_stats_key(self):
         """
-        return '%sdelta-%d.dat' % (
+        Path to a JSON file of `ColumnStats`, alongside the table file.
+        """
+        return '%sdelta-%d-column-stats.json' % (
             parquet_prefix(self.workflow_id, self.wf_module_id),
             self.delta_id
         )
 
+    def read_column_stats(self) -> Optional[Dict[str, ColumnStats]]:
+        """
+        Read `ColumnStats` for each column (costing a network request).
+
+        Return None if the stats file is missing: maybe we rendered before we
+        computed stats, or maybe a render deleted it. Callers should fall back
+        to reading the table.
+        """
+        try:
+            data = minio.get_object_with_data(minio.CachedRenderResultsBucket,
+                                              self.column_stats_key)['Body']
+        except minio.error.NoSuchKey:
+            return None
+        return dict((name, ColumnStats.from_dict(d))
+                    for name, d in json.loads(data).items())
+
     def read_dataframe(self, *args, **kwargs):
         """
         Read Parquet file as a dataframe (costing network requests).
@@ -102,6 +203,96 @@ class CachedRenderResult:
             # Treat bugs as "empty file"
             return pd.DataFrame()
 
+    def read_column(self, column_name: str) -> pd.Series:
+        """
+        Read one column (costing network requests).
+
+        This is slow. Prefer `read_column_stats()` when it suffices.
+
+        Raise FileNotFoundError if the file is missing.
+        """
+        # Only load the one column
+        dataframe = self.read_dataframe([column_name])
+        try:
+            return dataframe[column_name]
+        except KeyError:
+            # read_dataframe() returns empty DataFrame instead of throwing, as
+            # it maybe ought to.
+            raise FileNotFoundError(self.parquet_key)
+
+    def read_dataframe_row_range(self, columns: Optional[List[str]],
+                                 start_row: int,
+                                 end_row: int) -> pd.DataFrame:
+        """
+        Read rows `start_row:end_row` of the Parquet file as a dataframe.
+
+        This costs network requests -- but only for the Parquet row groups that
+        overlap the requested rows. Request latency doesn't depend on table
+        length.
+
+        Pass `columns=None` to read all columns. Like `read_dataframe()`, return
+        an empty DataFrame on error -- except raise FileNotFoundError if the
+        file is missing, so callers can tell a re-render deleted it.
+        """
+        try:
+            return parquet.read_row_range(
+                minio.CachedRenderResultsBucket,
+                self.parquet_key,
+                columns,
+                start_row,
+                end_row
+            )
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # File is empty. See read_dataframe().
+            return pd.DataFrame()
+        except parquet.FastparquetCouldNotHandleFile:
+            # Treat bugs as "empty file"
+            return pd.DataFrame()
+
+    def read_dataframe_rows(self, columns: Optional[List[str]],
+                            rows: np.array) -> pd.DataFrame:
+        """
+        Read rows `rows` (in that order) of the Parquet file as a dataframe.
+
+        This costs network requests for the Parquet row groups that hold
+        `rows`. Error handling is like `read_dataframe_row_range()`'s.
+        """
+        try:
+            return parquet.read_rows(
+                minio.CachedRenderResultsBucket,
+                self.parquet_key,
+                columns,
+                rows
+            )
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # File is empty. See read_dataframe().
+            return pd.DataFrame()
+        except parquet.FastparquetCouldNotHandleFile:
+            # Treat bugs as "empty file"
+            return pd.DataFrame()
+
+    def iter_dataframe_chunks(
+        self,
+        columns: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield the table (or just `columns`) in chunks of about `RowGroupSize`
+        rows.
+
+        The first `next()` downloads the file (costing network requests); the
+        rest read from local disk. This reads the table without holding it
+        all in memory, and without holding a lock once started.
+
+        Unlike `read_dataframe()`, the first `next()` may raise OSError (e.g.,
+        FileNotFoundError) or FastparquetCouldNotHandleFile.
+        """
+        return parquet.iter_chunks(minio.CachedRenderResultsBucket,
+                                   self.parquet_key, RowGroupSize, columns)
+
     @property
     def result(self):
         """
@@ -185,7 +376,11 @@ class CachedRenderResult:
                                  wf_module_id=wf_module.id, delta_id=delta_id,
                                  status=status, error=error, json=json_dict,
                                  quick_fixes=quick_fixes,
-                                 table_shape=TableShape(nrows, columns))
+                                 table_shape=TableShape(nrows, columns),
+                                 hash=wf_module.cached_render_result_hash,
+                                 input_hash=(
+                                     wf_module.cached_render_result_input_hash
+                                 ))
         # Keep in mind: ret.result has not been loaded yet. It might not exist
         # when we do try reading it.
         return ret
@@ -223,18 +418,34 @@ class CachedRenderResult:
         wf_module.cached_render_result_status = None
         wf_module.cached_render_result_columns = None
         wf_module.cached_render_result_nrows = None
+        wf_module.cached_render_result_hash = None
+        wf_module.cached_render_result_input_hash = None
 
         wf_module.save(update_fields=WfModuleFields)
 
     @staticmethod
     def assign_wf_module(wf_module: 'WfModule', delta_id: int,
-                         result: ProcessResult) -> 'CachedRenderResult':
+                         result: ProcessResult,
+                         input_hash: Optional[str] = None,
+                         digest: Optional[RenderResultDigest] = None
+                         ) -> 'CachedRenderResult':
         """
         Write `result` to `wf_module`'s fields and to disk.
+
+        `input_hash` identifies everything that went into producing `result`
+        (see `worker.execute.wf_module.build_render_input_hash()`). If it is
+        set, a later render with the same `input_hash` may reuse `result`
+        instead of calling `render()`.
+
+        `digest` must be `RenderResultDigest.of(result)`. If it is not set, we
+        build it here -- slowly.
         """
         assert delta_id == wf_module.last_relevant_delta_id
         assert result is not None
 
+        if digest is None:
+            digest = RenderResultDigest.of(result)
+
         json_bytes = json.dumps(result.json).encode('utf-8')
         quick_fixes = result.quick_fixes
 
@@ -246,14 +457,64 @@ class CachedRenderResult:
                                                       for qf in quick_fixes]
         wf_module.cached_render_result_columns = result.columns
         wf_module.cached_render_result_nrows = len(result.dataframe)
+        wf_module.cached_render_result_hash = digest.hash
+        wf_module.cached_render_result_input_hash = input_hash
 
         CachedRenderResult.delete_parquet_files_for_wf_module(wf_module)
 
         ret = CachedRenderResult.from_wf_module(wf_module)
         ret._result = result  # no need to read from disk
         parquet.write(minio.CachedRenderResultsBucket, ret.parquet_key,
-                      result.dataframe)
+                      result.dataframe, row_group_size=RowGroupSize)
+
+        minio.put_bytes(minio.CachedRenderResultsBucket, ret.column_stats_key,
+                        digest.column_stats_json)
 
         wf_module.save(update_fields=WfModuleFields)
 
         return ret
+
+    @staticmethod
+    def reassign_wf_module_delta_id(wf_module: 'WfModule',
+                                    delta_id: int) -> 'CachedRenderResult':
+        """
+        Mark `wf_module`'s (stale) cached result as fresh for `delta_id`.
+
+        Use this when we know a re-render would produce exactly the same
+        result. We never call `render()` and we never re-encode the Parquet
+        file: we copy it (and its column stats) to its new key on the S3
+        server, then delete the old one.
+
+        Since this alters data, be sure to call it within a lock.
+        """
+        assert delta_id == wf_module.last_relevant_delta_id
+
+        old_crr = CachedRenderResult.from_wf_module(wf_module)
+        assert old_crr is not None
+
+        wf_module.cached_render_result_delta_id = delta_id
+        ret = CachedRenderResult.from_wf_module(wf_module)
+
+        for old_key, key in [
+            (old_crr.parquet_key, ret.parquet_key),
+            (old_crr.column_stats_key, ret.column_stats_key),
+        ]:
+            try:
+                minio.copy(
+                    minio.CachedRenderResultsBucket,
+                    key,
+                    '%(Bucket)s/%(Key)s' % {
+                        'Bucket': minio.CachedRenderResultsBucket,
+                        'Key': old_key,
+                    }
+                )
+            except minio.error.NoSuchKey:
+                # DB and filesystem are out of sync. CachedRenderResult
+                # handles such cases gracefully: read_dataframe() returns an
+                # empty table and read_column_stats() returns None.
+                pass
+            minio.remove(minio.CachedRenderResultsBucket, old_key)
+
+        wf_module.save(update_fields=['cached_render_result_delta_id'])
+
+        return ret
@@ -87,6 +87,7 @@ class Delta(PolymorphicModel):
             'name': workflow.name,
             'public': workflow.public,
             'last_update': workflow.last_update().isoformat(),
+            'last_delta_id': workflow.last_delta_id,
         }
 
     def load_ws_data(self):
@@ -1,16 +1,71 @@
-import uuid
-from django.db import models
-from django.db.models.signals import pre_delete
+import hashlib
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 import pandas as pd
-from server.pandas_util import hash_table
+from server.pandas_util import hash_table, table_digest
 from server import minio, parquet
 
 
-def _build_key(workflow_id: int, wf_module_id: int) -> str:
-    """Build a helpful S3 key."""
-    return f'{workflow_id}/{wf_module_id}/{uuid.uuid1()}.dat'
+def _build_key(hash: str) -> str:
+    """
+    Build an S3 key from a table's `table_digest()`.
+
+    Tables are content-addressed: every StoredObject with the same data (in
+    any workflow) shares one file. We delete the file when we delete the last
+    StoredObject that refers to it.
+    """
+    return f'tables/{hash}.dat'
+
+
+def _is_legacy_hash(hash: str) -> bool:
+    """
+    True if `hash` came from `hash_table()`, before we used `table_digest()`.
+
+    `hash_table()` is order-insensitive and collides; a legacy hash can't
+    prove two tables are the same.
+    """
+    return len(hash) != 40
+
+
+def _lock_file(bucket: str, key: str) -> None:
+    """
+    Block until no other transaction is adding or removing references to
+    `bucket`/`key`; hold the lock until this transaction ends.
+
+    Call this within a transaction. We lock `(1, <32 bits of key hash>)`:
+    lock category 1 doesn't conflict with the render locks in
+    `worker.pg_locker` (category 0). Two keys may share a lock; that only
+    costs a bit of waiting.
+    """
+    digest = hashlib.sha1(f'{bucket}/{key}'.encode('utf-8')).digest()
+    lock_id = int.from_bytes(digest[:4], 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(1, %s)', [lock_id])
+
+
+def _delta_hash(parent_hash: str, delta_hash: str) -> str:
+    """
+    Build a `hash` for a delta segment atop a version with `parent_hash`.
+
+    This isn't `table_digest()` of the assembled table: computing that would
+    mean reading every segment. So a compacted version gets a new `hash`.
+    """
+    return hashlib.sha1(f'{parent_hash}+{delta_hash}'.encode('ascii')) \
+        .hexdigest()
+
+
+def _remove_file_if_unreferenced(bucket: str, key: str) -> None:
+    """
+    Delete `bucket`/`key` from S3 if no StoredObject refers to it.
+
+    Call this within a transaction.
+    """
+    _lock_file(bucket, key)
+    if not StoredObject.objects.filter(bucket=bucket, key=key).exists():
+        minio.remove(bucket, key)
 
 
 # StoredObject is our persistence layer.
@@ -23,11 +78,13 @@ class StoredObject(models.Model):
     # identification for file backing store
     bucket = models.CharField(max_length=255, null=False, blank=True,
                               default='')
-    key = models.CharField(max_length=255, null=False, blank=True, default='')
+    key = models.CharField(max_length=255, null=False, blank=True, default='',
+                           db_index=True)
     stored_at = models.DateTimeField(default=timezone.now)
 
-    # used only for stored tables
-    hash = models.CharField(max_length=32)
+    # used only for stored tables: `table_digest()` of the table (or, for
+    # tables stored before 2019-05, `hash_table()`)
+    hash = models.CharField(max_length=40)
     metadata = models.CharField(default=None, max_length=255, null=True)
     size = models.IntegerField(default=0)  # file size
 
@@ -35,47 +92,108 @@ class StoredObject(models.Model):
     # and delivered to the frontend
     read = models.BooleanField(default=False)
 
+    # For delta segments (see `create_delta()`): the version whose rows come
+    # after ours, and how many segments we'd read to assemble our table. The
+    # cron compacts long chains.
+    parent = models.ForeignKey('self', related_name='children', null=True,
+                               on_delete=models.CASCADE)
+    depth = models.IntegerField(default=0)
+
     @staticmethod
     def create_table(wf_module, table, metadata=None):
-        hash = hash_table(table)
+        hash = table_digest(table)
         return StoredObject.__create_table_internal(wf_module, table,
                                                     metadata, hash)
 
     # Create a new StoredObject if it's going to store different data than the
-    # previous one. Otherwise null Fast; checks hash without loading file
-    # contents
+    # previous one. Otherwise null. Fast: compares digests without loading
+    # file contents
     @staticmethod
     def create_table_if_different(wf_module, old_so, table, metadata=None):
         if old_so is None:
             return StoredObject.create_table(wf_module, table,
                                              metadata=metadata)
 
-        hash = hash_table(table)
-        if hash != old_so.hash:
-            old_table = old_so.get_table()
-            if not old_table.equals(table):
-                return StoredObject.__create_table_internal(wf_module, table,
-                                                            metadata, hash)
+        hash = table_digest(table)
+        if hash == old_so.hash:
+            return None
 
-        return None
+        if (
+            _is_legacy_hash(old_so.hash)
+            and hash_table(table) == old_so.hash
+            and old_so.get_table().equals(table)
+        ):
+            return None
+
+        return StoredObject.__create_table_internal(wf_module, table,
+                                                    metadata, hash)
 
     @staticmethod
-    def __create_table_internal(wf_module, table, metadata, hash):
-        # Write to minio bucket/key
-        bucket = minio.StoredObjectsBucket
-        key = _build_key(wf_module.workflow_id, wf_module.id)
-        size = parquet.write(bucket, key, table)
-
-        # Create the object that references the bucket/key
-        return wf_module.stored_objects.create(
-            metadata=metadata,
-            bucket=minio.StoredObjectsBucket,
-            key=key,
-            size=size,
-            hash=hash
+    def create_delta(wf_module, parent, table, metadata=None):
+        """
+        Create a version whose table is `table` followed by `parent`'s rows.
+
+        We only write `table` -- not the rows we already stored. That keeps
+        frequently-updated, accumulating fetches (like Twitter's) from
+        rewriting (and re-storing) their entire history on every update.
+        """
+        delta_hash = table_digest(table)
+        return StoredObject.__create_table_internal(
+            wf_module,
+            table,
+            metadata,
+            _delta_hash(parent.hash, delta_hash),
+            key=_build_key(delta_hash),
+            parent=parent,
+            depth=parent.depth + 1
         )
 
-    def get_table(self):
+    @staticmethod
+    def __create_table_internal(wf_module, table, metadata, hash, *,
+                                key=None, **kwargs):
+        bucket = minio.StoredObjectsBucket
+        if key is None:
+            key = _build_key(hash)
+
+        with transaction.atomic():
+            size = StoredObject.__write_file_if_new(bucket, key, table)
+
+            # Create the object that references the bucket/key
+            return wf_module.stored_objects.create(
+                metadata=metadata,
+                bucket=bucket,
+                key=key,
+                size=size,
+                hash=hash,
+                **kwargs
+            )
+
+    @staticmethod
+    def __write_file_if_new(bucket, key, table):
+        """
+        Write `table` to `bucket`/`key` and return its size.
+
+        Call this within a transaction, and reference the file before the
+        transaction ends. If another StoredObject has this table, share its
+        file.
+        """
+        _lock_file(bucket, key)
+        existing = StoredObject.objects \
+            .filter(bucket=bucket, key=key) \
+            .values_list('size', flat=True) \
+            .first()
+        if existing is None:
+            return parquet.write(bucket, key, table)
+        else:
+            return existing
+
+    def get_segment(self):
+        """
+        Read only the rows this version stored.
+
+        For a delta segment (see `create_delta()`), that's the rows its fetch
+        added. For any other version, it's the whole table.
+        """
         if not self.bucket or not self.key:
             # Old (obsolete) objects have no bucket/key, usually because
             # empty tables weren't being written.
@@ -86,30 +204,116 @@ class StoredObject(models.Model):
         except parquet.FastparquetCouldNotHandleFile:
             return pd.DataFrame()  # empty table
 
-    # make a deep copy for another WfModule
+    def get_table(self):
+        if self.parent_id is None:
+            return self.get_segment()
+
+        # Assemble our table from our segment and our ancestors'. Newest rows
+        # come first; stop reading once we've read enough rows to fill a
+        # table.
+        segments = []
+        nrows = 0
+        stored_object = self
+        while stored_object is not None \
+                and nrows < settings.MAX_ROWS_PER_TABLE:
+            segment = stored_object.get_segment()
+            segments.append(segment)
+            nrows += len(segment)
+            stored_object = stored_object.parent
+
+        # sort=False: use the newest segment's column order. Older segments
+        # may lack some of its columns (because the module changed).
+        table = pd.concat(segments, ignore_index=True, sort=False)
+        if len(table) > settings.MAX_ROWS_PER_TABLE:
+            table = table.iloc[:settings.MAX_ROWS_PER_TABLE]
+        return table
+
+    def compact(self) -> None:
+        """
+        Rewrite this delta-segment version as a single file.
+
+        Our table doesn't change, so readers needn't care. Our `hash` does
+        change: it becomes our table's `table_digest()`. Our ancestors stay
+        where they are, but we no longer depend on them.
+
+        We don't lock the workflow: reading segments and writing the table may
+        be slow, and nothing else edits an existing StoredObject's file.
+        """
+        if self.parent_id is None:
+            return
+
+        table = self.get_table()
+        hash = table_digest(table)
+        bucket = minio.StoredObjectsBucket
+        key = _build_key(hash)
+
+        with transaction.atomic():
+            size = StoredObject.__write_file_if_new(bucket, key, table)
+            n_updated = StoredObject.objects.filter(id=self.id).update(
+                bucket=bucket,
+                key=key,
+                hash=hash,
+                size=size,
+                parent=None,
+                depth=0
+            )
+            if n_updated == 0:
+                # We were deleted while we were reading
+                _remove_file_if_unreferenced(bucket, key)
+                return
+
+            if self.key and (self.bucket != bucket or self.key != key):
+                _remove_file_if_unreferenced(self.bucket, self.key)
+
+        self.bucket = bucket
+        self.key = key
+        self.hash = hash
+        self.size = size
+        self.parent = None
+        self.depth = 0
+
+    # make a copy for another WfModule. The copy shares our file.
     def duplicate(self, to_wf_module):
-        key = _build_key(to_wf_module.workflow_id, to_wf_module.id)
-        minio.copy(self.bucket, key, f'{self.bucket}/{self.key}')
-
-        return to_wf_module.stored_objects.create(
-            stored_at=self.stored_at,
-            hash=self.hash,
-            metadata=self.metadata,
-            bucket=self.bucket,
-            key=key,
-            size=self.size
-        )
+        if self.parent_id is not None:
+            # Our ancestors aren't being duplicated, so the copy can't share
+            # our segment. Give it a whole table.
+            table = self.get_table()
+            return StoredObject.__create_table_internal(
+                to_wf_module,
+                table,
+                self.metadata,
+                table_digest(table),
+                stored_at=self.stored_at
+            )
 
+        with transaction.atomic():
+            if self.bucket and self.key:
+                # Make sure nobody deletes the file while we add a reference
+                _lock_file(self.bucket, self.key)
 
-@receiver(pre_delete, sender=StoredObject)
-def _delete_from_s3_pre_delete(sender, instance, **kwargs):
+            return to_wf_module.stored_objects.create(
+                stored_at=self.stored_at,
+                hash=self.hash,
+                metadata=self.metadata,
+                bucket=self.bucket,
+                key=self.key,
+                size=self.size
+            )
+
+
+@receiver(post_delete, sender=StoredObject)
+def _delete_from_s3_post_delete(sender, instance, **kwargs):
     """
-    Delete file from S3, pre-delete.
+    Delete file from S3 if no other StoredObject refers to it.
+
+    We run within the delete's transaction, after the database DELETE. If S3
+    deletion fails, the transaction rolls back and the link remains in our
+    database -- that's how the user will know it isn't deleted.
 
-    Why pre-delete and not post-delete? Because our user expects the file to be
-    _gone_, completely, forever -- that's what "delete" means to the user. If
-    deletion fails, we need the link to remain in our database -- that's how
-    the user will know it isn't deleted.
+    Why post-delete and not pre-delete? Because when we delete many
+    StoredObjects at once (say, when deleting a workflow that has duplicated
+    steps), they may share a file. Only after all are deleted can we tell the
+    file is unused.
     """
     if instance.bucket and instance.key:
-        minio.remove(instance.bucket, instance.key)
+        _remove_file_if_unreferenced(instance.bucket, instance.key)
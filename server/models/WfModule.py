@@ -8,7 +8,7 @@ from .fields import ColumnsField
 from .Params import Params
 from .param_dtype import ParamDTypeDict
 from .param_spec import ParamSpec
-from .CachedRenderResult import CachedRenderResult
+from .CachedRenderResult import CachedRenderResult, RenderResultDigest
 from .module_version import ModuleVersion
 from .StoredObject import StoredObject
 from .Tab import Tab
@@ -114,6 +114,14 @@ class WfModule(models.Model):
     cached_render_result_quick_fixes = JSONField(blank=True, default=list)
     cached_render_result_columns = ColumnsField(null=True, blank=True)
     cached_render_result_nrows = models.IntegerField(null=True, blank=True)
+    # Hash of the cached ProcessResult (table, error, json, quick fixes and
+    # columns), so we can tell whether a re-render changed anything.
+    cached_render_result_hash = models.CharField(null=True, blank=True,
+                                                 max_length=40)
+    # Hash of everything that went into render(): input hash, params, module
+    # version and fetched data version. `None` means "never reuse".
+    cached_render_result_input_hash = models.CharField(null=True, blank=True,
+                                                       max_length=40)
 
     # TODO once we auto-compute stale module outputs, nix is_busy -- it will
     # be implied by the fact that the cached output revision is wrong.
@@ -201,15 +209,45 @@ class WfModule(models.Model):
                                                              metadata=metadata)
         return new_version.stored_at if new_version else None
 
-    def retrieve_fetched_table(self):
+    # Stores `table` as new rows atop the current version
+    # Note: does not switch to new version automatically
+    def store_fetched_delta(self, table, metadata=''):
+        if table.empty:
+            return None  # nothing changed
+
+        parent = StoredObject.objects.filter(
+            wf_module=self,
+            stored_at=self.stored_data_version
+        ).first()
+        if parent is None:
+            # There's no current version: `table` is the whole table
+            return self.store_fetched_table_if_different(table,
+                                                         metadata=metadata)
+
+        new_version = StoredObject.create_delta(self, parent, table,
+                                                metadata=metadata)
+        return new_version.stored_at
+
+    def retrieve_fetched_table(self, newest_segment=False):
+        """
+        Read the current fetched version's table, or None.
+
+        With `newest_segment=True`, read only the rows its fetch added (see
+        `StoredObject.get_segment()`).
+        """
         try:
-            return self.stored_objects.get(
+            stored_object = self.stored_objects.get(
                 stored_at=self.stored_data_version
-            ).get_table()
+            )
         except StoredObject.DoesNotExist:
             # Either self.stored_data_version is None or it has been deleted.
             return None
 
+        if newest_segment:
+            return stored_object.get_segment()
+        else:
+            return stored_object.get_table()
+
     def get_fetch_result(self) -> Optional[ProcessResult]:
         """Load the result of a Fetch, if there was one."""
         table = self.retrieve_fetched_table()
@@ -238,15 +276,19 @@ class WfModule(models.Model):
             return Params(ParamDTypeDict({}), {}, {})
 
         schema = self.module_version.param_schema
-        lm = (
-            # we don't import LoadedModule directly, because we'll mock it
-            # out in unit tests.
-            loaded_module.LoadedModule.for_module_version_sync(
-                self.module_version
+
+        def migrate(params):
+            lm = (
+                # we don't import LoadedModule directly, because we'll mock it
+                # out in unit tests.
+                loaded_module.LoadedModule.for_module_version_sync(
+                    self.module_version
+                )
             )
-        )
+            return lm.migrate_params(schema, params)
+
         # raises ValueError if there's a problem migrating, which indicates programmer error (probably module author)
-        values = lm.migrate_params(schema, self.params)
+        values = self.module_version.get_migrated_params(self.params, migrate)
 
         # "migrate" secrets: exactly the id_names specified in module_version
         # spec, with values maybe None
@@ -304,7 +346,7 @@ class WfModule(models.Model):
             new_wfm.cached_render_result_delta_id = \
                 new_wfm.last_relevant_delta_id
             for attr in ('status', 'error', 'json', 'quick_fixes', 'columns',
-                         'nrows'):
+                         'nrows', 'hash', 'input_hash'):
                 full_attr = f'cached_render_result_{attr}'
                 setattr(new_wfm, full_attr, getattr(self, full_attr))
 
@@ -312,24 +354,28 @@ class WfModule(models.Model):
 
             # Now new_wfm.cached_render_result will return a
             # CachedRenderResult, because all the DB values are set. It'll have
-            # a .parquet_key ... but there won't be a file there (because we
-            # never wrote it).
-            parquet_key = new_wfm.cached_render_result.parquet_key
-
-            try:
-                minio.copy(
-                    minio.CachedRenderResultsBucket,
-                    parquet_key,
-                    '%(Bucket)s/%(Key)s' % {
-                        'Bucket': minio.CachedRenderResultsBucket,
-                        'Key': cached_result.parquet_key,
-                    }
-                )
-            except minio.error.NoSuchKey:
-                # DB and filesystem are out of sync. CachedRenderResult handles
-                # such cases gracefully. So `new_result` will behave exactly
-                # like `cached_result`.
-                pass
+            # a .parquet_key and .column_stats_key ... but there won't be
+            # files there (because we never wrote them).
+            new_result = new_wfm.cached_render_result
+
+            for key, old_key in [
+                (new_result.parquet_key, cached_result.parquet_key),
+                (new_result.column_stats_key, cached_result.column_stats_key),
+            ]:
+                try:
+                    minio.copy(
+                        minio.CachedRenderResultsBucket,
+                        key,
+                        '%(Bucket)s/%(Key)s' % {
+                            'Bucket': minio.CachedRenderResultsBucket,
+                            'Key': old_key,
+                        }
+                    )
+                except minio.error.NoSuchKey:
+                    # DB and filesystem are out of sync. CachedRenderResult
+                    # handles such cases gracefully. So `new_result` will
+                    # behave exactly like `cached_result`.
+                    pass
         else:
             new_wfm.save()
 
@@ -375,11 +421,17 @@ class WfModule(models.Model):
             return None
         return result
 
-    def cache_render_result(self, delta_id: int,
-                            result: ProcessResult) -> CachedRenderResult:
+    def cache_render_result(self, delta_id: int, result: ProcessResult,
+                            input_hash: Optional[str] = None,
+                            digest: Optional[RenderResultDigest] = None
+                            ) -> CachedRenderResult:
         """
         Save the given ProcessResult for later viewing.
 
+        `input_hash`, if set, lets a later render reuse this result (see
+        `reuse_stale_cached_render_result()`). `digest`, if set, must be
+        `RenderResultDigest.of(result)`: build it before taking the lock.
+
         Raise AssertionError if `delta_id` is not what we expect.
 
         Since this alters data, be sure to call it within a lock:
@@ -391,7 +443,34 @@ class WfModule(models.Model):
         assert delta_id == self.last_relevant_delta_id
         assert result is not None
 
-        return CachedRenderResult.assign_wf_module(self, delta_id, result)
+        return CachedRenderResult.assign_wf_module(self, delta_id, result,
+                                                   input_hash, digest)
+
+    def reuse_stale_cached_render_result(
+        self,
+        delta_id: int,
+        input_hash: str
+    ) -> Optional[CachedRenderResult]:
+        """
+        Mark our stale cached result fresh, if it was rendered from `input_hash`.
+
+        Return the now-fresh CachedRenderResult, or `None` if there is no stale
+        result or it was rendered from different inputs (in which case the
+        caller must render).
+
+        Since this alters data, be sure to call it within a lock.
+        """
+        assert delta_id == self.last_relevant_delta_id
+
+        stale_crr = self.get_stale_cached_render_result()
+        if (
+            stale_crr is None
+            or stale_crr.input_hash is None
+            or stale_crr.input_hash != input_hash
+        ):
+            return None
+
+        return CachedRenderResult.reassign_wf_module_delta_id(self, delta_id)
 
     def clear_cached_render_result(self) -> None:
         """
@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from .AclEntry import AclEntry
 from .CachedRenderResult import CachedRenderResult
 from .workflow import Workflow
+from .workflow_viewers import WorkflowViewers
 from .WfModule import WfModule
 from .Tab import Tab
 from .Params import Params
@@ -18,6 +18,7 @@ class ChangeDataVersionCommand(ChangesWfModuleOutputs, Delta):
     old_version = models.DateTimeField('old_version', null=True)
     new_version = models.DateTimeField('new_version')
     wf_module_delta_ids = ChangesWfModuleOutputs.wf_module_delta_ids
+    wf_module_changed_fields = ('versions',)
 
     def forward_impl(self):
         self.wf_module.stored_data_version = self.new_version
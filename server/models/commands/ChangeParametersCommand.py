@@ -14,6 +14,7 @@ class ChangeParametersCommand(ChangesWfModuleOutputs, Delta):
     old_values = JSONField('old_values')  # _all_ params
     new_values = JSONField('new_values')  # only _changed_ params
     wf_module_delta_ids = ChangesWfModuleOutputs.wf_module_delta_ids
+    wf_module_changed_fields = ('params',)
 
     def forward_impl(self):
         self.wf_module.params = self.new_values
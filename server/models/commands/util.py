@@ -15,6 +15,7 @@ class ChangesWfModuleOutputs:
 
         class MyCommand(ChangesWfModuleOutputs, Delta):  # order matters!
             wf_module_delta_ids = ChangesWfModuleOutputs.wf_module_delta_ids
+            wf_module_changed_fields = ('params',)  # or None, meaning "all"
 
             # override
             @classmethod
@@ -40,6 +41,11 @@ class ChangesWfModuleOutputs:
                 self.backward_affected_delta_ids()
     """
 
+    # WfModuleSerializer fields that forward_impl() and backward_impl() change
+    # on `self.wf_module`, for websockets messages. `None` means, "send every
+    # field" -- for commands that make `self.wf_module` appear.
+    wf_module_changed_fields = None
+
     # List of (id, last_relevant_delta_id) for WfModules, pre-`forward()`.
     wf_module_delta_ids = ArrayField(
         ArrayField(
@@ -182,14 +188,19 @@ class ChangesWfModuleOutputs:
                 # When we did or undid this command, we removed the
                 # WfModule from the Workflow.
                 data['clearWfModuleIds'] = [self.wf_module_id]
-            else:
-                # Serialize _everything_, including params
-                #
-                # TODO consider serializing only what's changed, so when Alice
-                # changes 'has_header' it doesn't overwrite Bob's 'url' while
-                # he's editing it.
+            elif self.wf_module_changed_fields is None:
                 step_data = WfModuleSerializer(self.wf_module).data
                 data['updateWfModules'][str(self.wf_module_id)] = step_data
+            else:
+                # Serialize only what's changed, so when Alice changes 'notes'
+                # it doesn't overwrite Bob's 'params' while he's editing them.
+                step_data = WfModuleSerializer(
+                    self.wf_module,
+                    fields=self.wf_module_changed_fields
+                ).data
+                data['updateWfModules'] \
+                    .setdefault(str(self.wf_module_id), {}) \
+                    .update(step_data)
 
         return data
 
@@ -14,7 +14,8 @@ from typing import Any, Awaitable, Callable, Dict, Optional
 from django.contrib.auth.models import User
 import pandas as pd
 from cjworkbench.sync import database_sync_to_async
-from cjworkbench.types import ProcessResult, RenderColumn
+from cjworkbench.types import ProcessResult, RenderColumn, \
+        snapshot_column_buffers
 from . import module_loader
 from .module_version import ModuleVersion
 from .Params import Params
@@ -53,7 +54,7 @@ class DeletedModule:
         *,
         workflow_id: int,
         get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]],
-        get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]],
+        get_stored_dataframe: Callable[..., Awaitable[pd.DataFrame]],
         get_workflow_owner: Callable[[], Awaitable[User]]
     ) -> ProcessResult:
         logger.info('fetch() deleted module')
@@ -74,6 +75,16 @@ class LoadedModule:
         self.fetch_impl = fetch_impl
         self.migrate_params_impl = migrate_params_impl
 
+    def __reduce__(self):
+        """
+        Pickle as a name and version; unpickle by loading the module again.
+
+        `render_impl` may come from an external module, which pickle can't
+        find by name. (We pickle modules to render them in another process.)
+        """
+        return (_unpickle_loaded_module,
+                (self.module_id_name, self.version_sha1))
+
     def _wrap_exception(self, err) -> ProcessResult:
         """Coerce an Exception (must be on the stack) into a ProcessResult."""
         # Catch exceptions in the module render function, and return
@@ -120,6 +131,10 @@ class LoadedModule:
 
         table = input_result.dataframe
         input_columns = input_result.columns
+        # Snapshot before render(): columns render() doesn't replace needn't
+        # be validated again.
+        input_buffers = snapshot_column_buffers(table)
+        column_times = {}
 
         time1 = time.time()
 
@@ -130,7 +145,9 @@ class LoadedModule:
             out = self._wrap_exception(err)
 
         try:
-            out = ProcessResult.coerce(out, try_fallback_columns=input_columns)
+            out = ProcessResult.coerce(out, try_fallback_columns=input_columns,
+                                       input_buffers=input_buffers,
+                                       column_times=column_times)
         except ValueError as err:
             logger.exception('Exception coercing %s.render output',
                              self.module_id_name)
@@ -147,6 +164,13 @@ class LoadedModule:
         logger.info('%s rendered (%drows,%dcols)=>(%drows,%dcols) in %dms',
                     self.name, table.shape[0], table.shape[1],
                     shape[0], shape[1], int((time2 - time1) * 1000))
+        if column_times:
+            slowest = sorted(column_times.items(), key=lambda kv: -kv[1])[:5]
+            logger.info('%s output: validated %d columns in %dms (slowest: %s)',
+                        self.name, len(column_times),
+                        int(sum(column_times.values()) * 1000),
+                        ', '.join('%r %dms' % (column, int(seconds * 1000))
+                                  for column, seconds in slowest))
 
         return out
 
@@ -156,7 +180,7 @@ class LoadedModule:
         *,
         workflow_id: int,
         get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]],
-        get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]],
+        get_stored_dataframe: Callable[..., Awaitable[pd.DataFrame]],
         get_workflow_owner: Callable[[], Awaitable[User]]
     ) -> ProcessResult:
         """
@@ -318,6 +342,11 @@ class LoadedModule:
             module = load_external_module(module_id_name, version_sha1,
                                           module_version.last_update_time)
 
+        return cls._for_module(module_id_name, version_sha1, module)
+
+    @classmethod
+    def _for_module(cls, module_id_name: str, version_sha1: str,
+                    module: ModuleType) -> 'LoadedModule':
         render_impl = getattr(module, 'render', _default_render)
         fetch_impl = getattr(module, 'fetch', _default_fetch)
         migrate_params_impl = getattr(module, 'migrate_params', None)
@@ -327,6 +356,15 @@ class LoadedModule:
                    migrate_params_impl=migrate_params_impl)
 
 
+def _unpickle_loaded_module(module_id_name: str,
+                            version_sha1: str) -> LoadedModule:
+    if version_sha1 == 'internal':
+        module = InternalModules[module_id_name]
+    else:
+        module = _load_external_module_uncached(module_id_name, version_sha1)
+    return LoadedModule._for_module(module_id_name, version_sha1, module)
+
+
 def _is_basename_python_code(key: str) -> bool:
     """
     True iff the given filename is a module's Python code file.
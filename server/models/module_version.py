@@ -1,4 +1,8 @@
-from typing import Any, Dict, Optional
+import datetime
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
 from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -13,6 +17,70 @@ from .param_dtype import ParamDType
 from .param_spec import ParamSpec
 
 
+MaxMigratedParamsCacheBytes = 64 * 1024 * 1024
+"""Size of JSON-encoded migrate_params() results each process keeps."""
+
+
+class _MigratedParamsCache:
+    """
+    Thread-safe dict of JSON-encoded params, forgetting the oldest first.
+
+    We store JSON so each caller gets its own copy of the params: callers
+    may modify them. Every caller gets JSON-decoded params, whether or not
+    they were cached: tuples become lists, int dict keys become str.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = {}  # key => str; insertion order is age
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable,
+                     build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            blob = self._data.get(key)
+        if blob is not None:
+            return json.loads(blob)
+
+        value = build()  # may raise
+        blob = json.dumps(value)
+
+        with self._lock:
+            if key not in self._data and len(blob) <= self.max_bytes:
+                self._data[key] = blob
+                self._n_bytes += len(blob)
+                while self._n_bytes > self.max_bytes:
+                    oldest = next(iter(self._data))
+                    self._n_bytes -= len(self._data.pop(oldest))
+        return json.loads(blob)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._n_bytes = 0
+
+
+# Process-wide caches of values we compute from a ModuleVersion's spec, keyed
+# by `ModuleVersion.cache_key`. Dict operations are atomic; the worst a race
+# can do is compute a value twice.
+_param_fields_cache = {}
+_param_schema_cache = {}
+_migrated_params_cache = _MigratedParamsCache(MaxMigratedParamsCacheBytes)
+
+
+def clear_caches() -> None:
+    """
+    Forget cached param specs, schemas and migrated params.
+
+    Re-importing a module does this. (Other processes notice the re-import
+    because the module's `cache_key` changes.)
+    """
+    _param_fields_cache.clear()
+    _param_schema_cache.clear()
+    _migrated_params_cache.clear()
+
+
 def _django_validate_module_spec(spec: Any) -> None:
     try:
         validate_module_spec(spec)
@@ -140,8 +208,23 @@ class ModuleVersion(models.Model):
             }
         )
 
+        clear_caches()
+
         return module_version
 
+    @property
+    def cache_key(self) -> Optional[Tuple[str, str, datetime.datetime]]:
+        """
+        Key for process-wide caches of spec-derived values, or None.
+
+        Re-importing a module with the same `source_version_hash` changes its
+        `last_update_time`, so the key changes. Unsaved ModuleVersions (in
+        unit tests) have no `last_update_time`: we don't cache those.
+        """
+        if self.last_update_time is None:
+            return None
+        return (self.id_name, self.source_version_hash, self.last_update_time)
+
     @property
     def name(self):
         return self.spec['name']
@@ -184,24 +267,65 @@ class ModuleVersion(models.Model):
 
     @property
     def param_fields(self):
-        return [ParamSpec.from_dict(d) for d in self.spec['parameters']]
+        key = self.cache_key
+        try:
+            param_fields = _param_fields_cache[key]
+        except KeyError:
+            param_fields = [ParamSpec.from_dict(d)
+                            for d in self.spec['parameters']]
+            if key is not None:
+                _param_fields_cache[key] = param_fields
+        return list(param_fields)  # callers may modify the list
 
     # Returns a dict of DTypes for all parameters
     @property
     def param_schema(self):
+        key = self.cache_key
+        try:
+            return _param_schema_cache[key]
+        except KeyError:
+            pass
+
         if 'param_schema' in self.spec:
             # Module author wrote a schema in the YAML, to define storage of 'custom' parameters
             json_schema = self.spec['param_schema']
-            return ParamDType.parse({
+            schema = ParamDType.parse({
                 'type': 'dict',
                 'properties': json_schema
             })
         else:
             # Usual case: infer schema from module parameter types
             # Use of dict here means schema is not sensitive to parameter ordering, which is good
-            return ParamDType.Dict(dict((f.id_name, f.dtype)
-                                        for f in self.param_fields
-                                        if f.dtype is not None))
+            schema = ParamDType.Dict(dict((f.id_name, f.dtype)
+                                          for f in self.param_fields
+                                          if f.dtype is not None))
+
+        if key is not None:
+            _param_schema_cache[key] = schema
+        return schema
+
+    def get_migrated_params(
+        self,
+        params: Dict[str, Any],
+        migrate: Callable[[Dict[str, Any]], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Return `migrate(params)`, using a process-wide cache.
+
+        `migrate` must depend only on this ModuleVersion and `params`. It may
+        raise ValueError; we don't cache errors.
+        """
+        key = self.cache_key
+        if key is None:
+            return migrate(params)
+
+        params_hash = hashlib.sha1(
+            json.dumps(params, sort_keys=True).encode('utf-8')
+        ).digest()
+        return _migrated_params_cache.get_or_build(
+            (key, params_hash),
+            lambda: migrate(params)
+        )
 
     @property
     def default_params(self):
@@ -409,12 +409,21 @@ class Workflow(models.Model):
         return self.name + ' - id: ' + str(self.id)
 
     def are_all_render_results_fresh(self):
-        """Query whether all live WfModules are rendered."""
+        """
+        Query whether all live WfModules are rendered.
+
+        This is one query. It matches `wf_module.cached_render_result is None`
+        without loading each WfModule.
+        """
         from .WfModule import WfModule
-        for wf_module in WfModule.live_in_workflow(self):
-            if wf_module.cached_render_result is None:
-                return False
-        return True
+        stale = WfModule.live_in_workflow(self).filter(
+            models.Q(cached_render_result_delta_id__isnull=True)
+            | models.Q(cached_render_result_columns__isnull=True)
+            | ~models.Q(cached_render_result_delta_id=models.F(
+                'last_relevant_delta_id'
+            ))
+        )
+        return not stale.exists()
 
     def clear_deltas(self):
         """Become a single-Delta Workflow."""
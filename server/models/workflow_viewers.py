@@ -0,0 +1,62 @@
+import datetime
+from typing import Dict
+from django.db import models, transaction
+from django.utils import timezone
+from .workflow import Workflow
+
+
+class WorkflowViewers(models.Model):
+    """
+    Number of websockets one web process has open on a Workflow.
+
+    Each web process counts its viewers in memory and writes them here every
+    `HeartbeatInterval` seconds (see `heartbeat()`). A connect or disconnect
+    doesn't touch the database, and it never touches the Workflow row.
+
+    If a web process dies, its rows stop being refreshed. Readers ignore rows
+    older than `Expiry`, so its viewers stop counting a few minutes later. We
+    only use these counts to prioritize fetches.
+    """
+
+    class Meta:
+        unique_together = (('process_id', 'workflow'),)
+
+    HeartbeatInterval = 60  # seconds
+    """Seconds between a web process's writes."""
+
+    Expiry = datetime.timedelta(seconds=3 * HeartbeatInterval)
+    """Age at which a row no longer counts: its process must have died."""
+
+    process_id = models.CharField(max_length=100)
+    """Identifies the web process; unique per process start."""
+
+    workflow = models.ForeignKey(Workflow, related_name='+',
+                                 on_delete=models.CASCADE)
+
+    n_viewers = models.IntegerField()
+
+    updated_at = models.DateTimeField()
+
+    @classmethod
+    def heartbeat(cls, process_id: str, counts: Dict[int, int]) -> None:
+        """
+        Replace `process_id`'s rows with `counts` (workflow_id => n_viewers).
+
+        Also delete every process's expired rows. Skip workflows that have
+        been deleted.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            cls.objects.filter(
+                models.Q(process_id=process_id)
+                | models.Q(updated_at__lt=now - cls.Expiry)
+            ).delete()
+
+            workflow_ids = Workflow.objects \
+                .filter(id__in=[id for id, n in counts.items() if n > 0]) \
+                .values_list('id', flat=True)
+            cls.objects.bulk_create([
+                cls(process_id=process_id, workflow_id=workflow_id,
+                    n_viewers=counts[workflow_id], updated_at=now)
+                for workflow_id in workflow_ids
+            ])
@@ -31,7 +31,9 @@ Each module may define one or both (preferably one) of the following functions:
         # kwargs is optional and may include:
         # - workflow_id: int
         # - get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]]
-        # - get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]]
+        # - get_stored_dataframe: Callable[..., Awaitable[pd.DataFrame]]
+        #   (pass newest_segment=True to read only the rows the last
+        #   `ProcessResult(stored_delta=True)` added)
         # - get_workflow_owner: Callable[[], Awaitable[User]]
     ) -> ProcessResult:
 
@@ -1,5 +1,15 @@
+import ast
 import itertools
+import logging
+import operator
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
 from formulas import Parser
+from formulas.builder import AstBuilder
+from formulas.tokens.function import Function
+from formulas.tokens.operand import Number, Range, String
+from formulas.tokens.operator import Operator
 import pandas as pd
 import numpy as np
 from .utils import build_globals_for_eval
@@ -7,14 +17,253 @@ from server.sanitizedataframe import sanitize_series
 from django.utils.translation import gettext as _
 from .utils import autocast_series_dtype
 
+
+logger = logging.getLogger(__name__)
+
 # ---- Formula ----
 
 
-def python_formula(table, formula):
-    # spaces to underscores in column names
-    colnames = [x.replace(' ', '_') for x in table.columns]
+class _CannotVectorize(Exception):
+    """
+    The formula can't be evaluated over whole columns.
+
+    Either it uses syntax we don't vectorize, or vectorizing it would give a
+    different result than evaluating it row by row (e.g., division by zero).
+    """
+
+
+_VectorBinOps = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+# Python raises ZeroDivisionError; numpy returns inf/nan.
+_VectorDivisionOps = (ast.Div, ast.FloorDiv, ast.Mod)
+
+
+_VectorUnaryOps = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+_VectorCompareOps = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+# Python ints never overflow; int64 wraps. Python divides and compares ints
+# exactly; numpy converts big ints to float first, and rounds them. Below these
+# magnitudes, neither difference can show.
+_MaxSafeInt = 2 ** 62
+_MaxSafeIntAsFloat = 2 ** 53
+
+
+def _is_int(value: Any) -> bool:
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.dtype.kind in 'iu'
+    else:
+        return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_float(value: Any) -> bool:
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.dtype.kind == 'f'
+    else:
+        return isinstance(value, float)
+
+
+def _require_magnitude_below(value: Any, limit: int) -> None:
+    """Raise _CannotVectorize if any abs(value) >= limit."""
+    if isinstance(value, int):
+        if abs(value) >= limit:  # may be too big for float64
+            raise _CannotVectorize
+        return
+    with np.errstate(all='ignore'):
+        if np.any(np.abs(np.asarray(value, dtype=np.float64)) >= limit):
+            raise _CannotVectorize
+
+
+@dataclass(frozen=True)
+class _VectorContext:
+    columns: Dict[str, np.ndarray]
+    """Values of each column we can vectorize, by name."""
+
+    python_values: bool
+    """
+    True if the row loop sees Python int/float values; False for numpy.
+
+    The row loop evaluates the formula on each row of `table.values`. If every
+    column is numeric, that's a numeric array, and the row loop sees numpy
+    scalars: ints wrap on overflow and `1 / 0` is `inf`, as with our arrays.
+    Otherwise, it's an object array of Python values: ints never overflow and
+    `1 / 0` raises ZeroDivisionError. Then, we must check that our numpy
+    results are the ones Python would give.
+    """
 
-    code = compile(formula, '<string>', 'eval')
+
+def _check_python_binop(op_node: ast.AST, left: Any, right: Any) -> None:
+    """Raise _CannotVectorize if numpy and Python would disagree."""
+    if isinstance(op_node, _VectorDivisionOps) and np.any(right == 0):
+        raise _CannotVectorize  # Python raises ZeroDivisionError
+    if _is_int(left) and _is_int(right):
+        if isinstance(op_node, ast.Div):
+            _require_magnitude_below(left, _MaxSafeIntAsFloat)
+            _require_magnitude_below(right, _MaxSafeIntAsFloat)
+        else:
+            # Overflow check. Float math is approximate, but _MaxSafeInt
+            # leaves plenty of headroom below int64's limits.
+            with np.errstate(all='ignore'):
+                approximate = _VectorBinOps[type(op_node)](
+                    np.asarray(left, dtype=np.float64),
+                    np.asarray(right, dtype=np.float64)
+                )
+            _require_magnitude_below(approximate, _MaxSafeInt)
+
+
+def _check_python_compare(left: Any, right: Any) -> None:
+    """Raise _CannotVectorize if numpy would round an int Python wouldn't."""
+    if _is_int(left) and _is_float(right):
+        _require_magnitude_below(left, _MaxSafeIntAsFloat)
+    elif _is_float(left) and _is_int(right):
+        _require_magnitude_below(right, _MaxSafeIntAsFloat)
+
+
+def _eval_vectorized(node: ast.AST, context: _VectorContext) -> Any:
+    """
+    Evaluate `node` over entire numeric columns at once.
+
+    Only arithmetic, comparisons and `abs()` on int/float columns and number
+    literals are supported, and only where they give the same result on numpy
+    arrays as the row loop gives on each row's values (see `_VectorContext`).
+    Raise _CannotVectorize on anything else.
+    """
+    if isinstance(node, ast.Expression):
+        return _eval_vectorized(node.body, context)
+    elif isinstance(node, ast.Name):
+        try:
+            return context.columns[node.id]
+        except KeyError:
+            # A global (like `math`), a missing column or a non-numeric
+            # column: let the row loop handle it (and raise any error).
+            raise _CannotVectorize
+    elif isinstance(node, ast.Num):
+        if isinstance(node.n, bool) or not isinstance(node.n, (int, float)):
+            raise _CannotVectorize
+        if isinstance(node.n, int):
+            _require_magnitude_below(node.n, _MaxSafeInt)
+        return node.n
+    elif isinstance(node, ast.BinOp):
+        try:
+            op = _VectorBinOps[type(node.op)]
+        except KeyError:
+            raise _CannotVectorize  # e.g., `**`: hard to predict overflow
+        left = _eval_vectorized(node.left, context)
+        right = _eval_vectorized(node.right, context)
+        if context.python_values:
+            _check_python_binop(node.op, left, right)
+        elif (
+            isinstance(node.op, _VectorDivisionOps)
+            and not isinstance(left, np.ndarray)
+            and not isinstance(right, np.ndarray)
+            and right == 0
+        ):
+            raise _CannotVectorize  # `1 / 0`: let the row loop raise
+        result = op(left, right)  # Python math if both are literals
+        if _is_int(result) and not isinstance(result, np.ndarray):
+            _require_magnitude_below(result, _MaxSafeInt)  # e.g., 9e18 * 9
+        return result
+    elif isinstance(node, ast.UnaryOp):
+        try:
+            op = _VectorUnaryOps[type(node.op)]
+        except KeyError:
+            raise _CannotVectorize
+        operand = _eval_vectorized(node.operand, context)
+        if context.python_values and _is_int(operand):
+            _require_magnitude_below(operand, _MaxSafeInt)  # -(-2**63)
+        return op(operand)
+    elif isinstance(node, ast.Compare):
+        left = _eval_vectorized(node.left, context)
+        result = True
+        for op_node, right_node in zip(node.ops, node.comparators):
+            try:
+                op = _VectorCompareOps[type(op_node)]
+            except KeyError:
+                raise _CannotVectorize  # `in`, `is`
+            right = _eval_vectorized(right_node, context)
+            if context.python_values:
+                _check_python_compare(left, right)
+            result = result & op(left, right)
+            left = right
+        return result
+    elif (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == 'abs'
+        and node.func.id not in context.columns
+        and len(node.args) == 1
+        and not node.keywords
+    ):
+        operand = _eval_vectorized(node.args[0], context)
+        if context.python_values and _is_int(operand):
+            _require_magnitude_below(operand, _MaxSafeInt)  # abs(-2**63)
+        return abs(operand)
+    else:
+        raise _CannotVectorize
+
+
+def _python_formula_vectorized(table, colnames, tree) -> pd.Series:
+    """
+    Evaluate `tree` once, over whole columns; raise _CannotVectorize.
+    """
+    if not len(table):
+        raise _CannotVectorize  # row loop output has no dtype; mimic that
+
+    # Same dtype rules as the row loop's `table.values`: see _VectorContext.
+    dtypes = list(table.dtypes)
+    if all(dtype.kind in 'iuf' for dtype in dtypes):
+        row_dtype = np.result_type(*dtypes)  # e.g., int+float => float
+        python_values = False
+    else:
+        row_dtype = None
+        python_values = True
+
+    # Same precedence as `dict(zip(colnames, row))`: last duplicate wins.
+    columns = {}
+    for i, name in enumerate(colnames):
+        series = table.iloc[:, i]
+        # numpy arrays, not Series: pandas special-cases int division by zero
+        if row_dtype is not None:
+            columns[name] = series.values.astype(row_dtype)
+        elif series.dtype.kind in 'if':
+            columns[name] = series.values
+        else:
+            # Text, or uint64 (Python and numpy differ on negatives)
+            columns.pop(name, None)
+
+    with np.errstate(all='ignore'):
+        result = _eval_vectorized(tree, _VectorContext(columns, python_values))
+
+    if isinstance(result, np.ndarray):
+        result = pd.Series(result)
+    else:
+        # Expression of only literals, like `1 + 1`
+        result = pd.Series([result] * len(table))
+    if result.dtype == bool:
+        # The row loop outputs 'True'/'False' strings: do the same.
+        result = result.astype(object)
+    return result
+
+
+def _python_formula_row_by_row(table, colnames, code) -> pd.Series:
     custom_code_globals = build_globals_for_eval()
 
     # Much experimentation went into the form of this loop for good
@@ -24,6 +273,27 @@ def python_formula(table, formula):
     newcol = pd.Series(list(itertools.repeat(None, len(table))))
     for i, row in enumerate(table.values):
         newcol[i] = eval(code, custom_code_globals, dict(zip(colnames, row)))
+    return newcol
+
+
+def python_formula(table, formula):
+    # spaces to underscores in column names
+    colnames = [x.replace(' ', '_') for x in table.columns]
+
+    tree = ast.parse(formula, '<string>', 'eval')
+
+    start = time.time()
+    path = 'vectorized'
+    try:
+        try:
+            newcol = _python_formula_vectorized(table, colnames, tree)
+        except _CannotVectorize:
+            path = 'row-by-row'
+            code = compile(tree, '<string>', 'eval')
+            newcol = _python_formula_row_by_row(table, colnames, code)
+    finally:
+        logger.info('python_formula: %s evaluation of %d rows (%dms)', path,
+                    len(table), 1000 * (time.time() - start))
 
     newcol = autocast_series_dtype(sanitize_series(newcol))
 
@@ -89,7 +359,10 @@ def eval_excel_one_row(code, table):
     return val
 
 
-def eval_excel_all_rows(code, table):
+def _excel_all_rows_column_indices(code) -> List[List[int]]:
+    """
+    List column indices of each of `code`'s inputs; raise ValueError.
+    """
     col_idx = []
     for token, obj in code.inputs.items():
         # If the formula is valid but no object comes back it means the
@@ -112,6 +385,11 @@ def eval_excel_all_rows(code, table):
             col_last = rng['n2']
 
             col_idx.append(list(range(col_first - 1, col_last)))
+    return col_idx
+
+
+def eval_excel_all_rows(code, table):
+    col_idx = _excel_all_rows_column_indices(code)
 
     newcol = []
     for i, row in enumerate(table.values):
@@ -125,15 +403,452 @@ def eval_excel_all_rows(code, table):
     return pd.Series(newcol)
 
 
+# ---- Columnar Excel engine ----
+#
+# eval_excel_all_rows() calls the `formulas` function once per row. That's
+# slow: ~100us per row. For the most common functions and operators, we
+# evaluate the formula once, over entire columns, instead.
+#
+# The result must be exactly what the row loop would give -- including its
+# quirks (e.g., `A1*2` is always float; `SUM(A1)` of an int column is int).
+# Whenever we can't guarantee that -- Excel errors like #DIV/0!, empty cells,
+# text that might be parsed as numbers -- we raise _CannotVectorize and let
+# the row loop handle it.
+
+
+class _RecordingAstBuilder(AstBuilder):
+    """
+    AstBuilder that records tokens in Reverse Polish notation.
+
+    `formulas` only gives us a compiled, row-at-a-time function. We need the
+    parse tree; `self.rpn` gives it to us.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rpn = []
+
+    def append(self, token):
+        super().append(token)
+        self.rpn.append(token)
+
+
+class _RecordingParser(Parser):
+    ast_builder = _RecordingAstBuilder
+
+
+@dataclass(frozen=True)
+class _ExcelValue:
+    kind: str
+    """'int', 'float', 'bool' or 'text': the type each row's value has."""
+
+    value: Any
+    """Scalar (for literals) or np.ndarray with one value per row."""
+
+
+@dataclass(frozen=True)
+class _ExcelRange:
+    values: List[_ExcelValue]
+    """One _ExcelValue per column, left to right."""
+
+
+_ExcelNumberKinds = ('int', 'float')
+
+
+def _excel_row_value_kinds(table: pd.DataFrame) -> Dict[str, str]:
+    """
+    Map each column to the type the row loop sees for its values.
+
+    The row loop iterates over `table.values`. If all columns are numeric,
+    that's a numeric array: int columns become float if any column is float.
+    """
+    dtypes = list(table.dtypes)
+    if dtypes and all(dtype.kind in 'iuf' for dtype in dtypes):
+        all_numeric_kind = np.result_type(*dtypes).kind
+    else:
+        all_numeric_kind = None
+
+    kinds = {}
+    for column, dtype in zip(table.columns, dtypes):
+        if dtype.kind in 'iu':
+            kinds[column] = 'float' if all_numeric_kind == 'f' else 'int'
+        elif dtype.kind == 'f':
+            kinds[column] = 'float'
+        elif dtype == object or hasattr(table[column], 'cat'):
+            kinds[column] = 'text'  # sanitized: all values are str
+        else:
+            kinds[column] = None  # datetime: unsupported
+    return kinds
+
+
+def _excel_column(table: pd.DataFrame, index: int,
+                  kinds: Dict[str, str]) -> _ExcelValue:
+    if index >= len(table.columns):
+        raise _CannotVectorize  # row loop will raise the correct error
+    kind = kinds[table.columns[index]]
+    if kind is None:
+        raise _CannotVectorize
+    series = table.iloc[:, index]
+    if series.isna().any():
+        raise _CannotVectorize  # `formulas` handles empty cells specially
+    if kind == 'text':
+        return _ExcelValue('text', series.astype(object).values)
+    elif kind == 'float':
+        return _ExcelValue('float', series.values.astype(np.float64))
+    else:
+        return _ExcelValue('int', series.values)
+
+
+def _excel_scalar(value: Any) -> _ExcelValue:
+    if isinstance(value, bool):
+        return _ExcelValue('bool', value)
+    elif isinstance(value, int):
+        return _ExcelValue('int', value)
+    elif isinstance(value, float):
+        return _ExcelValue('float', value)
+    elif isinstance(value, str):
+        return _ExcelValue('text', value)
+    else:
+        raise _CannotVectorize
+
+
+def _excel_number(arg: _ExcelValue, allow_bool: bool = False) -> Any:
+    """Return float64 array or scalar; raise _CannotVectorize for text."""
+    if not isinstance(arg, _ExcelValue):
+        raise _CannotVectorize  # multi-column range
+    if arg.kind in _ExcelNumberKinds or (allow_bool and arg.kind == 'bool'):
+        return np.float64(arg.value) if np.isscalar(arg.value) \
+            else arg.value.astype(np.float64)
+    raise _CannotVectorize
+
+
+def _excel_scalar_int(arg: _ExcelValue) -> int:
+    """Return int argument (e.g., LEFT()'s num_chars); must be a literal."""
+    if (
+        not isinstance(arg, _ExcelValue)
+        or arg.kind not in _ExcelNumberKinds
+        or not np.isscalar(arg.value)
+    ):
+        raise _CannotVectorize
+    return int(arg.value)
+
+
+def _excel_text(arg: _ExcelValue) -> Any:
+    """Return str or object array, as `formulas` would stringify it."""
+    if not isinstance(arg, _ExcelValue):
+        raise _CannotVectorize
+    if arg.kind == 'text':
+        return arg.value
+    elif arg.kind == 'int':
+        if np.isscalar(arg.value):
+            return str(arg.value)
+        return arg.value.astype(str).astype(object)
+    elif arg.kind == 'bool' and np.isscalar(arg.value):
+        return str(arg.value).upper()
+    elif arg.kind == 'float' and np.isscalar(arg.value):
+        return str(arg.value)
+    else:
+        raise _CannotVectorize  # str(np.float64) formatting may differ
+
+
+def _excel_float_result(value: Any) -> _ExcelValue:
+    # `formulas` returns #NUM! for nan/inf
+    if not np.all(np.isfinite(value)):
+        raise _CannotVectorize
+    return _ExcelValue('float', value)
+
+
+def _excel_arithmetic(op: Callable[[Any, Any], Any]):
+    def f(left: _ExcelValue, right: _ExcelValue) -> _ExcelValue:
+        x = _excel_number(left, allow_bool=True)
+        y = _excel_number(right, allow_bool=True)
+        return _excel_float_result(op(x, y))
+    return f
+
+
+def _excel_power(left: _ExcelValue, right: _ExcelValue) -> _ExcelValue:
+    x = _excel_number(left, allow_bool=True)
+    y = _excel_number(right, allow_bool=True)
+    if np.any(x < 0):
+        raise _CannotVectorize  # Python gives complex numbers
+    return _excel_float_result(np.power(x, y))
+
+
+def _excel_comparison(op: Callable[[Any, Any], Any]):
+    def f(left: _ExcelValue, right: _ExcelValue) -> _ExcelValue:
+        if not isinstance(left, _ExcelValue) \
+                or not isinstance(right, _ExcelValue):
+            raise _CannotVectorize
+        if left.kind in _ExcelNumberKinds and right.kind in _ExcelNumberKinds:
+            return _ExcelValue('bool', op(_excel_number(left),
+                                          _excel_number(right)))
+        elif left.kind == 'text' and right.kind == 'text':
+            # object arrays compare with Python str semantics, like `formulas`
+            return _ExcelValue('bool', op(left.value, right.value))
+        else:
+            raise _CannotVectorize  # `formulas` compares type IDs
+    return f
+
+
+def _excel_concat(*args: _ExcelValue) -> _ExcelValue:
+    result = ''
+    for arg in args:
+        result = result + _excel_text(arg)
+    return _ExcelValue('text', result)
+
+
+def _excel_negate(arg: _ExcelValue) -> _ExcelValue:
+    return _excel_float_result(-_excel_number(arg, allow_bool=True))
+
+
+def _excel_percent(arg: _ExcelValue) -> _ExcelValue:
+    return _excel_float_result(_excel_number(arg, allow_bool=True) / 100.0)
+
+
+def _excel_if(condition: _ExcelValue, x: _ExcelValue,
+              y: _ExcelValue) -> _ExcelValue:
+    if not all(isinstance(v, _ExcelValue) for v in (condition, x, y)):
+        raise _CannotVectorize
+    if condition.kind not in ('bool', 'int', 'float'):
+        raise _CannotVectorize  # text condition is #VALUE!
+    if x.kind != y.kind:
+        raise _CannotVectorize  # output dtype would depend on the data
+    value = np.where(np.asarray(condition.value, dtype=bool), x.value,
+                     y.value)
+    if x.kind == 'text':
+        value = value.astype(object)
+    return _ExcelValue(x.kind, value)
+
+
+def _excel_flatten_numbers(args) -> List[_ExcelValue]:
+    values = []
+    for arg in args:
+        if isinstance(arg, _ExcelRange):
+            values.extend(arg.values)
+        else:
+            values.append(arg)
+    if not values or any(v.kind not in _ExcelNumberKinds for v in values):
+        # `formulas` skips bools and parses numeric-looking text. Don't.
+        raise _CannotVectorize
+    return values
+
+
+def _excel_sum(*args) -> _ExcelValue:
+    values = _excel_flatten_numbers(args)
+    kinds = set(v.kind for v in values)
+    # Python sum() of ints is int; add left-to-right, like sum()
+    total = values[0].value if kinds == {'int'} \
+        else _excel_number(values[0])
+    for value in values[1:]:
+        total = total + value.value
+    if kinds == {'int'}:
+        return _ExcelValue('int', total)
+    else:
+        return _excel_float_result(total)
+
+
+def _excel_average(*args) -> _ExcelValue:
+    values = _excel_flatten_numbers(args)
+    total = _excel_number(values[0])
+    for value in values[1:]:
+        total = total + value.value
+    return _excel_float_result(total / len(values))
+
+
+def _excel_min_max(reduce: Callable[[Any, Any], Any]):
+    def f(*args) -> _ExcelValue:
+        values = _excel_flatten_numbers(args)
+        kinds = set(v.kind for v in values)
+        if len(kinds) != 1:
+            # Python min() returns the original value, int _or_ float: the
+            # output dtype would depend on the data
+            raise _CannotVectorize
+        result = values[0].value
+        for value in values[1:]:
+            result = reduce(result, value.value)
+        return _ExcelValue(kinds.pop(), result)
+    return f
+
+
+def _excel_round(func: Callable[[Any], Any]):
+    def f(x: _ExcelValue, digits: _ExcelValue) -> _ExcelValue:
+        x = _excel_number(x)
+        factor = 10 ** _excel_scalar_int(digits)
+        value = func(np.abs(x * factor)) / factor
+        return _excel_float_result(np.where(x < 0, -value, value))
+    return f
+
+
+def _excel_abs(x: _ExcelValue) -> _ExcelValue:
+    return _excel_float_result(np.abs(_excel_number(x)))
+
+
+def _excel_text_series(arg: _ExcelValue) -> pd.Series:
+    if (
+        not isinstance(arg, _ExcelValue)
+        or arg.kind != 'text'
+        or np.isscalar(arg.value)
+    ):
+        raise _CannotVectorize
+    return pd.Series(arg.value)
+
+
+def _excel_left(text: _ExcelValue, num_chars: _ExcelValue) -> _ExcelValue:
+    n = _excel_scalar_int(num_chars)
+    if n < 0:
+        raise _CannotVectorize  # #VALUE!
+    return _ExcelValue('text', _excel_text_series(text).str[:n].values)
+
+
+def _excel_right(text: _ExcelValue, num_chars: _ExcelValue) -> _ExcelValue:
+    n = _excel_scalar_int(num_chars)
+    if n < 0:
+        raise _CannotVectorize  # #VALUE!
+    series = _excel_text_series(text)
+    if n == 0:
+        return _ExcelValue('text', np.full(len(series), '', dtype=object))
+    return _ExcelValue('text', series.str[-n:].values)
+
+
+def _excel_mid(text: _ExcelValue, start_num: _ExcelValue,
+               num_chars: _ExcelValue) -> _ExcelValue:
+    start = _excel_scalar_int(start_num) - 1
+    end = start + _excel_scalar_int(num_chars)
+    if not 0 <= start <= end:
+        raise _CannotVectorize  # #VALUE!
+    return _ExcelValue('text', _excel_text_series(text).str[start:end].values)
+
+
+def _excel_str_method(name: str, kind: str):
+    def f(text: _ExcelValue) -> _ExcelValue:
+        series = getattr(_excel_text_series(text).str, name)()
+        return _ExcelValue(kind, series.values)
+    return f
+
+
+_ExcelOperators = {
+    '+': _excel_arithmetic(operator.add),
+    '-': _excel_arithmetic(operator.sub),
+    '*': _excel_arithmetic(operator.mul),
+    '/': _excel_arithmetic(operator.truediv),
+    '^': _excel_power,
+    'u-': _excel_negate,
+    '%': _excel_percent,
+    '&': _excel_concat,
+    '=': _excel_comparison(operator.eq),
+    '<>': _excel_comparison(operator.ne),
+    '<': _excel_comparison(operator.lt),
+    '<=': _excel_comparison(operator.le),
+    '>': _excel_comparison(operator.gt),
+    '>=': _excel_comparison(operator.ge),
+}
+
+
+_ExcelFunctions = {
+    'ABS': _excel_abs,
+    'AVERAGE': _excel_average,
+    'CONCATENATE': _excel_concat,
+    'IF': _excel_if,
+    'LEFT': _excel_left,
+    'LEN': _excel_str_method('len', 'int'),
+    'LOWER': _excel_str_method('lower', 'text'),
+    'MAX': _excel_min_max(np.maximum),
+    'MID': _excel_mid,
+    'MIN': _excel_min_max(np.minimum),
+    'RIGHT': _excel_right,
+    'ROUND': _excel_round(np.round),
+    'ROUNDDOWN': _excel_round(np.floor),
+    'ROUNDUP': _excel_round(np.ceil),
+    'SUM': _excel_sum,
+    'TRIM': _excel_str_method('strip', 'text'),
+    'UPPER': _excel_str_method('upper', 'text'),
+}
+
+
+def eval_excel_all_rows_vectorized(code, rpn, table) -> pd.Series:
+    """
+    Evaluate `rpn` once, over whole columns; raise _CannotVectorize.
+
+    Raise ValueError on the same invalid-reference errors as
+    `eval_excel_all_rows()`.
+    """
+    _excel_all_rows_column_indices(code)  # raise ValueError
+    if not len(table):
+        raise _CannotVectorize  # row loop output has no dtype; mimic that
+
+    kinds = _excel_row_value_kinds(table)
+    columns = {}  # lazy-load: only columns the formula references
+    stack = []
+
+    with np.errstate(all='ignore'):
+        for token in rpn:
+            if isinstance(token, Range):
+                values = []
+                for index in range(token.attr['n1'] - 1, token.attr['n2']):
+                    if index not in columns:
+                        columns[index] = _excel_column(table, index, kinds)
+                    values.append(columns[index])
+                if len(values) == 1:
+                    stack.append(values[0])
+                else:
+                    stack.append(_ExcelRange(values))
+            elif isinstance(token, (Number, String)):
+                stack.append(_excel_scalar(token.compile()))
+            elif isinstance(token, (Operator, Function)):
+                if isinstance(token, Function):
+                    func = _ExcelFunctions.get(token.name.upper())
+                else:
+                    func = _ExcelOperators.get(token.name)
+                if func is None:
+                    raise _CannotVectorize
+                n_args = token.get_n_args
+                args = stack[len(stack) - n_args:] if n_args else []
+                del stack[len(stack) - n_args:]
+                try:
+                    stack.append(func(*args))
+                except TypeError:
+                    raise _CannotVectorize  # wrong number of arguments
+            else:
+                raise _CannotVectorize
+
+    if len(stack) != 1 or not isinstance(stack[0], _ExcelValue):
+        raise _CannotVectorize
+    result = stack[0]
+
+    if np.isscalar(result.value):
+        # Formula of only literals, like `=2*3`
+        value = np.full(len(table), result.value,
+                        dtype=object if result.kind == 'text' else None)
+    else:
+        value = result.value
+    if result.kind == 'bool':
+        value = value.astype(bool)
+    elif result.kind == 'int':
+        value = value.astype(np.int64)
+    return pd.Series(value)
+
+
 def excel_formula(table, formula, all_rows):
     try:
         # 0 is a list of tokens, 1 is the function builder object
-        code = Parser().ast(formula)[1].compile()
+        builder = _RecordingParser().ast(formula)[1]
+        code = builder.compile()
     except Exception as e:
         raise ValueError(f"Couldn't parse formula: {str(e)}")
 
     if all_rows:
-        newcol = eval_excel_all_rows(code, table)
+        start = time.time()
+        path = 'vectorized'
+        try:
+            try:
+                newcol = eval_excel_all_rows_vectorized(code, builder.rpn,
+                                                        table)
+            except _CannotVectorize:
+                path = 'row-by-row'
+                newcol = eval_excel_all_rows(code, table)
+        finally:
+            logger.info('excel_formula: %s evaluation of %d rows (%dms)',
+                        path, len(table), 1000 * (time.time() - start))
         newcol = autocast_series_dtype(sanitize_series(newcol))
     else:
         # the whole column is blank except first row
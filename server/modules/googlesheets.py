@@ -1,18 +1,21 @@
+import asyncio
 import io
 from typing import Any, Dict, Optional, Union
+import aiohttp
 import pandas as pd
-import requests
 from cjworkbench.types import ProcessResult
-from server import oauth
+from server import httpclient, oauth
 from .utils import parse_bytesio, turn_header_into_first_row, parse_json_param
 
 
 _Secret = Dict[str, Any]
+_Headers = Dict[str, str]
 
 
-def _build_requests_session(secret: _Secret) -> Union[requests.Session, str]:
-    """Prepare a Requests session, so caller can then call
-    `session.get(url)`.
+async def _generate_auth_headers(secret: _Secret) -> Union[_Headers, str]:
+    """Prepare headers so caller can then call `httpclient.get(url, headers)`.
+
+    Return a str error message if we cannot log in.
     """
     service = oauth.OAuthService.lookup_or_none('google_credentials')
     if not service:
@@ -21,29 +24,40 @@ def _build_requests_session(secret: _Secret) -> Union[requests.Session, str]:
             'Please restart Workbench with a Google secret.'
         )
 
-    session = service.requests_or_str_error(secret)
-    return session  # even if it's an error
+    # generate_access_token_or_str_error() uses requests: run it in a thread
+    loop = asyncio.get_event_loop()
+    token = await loop.run_in_executor(
+        None,
+        service.generate_access_token_or_str_error,
+        secret
+    )
+    if isinstance(token, str):
+        return token  # error
+    return {'Authorization': f'Bearer {token["access_token"]}'}
 
 
-def _download_bytes(session: requests.Session, url: str) -> Union[bytes, str]:
+async def _download_bytes(headers: _Headers, url: str) -> Union[bytes, str]:
     """Download bytes from `url` or return a str error message.
 
     This discards Content-Type, including charset. GDrive doesn't know the
     charset anyway.
     """
     try:
-        response = session.get(url)
-
-        if response.status_code < 200 or response.status_code > 299:
-            return f'HTTP {response.status_code} from Google: {response.text}'
-
-        return response.content
-    except requests.RequestException as err:
+        response = await httpclient.get(url, headers=headers)
+        async with response:
+            if response.status < 200 or response.status > 299:
+                text = await response.text()
+                return f'HTTP {response.status} from Google: {text}'
+
+            return await response.read()
+    except asyncio.TimeoutError:
+        return 'Timed out waiting for Google'
+    except aiohttp.ClientError as err:
         return str(err)
 
 
-def _download_google_sheet(session: requests.Session,
-                           sheet_id: str) -> Union[bytes, str]:
+async def _download_google_sheet(headers: _Headers,
+                                 sheet_id: str) -> Union[bytes, str]:
     """Download a Google Sheet as utf-8 CSV, or return a str error message.
 
     This uses the GDrive "export" API.
@@ -58,22 +72,22 @@ def _download_google_sheet(session: requests.Session,
         f'https://www.googleapis.com/drive/v3/files/'
         f'{sheet_id}/export?mimeType=text%2Fcsv'
     )
-    return _download_bytes(session, url)
+    return await _download_bytes(headers, url)
 
 
-def _download_gdrive_file(session: requests.Session,
-                          sheet_id: str) -> Union[bytes, str]:
+async def _download_gdrive_file(headers: _Headers,
+                                sheet_id: str) -> Union[bytes, str]:
     """Download bytes from Google Drive, or return a str error message.
 
     This discards Content-Type, including charset. GDrive doesn't know the
     charset anyway.
     """
     url = f'https://www.googleapis.com/drive/v3/files/{sheet_id}?alt=media'
-    return _download_bytes(session, url)
+    return await _download_bytes(headers, url)
 
 
-def download_data_frame(sheet_id: str, sheet_mime_type: str,
-                        secret: Optional[_Secret]) -> ProcessResult:
+async def download_data_frame(sheet_id: str, sheet_mime_type: str,
+                              secret: Optional[_Secret]) -> ProcessResult:
     """Download spreadsheet from Google, or return a str error message.
 
     Arguments decide how the download and parse will occur:
@@ -88,15 +102,15 @@ def download_data_frame(sheet_id: str, sheet_mime_type: str,
             error='Not authorized. Please connect to Google Drive.'
         )
 
-    session = _build_requests_session(secret)
-    if isinstance(session, str):
-        return ProcessResult(error=session)
+    headers = await _generate_auth_headers(secret)
+    if isinstance(headers, str):
+        return ProcessResult(error=headers)
 
     if sheet_mime_type == 'application/vnd.google-apps.spreadsheet':
-        blob = _download_google_sheet(session, sheet_id)
+        blob = await _download_google_sheet(headers, sheet_id)
         sheet_mime_type = 'text/csv'
     else:
-        blob = _download_gdrive_file(session, sheet_id)
+        blob = await _download_gdrive_file(headers, sheet_id)
     if isinstance(blob, str):
         return ProcessResult(error=blob)
 
@@ -124,7 +138,7 @@ def render(_unused_table, params, *, fetch_result, **kwargs):
         return table
 
 
-def fetch(params, **kwargs):  # TODO make async
+async def fetch(params, **kwargs):
     file_meta = parse_json_param(params['googlefileselect'])
     if not file_meta:
         return ProcessResult()
@@ -141,7 +155,8 @@ def fetch(params, **kwargs):  # TODO make async
 
     if sheet_id:
         secret = (params['google_credentials'] or {}).get('secret')
-        result = download_data_frame(sheet_id, sheet_mime_type, secret)
+        result = await download_data_frame(sheet_id, sheet_mime_type,
+                                           secret)
         result.truncate_in_place_if_too_big()
         return result
     else:
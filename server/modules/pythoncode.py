@@ -1,20 +1,50 @@
+import atexit
 import builtins
 import importlib
 from inspect import signature
 import io
+import logging
 import math
+from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
+from multiprocessing.connection import Connection, wait
+import os
 import os.path
+import shutil
+import signal
+import socket
 import sys
+import tempfile
+import threading
+import time
 import traceback
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import numpy
 import pandas
+from server import dataframe_mmap
 from .utils import build_globals_for_eval, PythonFeatureDisabledError
 
 
+logger = logging.getLogger(__name__)
+
+
 TIMEOUT = 30.0  # seconds
 
+POOL_SIZE = 2
+"""
+Number of idle sandboxes each process keeps ready for a render.
+"""
+
+_SharedMemoryDir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+"""
+Where we write tables for sandboxes: tmpfs when available.
+
+Parent and sandbox both memory-map the same file, so a table's numeric
+buffers are never copied or pickled on their way in or out.
+"""
+
+_fork = multiprocessing.get_context('fork')
+
 
 html_path = os.path.join(os.path.dirname(__file__), 'pythoncode.html')
 
@@ -83,43 +113,48 @@ def _scrub_globals_for_safety():
     _disable_builtin('exec')
 
 
-def inner_eval(code, table, sender):
-    """Within a subprocess, run code's "process(table)" and exit."""
+def inner_eval(code, table, code_globals=None):
+    """
+    Run code's "process(table)"; return (table, error, json).
+
+    Call this within a sandbox: it redirects stdout and stderr.
+    """
     result = [pandas.DataFrame(), '', {'output': ''}]
     output = io.StringIO()
 
-    def sending_return(*, error=None, tb=None):
+    def build_return(*, error=None, tb=None):
         result[2]['output'] = output.getvalue()
 
         if error is not None:
             result[1] = error
 
-        return sender.send(tuple(result))
+        return tuple(result)
 
     try:
         compiled_code = compile(code, 'user input', 'exec')
     except SyntaxError as err:
-        return sending_return(error=f'Line {err.lineno}: {err}')
+        return build_return(error=f'Line {err.lineno}: {err}')
     except ValueError as err:
         # Apparently this is another thing that compile() can raise
-        return sending_return(error=f'User input contains null bytes')
+        return build_return(error=f'User input contains null bytes')
 
     sys.stdout = sys.stderr = sys.__stdout__ = sys.__stderr__ = output
 
-    code_globals = build_globals_for_eval()
+    if code_globals is None:
+        code_globals = build_globals_for_eval()
 
     # Catch errors with the code and display to user
     try:
         exec(compiled_code, code_globals)
 
         if 'process' not in code_globals:
-            return sending_return(error='You must define a "process" function')
+            return build_return(error='You must define a "process" function')
 
         process = code_globals['process']
 
         sig = signature(process)
         if len(sig.parameters) != 1:
-            return sending_return(error=(
+            return build_return(error=(
                 'Your "process" function must accept exactly one argument'
             ))
 
@@ -137,7 +172,7 @@ def inner_eval(code, table, sender):
         traceback.print_tb(tb, limit=limit)
         print(f'{etype.__name__}: {value}')
 
-        return sending_return(error=(
+        return build_return(error=(
             f'Line {tb.tb_lineno}: {etype.__name__}: {value}'
         ))
     except Exception as err:
@@ -145,59 +180,377 @@ def inner_eval(code, table, sender):
         etype, value, tb = sys.exc_info()
         tb = tb.tb_next  # omit this method from the stack trace
         traceback.print_exception(etype, value, tb)
-        return sending_return(error=(
+        return build_return(error=(
             f'Line {tb.tb_lineno}: {etype.__name__}: {value}'
         ))
 
     if isinstance(out_table, code_globals['pd'].DataFrame):
         result[0] = out_table
     elif isinstance(out_table, str):
-        return sending_return(error=out_table)
+        return build_return(error=out_table)
     else:
         message = 'process(table) did not return a pd.DataFrame or a str'
         print(message)  # to show it in JSON output
-        return sending_return(error=message)
+        return build_return(error=message)
+
+    return build_return()
+
+
+def _sandbox_main(connection: Connection) -> None:
+    """
+    Within a freshly-forked sandbox, wait for one job and run it.
+
+    We send our pid first, so our pool can kill us. Then a job is (code,
+    input_path, output_path). We read the input table from `input_path` and
+    write the output table to `output_path`, both with
+    `server.dataframe_mmap`. Only (error, json) goes through `connection`.
+
+    After that, we wait for our pool to close `connection`. Until we exit,
+    our pid can't belong to another process, so our pool can kill it safely.
+    """
+    connection.send(os.getpid())
+
+    # Do the slow, code-independent work before the job arrives
+    code_globals = build_globals_for_eval()
+
+    try:
+        code, input_path, output_path = connection.recv()
+    except (EOFError, ConnectionResetError):
+        return  # our pool is gone
+
+    with open(input_path, 'rb') as f:
+        table = dataframe_mmap.read_dataframe(f)
+
+    out_table, error, json = inner_eval(code, table, code_globals)
+
+    if not error:
+        try:
+            with open(output_path, 'r+b') as f:
+                # Unvalidated: our parent reports non-str values
+                dataframe_mmap.write_dataframe(f, out_table,
+                                               allow_pickle=True)
+        except Exception as err:
+            error = f'Could not send output table: {err}'
+
+    connection.send((error, json))
+
+    try:
+        connection.recv()
+    except (EOFError, ConnectionResetError):
+        pass
+
+
+def _fork_sandboxes(listener: socket.socket,
+                    alive_recver: Connection) -> None:
+    """
+    Fork a sandbox for each connection to `listener`.
+
+    Return when `alive_recver` reaches EOF: that is, when every process that
+    could connect to us has exited.
+    """
+    # Let the kernel reap sandboxes. They aren't our pools' children, so our
+    # pools can't.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        ready = wait([listener, alive_recver])
+        if alive_recver in ready:
+            return
+        sock, _ = listener.accept()
+        if os.fork() == 0:
+            listener.close()
+            alive_recver.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _sandbox_main(Connection(sock.detach()))
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        sock.close()
+
+
+def _zygote_main(socket_dir: str, listener: socket.socket,
+                 alive_recver: Connection, alive_sender: Connection) -> None:
+    """
+    Run `_fork_sandboxes()` in a child; restart it if it dies.
+
+    The child may die of an OOM kill or a crash. Its replacement listens on
+    the same `listener`, so clients needn't know.
+
+    Return when `alive_recver` reaches EOF: that is, when every process that
+    could connect to us has exited. (If our parent exits normally,
+    multiprocessing kills us sooner; our parent deletes `socket_dir` then.)
+    """
+    alive_sender.close()  # or we'd never see EOF
+
+    try:
+        while True:
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    _fork_sandboxes(listener, alive_recver)
+                except BaseException:
+                    traceback.print_exc()
+                    os._exit(1)
+                os._exit(0)
+
+            _, status = os.waitpid(pid, 0)
+            if alive_recver.poll():
+                return  # EOF: nobody needs sandboxes any more
+            print('pythoncode sandbox forker died (status %d); restarting'
+                  % status, file=sys.stderr)
+            time.sleep(1)  # don't spin if it dies at startup
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+class _Zygote:
+    """
+    A small process that forks sandboxes.
 
-    return sending_return()
+    Why not fork sandboxes from the process that renders? Because that process
+    holds user data -- input tables, cached render results -- and each sandbox
+    would start with a copy-on-write snapshot of it, which user code could
+    read. We fork the zygote before rendering anything (see `start_zygote()`),
+    so it holds none.
+
+    Any process may ask for a sandbox -- including render processes forked
+    after the zygote started -- by connecting to the zygote's Unix socket. The
+    zygote forks, and the new sandbox keeps that connection.
+
+    The zygote restarts its forking child if that dies (see `_zygote_main()`).
+    If the zygote itself dies, only the process that started it can start
+    another (see `start_zygote()`).
+    """
+
+    def __init__(self):
+        self.creator_pid = os.getpid()
+        socket_dir = tempfile.mkdtemp(prefix='pythoncode-')  # mode 0700
+        self.path = os.path.join(socket_dir, 'zygote')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        # Every process that could connect holds a copy of `alive_sender`
+        alive_recver, self.alive_sender = _fork.Pipe(duplex=False)
+        self.process = _fork.Process(target=_zygote_main,
+                                     name='pythoncode-zygote', daemon=True,
+                                     args=[socket_dir, listener, alive_recver,
+                                           self.alive_sender])
+        self.process.start()
+        atexit.register(shutil.rmtree, socket_dir, ignore_errors=True)
+        listener.close()
+        alive_recver.close()
+
+    def connect(self) -> Connection:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except BaseException:
+            sock.close()
+            raise
+        return Connection(sock.detach())
+
+
+_zygote: Optional[_Zygote] = None
+_zygote_lock = threading.Lock()
+
+
+def start_zygote() -> None:
+    """
+    Fork the process that forks sandboxes, if it isn't running.
+
+    Call this at startup, before this process reads any user data. (The worker
+    does.) Otherwise, the first render starts it -- and its sandboxes inherit
+    whatever this process held at that time. The same goes for restarting a
+    zygote that died.
+    """
+    global _zygote
+    with _zygote_lock:
+        if _zygote is None:
+            _zygote = _Zygote()
+        elif (
+            _zygote.creator_pid == os.getpid()
+            and not _zygote.process.is_alive()
+        ):
+            logger.warning('pythoncode zygote died (exit code %r); '
+                           'restarting', _zygote.process.exitcode)
+            _zygote.alive_sender.close()
+            _zygote = _Zygote()
+
+
+class _Sandbox:
+    """
+    A process forked by the zygote, which will run one job, then exit.
+
+    We never reuse a sandbox: user code may have altered it.
+    """
+
+    def __init__(self):
+        """
+        Fork a sandbox, or raise OSError.
+
+        (The zygote may be dead; or it may fail to fork.)
+        """
+        start_zygote()
+        self.connection = _zygote.connect()
+        try:
+            self.pid = self.connection.recv()
+        except EOFError:
+            self.connection.close()
+            raise OSError('pythoncode sandbox exited before starting')
+
+    def is_alive(self) -> bool:
+        # An idle sandbox never sends anything after its pid. If there's
+        # something to read, it's EOF: the sandbox died.
+        return not self.connection.poll()
+
+    def kill(self):
+        # we got our result (or gave up); clean up like an assassin
+        #
+        # A sandbox only exits before we close the connection if it crashed.
+        # Then the kernel reaped it at once, and another process may have its
+        # pid. Its connection has EOF, so poll() is True: don't kill. (poll()
+        # is also True if the sandbox sent a result we didn't read; it'll exit
+        # when we close.)
+        if not self.connection.poll():
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.connection.close()
+
+
+class SandboxPool:
+    """
+    Idle sandboxes, forked ahead of time so renders don't wait for fork().
+
+    `take()` refills the pool in a background thread, so renders don't wait
+    for that, either. Each process that renders has its own pool.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.pid = os.getpid()
+        self._idle: List[_Sandbox] = []
+        self._lock = threading.Lock()
+        self._refiller = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='pythoncode-refill-'
+        )
+
+    def take(self) -> _Sandbox:
+        """Return an idle sandbox (or a new one); refill in the background."""
+        sandbox = None
+        with self._lock:
+            while self._idle and sandbox is None:
+                sandbox = self._idle.pop(0)
+                if not sandbox.is_alive():
+                    sandbox.kill()  # clean up a sandbox that died while idle
+                    sandbox = None
+        if sandbox is None:
+            sandbox = _Sandbox()
+        self._refiller.submit(self.refill)
+        return sandbox
+
+    def refill(self) -> None:
+        """Fork sandboxes until `size` are idle; log errors."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= self.size:
+                    return
+            try:
+                # without the lock: take() mustn't wait
+                sandbox = _Sandbox()
+            except OSError:
+                # The next take() will try again (and report the error)
+                logger.exception('Could not fork pythoncode sandbox')
+                return
+            with self._lock:
+                self._idle.append(sandbox)
+
+    def close(self) -> None:
+        self._refiller.shutdown(wait=True)
+        with self._lock:
+            for sandbox in self._idle:
+                sandbox.kill()
+            self._idle = []
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            # (A forked child must not share its parent's sandboxes.)
+            _pool = SandboxPool(POOL_SIZE)
+        return _pool
 
 
 def safe_eval_process(code, table, timeout=TIMEOUT):
     """
     Runs `code`'s "process" method in a sandbox; returns (table, error, json).
 
-    The inner process will send a (table, error, json) tuple as a result, then
-    exit.
-
     Process stdout, stderr and exception traceback are all stored in
     result[2].output.
 
     An exception string is also returned in result.error.
 
-    Internally, this method uses multiprocessing to spin up a new Python
-    process with restricted execution (a sandbox). The sandbox forbids key
-    Python features (such as opening files).
-    """
-    recver, sender = multiprocessing.Pipe(duplex=False)
-    subprocess = multiprocessing.Process(target=inner_eval, name='pythoncode',
-                                         daemon=True,
-                                         args=[code, table, sender])
-    subprocess.start()
-    # TODO make this async
-    if recver.poll(timeout):
-        result = recver.recv()
-    else:
-        subprocess.terminate()  # in case the timeout was exceeded
-        result = (
-            pandas.DataFrame(), 
-            f'Python subprocess did not respond in {timeout}s',
+    Internally, this method sends `code` to a sandbox: a pre-forked Python
+    process with restricted execution. The sandbox forbids key Python
+    features (such as opening files). It runs one job and then dies; the
+    zygote (see `_Zygote`) forks a replacement in the background. Tables
+    travel through memory-mapped files (see `_SharedMemoryDir`), not
+    pickles.
+    """
+    pool = _get_pool()
+    try:
+        sandbox = pool.take()
+    except OSError as err:
+        return (
+            pandas.DataFrame(),
+            f'Could not start Python subprocess: {err}',
             {'output': ''}
         )
 
-    # we got our result; clean up like an assassin
-    subprocess.terminate()  # TODO subprocess.kill() in Python 3.7
-    subprocess.join()
-
-    return result
+    try:
+        with tempfile.NamedTemporaryFile(dir=_SharedMemoryDir,
+                                         prefix='pythoncode-in-') as input_file, \
+                tempfile.NamedTemporaryFile(dir=_SharedMemoryDir,
+                                            prefix='pythoncode-out-') \
+                as output_file:
+            dataframe_mmap.write_dataframe(input_file, table)
+            sandbox.connection.send((code, input_file.name,
+                                     output_file.name))
+
+            # TODO make this async
+            if not sandbox.connection.poll(timeout):
+                return (
+                    pandas.DataFrame(),
+                    f'Python subprocess did not respond in {timeout}s',
+                    {'output': ''}
+                )
+
+            try:
+                error, json = sandbox.connection.recv()
+            except EOFError:
+                return (
+                    pandas.DataFrame(),
+                    'Python subprocess exited without responding',
+                    {'output': ''}
+                )
+
+            if error:
+                return (pandas.DataFrame(), error, json)
+            else:
+                return (dataframe_mmap.read_dataframe(output_file,
+                                                      allow_pickle=True),
+                        error, json)
+    finally:
+        sandbox.kill()
 
 
 def render(
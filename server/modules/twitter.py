@@ -2,15 +2,13 @@ from collections import namedtuple
 from enum import Enum
 import re
 from typing import Any, Dict, List, Optional, Tuple
-import aiohttp
 from aiohttp.client_exceptions import ClientResponseError
 import numpy as np
 from oauthlib import oauth1
 from oauthlib.common import urlencode
 import pandas as pd
-import yarl  # expose aiohttp's innards -- ick.
 from cjworkbench.types import ProcessResult
-from server import oauth
+from server import httpclient, oauth
 
 
 class QueryType(Enum):
@@ -166,14 +164,19 @@ def _recover_from_160258591(table):
             table[column.name] = table[column.name].astype(column.dtype)
 
 
-# Get dataframe of last tweets fron our storage,
-async def get_stored_tweets(get_stored_dataframe):
-    table = await get_stored_dataframe()
-    if table is None or table.empty:
-        table = create_empty_table()
-    else:
-        _recover_from_160258591(table)
-    return table
+async def get_stored_last_id(get_stored_dataframe) -> Optional[int]:
+    """
+    Find the ID of the newest tweet we stored, or None.
+
+    We store new tweets first, so the newest tweet is in the newest segment.
+    Reading just that segment keeps each fetch's cost proportional to the
+    number of new tweets.
+    """
+    table = await get_stored_dataframe(newest_segment=True)
+    if table is None or table.empty or 'id' not in table:
+        return None
+    # https://www.pivotaltracker.com/story/show/160258591 -- 'id' may be str
+    return int(table['id'].astype(np.int64).max())
 
 
 def statuses_to_dataframe(statuses: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -199,50 +202,46 @@ async def fetch_from_twitter(access_token, path, params: List[Tuple[str, str]],
     page_dataframes = [create_empty_table()]
 
     max_id = None
-    async with aiohttp.ClientSession() as session:  # aiohttp timeout of 5min
-        for page in range(n_pages):
-            # Assume {path} contains '?' already
-            page_params = [
-                *params,
-                ('tweet_mode', 'extended'),
-                ('count', str(per_page)),
-            ]
-            if since_id:
-                page_params.append(('since_id', str(since_id)))
-            if max_id:
-                page_params.append(('max_id', str(max_id)))
-
-            page_url = (
-                f'https://api.twitter.com/1.1/{path}?{urlencode(page_params)}'
-            )
-
-            page_url, headers, body = oauth_client.sign(
-                page_url,
-                headers={'Accept': 'application/json'}
-            )
-
-            # aiohttp internally performs URL canonization before sending
-            # request. DISABLE THIS: it rewrites the signed URL!
-            #
-            # https://github.com/aio-libs/aiohttp/issues/3424
-            page_url = yarl.URL(page_url, encoded=True)  # disable magic
-
-            response = await session.get(page_url, headers=headers)
-            response.raise_for_status()
+    for page in range(n_pages):
+        # Assume {path} contains '?' already
+        page_params = [
+            *params,
+            ('tweet_mode', 'extended'),
+            ('count', str(per_page)),
+        ]
+        if since_id:
+            page_params.append(('since_id', str(since_id)))
+        if max_id:
+            page_params.append(('max_id', str(max_id)))
+
+        page_url = (
+            f'https://api.twitter.com/1.1/{path}?{urlencode(page_params)}'
+        )
+
+        page_url, headers, body = oauth_client.sign(
+            page_url,
+            headers={'Accept': 'application/json'}
+        )
+
+        # httpclient won't canonicalize page_url: that would break the
+        # signature. aiohttp timeout of 5min.
+        response = await httpclient.get(page_url, headers=headers,
+                                        raise_for_status=True)
+        async with response:
             page_statuses = await response.json()
 
-            if isinstance(page_statuses, dict) and 'statuses' in page_statuses:
-                # /search wraps result in {}
-                page_statuses = page_statuses['statuses']
+        if isinstance(page_statuses, dict) and 'statuses' in page_statuses:
+            # /search wraps result in {}
+            page_statuses = page_statuses['statuses']
 
-            if not page_statuses:
-                break
+        if not page_statuses:
+            break
 
-            # Parse one page at a time, instead of parsing all at the end.
-            # Should save a bit of memory and make a smaller CPU-blip in our
-            # event loop.
-            page_dataframes.append(statuses_to_dataframe(page_statuses))
-            max_id = page_statuses[-1]['id'] - 1
+        # Parse one page at a time, instead of parsing all at the end.
+        # Should save a bit of memory and make a smaller CPU-blip in our
+        # event loop.
+        page_dataframes.append(statuses_to_dataframe(page_statuses))
+        max_id = page_statuses[-1]['id'] - 1
 
     return pd.concat(page_dataframes, ignore_index=True, sort=False)
 
@@ -297,12 +296,8 @@ LIST_REGEX = re.compile(f'^{USERNAME_REGEX_PART}/{LIST_REGEX_PART}$')
 
 
 # Get from Twitter, return as dataframe
-async def get_new_tweets(access_token, querytype, query, old_tweets):
-    if old_tweets is not None and not old_tweets.empty:
-        last_id = old_tweets['id'].max()
-    else:
-        last_id = None
-
+async def get_new_tweets(access_token, querytype, query,
+                         last_id: Optional[int]):
     if querytype == QueryType.USER_TIMELINE:
         match = USERNAME_REGEX.match(query)
         if not match:
@@ -326,25 +321,6 @@ async def get_new_tweets(access_token, querytype, query, old_tweets):
                                            match.group(2), last_id)
 
 
-# Combine this set of tweets with previous set of tweets
-def merge_tweets(old_table, new_table):
-    if old_table is None or old_table.empty:
-        return new_table
-    elif new_table is None or new_table.empty:
-        return old_table
-    else:
-        # The new tweets all go before the old tweets.
-        #
-        # We tend to add columns to our output in successive versions of the
-        # Twitter module. `new_table` has the correct list of columns;
-        # `old_table` may be incomplete. `new_table` has the correct list of
-        # columns; `old_table` may be incomplete.
-        #
-        # sort=False: use the ordering in new_table. (pandas 0.23 corrects the
-        # previous unintuitive behavior in DataFrame.append().)
-        return new_table.append(old_table, ignore_index=True, sort=False)
-
-
 # Render just returns previously retrieved tweets
 def render(table, params, *, fetch_result):
     if fetch_result is None:
@@ -382,10 +358,11 @@ async def fetch(params, *, get_stored_dataframe):
 
     try:
         if params['accumulate']:
-            old_tweets = await get_stored_tweets(get_stored_dataframe)
+            # Return only the new tweets. Workbench stores them atop the
+            # previous version, new tweets first, without rewriting old ones.
+            last_id = await get_stored_last_id(get_stored_dataframe)
             tweets = await get_new_tweets(access_token, querytype, query,
-                                          old_tweets)
-            tweets = merge_tweets(old_tweets, tweets)
+                                          last_id)
         else:
             tweets = await get_new_tweets(access_token, querytype,
                                           query, None)
@@ -410,6 +387,7 @@ async def fetch(params, *, get_stored_dataframe):
         else:
             return Err('Error fetching tweets: %s' % str(err))
 
-    result = ProcessResult(dataframe=tweets)
+    result = ProcessResult(dataframe=tweets,
+                           stored_delta=bool(params['accumulate']))
     result.truncate_in_place_if_too_big()
     return result
@@ -4,8 +4,8 @@ import re
 from django.conf import settings
 from django.utils import timezone
 import pandas as pd
-import yarl  # aiohttp innards -- yuck!
 from cjworkbench.types import ProcessResult
+from server import httpclient
 
 
 async def async_get_url(row, url):
@@ -19,20 +19,14 @@ async def async_get_url(row, url):
     exception may be `asyncio.TimeoutError`, `ValueError` (invalid URL) or
     `aiohttp.client_exceptions.ClientError`.
     """
-    session = aiohttp.ClientSession()
-
     try:
-        # aiohttp internally performs URL canonization before sending
-        # request. DISABLE THIS: it breaks oauth and user's expectations.
-        #
-        # https://github.com/aio-libs/aiohttp/issues/3424
-        url = yarl.URL(url, encoded=True)  # prevent magic
-
-        response = await session.get(url, timeout=settings.SCRAPER_TIMEOUT)
+        response = await httpclient.get(url,
+                                        timeout=settings.SCRAPER_TIMEOUT)
         # We have the header. Now read the content.
         # response.text() times out according to SCRAPER_TIMEOUT above. See
         # https://docs.aiohttp.org/en/stable/client_quickstart.html#timeouts
-        text = await response.text()
+        async with response:
+            text = await response.text()
 
         return (row, str(response.status), text)
     except asyncio.TimeoutError:
@@ -5,7 +5,7 @@ import json
 import re
 import shutil
 import tempfile
-from typing import Any, Dict, Callable, Iterator, Optional
+from typing import Any, Dict, Callable, Iterator, Optional, Set
 import aiohttp
 from asgiref.sync import async_to_sync
 from async_generator import asynccontextmanager  # TODO python 3.7 native
@@ -18,10 +18,9 @@ import numpy as np
 import pandas as pd
 from pandas.api.types import is_numeric_dtype, is_datetime64_dtype
 import xlrd
-import yarl  # aiohttp innards -- yuck!
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import ProcessResult
-from server import rabbitmq
+from server import httpclient, rabbitmq
 from server.models import Workflow
 
 
@@ -189,48 +188,193 @@ def wrap_text(bytesio: io.BytesIO, text_encoding: _TextEncoding):
         yield textio
 
 
+class _RestartParse(Exception):
+    """
+    Columns we assumed were numeric turned out to be text.
+
+    We've already discarded the text of earlier chunks, so we must re-read.
+    """
+
+    def __init__(self, column_indices: Set[int]):
+        super().__init__(column_indices)
+        self.column_indices = column_indices
+
+
+class _StreamingColumn:
+    """
+    Accumulate one column of a CSV, chunk by chunk, in compact form.
+
+    A column starts out numeric (unless we know better). Each chunk is
+    converted with `pd.to_numeric()` and the text is discarded. If a chunk
+    contains non-numbers, the column becomes text: we store each value as an
+    int32 code into an ever-growing dictionary of categories. Either way,
+    memory use is proportional to the output column, not the input text.
+
+    Until we see a non-empty value, the column is undecided: its earlier
+    values were all '', so it can become text without re-reading them.
+
+    The result is what `autocast_series_dtype()` would give on the complete
+    column: numbers if every value is numeric (or empty), otherwise a
+    Categorical of str.
+    """
+
+    def __init__(self, index: int, is_text: bool):
+        self.index = index
+        self.is_text = is_text
+        self.chunks = []  # number arrays, or int32 code arrays if is_text
+        self.has_nonempty_number = False
+        self.category_codes = {}  # str => int32 code
+
+    def append(self, values: np.ndarray) -> bool:
+        """
+        Add `values`, an object array of str.
+
+        Return False (and add nothing) if we need the text from earlier
+        chunks: that is, if this column must be re-read as text.
+        """
+        if not self.is_text:
+            try:
+                numbers = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                numbers = None
+            if numbers is not None and numbers.dtype.kind in 'iuf':
+                self.chunks.append(numbers)
+                self.has_nonempty_number = (
+                    self.has_nonempty_number
+                    or (values != '').any()
+                )
+                return True
+            elif self.has_nonempty_number:
+                return False
+            else:
+                # Every earlier value was ''
+                nrows = sum(len(chunk) for chunk in self.chunks)
+                self.is_text = True
+                self.chunks = []
+                if nrows:
+                    self.category_codes[''] = 0
+                    self.chunks.append(np.zeros(nrows, dtype=np.int32))
+
+        codes, uniques = pd.factorize(values)
+        category_codes = self.category_codes
+        mapping = np.array([category_codes.setdefault(u, len(category_codes))
+                            for u in uniques], dtype=np.int32)
+        self.chunks.append(mapping[codes])
+        return True
+
+    def to_series(self) -> pd.Series:
+        if not self.is_text and self.has_nonempty_number:
+            return pd.Series(np.concatenate(self.chunks))
+
+        if not self.is_text:
+            # All-empty: we parsed '' as NaN. Make it text, like
+            # autocast_series_dtype() does.
+            nrows = sum(len(chunk) for chunk in self.chunks)
+            self.chunks = [np.zeros(nrows, dtype=np.int32)]
+            self.category_codes = {'': 0} if nrows else {}
+
+        # Sort categories, as pd.read_csv(..., dtype='category') does
+        categories = np.array(list(self.category_codes), dtype=object)
+        order = np.argsort(categories, kind='stable')
+        new_codes = np.empty(len(order), dtype=np.int32)
+        new_codes[order] = np.arange(len(order), dtype=np.int32)
+        codes = (np.concatenate(self.chunks) if self.chunks
+                 else np.array([], dtype=np.int32))
+        return pd.Series(pd.Categorical.from_codes(new_codes[codes],
+                                                   categories[order]))
+
+
+def _parse_table_chunks(textio: io.TextIOWrapper, sep: str,
+                        text_column_indices: set) -> ProcessResult:
+    """
+    Parse CSV from `textio`, chunk by chunk; raise _RestartParse.
+    """
+    # Find the column names, so we can pick a chunk size that uses a
+    # predictable amount of memory no matter how wide the table is.
+    header = pd.read_csv(textio, dtype=str, sep=sep, na_filter=False,
+                         nrows=0)
+    textio.seek(0)
+    rows_per_chunk = max(
+        1,
+        settings.PARSE_CSV_CHUNK_CELLS // max(1, len(header.columns))
+    )
+    max_rows = settings.MAX_ROWS_PER_TABLE
+
+    columns = None
+    nrows = 0  # rows in the file
+    reader = pd.read_csv(textio, dtype=str, sep=sep, na_filter=False,
+                         chunksize=rows_per_chunk)
+    for chunk in reader:
+        if columns is None:
+            colnames = list(chunk.columns)
+            columns = [_StreamingColumn(i, i in text_column_indices)
+                       for i in range(len(colnames))]
+
+        chunk_start = nrows
+        nrows += len(chunk)
+        if chunk_start >= max_rows:
+            continue  # past the end of our table: only count rows
+        if nrows > max_rows:
+            chunk = chunk.iloc[:max_rows - chunk_start]
+
+        restart_column_indices = set(
+            i
+            for i, column in enumerate(columns)
+            if not column.append(chunk.iloc[:, i].values)
+        )
+        if restart_column_indices:
+            raise _RestartParse(restart_column_indices)
+
+    if columns is None:
+        # Header but no rows: pd.read_csv() yielded no chunks
+        colnames = list(header.columns)
+        columns = [_StreamingColumn(i, True) for i in range(len(colnames))]
+
+    data = pd.DataFrame({i: column.to_series()
+                         for i, column in enumerate(columns)})
+    data.columns = colnames
+    data.reset_index(drop=True, inplace=True)  # empty => RangeIndex
+
+    if nrows > len(data):
+        return ProcessResult(data, error=(
+            'Truncated output from %d rows to %d' % (nrows, len(data))
+        ))
+    else:
+        return ProcessResult(data)
+
+
 def _parse_table(bytesio: io.BytesIO, sep: Optional[str],
-                 text_encoding: _TextEncoding) -> pd.DataFrame:
+                 text_encoding: _TextEncoding) -> ProcessResult:
+    """
+    Parse CSV/TSV/txt, with peak memory proportional to the output table.
+
+    pd.read_csv(..., dtype='category') tokenizes the whole file before
+    converting any of it, and then we'd convert categories to numbers and
+    truncate to MAX_ROWS_PER_TABLE. On our 1.2GB `general.csv` that costs
+    ~3GB of RAM. Instead, we read `settings.PARSE_CSV_CHUNK_CELLS` cells at a
+    time and convert as we go (see _StreamingColumn); and we stop converting
+    at MAX_ROWS_PER_TABLE. (We keep reading after that, to count rows.)
+
+    If a column holds numbers at first but a later chunk holds text, we
+    restart the parse with that column read as text. That's rare: in most
+    files, the first chunk tells us every column's type.
+    """
     with wrap_text(bytesio, text_encoding) as textio:
         if not sep:
             sep = _detect_separator(textio)
 
-        # Pandas CSV parser looks like this:
-        #
-        # 1. "Tokenize" the input stream: copy all its _data_ bytes into
-        #    memory, and maintain arrays of "words" and "lines" pointers
-        #    into that array.
-        # 2. Determine list of columns
-        # 3. Per-column, convert dtypes to array
-        # 4. Smoosh arrays together into a pd.DataFrame.
-        #
-        # When `low_memory=True`, all this happens in a bigger loop, so
-        # that the tokenized data structure is smaller.
-        #
-        # `low_memory=True` forces re-coding categories. That's `O(Ch * N
-        # * Ca lg Ca)`, where Ch is number of column-chunks (9,000 * 60
-        # in this case), N is number of records, Ch is number of chunks
-        # (8, in this case), and Ca is the number of categories.
-        #
-        # This `rc11.txt` file has enormous `Ch`: 9,000 * 60 = 540,000.
-        # `general.csv` (our 1.2GB file) is much smaller, at ~4,000, even
-        # though it has 250x more rows. Pandas doesn't let us adjust
-        # chunk size, and its heuristic is terrible for`rc11.txt`.
-        #
-        # Let's try `low_memory=False`. That makes the CPU cost
-        # `O(N * Co * Ca lg Ca)`, where Co is the number of columns. Memory
-        # usage grows by the number of cells. In the case of `general.csv`,
-        # the cost is an extra 1GB.
-        data = pd.read_csv(textio, dtype='category', sep=sep,
-                           na_filter=False, low_memory=False)
-        data.reset_index(drop=True, inplace=True)  # empty => RangeIndex
-        autocast_dtypes_in_place(data)
-        return data
+        text_column_indices = set()
+        while True:
+            try:
+                return _parse_table_chunks(textio, sep, text_column_indices)
+            except _RestartParse as err:
+                text_column_indices.update(err.column_indices)
+                textio.seek(0)
 
 
 def _parse_csv(bytesio: io.BytesIO,
-               text_encoding: _TextEncoding) -> pd.DataFrame:
-    """Build a pd.DataFrame or raise parse error.
+               text_encoding: _TextEncoding) -> ProcessResult:
+    """Build a ProcessResult or raise parse error.
 
     Peculiarities:
 
@@ -245,8 +389,8 @@ def _parse_csv(bytesio: io.BytesIO,
 
 
 def _parse_tsv(bytesio: io.BytesIO,
-               text_encoding: _TextEncoding) -> pd.DataFrame:
-    """Build a pd.DataFrame or raise parse error.
+               text_encoding: _TextEncoding) -> ProcessResult:
+    """Build a ProcessResult or raise parse error.
 
     Peculiarities:
 
@@ -338,9 +482,9 @@ def _parse_xlsx(bytesio: io.BytesIO, _unused: _TextEncoding) -> pd.DataFrame:
 
 
 def _parse_txt(bytesio: io.BytesIO,
-               text_encoding: _TextEncoding) -> pd.DataFrame:
+               text_encoding: _TextEncoding) -> ProcessResult:
     """
-    Build a pd.DataFrame from txt bytes or raise parse error.
+    Build a ProcessResult from txt bytes or raise parse error.
 
     Peculiarities:
 
@@ -558,27 +702,15 @@ async def spooled_data_from_url(url: str, headers: Dict[str, str] = {},
 
     Raise asyncio.TimeoutError when `timeout` seconds have expired.
     """
-
-    # aiohttp internally performs URL canonization before sending
-    # request. DISABLE THIS: it breaks oauth and user's expectations.
-    #
-    # https://github.com/aio-libs/aiohttp/issues/3424
-    url = yarl.URL(url, encoded=True)  # prevent magic
-    if url.scheme not in ('http', 'https'):
-        raise aiohttp.InvalidURL('URL must start with http:// or https://')
-
     with tempfile.TemporaryFile(prefix='loadurl') as spool:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers,
-                                   timeout=timeout,
-                                   raise_for_status=True) as response:
-                response.raise_for_status()
-
-                async for blob in response.content.iter_chunked(_ChunkSize):
-                    spool.write(blob)
-
-                headers = response.headers
-                charset = response.charset
+        response = await httpclient.get(url, headers=headers, timeout=timeout,
+                                        raise_for_status=True)
+        async with response:
+            async for blob in httpclient.iter_chunked(response, _ChunkSize):
+                spool.write(blob)
+
+            headers = response.headers
+            charset = response.charset
 
         spool.seek(0)
         yield spool, headers, charset
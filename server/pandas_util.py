@@ -1,4 +1,6 @@
-from pandas import DataFrame
+import hashlib
+import numpy as np
+from pandas import Categorical, DataFrame, Series, isna
 from pandas.util import hash_pandas_object
 
 
@@ -7,3 +9,68 @@ def hash_table(table: DataFrame) -> str:
     h = hash_pandas_object(table).sum()  # xor would be nice, but whatevs
     h = h if h > 0 else -h               # stay positive (sum often overflows)
     return str(h)
+
+
+def fingerprint_table(table: DataFrame) -> str:
+    """
+    Build a hex digest of `table`'s column names, dtypes and values.
+
+    Unlike `hash_table()`, this is order-sensitive: swapping two rows (or two
+    columns) produces a different fingerprint. Two tables with the same
+    fingerprint are equal, for all intents and purposes.
+    """
+    h = hashlib.sha1()
+    h.update(repr(len(table)).encode('utf-8'))
+    for column in table.columns:
+        series = table[column]
+        h.update(repr((column, str(series.dtype))).encode('utf-8'))
+        h.update(hash_pandas_object(series, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def column_digest(series: Series) -> bytes:
+    """
+    Build a SHA-1 digest of `series`'s values, in order.
+
+    Unlike `hash_pandas_object()`, this digests the values themselves -- not
+    64-bit hashes of them -- so two different columns won't collide in
+    practice. `series` must be valid (see `cjworkbench.types.validate_series`):
+    text must be `str`, `None` or `np.nan`.
+
+    The dtype is not part of the digest: `table_digest()` adds it.
+    """
+    h = hashlib.sha1()
+    values = series.values
+    if isinstance(values, Categorical):
+        h.update(column_digest(Series(values.categories.values)))
+        h.update(np.ascontiguousarray(values.codes).view(np.uint8))
+    elif values.dtype.kind in 'biufcmM':
+        h.update(np.ascontiguousarray(values).view(np.uint8))
+    else:
+        # Text. Digest the null mask, each string's length and then all the
+        # text at once: together they identify the exact list of values.
+        isnull = isna(values)
+        strings = values[~isnull]
+        lengths = np.fromiter((len(s) for s in strings), dtype=np.int64,
+                              count=len(strings))
+        h.update(np.packbits(isnull).tobytes())
+        h.update(lengths.tobytes())
+        h.update(''.join(strings).encode('utf-8', errors='surrogatepass'))
+    return h.digest()
+
+
+def table_digest(table: DataFrame) -> str:
+    """
+    Build a hex SHA-1 digest of `table`'s column names, dtypes and values.
+
+    Like `fingerprint_table()`, this is order-sensitive. Unlike it, it hashes
+    values themselves (see `column_digest()`), so it's strong enough to use
+    as a content address: two tables with the same digest hold the same data.
+    """
+    h = hashlib.sha1()
+    h.update(repr(len(table)).encode('utf-8'))
+    for column in table.columns:
+        series = table[column]
+        h.update(repr((column, str(series.dtype))).encode('utf-8'))
+        h.update(column_digest(series))
+    return h.hexdigest()
@@ -1,15 +1,18 @@
+from contextlib import contextmanager
 import functools
 import io
 from pathlib import Path
 import tempfile
 from urllib3.exceptions import ProtocolError
 import fastparquet
-from typing import Any, Callable
+import numpy
+from typing import Any, Callable, Iterator, List, Optional
 from fastparquet import ParquetFile
 import pandas
 import snappy
 import warnings
-from server import minio
+from django.conf import settings
+from server import dataframe_mmap, minio
 
 
 # Workaround for https://github.com/dask/fastparquet/issues/394
@@ -18,7 +21,7 @@ warnings.filterwarnings("ignore", category=FutureWarning,
                         module='fastparquet.util', lineno=221)
 
 
-def _minio_open_random(bucket, key):
+def _minio_open_random(bucket, key, file_stat=None):
     if key.endswith('/_metadata'):
         # fastparquet insists upon trying for the 'hive' storage schema before
         # settling on the 'simple' storage schema. At no time have we ever
@@ -31,7 +34,7 @@ def _minio_open_random(bucket, key):
     # (We'll want to benchmark.) Another option is to use the 'hive' format and
     # FullReadMinioFile; but that choice would be hard to un-choose, so let's
     # not rush into it.
-    raw = minio.RandomReadMinioFile(bucket, key)
+    raw = minio.RandomReadMinioFile(bucket, key, file_stat=file_stat)
 
     # fastparquet actually expects a _buffered_ reader -- it expects `read()`
     # to always return a buffer of the same length it requests.
@@ -40,7 +43,7 @@ def _minio_open_random(bucket, key):
     return buffered
 
 
-def _minio_open_full(bucket, key):
+def _minio_open_full(bucket, key, file_stat=None):
     """
     Optimized open call, for when we know we'll read the entire file.
     """
@@ -54,7 +57,7 @@ def _minio_open_full(bucket, key):
     # Don't worry about needing a _buffered_ reader here (like we worry in
     # _minio_open_random). FullReadMinioFile actually does a regular open() on
     # a regular file -- so it will behave exactly as fastparquet expects.
-    return minio.FullReadMinioFile(bucket, key)
+    return minio.FullReadMinioFile(bucket, key, file_stat=file_stat)
 
 
 # Suppress this arning:
@@ -102,6 +105,67 @@ def read_header(bucket: str, key: str,
     return fastparquet.ParquetFile(filelike)
 
 
+@contextmanager
+def _translate_fastparquet_errors():
+    """
+    Convert Fastparquet's errors on old pyarrow-written files.
+
+    See FastparquetIssue375.
+    """
+    try:
+        yield
+    except snappy.UncompressError as err:
+        if str(err) == 'Error while decompressing: invalid input':
+            # Assume Fastparquet is reporting the wrong bug.
+            #
+            # XXX this means we can't actually report corrupt files. Let's fix
+            # Fastparquet and delete this possibility altogether.
+            raise FastparquetIssue375
+        raise
+    except AssertionError:
+        raise FastparquetIssue375
+
+
+TableFormatMetadataKey = 'table-format'
+"""
+S3 user-metadata key that marks a file's format.
+
+Files written in 'mmap' format have `{'table-format': 'mmap'}`. Files without
+it are Parquet -- as are all files written before we had a choice.
+"""
+
+
+_TableFormatSettingsKeys = {
+    minio.CachedRenderResultsBucket: 'cached-render-results',
+    minio.StoredObjectsBucket: 'stored-objects',
+}
+
+
+def _write_format(bucket: str) -> str:
+    """Return 'parquet' or 'mmap', from `settings.TABLE_FORMATS`."""
+    settings_key = _TableFormatSettingsKeys.get(bucket)
+    table_format = settings.TABLE_FORMATS.get(settings_key, 'parquet')
+    if table_format not in ('parquet', 'mmap'):
+        raise ValueError('Invalid table format %r for bucket %s'
+                         % (table_format, bucket))
+    return table_format
+
+
+def _stat(bucket: str, key: str) -> minio.Stat:
+    """
+    Return the file's `minio.Stat`, or raise FileNotFoundError.
+
+    Pass the result to `minio.open_cached()` or `_minio_open_*()`, so we
+    request the file's metadata at most once per read. (If the file is in
+    the local cache, we don't request it at all.)
+    """
+    return minio.cached_stat(bucket, key)
+
+
+def _is_mmap(file_stat: minio.Stat) -> bool:
+    return file_stat.metadata.get(TableFormatMetadataKey) == 'mmap'
+
+
 def read(bucket: str, key: str, to_parquet_args=[],
          to_parquet_kwargs={}) -> pandas.DataFrame:
     """
@@ -113,40 +177,213 @@ def read(bucket: str, key: str, to_parquet_args=[],
     https://github.com/dask/fastparquet/issues/375 -- we used to write with
     pyarrow, and fastparquet fails on some files with large strings. Those
     files are so old we won't attempt to support them.
+
+    Files written in 'mmap' format (see `write()`) are downloaded to the local
+    cache once and memory-mapped. Of `to_parquet_args` and
+    `to_parquet_kwargs`, only `columns` applies to them.
     """
+    file_stat = _stat(bucket, key)
+    if _is_mmap(file_stat):
+        if to_parquet_args:
+            columns = to_parquet_args[0]
+        else:
+            columns = to_parquet_kwargs.get('columns')
+        with minio.open_cached(bucket, key, file_stat) as f:
+            return dataframe_mmap.read_dataframe(f, columns)
+
     if to_parquet_args or to_parquet_kwargs:
-        open_with = _minio_open_random
+        open_with = functools.partial(_minio_open_random, file_stat=file_stat)
     else:
-        open_with = _minio_open_full
+        open_with = functools.partial(_minio_open_full, file_stat=file_stat)
 
-    try:
+    with _translate_fastparquet_errors():
         pf = read_header(bucket, key, open_with=open_with)
         return pf.to_pandas(*to_parquet_args, **to_parquet_kwargs)
-    except snappy.UncompressError as err:
-        if str(err) == 'Error while decompressing: invalid input':
-            # Assume Fastparquet is reporting the wrong bug.
-            #
-            # XXX this means we can't actually report corrupt files. Let's fix
-            # Fastparquet and delete this possibility altogether.
-            raise FastparquetIssue375
-        raise
-    except AssertionError:
-        raise FastparquetIssue375
 
 
-def write(bucket: str, key: str, table: pandas.DataFrame) -> int:
+def read_row_range(bucket: str, key: str, columns: Optional[List[str]],
+                   start_row: int, end_row: int) -> pandas.DataFrame:
+    """
+    Load rows `start_row:end_row` of a Pandas DataFrame from disk.
+
+    Only the row groups that overlap the requested range are read, so only
+    their bytes are downloaded from minio (in `RandomReadMinioFile` blocks).
+    Files written with a single row group (i.e., before `write()` accepted
+    `row_group_size`) are read in full -- slower, but still correct.
+
+    The returned DataFrame has a fresh RangeIndex.
+
+    Files in 'mmap' format are read from the local cache, slicing only the
+    requested rows.
+
+    May raise OSError or FastparquetCouldNotHandleFile, like `read()`.
+    """
+    file_stat = _stat(bucket, key)
+    if _is_mmap(file_stat):
+        with minio.open_cached(bucket, key, file_stat) as f:
+            return dataframe_mmap.read_row_range(f, columns, start_row,
+                                                 end_row)
+
+    open_with = functools.partial(_minio_open_random, file_stat=file_stat)
+    with _translate_fastparquet_errors():
+        pf = read_header(bucket, key, open_with=open_with)
+
+        row_groups = []
+        first_row_group_start = None
+        offset = 0
+        for row_group in pf.row_groups:
+            n = row_group.num_rows
+            if offset + n > start_row and offset < end_row:
+                if first_row_group_start is None:
+                    first_row_group_start = offset
+                row_groups.append(row_group)
+            offset += n
+
+        if first_row_group_start is None:
+            # No rows in range: return an empty table, with the right dtypes
+            row_groups = pf.row_groups[:0]
+            first_row_group_start = start_row
+
+        # Fastparquet's to_pandas() reads `pf.row_groups`. `pf` is ours alone,
+        # so we can restrict what it reads by overwriting that list.
+        pf.row_groups = row_groups
+        dataframe = pf.to_pandas(columns=columns)
+
+    dataframe = dataframe.iloc[(start_row - first_row_group_start):
+                               (end_row - first_row_group_start)]
+    dataframe.reset_index(drop=True, inplace=True)
+    return dataframe
+
+
+def read_rows(bucket: str, key: str, columns: Optional[List[str]],
+              rows: numpy.array) -> pandas.DataFrame:
+    """
+    Load rows `rows` (in that order) of a Pandas DataFrame from disk.
+
+    Like `read_row_range()`, only the row groups that hold `rows` are read.
+    Rows near one another are cheap; rows scattered across a big table cost
+    a read of every row group they touch.
+
+    The returned DataFrame has a fresh RangeIndex. Raise IndexError if a row
+    is out of bounds.
+
+    May raise OSError or FastparquetCouldNotHandleFile, like `read()`.
+    """
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+
+    file_stat = _stat(bucket, key)
+    if _is_mmap(file_stat):
+        with minio.open_cached(bucket, key, file_stat) as f:
+            return dataframe_mmap.read_rows(f, columns, rows)
+
+    open_with = functools.partial(_minio_open_random, file_stat=file_stat)
+    with _translate_fastparquet_errors():
+        pf = read_header(bucket, key, open_with=open_with)
+
+        # Row number of the first row in each row group (and the end)
+        starts = numpy.cumsum([0] + [rg.num_rows for rg in pf.row_groups])
+        if len(rows) and (rows.min() < 0 or rows.max() >= starts[-1]):
+            raise IndexError('Rows are out of bounds')
+
+        group_of_row = numpy.searchsorted(starts, rows, side='right') - 1
+        wanted = numpy.unique(group_of_row)
+        # Fastparquet's to_pandas() reads `pf.row_groups`. See
+        # read_row_range().
+        pf.row_groups = [pf.row_groups[i] for i in wanted]
+        dataframe = pf.to_pandas(columns=columns)
+
+    # Map each row number to its position in `dataframe`
+    read_starts = numpy.cumsum([0] + [rg.num_rows for rg in pf.row_groups])
+    positions = (read_starts[numpy.searchsorted(wanted, group_of_row)]
+                 + rows - starts[group_of_row])
+    dataframe = dataframe.iloc[positions]
+    dataframe.reset_index(drop=True, inplace=True)
+    return dataframe
+
+
+def iter_chunks(bucket: str, key: str, nrows_per_chunk: int,
+                columns: Optional[List[str]] = None
+                ) -> Iterator[pandas.DataFrame]:
+    """
+    Yield a table (or just `columns`) as a series of DataFrames, so callers
+    can stream it.
+
+    Parquet files yield one DataFrame per row group. (Files written with a
+    single row group -- i.e., before `write()` accepted `row_group_size` --
+    yield one big DataFrame.) Files in 'mmap' format yield `nrows_per_chunk`
+    rows at a time. We always yield at least one DataFrame, even if the table
+    is empty, so callers can read column names.
+
+    The first `next()` downloads the entire file to the local cache. After
+    that, deleting the file from minio won't interrupt the caller.
+
+    The first `next()` may raise OSError or FastparquetCouldNotHandleFile,
+    like `read()`.
+    """
+    file_stat = _stat(bucket, key)
+    if _is_mmap(file_stat):
+        with minio.open_cached(bucket, key, file_stat) as f:
+            start_row = 0
+            while True:
+                dataframe = dataframe_mmap.read_row_range(
+                    f,
+                    columns,
+                    start_row,
+                    start_row + nrows_per_chunk
+                )
+                if start_row == 0 or len(dataframe):
+                    yield dataframe
+                if len(dataframe) < nrows_per_chunk:
+                    return
+                start_row += nrows_per_chunk
+
+    open_with = functools.partial(_minio_open_full, file_stat=file_stat)
+    with _translate_fastparquet_errors():
+        pf = read_header(bucket, key, open_with=open_with)
+        if not pf.row_groups:
+            yield pf.to_pandas(columns=columns)
+            return
+
+        for dataframe in pf.iter_row_groups(columns=columns):
+            yield dataframe
+
+
+def write(bucket: str, key: str, table: pandas.DataFrame,
+          row_group_size: Optional[int] = None) -> int:
     """
     Write a Pandas DataFrame to a minio file, overwriting if needed.
 
     Return number of bytes written.
 
+    If `row_group_size` is set, split the file into row groups of roughly that
+    many rows, so `read_row_range()` can read a few rows cheaply.
+
+    The file format depends on `bucket`: see `settings.TABLE_FORMATS`. The
+    'mmap' format (`server.dataframe_mmap`) is larger than Parquet, but it
+    reads without decoding: readers memory-map a local copy and share its
+    pages.
+
     We aim to keep the file format "stable": all future versions of
     parquet.read() should support all files written by today's version of this
     function.
     """
+    if row_group_size is None:
+        # fastparquet default: one row group per 50M rows (i.e., one)
+        kwargs = {}
+    else:
+        kwargs = {'row_group_offsets': row_group_size}
+
+    if _write_format(bucket) == 'mmap':
+        with tempfile.NamedTemporaryFile() as tf:
+            dataframe_mmap.write_dataframe(tf, table,
+                                           rows_per_chunk=row_group_size)
+            minio.fput_file(bucket, key, Path(tf.name),
+                            metadata={TableFormatMetadataKey: 'mmap'})
+            return tf.tell()
+
     with tempfile.NamedTemporaryFile() as tf:
         fastparquet.write(tf.name, table, compression='SNAPPY',
-                          object_encoding='utf8')
+                          object_encoding='utf8', **kwargs)
         minio.fput_file(bucket, key, Path(tf.name))
         tf.seek(0, io.SEEK_END)
         return tf.tell()
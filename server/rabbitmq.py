@@ -1,4 +1,5 @@
 import asyncio
+from typing import List
 from cjworkbench import rabbitmq
 
 
@@ -43,6 +44,16 @@ async def queue_fetch(wf_module):
     await connection.queue_fetch(wf_module.id)
 
 
+async def queue_fetch_batch(wf_module_ids: List[int]):
+    """
+    Queue many fetches in RabbitMQ, in order.
+
+    The caller must have written is_busy=True on each WfModule.
+    """
+    connection = await get_connection()
+    await connection.queue_fetch_batch(wf_module_ids)
+
+
 async def queue_handle_upload_DELETEME(uploaded_file):
     """
     Queue handle-upload in RabbitMQ.
@@ -1,5 +1,5 @@
 import re
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Iterable, Optional, Tuple
 from allauth.account.utils import user_display
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
@@ -46,6 +46,28 @@ def _camel_case_dict_factory(tuples: Tuple[str, Any]) -> Dict[str, Any]:
     return dict((_camelize(k), v) for k, v in tuples)
 
 
+class _FieldSubsetMixin:
+    """
+    Let callers pass `fields=[...]` to serialize only some fields.
+
+    Usage:
+
+        class MySerializer(_FieldSubsetMixin, serializers.ModelSerializer):
+            ...
+
+        MySerializer(obj, fields=['name']).data  # {'name': ...}
+    """
+
+    def __init__(self, *args, fields: Optional[Iterable[str]] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.only_fields = None if fields is None else frozenset(fields)
+        if self.only_fields is not None:
+            for name in list(self.fields):
+                if name not in self.only_fields:
+                    self.fields.pop(name)
+
+
 class StoredObjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = StoredObject
@@ -92,11 +114,15 @@ class ModuleSerializer(serializers.ModelSerializer):
                   'param_fields')
 
 
-class TabSerializer(serializers.ModelSerializer):
+class TabSerializer(_FieldSubsetMixin, serializers.ModelSerializer):
     wf_module_ids = serializers.SerializerMethodField()
 
     def get_wf_module_ids(self, obj):
-        return list(obj.live_wf_modules.values_list('id', flat=True))
+        try:
+            # set by workflow_snapshot
+            return self.context['tab_wf_module_ids'][obj.id]
+        except KeyError:
+            return list(obj.live_wf_modules.values_list('id', flat=True))
 
     class Meta:
         model = Tab
@@ -115,7 +141,12 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('email', 'display_name', 'id', 'is_staff')
 
 
-class WfModuleSerializer(serializers.ModelSerializer):
+class WfModuleSerializer(_FieldSubsetMixin, serializers.ModelSerializer):
+    # Fields from get_cached_render_result_data(). They come as a set: pass
+    # any of them in `fields` to serialize all three.
+    CachedRenderResultFields = frozenset(['cached_render_result_delta_id',
+                                          'output_columns', 'output_n_rows'])
+
     params = serializers.SerializerMethodField()
     update_interval = serializers.SerializerMethodField()
     update_units = serializers.SerializerMethodField()
@@ -140,10 +171,17 @@ class WfModuleSerializer(serializers.ModelSerializer):
             return False
 
     def get_versions(self, wfm):
+        try:
+            # set by workflow_snapshot
+            fetched_data_versions = self.context['fetched_data_versions'][
+                wfm.id
+            ]
+        except KeyError:
+            fetched_data_versions = wfm.list_fetched_data_versions()
         versions = [
             # XXX nonsense: Arrays instead of JSON objects.
             [isoformat(stored_at), read]
-            for stored_at, read in wfm.list_fetched_data_versions()
+            for stored_at, read in fetched_data_versions
         ]
         current_version = isoformat(wfm.stored_data_version)
         return {'versions': versions, 'selected': current_version}
@@ -174,7 +212,9 @@ class WfModuleSerializer(serializers.ModelSerializer):
 
     def to_representation(self, wfm):
         ret = super().to_representation(wfm)
-        ret.update(self.get_cached_render_result_data(wfm))
+        if self.only_fields is None \
+           or self.only_fields & self.CachedRenderResultFields:
+            ret.update(self.get_cached_render_result_data(wfm))
         return ret
 
     def get_params(self, wfm):
@@ -238,6 +278,7 @@ class WorkflowSerializerLite(serializers.ModelSerializer):
 
 class WorkflowSerializer(WorkflowSerializerLite):
     tab_slugs = serializers.SerializerMethodField()
+    last_delta_id = serializers.ReadOnlyField()
 
     def get_tab_slugs(self, obj):
         return list(obj.live_tabs.values_list('slug', flat=True))
@@ -246,7 +287,8 @@ class WorkflowSerializer(WorkflowSerializerLite):
         model = Workflow
         fields = ('id', 'url_id', 'name', 'tab_slugs', 'public', 'read_only',
                   'last_update', 'is_owner', 'owner_email', 'owner_name',
-                  'selected_tab_position', 'is_anonymous', 'acl')
+                  'selected_tab_position', 'is_anonymous', 'acl',
+                  'last_delta_id')
 
 
 class LessonSerializer(serializers.BaseSerializer):
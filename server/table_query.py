@@ -0,0 +1,240 @@
+"""
+Sorted and filtered views of cached render results.
+
+The data grid asks for, say, "rows 200-300 of this table, sorted by B and
+filtered to rows whose A contains 'x'". Answering means reading whole
+columns. We do that once per (result, column), build a `ColumnIndex`, and
+keep it in memory: after that, each page is a slice of row numbers plus a
+read of just those rows.
+
+We key cache entries on the cached result's hash (see
+`server.models.CachedRenderResult.hash_process_result()`), not its delta
+ID: a re-render can change a result without changing its delta ID. Two
+results with the same hash have the same table and column formats, so an
+entry can't go stale. We evict the least-recently-used entries once the
+cache exceeds its size in bytes. Each web process has its own cache.
+(Results rendered before we stored hashes aren't cached.)
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+from typing import Callable, Hashable, Optional, TypeVar
+import numpy as np
+import pandas as pd
+from cjworkbench.types import Column
+
+
+MaxCachedIndexBytes = 256 * 1024 * 1024
+"""Size of `ColumnIndex` objects each process keeps in memory."""
+
+MaxCachedQueryBytes = 64 * 1024 * 1024
+"""Size of query results (arrays of row numbers) each process keeps."""
+
+
+T = TypeVar('T')
+
+
+class _LruCache:
+    """
+    Thread-safe dict that forgets its least-recently-used entries.
+
+    `nbytes(value)` is the size of each value. The total stays under
+    `max_bytes`: we don't cache a value larger than that.
+    """
+
+    def __init__(self, max_bytes: int, nbytes: Callable[[T], int]):
+        self.max_bytes = max_bytes
+        self._nbytes = nbytes
+        self._data = OrderedDict()  # key => (value, nbytes)
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], T]) -> T:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key][0]
+            except KeyError:
+                pass
+
+        # Build outside the lock: building reads from minio. Two threads may
+        # build the same value; that's wasteful but correct.
+        value = build()
+        nbytes = self._nbytes(value)
+
+        with self._lock:
+            if key not in self._data and nbytes <= self.max_bytes:
+                self._data[key] = (value, nbytes)
+                self._n_bytes += nbytes
+                while self._n_bytes > self.max_bytes:
+                    _, (_, evicted_nbytes) = self._data.popitem(last=False)
+                    self._n_bytes -= evicted_nbytes
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._n_bytes = 0
+
+
+_column_indexes = _LruCache(MaxCachedIndexBytes, lambda index: index.nbytes)
+_query_results = _LruCache(MaxCachedQueryBytes, lambda rows: rows.nbytes)
+
+
+class ColumnIndex:
+    """
+    Sort permutation and inverted index of one column.
+
+    `values` are the column's distinct non-null values, sorted. Rows
+    `rows[offsets[i]:offsets[i + 1]]` hold `values[i]`, in table order; rows
+    `rows[offsets[-1]:]` are null. So `rows` is also the ascending sort
+    permutation, nulls last.
+    """
+
+    def __init__(self, series: pd.Series, column: Column):
+        if hasattr(series, 'cat'):
+            # Sort by value, not by category order
+            series = series.astype(object)
+        codes, values = pd.factorize(series.values, sort=True)
+        n_values = len(values)
+
+        keys = np.where(codes < 0, n_values, codes)  # nulls last
+        self.rows = np.argsort(keys, kind='mergesort').astype(np.int32)
+        self.offsets = np.searchsorted(keys[self.rows],
+                                       np.arange(n_values + 1))
+        self.values = values
+        self.column = column
+        self._codes = codes
+        self._descending_rows = None
+        self._formatted_values = None
+
+        # Count the lazily-built parts as though they were built: descending
+        # rows are the size of `rows`; formatted values, about `values`.
+        values_nbytes = int(pd.Series(values).memory_usage(index=False,
+                                                           deep=True))
+        self.nbytes = (2 * self.rows.nbytes + self.offsets.nbytes
+                       + codes.nbytes + 2 * values_nbytes)
+
+    def sort_permutation(self, ascending: bool) -> np.array:
+        """Row numbers in sorted order, nulls last; ties keep table order."""
+        if ascending:
+            return self.rows
+
+        if self._descending_rows is None:
+            n_values = len(self.values)
+            keys = np.where(self._codes < 0, n_values,
+                            n_values - 1 - self._codes)
+            self._descending_rows = \
+                np.argsort(keys, kind='mergesort').astype(np.int32)
+        return self._descending_rows
+
+    @property
+    def formatted_values(self) -> pd.Series:
+        """`values`, formatted the way the value-counts endpoint does."""
+        if self._formatted_values is None:
+            self._formatted_values = self.column.type.format_series(
+                pd.Series(np.asarray(self.values))
+            )
+        return self._formatted_values
+
+    def rows_where(self, mask: np.array) -> np.array:
+        """Sorted row numbers whose value `i` has `mask[i]`."""
+        parts = [self.rows[self.offsets[i]:self.offsets[i + 1]]
+                 for i in np.flatnonzero(mask)]
+        if not parts:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate(parts))
+
+
+@dataclass(frozen=True)
+class Query:
+    sort_column: Optional[str] = None
+    """Column to sort by, or None to keep table order."""
+
+    sort_ascending: bool = True
+
+    filter_column: Optional[str] = None
+    """Column to filter by, or None to keep all rows."""
+
+    filter_value: Optional[str] = None
+    """Keep rows whose formatted value is exactly this."""
+
+    filter_substring: Optional[str] = None
+    """Keep rows whose formatted value contains this (ignoring case)."""
+
+
+def get_column_index(cached_result: 'CachedRenderResult',
+                     column: Column) -> ColumnIndex:
+    """
+    Return the `ColumnIndex` of `column`, building it if needed.
+
+    Building reads the column: it may raise FileNotFoundError.
+    """
+    def build():
+        return ColumnIndex(cached_result.read_column(column.name), column)
+
+    if cached_result.hash is None:
+        return build()
+    return _column_indexes.get_or_build((cached_result.hash, column.name),
+                                        build)
+
+
+def _find_column(cached_result: 'CachedRenderResult', name: str) -> Column:
+    for column in cached_result.columns:
+        if column.name == name:
+            return column
+    raise KeyError(name)
+
+
+def _evaluate(cached_result: 'CachedRenderResult', query: Query) -> np.array:
+    if query.filter_column is not None:
+        index = get_column_index(
+            cached_result,
+            _find_column(cached_result, query.filter_column)
+        )
+        formatted = index.formatted_values
+        if query.filter_value is not None:
+            mask = (formatted == query.filter_value).values
+        else:
+            mask = formatted.str.contains(query.filter_substring or '',
+                                          case=False, regex=False).values
+        filtered_rows = index.rows_where(mask)
+    else:
+        filtered_rows = None
+
+    if query.sort_column is not None:
+        index = get_column_index(
+            cached_result,
+            _find_column(cached_result, query.sort_column)
+        )
+        rows = index.sort_permutation(query.sort_ascending)
+        if filtered_rows is not None:
+            rows = rows[np.isin(rows, filtered_rows, assume_unique=True)]
+        return rows
+    elif filtered_rows is not None:
+        return filtered_rows
+    else:
+        return np.arange(cached_result.nrows, dtype=np.int32)
+
+
+def query_rows(cached_result: 'CachedRenderResult', query: Query) -> np.array:
+    """
+    Return the row numbers that `query` selects from `cached_result`, in order.
+
+    The first call for a column reads it in full (and may raise
+    FileNotFoundError). Later calls that sort or filter by the same column
+    reuse its `ColumnIndex`; repeating the same query is a cache lookup.
+
+    Raise KeyError if `query` names a column that does not exist.
+    """
+    for name in (query.sort_column, query.filter_column):
+        if name is not None:
+            _find_column(cached_result, name)  # raise KeyError
+
+    def build():
+        return _evaluate(cached_result, query)
+
+    if cached_result.hash is None:
+        return build()
+    return _query_results.get_or_build((cached_result.hash, query), build)
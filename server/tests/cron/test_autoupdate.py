@@ -1,9 +1,11 @@
 import asyncio
+from datetime import timedelta
 import logging
 from unittest.mock import patch
 from dateutil import parser
+from django.db import connection
 from server.cron import autoupdate
-from server.models import Workflow
+from server.models import Workflow, WorkflowViewers
 from server.tests.utils import DbTestCase
 
 
@@ -11,36 +13,37 @@ future_none = asyncio.Future()
 future_none.set_result(None)
 
 
-class SuccessfulRenderLock:
-    def __init__(self, workflow_id: int):
-        self.workflow_id = workflow_id
+Now = parser.parse('Aug 28 1999 2:35PM UTC')
 
-    @classmethod
-    def render_lock(cls, workflow_id: int):
-        return cls(workflow_id)
 
-    async def __aenter__(self):
-        pass
-
-    async def __aexit__(self, exc_type, exc, tb):
-        pass
+@patch('server.websockets.ws_client_send_delta_async',
+       lambda _1, _2: future_none)
+@patch('django.utils.timezone.now', lambda: Now)
+class UpdatesTests(DbTestCase):
+    def setUp(self):
+        super().setUp()
 
+        self.workflow = Workflow.objects.create()
+        self.tab = self.workflow.tabs.create(position=0)
 
-class UpdatesTests(DbTestCase):
-    @patch('server.rabbitmq.queue_fetch')
-    @patch('server.websockets.ws_client_send_delta_async',
-           lambda _1, _2: future_none)
-    @patch('django.utils.timezone.now',
-           lambda: parser.parse('Aug 28 1999 2:35PM UTC'))
-    def test_queue_fetches(self, mock_queue_fetch):
-        workflow = Workflow.objects.create()
-        tab = workflow.tabs.create(position=0)
+    def _create_due_wf_module(self, tab=None, **kwargs):
+        return (tab or self.tab).wf_modules.create(
+            order=0,
+            auto_update_data=True,
+            last_update_check=parser.parse('Aug 28 1999 2:24PM UTC'),
+            next_update=parser.parse('Aug 28 1999 2:34PM UTC'),
+            update_interval=600,
+            **kwargs
+        )
 
+    @patch('server.rabbitmq.queue_fetch_batch')
+    def test_queue_fetches(self, mock_queue_fetch_batch):
         # wfm1 does not auto-update
-        self.wfm1 = tab.wf_modules.create(order=0, auto_update_data=False)
+        self.wfm1 = self.tab.wf_modules.create(order=0,
+                                               auto_update_data=False)
 
         # wfm2 is ready to update
-        self.wfm2 = tab.wf_modules.create(
+        self.wfm2 = self.tab.wf_modules.create(
             order=1,
             auto_update_data=True,
             last_update_check=parser.parse('Aug 28 1999 2:24PM UTC'),
@@ -49,7 +52,7 @@ class UpdatesTests(DbTestCase):
         )
 
         # wfm3 has a few more minutes before it should update
-        self.wfm3 = tab.wf_modules.create(
+        self.wfm3 = self.tab.wf_modules.create(
             order=2,
             auto_update_data=True,
             last_update_check=parser.parse('Aug 28 1999 2:20PM UTC'),
@@ -57,23 +60,117 @@ class UpdatesTests(DbTestCase):
             update_interval=1200
         )
 
-        mock_queue_fetch.return_value = future_none
+        mock_queue_fetch_batch.return_value = future_none
 
         # eat log messages
         with self.assertLogs(autoupdate.__name__, logging.INFO):
-            self.run_with_async_db(
-                autoupdate.queue_fetches(SuccessfulRenderLock)
-            )
+            self.run_with_async_db(autoupdate.queue_fetches())
 
-        self.assertEqual(mock_queue_fetch.call_count, 1)
-        mock_queue_fetch.assert_called_with(self.wfm2)
+        mock_queue_fetch_batch.assert_called_once_with([self.wfm2.id])
 
         self.wfm2.refresh_from_db()
         self.assertTrue(self.wfm2.is_busy)
 
         # Second call shouldn't fetch again, because it's busy
-        self.run_with_async_db(
-            autoupdate.queue_fetches(SuccessfulRenderLock)
+        self.run_with_async_db(autoupdate.queue_fetches())
+
+        self.assertEqual(mock_queue_fetch_batch.call_count, 1)
+
+    @patch('server.rabbitmq.queue_fetch_batch')
+    def test_schedule_next_update_with_jitter(self, mock_queue_fetch_batch):
+        mock_queue_fetch_batch.return_value = future_none
+        wf_module = self._create_due_wf_module()
+
+        with self.assertLogs(autoupdate.__name__, logging.INFO):
+            self.run_with_async_db(autoupdate.queue_fetches())
+
+        wf_module.refresh_from_db()
+        # Next update "on schedule" is 2:44PM; jitter is 10% of the interval
+        self.assertGreaterEqual(wf_module.next_update,
+                                parser.parse('Aug 28 1999 2:43PM UTC'))
+        self.assertLessEqual(wf_module.next_update,
+                             parser.parse('Aug 28 1999 2:45PM UTC'))
+
+    @patch('server.rabbitmq.queue_fetch_batch')
+    def test_skip_missed_updates(self, mock_queue_fetch_batch):
+        mock_queue_fetch_batch.return_value = future_none
+        wf_module = self._create_due_wf_module()
+        wf_module.next_update = Now - timedelta(days=1, seconds=10)
+        wf_module.save(update_fields=['next_update'])
+
+        with self.assertLogs(autoupdate.__name__, logging.INFO):
+            self.run_with_async_db(autoupdate.queue_fetches())
+
+        wf_module.refresh_from_db()
+        self.assertGreater(wf_module.next_update, Now)
+        self.assertLessEqual(wf_module.next_update,
+                             Now + timedelta(seconds=660))
+
+    @patch('server.rabbitmq.queue_fetch_batch')
+    def test_prioritize_overdue_and_viewed(self, mock_queue_fetch_batch):
+        mock_queue_fetch_batch.return_value = future_none
+
+        recent = self._create_due_wf_module()
+
+        overdue = self._create_due_wf_module()
+        overdue.next_update = Now - timedelta(minutes=5)
+        overdue.save(update_fields=['next_update'])
+
+        viewed_workflow = Workflow.objects.create()
+        WorkflowViewers.objects.create(process_id='a',
+                                       workflow=viewed_workflow,
+                                       n_viewers=5, updated_at=Now)
+        WorkflowViewers.objects.create(process_id='b',
+                                       workflow=viewed_workflow,
+                                       n_viewers=4, updated_at=Now)
+        # A dead web process's viewers don't count
+        WorkflowViewers.objects.create(process_id='dead',
+                                       workflow=self.workflow, n_viewers=99,
+                                       updated_at=Now - timedelta(hours=1))
+        viewed = self._create_due_wf_module(
+            tab=viewed_workflow.tabs.create(position=0)
+        )
+
+        with self.assertLogs(autoupdate.__name__, logging.INFO):
+            self.run_with_async_db(autoupdate.queue_fetches())
+
+        mock_queue_fetch_batch.assert_called_once_with([
+            viewed.id,  # 60s overdue * 10
+            overdue.id,  # 300s overdue
+            recent.id,  # 60s overdue
+        ])
+
+    @patch('server.rabbitmq.queue_fetch_batch')
+    @patch.object(autoupdate, 'FetchBatchSize', 2)
+    def test_queue_in_batches(self, mock_queue_fetch_batch):
+        mock_queue_fetch_batch.return_value = future_none
+        for _ in range(3):
+            self._create_due_wf_module()
+
+        with self.assertLogs(autoupdate.__name__, logging.INFO):
+            self.run_with_async_db(autoupdate.queue_fetches())
+
+        self.assertEqual(
+            [len(call[0][0]) for call in mock_queue_fetch_batch.call_args_list],
+            [2, 1]
         )
 
-        self.assertEqual(mock_queue_fetch.call_count, 1)
+    @patch('server.rabbitmq.queue_fetch_batch')
+    def test_skip_rendering_workflow(self, mock_queue_fetch_batch):
+        mock_queue_fetch_batch.return_value = future_none
+        wf_module = self._create_due_wf_module()
+
+        # Simulate worker.pg_locker.PgLocker.render_lock()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(0, %s)',
+                           [self.workflow.id])
+        try:
+            self.run_with_async_db(autoupdate.queue_fetches())
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(0, %s)',
+                               [self.workflow.id])
+
+        mock_queue_fetch_batch.assert_not_called()
+        wf_module.refresh_from_db()
+        self.assertFalse(wf_module.is_busy)
@@ -0,0 +1,56 @@
+from django.test import override_settings
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server.cron import compact
+from server.models import StoredObject, Workflow
+from server.tests.utils import DbTestCase
+
+
+class CompactStoredObjectsTest(DbTestCase):
+    def setUp(self):
+        super().setUp()
+
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        self.wf_module = tab.wf_modules.create(order=0)
+
+    def _create_chain(self, n_deltas: int):
+        stored_object = StoredObject.create_table(self.wf_module,
+                                                  pd.DataFrame({'A': [0]}))
+        for i in range(1, n_deltas + 1):
+            stored_object = StoredObject.create_delta(
+                self.wf_module,
+                stored_object,
+                pd.DataFrame({'A': [i]})
+            )
+        self.wf_module.stored_data_version = stored_object.stored_at
+        self.wf_module.save(update_fields=['stored_data_version'])
+        return stored_object
+
+    @override_settings(MAX_STORED_DELTA_SEGMENTS=2)
+    def test_compact_long_chain(self):
+        stored_object = self._create_chain(3)
+        compact.compact_stored_objects_sync()
+        stored_object.refresh_from_db()
+        self.assertIsNone(stored_object.parent)
+        assert_frame_equal(stored_object.get_table(),
+                           pd.DataFrame({'A': [3, 2, 1, 0]}))
+
+    @override_settings(MAX_STORED_DELTA_SEGMENTS=2)
+    def test_compact_only_current_version(self):
+        stored_object = self._create_chain(3)
+        parent = stored_object.parent
+        self.wf_module.stored_data_version = parent.stored_at
+        self.wf_module.save(update_fields=['stored_data_version'])
+        compact.compact_stored_objects_sync()
+        stored_object.refresh_from_db()
+        parent.refresh_from_db()
+        self.assertEqual(stored_object.depth, 3)
+        self.assertEqual(parent.depth, 0)
+
+    @override_settings(MAX_STORED_DELTA_SEGMENTS=2)
+    def test_ignore_short_chain(self):
+        stored_object = self._create_chain(1)
+        compact.compact_stored_objects_sync()
+        stored_object.refresh_from_db()
+        self.assertEqual(stored_object.depth, 1)
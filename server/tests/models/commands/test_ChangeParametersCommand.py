@@ -70,6 +70,37 @@ class ChangeParametersCommandTest(DbTestCase):
         wf_module.refresh_from_db()
         self.assertEqual(wf_module.params, params2)
 
+    def test_ws_data_has_only_changed_fields(self):
+        workflow = Workflow.create_and_init()
+
+        ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'loadurl',
+            'name': 'loadurl',
+            'category': 'Clean',
+            'parameters': [
+                {'id_name': 'url', 'type': 'string'},
+            ]
+        })
+
+        wf_module = workflow.tabs.first().wf_modules.create(
+            module_id_name='loadurl',
+            order=0,
+            notes='Bob is editing these notes',
+            last_relevant_delta_id=workflow.last_delta_id,
+            params={'url': ''}
+        )
+
+        cmd = self.run_with_async_db(ChangeParametersCommand.create(
+            workflow=workflow,
+            wf_module=wf_module,
+            new_values={'url': 'http://example.com/foo'}
+        ))
+
+        step_data = cmd.load_ws_data()['updateWfModules'][str(wf_module.id)]
+        self.assertEqual(step_data['params']['url'], 'http://example.com/foo')
+        self.assertEqual(step_data['last_relevant_delta_id'], cmd.id)
+        self.assertNotIn('notes', step_data)
+
     def test_change_parameters_on_soft_deleted_wf_module(self):
         workflow = Workflow.create_and_init()
 
@@ -34,6 +34,7 @@ class DuplicateTabCommandTest(DbTestCase):
                 'name': workflow.name,
                 'public': False,
                 'last_update': cmd.datetime.isoformat(),
+                'last_delta_id': cmd.id,
                 'tab_slugs': ['tab-1', 'tab-2'],
             },
             'updateTabs': {
@@ -56,6 +57,7 @@ class DuplicateTabCommandTest(DbTestCase):
                 'name': workflow.name,
                 'public': False,
                 'last_update': workflow.last_delta.datetime.isoformat(),
+                'last_delta_id': workflow.last_delta_id,
                 'tab_slugs': ['tab-1'],
             },
             'clearTabSlugs': ['tab-2'],
@@ -71,6 +73,7 @@ class DuplicateTabCommandTest(DbTestCase):
                 'name': workflow.name,
                 'public': False,
                 'last_update': cmd.datetime.isoformat(),
+                'last_delta_id': cmd.id,
                 'tab_slugs': ['tab-1', 'tab-2'],
             },
             'updateTabs': {
@@ -1,8 +1,11 @@
 import datetime
+from unittest.mock import patch
 import pandas
 from cjworkbench.types import Column, ColumnType, ProcessResult, QuickFix
 from server import minio
 from server.models import Workflow, WfModule
+from server.models.CachedRenderResult import hash_process_result, \
+        RenderResultDigest
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
 
@@ -40,7 +43,7 @@ class CachedRenderResultTests(DbTestCase):
             cached.parquet_key,
             (
                 f'wf-{self.workflow.id}/wfm-{self.wf_module.id}'
-                f'/delta-{self.delta.id}.dat'
+                f'/delta-{self.delta.id}-{cached.hash}.dat'
             )
         )
 
@@ -50,6 +53,48 @@ class CachedRenderResultTests(DbTestCase):
         self.assertEqual(cached.delta_id, self.delta.id)
         self.assertEqual(from_db.result, result)
 
+    def test_rerender_same_delta_changes_key(self):
+        # Readers cache files by key: a key must never name new contents
+        self.wf_module.cache_render_result(
+            self.delta.id,
+            ProcessResult(pandas.DataFrame({'a': [1]}))
+        )
+        key1 = self.wf_module.cached_render_result.parquet_key
+        self.wf_module.cache_render_result(
+            self.delta.id,
+            ProcessResult(pandas.DataFrame({'a': [2]}))
+        )
+        key2 = self.wf_module.cached_render_result.parquet_key
+        self.assertNotEqual(key1, key2)
+        self.assertFalse(minio.exists(minio.CachedRenderResultsBucket, key1))
+
+    def test_assign_writes_column_stats(self):
+        result = ProcessResult(pandas.DataFrame({'a': ['x', 'y', 'x']}))
+        self.wf_module.cache_render_result(self.delta.id, result)
+
+        db_wf_module = WfModule.objects.get(id=self.wf_module.id)
+        stats = db_wf_module.cached_render_result.read_column_stats()
+        self.assertEqual(list(stats.keys()), ['a'])
+        self.assertEqual(stats['a'].n_distinct, 2)
+        self.assertEqual(stats['a'].value_counts, {'x': 2, 'y': 1})
+
+    def test_assign_uses_precomputed_digest(self):
+        result = ProcessResult(pandas.DataFrame({'a': ['x', 'y', 'x']}))
+        digest = RenderResultDigest.of(result)
+        with patch('server.models.CachedRenderResult.compute_table_stats') \
+                as compute_table_stats:
+            cached = self.wf_module.cache_render_result(self.delta.id, result,
+                                                        digest=digest)
+        compute_table_stats.assert_not_called()
+        self.assertEqual(cached.hash, hash_process_result(result))
+        self.assertEqual(cached.read_column_stats()['a'].n_distinct, 2)
+
+    def test_read_missing_column_stats(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        cached = self.wf_module.cache_render_result(self.delta.id, result)
+        minio.remove(minio.CachedRenderResultsBucket, cached.column_stats_key)
+        self.assertIsNone(cached.read_column_stats())
+
     def test_set_to_empty(self):
         result = ProcessResult(pandas.DataFrame({'a': [1]}))
         self.wf_module.cache_render_result(self.delta.id, result)
@@ -145,6 +190,52 @@ class CachedRenderResultTests(DbTestCase):
         self.wf_module.clear_cached_render_result()
         self.assertIsNone(self.wf_module.cached_render_result)
 
+    def test_hash_ignores_memory_layout(self):
+        result1 = ProcessResult(pandas.DataFrame({'a': [1, 2]}))
+        result2 = ProcessResult(pandas.DataFrame({'a': [1, 2]}))
+        result3 = ProcessResult(pandas.DataFrame({'a': [2, 1]}))
+        self.assertEqual(hash_process_result(result1),
+                         hash_process_result(result2))
+        self.assertNotEqual(hash_process_result(result1),
+                            hash_process_result(result3))
+
+    def test_reuse_stale_result_with_same_input_hash(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        self.wf_module.cache_render_result(self.delta.id, result,
+                                           input_hash='abc')
+        old_parquet_key = self.wf_module.cached_render_result.parquet_key
+        self.wf_module.last_relevant_delta_id += 1
+        self.wf_module.save(update_fields=['last_relevant_delta_id'])
+
+        cached_result = self.wf_module.reuse_stale_cached_render_result(
+            self.wf_module.last_relevant_delta_id,
+            'abc'
+        )
+        self.assertEqual(cached_result.delta_id,
+                         self.wf_module.last_relevant_delta_id)
+        self.assertFalse(minio.exists(minio.CachedRenderResultsBucket,
+                                      old_parquet_key))
+
+        db_wf_module = WfModule.objects.get(id=self.wf_module.id)
+        self.assertEqual(db_wf_module.cached_render_result.result, result)
+        self.assertEqual(
+            db_wf_module.cached_render_result.read_column_stats()['a'].max,
+            1
+        )
+
+    def test_reuse_stale_result_with_different_input_hash(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        self.wf_module.cache_render_result(self.delta.id, result,
+                                           input_hash='abc')
+        self.wf_module.last_relevant_delta_id += 1
+        self.wf_module.save(update_fields=['last_relevant_delta_id'])
+
+        self.assertIsNone(self.wf_module.reuse_stale_cached_render_result(
+            self.wf_module.last_relevant_delta_id,
+            'def'
+        ))
+        self.assertIsNone(self.wf_module.cached_render_result)
+
     def test_duplicate_copies_fresh_cache(self):
         # The cache's filename depends on workflow_id and wf_module_id.
         # Duplicating it would need more complex code :).
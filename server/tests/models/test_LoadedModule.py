@@ -3,6 +3,7 @@ from collections import namedtuple
 import inspect
 import io
 import logging
+import pickle
 import unittest
 from unittest.mock import Mock, patch
 from asgiref.sync import async_to_sync
@@ -166,6 +167,33 @@ class LoadedModuleTest(unittest.TestCase):
 
         self.assertIs(lm.render_impl, lm2.render_impl)
 
+    def test_pickle_static(self):
+        lm = LoadedModule.for_module_version_sync(
+            MockModuleVersion('pastecsv', '(ignored)', 'now')
+        )
+        lm2 = pickle.loads(pickle.dumps(lm))
+        self.assertEqual(lm2.name, 'pastecsv:internal')
+        self.assertEqual(lm2.render_impl, server.modules.pastecsv.render)
+
+    def test_pickle_dynamic(self):
+        code = b'def render(table, params):\n    return table * 2'
+        minio.client.put_object(Bucket=minio.ExternalModulesBucket,
+                                Key='imported/abcdef/imported.py',
+                                Body=code, ContentLength=len(code))
+
+        with self.assertLogs('server.models.loaded_module'):
+            lm = LoadedModule.for_module_version_sync(
+                MockModuleVersion('imported', 'abcdef', 'now')
+            )
+            lm2 = pickle.loads(pickle.dumps(lm))  # loads the code again
+
+        self.assertEqual(lm2.name, 'imported:abcdef')
+        with self.assertLogs('server.models.loaded_module'):
+            result = lm2.render(ProcessResult(pd.DataFrame({'A': [1, 2]})),
+                                {'col': 'A'}, tab_name='x',
+                                fetch_result=ProcessResult())
+        assert_frame_equal(result.dataframe, pd.DataFrame({'A': [2, 4]}))
+
     def test_load_dynamic_from_none(self):
         lm = LoadedModule.for_module_version_sync(None)
 
@@ -332,7 +360,7 @@ class LoadedModuleTest(unittest.TestCase):
             'Something unexpected happened. We have been notified and are '
             'working to fix it. If this persists, contact us. Error code: '
             'ProcessResult input must only contain {dataframe, error, json, '
-            'quick_fixes, column_formats}'
+            'quick_fixes, column_formats, stored_delta}'
         ))
 
     def test_render_use_input_columns_as_try_fallback_columns(self):
@@ -381,7 +409,7 @@ class LoadedModuleTest(unittest.TestCase):
             'Something unexpected happened. We have been notified and are '
             'working to fix it. If this persists, contact us. Error code: '
             'ProcessResult input must only contain {dataframe, error, json, '
-            'quick_fixes, column_formats}'
+            'quick_fixes, column_formats, stored_delta}'
         ))
 
     def test_render_dynamic_default(self):
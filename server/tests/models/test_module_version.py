@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import Mock
 from server.models.module_version import ModuleVersion
 from server.models.param_spec import ParamDType
 from server.tests.utils import DbTestCase
@@ -104,3 +105,72 @@ class ModuleVersionTest(DbTestCase):
         }, source_version_hash='a')
 
         self.assertEqual(mv1.id, mv2.id)
+
+    def test_param_schema_is_cached(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        }, source_version_hash='a')
+        mv_copy = ModuleVersion.objects.get(id=mv.id)
+        self.assertIs(mv_copy.param_schema, mv.param_schema)
+
+    def test_reimport_invalidates_cache(self):
+        mv1 = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        }, source_version_hash='a')
+        mv1.param_fields  # cache
+        mv1.param_schema  # cache
+        mv2 = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'bar', 'type': 'string'}]
+        }, source_version_hash='a')
+        self.assertEqual([f.id_name for f in mv2.param_fields], ['bar'])
+        self.assertEqual(mv2.default_params, {'bar': ''})
+
+    def test_get_migrated_params_is_cached(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        }, source_version_hash='a')
+        migrate = Mock(side_effect=lambda params: {'foo': params['x']})
+
+        result1 = mv.get_migrated_params({'x': 'y'}, migrate)
+        result1['foo'] = 'changed by caller'
+        result2 = ModuleVersion.objects.get(id=mv.id) \
+            .get_migrated_params({'x': 'y'}, migrate)
+        self.assertEqual(result2, {'foo': 'y'})
+        self.assertEqual(migrate.call_count, 1)
+
+        mv.get_migrated_params({'x': 'z'}, migrate)
+        self.assertEqual(migrate.call_count, 2)
+
+    def test_get_migrated_params_miss_and_hit_are_equal(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        }, source_version_hash='a')
+        migrate = Mock(side_effect=lambda params: {'foo': ('a', 'b')})
+        result1 = mv.get_migrated_params({}, migrate)  # miss
+        result2 = mv.get_migrated_params({}, migrate)  # hit
+        self.assertEqual(result1, {'foo': ['a', 'b']})
+        self.assertEqual(result2, {'foo': ['a', 'b']})
+
+    def test_get_migrated_params_does_not_cache_errors(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        }, source_version_hash='a')
+        migrate = Mock(side_effect=ValueError('bad'))
+        with self.assertRaises(ValueError):
+            mv.get_migrated_params({}, migrate)
+        with self.assertRaises(ValueError):
+            mv.get_migrated_params({}, migrate)
+        self.assertEqual(migrate.call_count, 2)
+
+    def test_unsaved_module_version_is_not_cached(self):
+        mv = ModuleVersion(id_name='x', spec={
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        })
+        self.assertIsNot(mv.param_schema, mv.param_schema)
@@ -2,12 +2,15 @@ from datetime import datetime
 import io
 import json
 from pathlib import Path
+from unittest.mock import patch
 from django.conf import settings
 import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
-from server import minio
+from server import minio, parquet
 from server.models import StoredObject, Workflow
+from server.models.StoredObject import _build_key
+from server.pandas_util import hash_table, table_digest
 from server.tests.utils import DbTestCase
 
 
@@ -98,15 +101,186 @@ class StoredObjectTests(DbTestCase):
         so1 = StoredObject.create_table(self.wfm1, table)
         so2 = so1.duplicate(self.wfm2)
 
-        # new StoredObject should have same time, same metadata,
-        # different file with same contents
+        # new StoredObject should have same time, same metadata, same file
         self.assertEqual(so1.stored_at, so2.stored_at)
         self.assertEqual(so1.metadata, so2.metadata)
         self.assertEqual(so1.size, so2.size)
         self.assertEqual(so1.bucket, so2.bucket)
-        self.assertNotEqual(so1.key, so2.key)
+        self.assertEqual(so1.key, so2.key)
         assert_frame_equal(so2.get_table(), table)
 
+    def test_duplicate_then_delete_keeps_file(self):
+        table = pd.DataFrame({'A': [1]})
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so2 = so1.duplicate(wfm2)
+        so1.delete()
+        assert_frame_equal(so2.get_table(), table)
+        so2.delete()
+        self.assertFalse(minio.exists(so2.bucket, so2.key))
+
+    def test_share_file_between_workflows(self):
+        table = pd.DataFrame({'A': [1, 2], 'B': ['x', None]})
+        workflow2 = Workflow.objects.create()
+        wfm2 = workflow2.tabs.create(position=0).wf_modules.create(order=0)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        with patch.object(parquet, 'write') as write:
+            so2 = StoredObject.create_table(wfm2, table.copy())
+            write.assert_not_called()
+        self.assertEqual(so1.key, so2.key)
+        self.assertEqual(so1.size, so2.size)
+        workflow2.delete()
+        assert_frame_equal(so1.get_table(), table)
+
+    def test_delete_workflow_with_shared_files(self):
+        # Both StoredObjects are deleted in one query. The second one deleted
+        # must remove the file.
+        table = pd.DataFrame({'A': [1]})
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so1.duplicate(wfm2)
+        self.workflow.delete()
+        self.assertFalse(minio.exists(so1.bucket, so1.key))
+
+    def test_create_table_if_different_row_order(self):
+        # hash_table() used to say these were the same
+        df1 = pd.DataFrame({'A': [1, 2]})
+        df2 = pd.DataFrame({'A': [2, 1]})
+        so1 = StoredObject.create_table(self.wfm1, df1)
+        so2 = StoredObject.create_table_if_different(self.wfm1, so1, df2)
+        self.assertIsNotNone(so2)
+        assert_frame_equal(so2.get_table(), df2)
+
+    def test_create_table_if_different_does_not_read(self):
+        df1 = pd.DataFrame({'A': [1]})
+        so1 = StoredObject.create_table(self.wfm1, df1)
+        with patch.object(parquet, 'read') as read:
+            self.assertIsNone(
+                StoredObject.create_table_if_different(self.wfm1, so1,
+                                                       df1.copy())
+            )
+            read.assert_not_called()
+
+    def test_create_table_if_different_legacy_hash(self):
+        # Before 2019-05, we stored hash_table() values
+        df1 = pd.DataFrame({'A': [1]})
+        so1 = StoredObject.create_table(self.wfm1, df1)
+        so1.hash = hash_table(df1)
+        so1.save(update_fields=['hash'])
+        self.assertIsNone(
+            StoredObject.create_table_if_different(self.wfm1, so1, df1)
+        )
+
+    def test_create_delta(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2, 3]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1]}),
+                                        metadata=self.metadata)
+        self.assertEqual(so2.parent, so1)
+        self.assertEqual(so2.depth, 1)
+        self.assertEqual(so2.metadata, self.metadata)
+        self.assertNotEqual(so2.key, so1.key)
+        assert_frame_equal(so2.get_table(), pd.DataFrame({'A': [1, 2, 3]}))
+        # The parent version is unchanged
+        assert_frame_equal(so1.get_table(), pd.DataFrame({'A': [2, 3]}))
+
+    def test_create_delta_writes_only_new_rows(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2, 3]}))
+        with patch.object(parquet, 'write', return_value=10) as write:
+            StoredObject.create_delta(self.wfm1, so1,
+                                      pd.DataFrame({'A': [1]}))
+            written = write.call_args[0][2]
+        assert_frame_equal(written, pd.DataFrame({'A': [1]}))
+
+    def test_get_segment(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2, 3]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1]}))
+        assert_frame_equal(so2.get_segment(), pd.DataFrame({'A': [1]}))
+        assert_frame_equal(so1.get_segment(), pd.DataFrame({'A': [2, 3]}))
+
+    def test_delta_new_columns(self):
+        # Modules add columns over time. Old rows get null.
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'B': ['x'], 'A': [1]}))
+        assert_frame_equal(so2.get_table(), pd.DataFrame({
+            'B': ['x', np.nan],
+            'A': [1, 2],
+        }))
+
+    def test_delta_truncate(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [3, 4]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1, 2]}))
+        with self.settings(MAX_ROWS_PER_TABLE=3):
+            assert_frame_equal(so2.get_table(),
+                               pd.DataFrame({'A': [1, 2, 3]}))
+
+    def test_compact(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [3]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [2]}))
+        so3 = StoredObject.create_delta(self.wfm1, so2,
+                                        pd.DataFrame({'A': [1]}))
+        delta_key = so3.key
+        so3.compact()
+        so3.refresh_from_db()
+        self.assertIsNone(so3.parent)
+        self.assertEqual(so3.depth, 0)
+        self.assertFalse(minio.exists(so3.bucket, delta_key))
+        expected = pd.DataFrame({'A': [1, 2, 3]})
+        self.assertEqual(so3.hash, table_digest(expected))
+        with patch.object(parquet, 'read', wraps=parquet.read) as read:
+            assert_frame_equal(so3.get_table(), expected)
+            self.assertEqual(read.call_count, 1)
+        # Ancestors are still versions in their own right
+        assert_frame_equal(so2.get_table(), pd.DataFrame({'A': [2, 3]}))
+
+    def test_compact_deleted(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1]}))
+        get_table = so2.get_table
+
+        def get_table_then_delete():
+            # Simulate a race: delete while compact() reads
+            table = get_table()
+            StoredObject.objects.filter(id=so2.id).delete()
+            return table
+
+        with patch.object(so2, 'get_table', get_table_then_delete):
+            so2.compact()
+        key = _build_key(table_digest(pd.DataFrame({'A': [1, 2]})))
+        self.assertFalse(minio.exists(minio.StoredObjectsBucket, key))
+
+    def test_duplicate_delta(self):
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1]}))
+        so3 = so2.duplicate(wfm2)
+        self.assertIsNone(so3.parent)
+        self.assertEqual(so3.stored_at, so2.stored_at)
+        assert_frame_equal(so3.get_table(), pd.DataFrame({'A': [1, 2]}))
+
+    def test_delete_workflow_with_delta(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [2]}))
+        so2 = StoredObject.create_delta(self.wfm1, so1,
+                                        pd.DataFrame({'A': [1]}))
+        self.workflow.delete()
+        self.assertFalse(minio.exists(so1.bucket, so1.key))
+        self.assertFalse(minio.exists(so2.bucket, so2.key))
+
     def test_read_file_fastparquet_issue_375(self):
         path = (
             Path(__file__).parent.parent
@@ -0,0 +1,42 @@
+from datetime import timedelta
+from unittest.mock import patch
+from dateutil import parser
+from server.models import Workflow, WorkflowViewers
+from server.tests.utils import DbTestCase
+
+
+Now = parser.parse('Aug 28 1999 2:35PM UTC')
+
+
+@patch('django.utils.timezone.now', lambda: Now)
+class WorkflowViewersTest(DbTestCase):
+    def _rows(self):
+        return set(WorkflowViewers.objects.values_list('process_id',
+                                                       'workflow_id',
+                                                       'n_viewers'))
+
+    def test_heartbeat_replaces_process_rows(self):
+        workflow1 = Workflow.objects.create()
+        workflow2 = Workflow.objects.create()
+        WorkflowViewers.heartbeat('a', {workflow1.id: 2, workflow2.id: 1})
+        WorkflowViewers.heartbeat('b', {workflow1.id: 1})
+        WorkflowViewers.heartbeat('a', {workflow1.id: 3})
+        self.assertEqual(self._rows(), {('a', workflow1.id, 3),
+                                        ('b', workflow1.id, 1)})
+        WorkflowViewers.heartbeat('a', {})
+        self.assertEqual(self._rows(), {('b', workflow1.id, 1)})
+
+    def test_heartbeat_deletes_expired_rows(self):
+        workflow = Workflow.objects.create()
+        WorkflowViewers.objects.create(process_id='dead', workflow=workflow,
+                                       n_viewers=1,
+                                       updated_at=Now - timedelta(hours=1))
+        WorkflowViewers.heartbeat('a', {workflow.id: 1})
+        self.assertEqual(self._rows(), {('a', workflow.id, 1)})
+
+    def test_heartbeat_skips_deleted_workflow(self):
+        workflow = Workflow.objects.create()
+        workflow_id = workflow.id
+        workflow.delete()
+        WorkflowViewers.heartbeat('a', {workflow_id: 1})
+        self.assertEqual(self._rows(), set())
@@ -2,7 +2,7 @@ import unittest
 from typing import Any, Dict
 import numpy as np
 import pandas as pd
-from pandas.testing import assert_frame_equal
+from pandas.testing import assert_frame_equal, assert_series_equal
 from cjworkbench.types import ProcessResult
 from server.modules import formula
 from .util import MockParams
@@ -118,6 +118,60 @@ class FormulaTests(unittest.TestCase):
             pd.DataFrame({'A b': [1, 2], 'R': [2, 4]})
         )
 
+    def test_python_formula_vectorized(self):
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [10, 20], 'B': [1.5, np.nan]}),
+                {'syntax': 'python', 'formula_python': 'abs(-A) / B > 7'},
+                pd.DataFrame({
+                    'A': [10, 20],
+                    'B': [1.5, np.nan],
+                    'R': ['False', 'False'],
+                })
+            )
+        self.assertRegex(cm.output[0], 'vectorized')
+
+    def test_python_formula_vectorized_falls_back_on_zero_division(self):
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [1, 0], 'B': ['x', 'y']}),
+                {'syntax': 'python', 'formula_python': '1 / A'},
+                expected_error='division by zero'
+            )
+        self.assertRegex(cm.output[0], 'row-by-row')
+
+    def test_python_formula_vectorized_all_numeric_upcasts_int(self):
+        # The row loop sees a float64 array: every value is float
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [1, 2], 'B': [0.5, 1.0]}),
+                {'syntax': 'python', 'formula_python': 'A'},
+                pd.DataFrame({'A': [1, 2], 'B': [0.5, 1.0], 'R': [1.0, 2.0]})
+            )
+        self.assertRegex(cm.output[0], 'vectorized')
+
+    def test_python_formula_vectorized_all_numeric_zero_division(self):
+        # The row loop sees numpy ints: 1 / 0 is inf, not an error
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            result = formula.python_formula(pd.DataFrame({'A': [1, 0]}),
+                                            '1 / A')
+        self.assertEqual(list(result), [1.0, np.inf])
+        self.assertRegex(cm.output[0], 'vectorized')
+
+    def test_python_formula_vectorized_falls_back_on_int_overflow(self):
+        # The row loop sees Python ints, which don't wrap
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [2 ** 62, 1], 'B': ['x', 'y']}),
+                {'syntax': 'python', 'formula_python': 'A * 4'},
+                pd.DataFrame({
+                    'A': [2 ** 62, 1],
+                    'B': ['x', 'y'],
+                    'R': [str(2 ** 64), '4'],
+                })
+            )
+        self.assertRegex(cm.output[0], 'row-by-row')
+
     def test_excel_formula_no_output_col_name(self):
         # if no output column name specified, store to a column named 'result'
         self._test(
@@ -153,6 +207,69 @@ class FormulaTests(unittest.TestCase):
             pd.DataFrame({'A': ['foo', 'bar'], 'R': ['fo', 'ba']})
         )
 
+    def test_excel_all_rows_vectorized(self):
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [1, 2], 'B': ['foo', 'bar']}),
+                {
+                    'formula_excel': '=IF(A1>1, UPPER(LEFT(B1, 2)), B1&A1)',
+                    'all_rows': True
+                },
+                pd.DataFrame({
+                    'A': [1, 2],
+                    'B': ['foo', 'bar'],
+                    'R': ['foo1', 'BA'],
+                })
+            )
+        self.assertRegex(cm.output[0], 'vectorized')
+
+    def test_excel_all_rows_vectorized_round(self):
+        self._test(
+            pd.DataFrame({'A': [0.125, -2.5, 1.0]}),
+            {'formula_excel': '=ROUND(A1*2, 1)', 'all_rows': True},
+            pd.DataFrame({'A': [0.125, -2.5, 1.0], 'R': [0.2, -5.0, 2.0]})
+        )
+
+    def test_excel_all_rows_vectorized_falls_back_on_unknown_function(self):
+        with self.assertLogs(formula.logger, 'INFO') as cm:
+            self._test(
+                pd.DataFrame({'A': [1, 4]}),
+                {'formula_excel': '=SQRT(A1)', 'all_rows': True},
+                pd.DataFrame({'A': [1, 4], 'R': [1.0, 2.0]})
+            )
+        self.assertRegex(cm.output[0], 'row-by-row')
+
+    def test_excel_all_rows_vectorized_matches_row_by_row(self):
+        random = np.random.RandomState(0)
+        table = pd.DataFrame({
+            'A': random.randint(0, 1000, 1000),
+            'B': random.rand(1000) * 1000,
+            'C': pd.Series(random.choice(['alpha', 'bravo', 'charlie'], 1000),
+                           dtype=object),
+        })
+        for excel_formula in [
+            '=A1*2+B1',
+            '=ROUND(AVERAGE(A1:B1), 2)',
+            '=IF(A1>B1, LEFT(C1, 3), UPPER(C1))',
+        ]:
+            with self.subTest(excel_formula=excel_formula):
+                builder = formula._RecordingParser().ast(excel_formula)[1]
+                code = builder.compile()
+                vectorized = formula.eval_excel_all_rows_vectorized(
+                    code,
+                    builder.rpn,
+                    table
+                )
+                row_by_row = formula.eval_excel_all_rows(code, table)
+                assert_series_equal(
+                    formula.autocast_series_dtype(
+                        formula.sanitize_series(vectorized)
+                    ),
+                    formula.autocast_series_dtype(
+                        formula.sanitize_series(row_by_row)
+                    )
+                )
+
     # --- Formulas which write only to a single row ---
     def test_excel_divide_two_rows(self):
         self._test(
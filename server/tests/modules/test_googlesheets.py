@@ -1,9 +1,11 @@
+import asyncio
 import os.path
 import unittest
 from unittest.mock import patch, Mock
+import aiohttp
+from asgiref.sync import async_to_sync
 import pandas as pd
 from pandas.testing import assert_frame_equal
-import requests.exceptions
 from server import oauth
 from server.modules import googlesheets
 from .util import MockParams
@@ -25,15 +27,27 @@ expected_table = pd.DataFrame({
 })
 
 
+# mock for aiohttp.ClientResponse
 class MockResponse:
-    def __init__(self, status_code, text):
-        self.status_code = status_code
+    def __init__(self, status, body):
+        self.status = status
 
-        if isinstance(text, str):
-            self.text = text
-            self.content = text.encode('utf-8')
+        if isinstance(body, str):
+            self.body = body.encode('utf-8')
         else:
-            self.content = text
+            self.body = body
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode('utf-8')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
 
 
 default_secret = {
@@ -57,7 +71,7 @@ P = MockParams.factory(google_credentials=default_secret,
 
 def fetch(**kwargs):
     params = P(**kwargs)
-    return googlesheets.fetch(params)
+    return async_to_sync(googlesheets.fetch)(params)
 
 
 class GoogleSheetsTests(unittest.TestCase):
@@ -65,13 +79,9 @@ class GoogleSheetsTests(unittest.TestCase):
         super().setUp()
 
         # Set up auth
-        self.requests = Mock()
-        self.requests.get = Mock(
-            return_value=MockResponse(404, 'Test not written')
-        )
         self.oauth_service = Mock()
-        self.oauth_service.requests_or_str_error = Mock(
-            return_value=self.requests
+        self.oauth_service.generate_access_token_or_str_error = Mock(
+            return_value={'access_token': 'an-access-token'}
         )
         self.oauth_service_lookup_patch = patch.object(
             oauth.OAuthService,
@@ -80,7 +90,18 @@ class GoogleSheetsTests(unittest.TestCase):
         )
         self.oauth_service_lookup_patch.start()
 
+        # Set up HTTP
+        self.response = MockResponse(404, 'Test not written')
+
+        async def get(url, **kwargs):
+            return self.response
+
+        self.http_get_patch = patch('server.httpclient.get')
+        self.http_get = self.http_get_patch.start()
+        self.http_get.side_effect = get
+
     def tearDown(self):
+        self.http_get_patch.stop()
         self.oauth_service_lookup_patch.stop()
 
         super().tearDown()
@@ -91,22 +112,23 @@ class GoogleSheetsTests(unittest.TestCase):
         self.assertTrue(fetch_result.dataframe.empty)
 
     def _assert_happy_path(self, fetch_result):
-        self.requests.get.assert_called_with(
+        self.http_get.assert_called_with(
             'https://www.googleapis.com/drive/v3/files/'
-            'aushwyhtbndh7365YHALsdfsdf987IBHJB98uc9uisdj?alt=media'
+            'aushwyhtbndh7365YHALsdfsdf987IBHJB98uc9uisdj?alt=media',
+            headers={'Authorization': 'Bearer an-access-token'}
         )
 
         self.assertEqual(fetch_result.error, '')
         assert_frame_equal(fetch_result.dataframe, expected_table)
 
     def test_fetch_csv(self):
-        self.requests.get.return_value = MockResponse(200, example_csv)
+        self.response = MockResponse(200, example_csv)
         fetch_result = fetch(googlefileselect={**default_googlefileselect,
                                                'mimeType': 'text/csv'})
         self._assert_happy_path(fetch_result)
 
     def test_fetch_tsv(self):
-        self.requests.get.return_value = MockResponse(200, example_tsv)
+        self.response = MockResponse(200, example_tsv)
         fetch_result = fetch(googlefileselect={
             **default_googlefileselect,
             'mimeType': 'text/tab-separated-values',
@@ -114,7 +136,7 @@ class GoogleSheetsTests(unittest.TestCase):
         self._assert_happy_path(fetch_result)
 
     def test_fetch_xls(self):
-        self.requests.get.return_value = MockResponse(200, example_xls)
+        self.response = MockResponse(200, example_xls)
         fetch_result = fetch(googlefileselect={
             **default_googlefileselect,
             'mimeType': 'application/vnd.ms-excel',
@@ -122,7 +144,7 @@ class GoogleSheetsTests(unittest.TestCase):
         self._assert_happy_path(fetch_result)
 
     def test_fetch_xlsx(self):
-        self.requests.get.return_value = MockResponse(200, example_xlsx)
+        self.response = MockResponse(200, example_xlsx)
         fetch_result = fetch(googlefileselect={
             **default_googlefileselect,
             'mimeType':
@@ -131,7 +153,7 @@ class GoogleSheetsTests(unittest.TestCase):
         self._assert_happy_path(fetch_result)
 
     def test_no_first_row_header(self):
-        self.requests.get.return_value = MockResponse(200, example_csv)
+        self.response = MockResponse(200, example_csv)
         kwargs = {
             'googlefileselect': {
                 **default_googlefileselect,
@@ -154,21 +176,35 @@ class GoogleSheetsTests(unittest.TestCase):
                          'Not authorized. Please connect to Google Drive.')
 
     def test_no_table_on_http_error(self):
-        self.requests.get.side_effect = \
-            requests.exceptions.ReadTimeout('read timeout')
+        self.http_get.side_effect = \
+            aiohttp.ClientConnectionError('connection reset')
+        fetch_result = fetch()
+        self.assertTrue(fetch_result.dataframe.empty)
+        self.assertEqual(fetch_result.error, 'connection reset')
+
+    def test_no_table_on_timeout(self):
+        self.http_get.side_effect = asyncio.TimeoutError
+        fetch_result = fetch()
+        self.assertTrue(fetch_result.dataframe.empty)
+        self.assertEqual(fetch_result.error, 'Timed out waiting for Google')
+
+    def test_no_table_on_auth_error(self):
+        self.oauth_service.generate_access_token_or_str_error.return_value = \
+            'Token revoked'
         fetch_result = fetch()
         self.assertTrue(fetch_result.dataframe.empty)
-        self.assertEqual(fetch_result.error, 'read timeout')
+        self.assertEqual(fetch_result.error, 'Token revoked')
+        self.http_get.assert_not_called()
 
     def test_no_table_on_missing_table(self):
-        self.requests.get.return_value = MockResponse(404, 'not found')
+        self.response = MockResponse(404, 'not found')
         fetch_result = fetch()
         self.assertTrue(fetch_result.dataframe.empty)
         self.assertEqual(fetch_result.error,
                          'HTTP 404 from Google: not found')
 
     def test_render(self):
-        self.requests.get.return_value = MockResponse(200, example_csv)
+        self.response = MockResponse(200, example_csv)
         kwargs = {
             'googlefileselect': {
                 **default_googlefileselect,
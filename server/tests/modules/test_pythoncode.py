@@ -1,14 +1,26 @@
+import os
+import signal
+import tempfile
+import time
 import unittest
+from unittest.mock import patch
 import numpy
 import pandas
 from pandas.testing import assert_frame_equal
-from server.modules.pythoncode import safe_eval_process
+from server import dataframe_mmap
+from server.modules import pythoncode
+from server.modules.pythoncode import SandboxPool, safe_eval_process
 
 
 EMPTY_DATAFRAME = pandas.DataFrame()
 EMPTY_OUTPUT = {'output': ''}
 
 
+def _get_ppid(pid: int) -> int:
+    with open(f'/proc/{pid}/stat') as f:
+        return int(f.read().rsplit(')', 1)[1].split()[1])
+
+
 class SafeEvalProcessTest(unittest.TestCase):
     def test_pipe_dataframe(self):
         dataframe = pandas.DataFrame({'a': [1, 2]})
@@ -144,6 +156,124 @@ def process(table):
             'output': 'process(table) did not return a pd.DataFrame or a str\n'
         })
 
+    def test_table_types_round_trip(self):
+        dataframe = pandas.DataFrame({
+            'i': [1, 2],
+            'f': [1.5, numpy.nan],
+            's': ['a', None],
+            'c': pandas.Series(['x', 'y'], dtype='category'),
+            'd': pandas.to_datetime(['2019-01-01', None]),
+        })
+        table, error, _ = safe_eval_process("""
+def process(table):
+    return table
+""", dataframe.copy())
+        self.assertEqual(error, '')
+        assert_frame_equal(table, dataframe)
+
+    def test_duplicate_column_names(self):
+        # The module framework renames them later. Don't crash here.
+        table, error, _ = safe_eval_process("""
+def process(table):
+    return pd.DataFrame([[1, 'x']], columns=['A', 'A'])
+""", EMPTY_DATAFRAME)
+        self.assertEqual(error, '')
+        self.assertEqual(list(table.columns), ['A', 'A'])
+        self.assertEqual(table.values.tolist(), [[1, 'x']])
+
+    def test_refill_pool_ahead_of_time(self):
+        safe_eval_process("""
+def process(table):
+    return table
+""", EMPTY_DATAFRAME)
+        pool = pythoncode._get_pool()
+        pool._refiller.submit(lambda: None).result()  # wait for refill
+        self.assertEqual(len(pool._idle), pythoncode.POOL_SIZE)
+        self.assertTrue(all(sandbox.is_alive() for sandbox in pool._idle))
+
+    def test_sandbox_is_not_our_child(self):
+        # Sandboxes must not inherit this process's memory (and user data)
+        sandbox = pythoncode._get_pool().take()
+        try:
+            forker_pid = _get_ppid(sandbox.pid)
+            self.assertNotEqual(forker_pid, os.getpid())
+            self.assertEqual(_get_ppid(forker_pid),
+                             pythoncode._zygote.process.pid)
+        finally:
+            sandbox.kill()
+
+    def test_sandbox_waits_to_be_killed(self):
+        # If the sandbox exited after responding, the kernel would reap it
+        # and kill() might hit another process with the same pid.
+        sandbox = pythoncode._get_pool().take()
+        try:
+            with tempfile.NamedTemporaryFile() as input_file:
+                dataframe_mmap.write_dataframe(input_file, EMPTY_DATAFRAME)
+                sandbox.connection.send(('syntax error(', input_file.name,
+                                         '/dev/null'))
+                error, json = sandbox.connection.recv()
+            self.assertTrue(error)
+            time.sleep(0.1)
+            os.kill(sandbox.pid, 0)  # raises if the sandbox exited
+        finally:
+            sandbox.kill()
+
+    def test_restart_dead_forker(self):
+        sandbox = pythoncode._get_pool().take()
+        forker_pid = _get_ppid(sandbox.pid)
+        sandbox.kill()
+        os.kill(forker_pid, signal.SIGKILL)  # e.g., OOM killer
+
+        table, error, json = safe_eval_process("""
+def process(table):
+    return table
+""", pandas.DataFrame({'a': [1]}))
+        self.assertEqual(error, '')
+
+    def test_connect_error(self):
+        with patch.object(pythoncode, '_pool', SandboxPool(0)), \
+                patch.object(pythoncode._Zygote, 'connect',
+                             side_effect=ConnectionRefusedError(
+                                 111, 'Connection refused'
+                             )):
+            table, error, json = safe_eval_process("""
+def process(table):
+    return table
+""", pandas.DataFrame({'a': [1]}))
+        self.assertEqual(error, (
+            'Could not start Python subprocess: '
+            '[Errno 111] Connection refused'
+        ))
+
+
+class SandboxPoolTest(unittest.TestCase):
+    def test_sandboxes_are_single_use(self):
+        pool = SandboxPool(1)
+        try:
+            pool.refill()
+            sandbox1 = pool.take()
+            pool.refill()
+            sandbox2 = pool.take()
+            self.assertNotEqual(sandbox1.pid, sandbox2.pid)
+            sandbox1.kill()
+            sandbox2.kill()
+        finally:
+            pool.close()
+
+    def test_replace_dead_idle_sandbox(self):
+        pool = SandboxPool(1)
+        try:
+            pool.refill()
+            dead = pool._idle[0]
+            os.kill(dead.pid, signal.SIGKILL)
+            dead.connection.poll(5)  # wait for EOF
+            sandbox = pool.take()
+            self.assertIsNot(sandbox, dead)
+            self.assertTrue(sandbox.is_alive())
+            sandbox.kill()
+        finally:
+            pool.close()
+
 #     def test_builtins_disabled_within_pandas(self):
 #         result = safe_eval_process("""
 # def process(table):
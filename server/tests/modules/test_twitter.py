@@ -25,22 +25,19 @@ class MockAiohttpResponse:
     async def json(self):
         return self.json_dict
 
-    def raise_for_status(self):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
         pass
 
 
-class MockAiohttpSession:
+class MockHttpClient:
     def __init__(self, responses):
         self.responses = responses
         self.requests = []
         self.i = 0
 
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, *args):
-        pass
-
     async def get(self, url, *args, **kwargs):
         self.requests.append(MockAiohttpRequest(url, args, kwargs))
         ret = MockAiohttpResponse(self.responses[self.i])
@@ -780,7 +777,7 @@ P = MockParams.factory(querytype='user_timeline', username='username',
 
 
 def fetch(params, stored_dataframe=None):
-    async def get_stored_dataframe():
+    async def get_stored_dataframe(newest_segment=False):
         return stored_dataframe
 
     return async_to_sync(twitter.fetch)(
@@ -892,25 +889,26 @@ class TwitterTests(unittest.TestCase):
         self.assertEqual(result, Err('Not a valid Twitter list URL'))
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_fetch_user_timeline_accumulate(self, session):
-        session.return_value = mock_session = MockAiohttpSession([
+    @patch('server.httpclient.get')
+    def test_fetch_user_timeline_accumulate(self, get):
+        mock_client = MockHttpClient([
             mock_statuses2,
             []
         ])
+        get.side_effect = mock_client.get
 
         params = P(querytype='user_timeline', username='foouser',
                    accumulate=True)
 
         result = fetch(params, mock_tweet_table)
-        expected = pd.concat([mock_tweet_table2, mock_tweet_table],
-                             ignore_index=True, sort=False)
+        # Only new tweets: Workbench stores them atop the old ones
         self.assertEqual(result.error, '')
-        assert_frame_equal(result.dataframe, expected)
+        self.assertTrue(result.stored_delta)
+        assert_frame_equal(result.dataframe, mock_tweet_table2)
 
         # query should start where we left off
         self.assertEqual(
-            str(mock_session.requests[0].url),
+            str(mock_client.requests[0].url),
             (
                 'https://api.twitter.com/1.1/statuses/user_timeline.json'
                 '?screen_name=foouser&tweet_mode=extended&count=200'
@@ -918,7 +916,7 @@ class TwitterTests(unittest.TestCase):
             )
         )
         self.assertEqual(
-            str(mock_session.requests[1].url),
+            str(mock_client.requests[1].url),
             (
                 'https://api.twitter.com/1.1/statuses/user_timeline.json'
                 '?screen_name=foouser&tweet_mode=extended&count=200'
@@ -927,41 +925,61 @@ class TwitterTests(unittest.TestCase):
         )
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_fetch_accumulate_from_None(self, session):
+    @patch('server.httpclient.get')
+    def test_fetch_accumulate_reads_newest_segment(self, get):
+        get.side_effect = MockHttpClient([[]]).get
+        calls = []
+
+        async def get_stored_dataframe(**kwargs):
+            calls.append(kwargs)
+            return mock_tweet_table
+
+        async_to_sync(twitter.fetch)(
+            P(accumulate=True),
+            get_stored_dataframe=get_stored_dataframe
+        )
+        # Don't read (and assemble) every stored segment
+        self.assertEqual(calls, [{'newest_segment': True}])
+
+    @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
+    @patch('server.httpclient.get')
+    def test_fetch_accumulate_from_None(self, get):
         # https://www.pivotaltracker.com/story/show/160258591
         # Empty dataframe shouldn't change types
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             mock_statuses,
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P(accumulate=True), None)
         self.assertEqual(result.error, '')
         assert_frame_equal(result.dataframe, mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_fetch_accumulate_from_empty(self, session):
+    @patch('server.httpclient.get')
+    def test_fetch_accumulate_from_empty(self, get):
         # https://www.pivotaltracker.com/story/show/160258591
         # Empty dataframe shouldn't change types
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             mock_statuses,
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P(accumulate=True), pd.DataFrame())  # missing columns
         self.assertEqual(result.error, '')
         assert_frame_equal(result.dataframe, mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_fetch_accumulate_all_empty(self, session):
+    @patch('server.httpclient.get')
+    def test_fetch_accumulate_all_empty(self, get):
         # https://www.pivotaltracker.com/story/show/160258591
         # Empty dataframe shouldn't change types
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P(accumulate=True), pd.DataFrame())  # missing columns
         self.assertEqual(result.error, '')
@@ -969,29 +987,29 @@ class TwitterTests(unittest.TestCase):
         assert_frame_equal(result.dataframe, expected)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_fetch_accumulate_empty_upon_data(self, session):
+    @patch('server.httpclient.get')
+    def test_fetch_accumulate_empty_upon_data(self, get):
         # https://www.pivotaltracker.com/story/show/160258591
         # Empty dataframe shouldn't change types
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P(accumulate=True), mock_tweet_table)  # missing columns
         self.assertEqual(result.error, '')
-        assert_frame_equal(result.dataframe, mock_tweet_table)
+        self.assertTrue(result.stored_delta)
+        expected = mock_tweet_table[0:0].reset_index(drop=True)  # no new rows
+        assert_frame_equal(result.dataframe, expected)
 
-    @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_accumulate_recover_after_bug_160258591(self, session):
+    def test_accumulate_recover_after_bug_160258591(self):
         # https://www.pivotaltracker.com/story/show/160258591
         # 'id', 'retweet_count' and 'favorite_count' had wrong type after
         # accumulating an empty table. Now the bad data is in our database;
         # let's convert back to the type we want.
-        session.return_value = MockAiohttpSession([
-            # Fix it _no matter what_ -- even if we aren't adding any data
-            []
-        ])
+        #
+        # Fix it _no matter what_ -- even if we aren't adding any data. We
+        # don't rewrite old data when accumulating, so fix it in render().
 
         # Simulate the bug: convert everything to str
         bad_table = mock_tweet_table.copy()
@@ -999,22 +1017,23 @@ class TwitterTests(unittest.TestCase):
         bad_table = bad_table.astype(str)
         bad_table[nulls] = None
 
-        result = fetch(P(accumulate=True), bad_table)
-        self.assertEqual(result.error, '')
-        assert_frame_equal(result.dataframe, mock_tweet_table)
+        result = twitter.render(pd.DataFrame(), P(accumulate=True),
+                                fetch_result=ProcessResult(bad_table))
+        assert_frame_equal(result['dataframe'], mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_twitter_search(self, session):
-        session.return_value = mock_session = MockAiohttpSession([
+    @patch('server.httpclient.get')
+    def test_twitter_search(self, get):
+        mock_client = MockHttpClient([
             mock_statuses,
             []
         ])
+        get.side_effect = mock_client.get
 
         # Actually fetch!
         result = fetch(P(querytype='search', query='cat'))
         self.assertEqual(result.error, '')
-        self.assertEqual([str(req.url) for req in mock_session.requests], [
+        self.assertEqual([str(req.url) for req in mock_client.requests], [
             (
                 'https://api.twitter.com/1.1/search/tweets.json'
                 '?q=cat&result_type=recent&tweet_mode=extended&count=100'
@@ -1030,19 +1049,20 @@ class TwitterTests(unittest.TestCase):
         assert_frame_equal(result.dataframe, mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_twitter_list(self, session):
-        session.return_value = mock_session = MockAiohttpSession([
+    @patch('server.httpclient.get')
+    def test_twitter_list(self, get):
+        mock_client = MockHttpClient([
             mock_statuses,
             []
         ])
+        get.side_effect = mock_client.get
 
         # Actually fetch!
         result = fetch(
             P(querytype='lists_statuses',
               listurl='https://twitter.com/thatuser/lists/theirlist')
         )
-        self.assertEqual([str(req.url) for req in mock_session.requests], [
+        self.assertEqual([str(req.url) for req in mock_client.requests], [
             (
                 'https://api.twitter.com/1.1/lists/statuses.json'
                 '?owner_screen_name=thatuser&slug=theirlist'
@@ -1079,38 +1099,46 @@ class TwitterTests(unittest.TestCase):
         self.assertEqual(result['column_formats'], {'id': '{:d}'})
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_add_retweet_status_screen_name(self, session):
+    @patch('server.httpclient.get')
+    def test_add_retweet_status_screen_name(self, get):
         # Migration: what happens when we accumulate tweets
         # where the old stored table does not have retweet_status_screen_name?
         # We should consider those to have just None in that column
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             # add tweets which are not duplicated (mocking max_id)
             mock_statuses2,
             []
         ])
+        get.side_effect = mock_client.get
 
         # Simulate old format by deleting retweet screen name column
         old_format_table = mock_tweet_table.copy(deep=True) \
             .drop('retweeted_status_screen_name', axis=1)
 
         result = fetch(P(accumulate=True), old_format_table)
-
+        self.assertEqual(result.error, '')
+        assert_frame_equal(result.dataframe, mock_tweet_table2)
+
+        # Workbench stores the new tweets atop the old ones. When it assembles
+        # them, old rows get None in the new column.
+        stored = pd.concat([result.dataframe, old_format_table],
+                           ignore_index=True, sort=False)
+        result = twitter.render(pd.DataFrame(), P(accumulate=True),
+                                fetch_result=ProcessResult(stored))
         expected = pd.concat([mock_tweet_table2, mock_tweet_table],
                              ignore_index=True, sort=False)
-        expected.loc[3:5, 'retweeted_status_screen_name'] = None
-        self.assertEqual(result.error, '')
-        assert_frame_equal(result.dataframe, expected)
+        assert_frame_equal(result['dataframe'], expected)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_retweeted_status_full_text(self, session):
+    @patch('server.httpclient.get')
+    def test_retweeted_status_full_text(self, get):
         # https://www.pivotaltracker.com/story/show/165502310
         # Retweets' .full_text isn't actually the full text.
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             json.loads(ExtendedRetweetSample),
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P())
         self.assertEqual(result.dataframe['text'][0], (
@@ -1122,13 +1150,14 @@ class TwitterTests(unittest.TestCase):
         ))
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
-    @patch('aiohttp.ClientSession')
-    def test_undefined_language_is_null(self, session):
+    @patch('server.httpclient.get')
+    def test_undefined_language_is_null(self, get):
         # https://blog.twitter.com/developer/en_us/a/2013/introducing-new-metadata-for-tweets.html
-        session.return_value = MockAiohttpSession([
+        mock_client = MockHttpClient([
             json.loads(UndefinedLangSample),
             []
         ])
+        get.side_effect = mock_client.get
 
         result = fetch(P())
         lang = result.dataframe['lang'][0]
@@ -61,6 +61,12 @@ class MockResponse:
     async def text(self):
         return self._text
 
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
 
 class MockCachedRenderResult:
     def __init__(self, dataframe: pd.DataFrame):
@@ -100,8 +106,6 @@ class ScrapeUrlsTest(SimpleTestCase):
     @override_settings(SCRAPER_TIMEOUT=0.2)  # all our test data lags 0.25s max
     def scraper_result_test(self, results, response_times):
         async def session_get(url, *, timeout=None):
-            url = str(url)  # undo yarl un-magick-ing
-
             # Silly mock HTTP GET computes the test's input based on its
             # expected output. This defeats the purpose of a test.
             row = results[results['url'] == url]
@@ -123,10 +127,9 @@ class ScrapeUrlsTest(SimpleTestCase):
             else:
                 return MockResponse(int(status), text)
 
-        with patch('aiohttp.ClientSession') as session:
+        with patch('server.httpclient.get') as get:
             urls = results['url'].tolist()
-            session_mock = session.return_value
-            session_mock.get.side_effect = session_get
+            get.side_effect = session_get
 
             # mock the output table format scraper expects
             out_table = pd.DataFrame(
@@ -143,10 +146,8 @@ class ScrapeUrlsTest(SimpleTestCase):
                 results[['url', 'status', 'html']]
             )
 
-            # ensure aiohttp.get() called with the right sequence of urls
-            # str() to un-magick the yarl.URL() magic
-            call_urls = [str(args[0]) for name, args, kwargs
-                         in session_mock.get.mock_calls]
+            # ensure httpclient.get() called with the right sequence of urls
+            call_urls = [args[0] for name, args, kwargs in get.mock_calls]
             self.assertEqual(set(call_urls), set(urls))
 
     # basic tests, number of urls smaller than max simultaneous connections
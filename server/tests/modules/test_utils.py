@@ -12,6 +12,7 @@ from pandas.testing import assert_frame_equal
 from cjworkbench.types import ProcessResult
 from server.models import Workflow
 from server.models.commands import InitWorkflowCommand
+from server.modules import utils
 from server.modules.utils import build_globals_for_eval, parse_bytesio, \
         turn_header_into_first_row, workflow_url_to_id, \
         fetch_external_workflow, spooled_data_from_url, \
@@ -95,6 +96,53 @@ class ParseBytesIoTest(SimpleTestCase):
         expected = pd.DataFrame({'A': ['café']}).astype('category')
         assert_frame_equal(result.dataframe, expected)
 
+    @override_settings(PARSE_CSV_CHUNK_CELLS=4)
+    def test_csv_chunked(self):
+        # 2 rows per chunk. Column B is numeric until the third chunk.
+        result = parse_bytesio(io.BytesIO(
+            b'A,B\n1,2\n3,\n5,6\n7,08\nx,y\n'
+        ), 'text/csv', 'utf-8')
+        expected = pd.DataFrame({
+            'A': ['1', '3', '5', '7', 'x'],
+            'B': ['2', '', '6', '08', 'y'],
+        }).astype('category')
+        assert_frame_equal(result.dataframe, expected)
+
+    @override_settings(PARSE_CSV_CHUNK_CELLS=4)
+    def test_csv_chunked_restart_once_for_all_text_columns(self):
+        # Columns A and B both turn out to be text in the third chunk
+        with patch('server.modules.utils._parse_table_chunks',
+                   wraps=utils._parse_table_chunks) as parse_table_chunks:
+            parse_bytesio(io.BytesIO(b'A,B\n1,2\n3,4\nx,y\n'),
+                          'text/csv', 'utf-8')
+        self.assertEqual(parse_table_chunks.call_count, 2)
+
+    @override_settings(PARSE_CSV_CHUNK_CELLS=4)
+    def test_csv_chunked_empty_chunk_is_undecided(self):
+        # Column B is empty in the first chunk: it can become text without a
+        # restart.
+        with patch('server.modules.utils._parse_table_chunks',
+                   wraps=utils._parse_table_chunks) as parse_table_chunks:
+            result = parse_bytesio(io.BytesIO(b'A,B\n1,\n2,\n3,x\n'),
+                                   'text/csv', 'utf-8')
+        self.assertEqual(parse_table_chunks.call_count, 1)
+        assert_frame_equal(result.dataframe, pd.DataFrame({
+            'A': [1, 2, 3],
+            'B': pd.Series(['', '', 'x'], dtype='category'),
+        }))
+
+    @override_settings(PARSE_CSV_CHUNK_CELLS=2, MAX_ROWS_PER_TABLE=3)
+    def test_csv_stop_at_max_rows(self):
+        result = parse_bytesio(io.BytesIO(b'A,B\n1,a\n2,b\n3,c\n4,d\n5,e\n'),
+                               'text/csv', 'utf-8')
+        self.assertEqual(result, ProcessResult(
+            pd.DataFrame({
+                'A': [1, 2, 3],
+                'B': pd.Series(['a', 'b', 'c'], dtype='category'),
+            }),
+            error='Truncated output from 5 rows to 3'
+        ))
+
     def test_json_with_nulls(self):
         result = parse_bytesio(io.BytesIO("""[
             {"A": "a"},
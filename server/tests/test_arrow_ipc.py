@@ -0,0 +1,183 @@
+import struct
+import unittest
+import numpy as np
+import pandas as pd
+from server.arrow_ipc import encode_dataframe
+
+
+class _FlatbufferTable:
+    """Just enough Flatbuffers to read what we wrote."""
+
+    def __init__(self, buf: bytes, pos: int):
+        self.buf = buf
+        self.pos = pos
+        vtable_pos = pos - struct.unpack_from('<i', buf, pos)[0]
+        vtable_size = struct.unpack_from('<H', buf, vtable_pos)[0]
+        n_slots = (vtable_size - 4) // 2
+        self.slot_offsets = struct.unpack_from('<%dH' % n_slots, buf,
+                                               vtable_pos + 4)
+
+    def _field_pos(self, slot):
+        if slot >= len(self.slot_offsets) or not self.slot_offsets[slot]:
+            return None
+        return self.pos + self.slot_offsets[slot]
+
+    def scalar(self, slot, fmt, default=0):
+        pos = self._field_pos(slot)
+        if pos is None:
+            return default
+        return struct.unpack_from('<' + fmt, self.buf, pos)[0]
+
+    def _deref(self, slot):
+        pos = self._field_pos(slot)
+        if pos is None:
+            return None
+        return pos + struct.unpack_from('<I', self.buf, pos)[0]
+
+    def table(self, slot):
+        pos = self._deref(slot)
+        return None if pos is None else _FlatbufferTable(self.buf, pos)
+
+    def string(self, slot):
+        pos = self._deref(slot)
+        length = struct.unpack_from('<I', self.buf, pos)[0]
+        return self.buf[pos + 4:pos + 4 + length].decode('utf-8')
+
+    def tables(self, slot):
+        pos = self._deref(slot)
+        if pos is None:
+            return []
+        n = struct.unpack_from('<I', self.buf, pos)[0]
+        return [
+            _FlatbufferTable(self.buf, pos + 4 + 4 * i
+                             + struct.unpack_from('<I', self.buf,
+                                                  pos + 4 + 4 * i)[0])
+            for i in range(n)
+        ]
+
+    def structs(self, slot, fmt):
+        pos = self._deref(slot)
+        n = struct.unpack_from('<I', self.buf, pos)[0]
+        size = struct.calcsize('<' + fmt)
+        return [struct.unpack_from('<' + fmt, self.buf, pos + 4 + size * i)
+                for i in range(n)]
+
+
+def _read_messages(blob: bytes):
+    """Yield (header_type, header, body) until end-of-stream."""
+    pos = 0
+    while True:
+        continuation, length = struct.unpack_from('<Ii', blob, pos)
+        assert continuation == 0xffffffff
+        pos += 8
+        if length == 0:
+            assert pos == len(blob)
+            return
+        assert length % 8 == 0
+        metadata = blob[pos:pos + length]
+        message = _FlatbufferTable(metadata,
+                                   struct.unpack_from('<I', metadata, 0)[0])
+        body_length = message.scalar(3, 'q')
+        body = blob[pos + length:pos + length + body_length]
+        pos += length + body_length
+        yield (message.scalar(1, 'B'), message.table(2), body)
+
+
+def _buffers(record_batch, body):
+    return [body[offset:offset + length]
+            for offset, length in record_batch.structs(2, 'qq')]
+
+
+class EncodeDataframeTest(unittest.TestCase):
+    def test_schema(self):
+        blob = encode_dataframe(pd.DataFrame({
+            'A': [1, 2],
+            'B': [1.5, 2.5],
+            'C': ['x', 'y'],
+            'D': pd.Series(['x', 'y'], dtype='category'),
+            'E': pd.to_datetime(['2019-01-01', '2019-01-02']),
+        }), {'start_row': '0'})
+        messages = list(_read_messages(blob))
+        self.assertEqual([m[0] for m in messages], [1, 2, 3])
+
+        schema = messages[0][1]
+        fields = schema.tables(1)
+        self.assertEqual([f.string(0) for f in fields],
+                         ['A', 'B', 'C', 'D', 'E'])
+        # Type enum: Int, FloatingPoint, Utf8, Utf8 (dictionary), Timestamp
+        self.assertEqual([f.scalar(2, 'B') for f in fields],
+                         [2, 3, 5, 5, 10])
+        self.assertEqual(fields[0].table(3).scalar(0, 'i'), 64)  # bitWidth
+        self.assertIsNone(fields[2].table(4))
+        self.assertEqual(fields[3].table(4).scalar(0, 'q'), 3)  # dict ID
+        self.assertEqual(fields[4].table(3).scalar(0, 'h'), 1)  # ms
+
+        metadata = schema.tables(2)
+        self.assertEqual([(kv.string(0), kv.string(1)) for kv in metadata],
+                         [('start_row', '0')])
+
+    def test_numbers(self):
+        blob = encode_dataframe(pd.DataFrame({
+            'A': [1, -2, 3],
+            'B': [1.5, np.nan, 3.0],
+        }))
+        _, record_batch, body = list(_read_messages(blob))[1]
+        self.assertEqual(record_batch.scalar(0, 'q'), 3)
+        self.assertEqual(record_batch.structs(1, 'qq'), [(3, 0), (3, 1)])
+        a_validity, a_data, b_validity, b_data = \
+            _buffers(record_batch, body)
+        self.assertEqual(a_validity, b'')
+        self.assertEqual(struct.unpack('<3q', a_data), (1, -2, 3))
+        self.assertEqual(b_validity, b'\x05')  # 0b101
+        self.assertEqual(struct.unpack('<3d', b_data)[0::2], (1.5, 3.0))
+
+    def test_text(self):
+        blob = encode_dataframe(pd.DataFrame({'A': ['a', None, 'héllo']}))
+        _, record_batch, body = list(_read_messages(blob))[1]
+        self.assertEqual(record_batch.structs(1, 'qq'), [(3, 1)])
+        validity, offsets, data = _buffers(record_batch, body)
+        self.assertEqual(validity, b'\x05')
+        self.assertEqual(struct.unpack('<4i', offsets), (0, 1, 1, 7))
+        self.assertEqual(data.decode('utf-8'), 'ahéllo')
+
+    def test_categorical_is_dictionary_encoded(self):
+        blob = encode_dataframe(pd.DataFrame({
+            'A': pd.Series(['b', 'a', None, 'b'], dtype='category'),
+        }))
+        _, dictionary_batch, dictionary_body = list(_read_messages(blob))[1]
+        _, record_batch, body = list(_read_messages(blob))[2]
+
+        self.assertEqual(dictionary_batch.scalar(0, 'q'), 0)  # dict ID
+        dictionary = dictionary_batch.table(1)
+        _, offsets, data = _buffers(dictionary, dictionary_body)
+        self.assertEqual(struct.unpack('<3i', offsets), (0, 1, 2))
+        self.assertEqual(data, b'ab')
+
+        validity, indices = _buffers(record_batch, body)
+        self.assertEqual(validity, b'\x0b')  # 0b1011
+        self.assertEqual(struct.unpack('<4i', indices), (1, 0, 0, 1))
+
+    def test_datetime_milliseconds(self):
+        blob = encode_dataframe(pd.DataFrame({
+            'A': pd.to_datetime(['1970-01-01T00:00:01.5', None]),
+        }))
+        _, record_batch, body = list(_read_messages(blob))[1]
+        validity, data = _buffers(record_batch, body)
+        self.assertEqual(validity, b'\x01')
+        self.assertEqual(struct.unpack('<2q', data), (1500, 0))
+
+    def test_buffers_are_aligned(self):
+        blob = encode_dataframe(pd.DataFrame({
+            'A': ['a', 'bc', None],
+            'B': [1, 2, 3],
+        }))
+        _, record_batch, body = list(_read_messages(blob))[1]
+        self.assertTrue(all(offset % 8 == 0
+                            for offset, _ in record_batch.structs(2, 'qq')))
+        self.assertEqual(len(body) % 8, 0)
+
+    def test_empty(self):
+        blob = encode_dataframe(pd.DataFrame())
+        messages = list(_read_messages(blob))
+        self.assertEqual(messages[0][1].tables(1), [])
+        self.assertEqual(messages[1][1].scalar(0, 'q'), 0)
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from cjworkbench.types import Column, ColumnType
+from server.column_stats import ColumnStats, compute_column_stats, \
+        compute_table_stats
+
+
+class ColumnStatsTest(unittest.TestCase):
+    def test_text(self):
+        stats = compute_column_stats(
+            pd.Series(['b', 'a', None, 'b']),
+            Column('A', ColumnType.TEXT())
+        )
+        self.assertEqual(stats, ColumnStats(n_nulls=1, n_distinct=2,
+                                            min='a', max='b',
+                                            value_counts={'a': 1, 'b': 2}))
+
+    def test_category_ignores_unused_categories(self):
+        series = pd.Series(['b', 'a', 'b'], dtype='category') \
+            .cat.add_categories(['c'])
+        stats = compute_column_stats(series, Column('A', ColumnType.TEXT()))
+        self.assertEqual(stats.n_distinct, 2)
+        self.assertEqual(stats.value_counts, {'a': 1, 'b': 2})
+        self.assertEqual((stats.min, stats.max), ('a', 'b'))
+
+    def test_number_formats_value_counts(self):
+        stats = compute_column_stats(
+            pd.Series([1.001, 1.002, 2, np.nan]),
+            Column('A', ColumnType.NUMBER('{:.2f}'))
+        )
+        self.assertEqual(stats.n_nulls, 1)
+        self.assertEqual(stats.n_distinct, 3)
+        self.assertEqual((stats.min, stats.max), (1.001, 2.0))
+        self.assertIsInstance(stats.max, float)  # not numpy: JSON-friendly
+        self.assertEqual(stats.value_counts, {'1.00': 2, '2.00': 1})
+
+    def test_datetime(self):
+        stats = compute_column_stats(
+            pd.Series(pd.to_datetime(['2019-01-02', '2019-01-01', None])),
+            Column('A', ColumnType.DATETIME())
+        )
+        self.assertEqual(stats.n_nulls, 1)
+        self.assertEqual(stats.min, '2019-01-01T00:00:00Z')
+        self.assertEqual(stats.max, '2019-01-02T00:00:00Z')
+        self.assertEqual(stats.value_counts, {
+            '2019-01-01T00:00:00.000000Z': 1,
+            '2019-01-02T00:00:00.000000Z': 1,
+        })
+
+    def test_all_null(self):
+        stats = compute_column_stats(pd.Series([np.nan, np.nan]),
+                                     Column('A', ColumnType.NUMBER()))
+        self.assertEqual(stats, ColumnStats(n_nulls=2, n_distinct=0))
+
+    @patch('server.column_stats.MaxValueCounts', 2)
+    def test_skip_value_counts_when_many_distinct_values(self):
+        stats = compute_column_stats(pd.Series(['a', 'b', 'c']),
+                                     Column('A', ColumnType.TEXT()))
+        self.assertEqual(stats.n_distinct, 3)
+        self.assertIsNone(stats.value_counts)
+
+    def test_table_and_dict_round_trip(self):
+        dataframe = pd.DataFrame({'A': [1, 2], 'B': ['x', 'y']})
+        stats = compute_table_stats(dataframe, [
+            Column('A', ColumnType.NUMBER()),
+            Column('B', ColumnType.TEXT()),
+        ])
+        self.assertEqual(list(stats.keys()), ['A', 'B'])
+        self.assertEqual(ColumnStats.from_dict(stats['A'].to_dict()),
+                         stats['A'])
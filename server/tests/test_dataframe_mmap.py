@@ -0,0 +1,154 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server import dataframe_mmap
+from server.dataframe_mmap import read_dataframe, read_row_range, \
+        read_rows, write_dataframe
+
+
+class DataframeMmapTest(unittest.TestCase):
+    def _round_trip(self, dataframe):
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, dataframe)
+            return read_dataframe(f)
+
+    def test_round_trip(self):
+        dataframe = pd.DataFrame({
+            'i': [1, 2, 3],
+            'f': [1.0, np.nan, 3.5],
+            'b': [True, False, True],
+            's': ['a', None, 'c'],
+            'c': pd.Series(['x', 'y', 'x'], dtype='category'),
+            'd': pd.to_datetime(['2019-01-01', None, '2019-01-03']),
+        })
+        assert_frame_equal(self._round_trip(dataframe), dataframe)
+
+    def test_empty(self):
+        dataframe = pd.DataFrame({'A': []}, dtype=np.int64)
+        assert_frame_equal(self._round_trip(dataframe), dataframe)
+
+    def test_modify_result_does_not_modify_file(self):
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, pd.DataFrame({'A': [1, 2]}))
+            result1 = read_dataframe(f)
+            result1.loc[0, 'A'] = 3
+            result2 = read_dataframe(f)
+        assert_frame_equal(result2, pd.DataFrame({'A': [1, 2]}))
+
+    def test_numeric_columns_share_file_memory(self):
+        # Two same-dtype columns: pd.DataFrame(dict) would copy both into
+        # one block
+        mapped = []
+        original_frombuffer = np.frombuffer
+
+        def frombuffer(*args, **kwargs):
+            array = original_frombuffer(*args, **kwargs)
+            mapped.append(array)
+            return array
+
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, pd.DataFrame({'A': [1, 2, 3], 'B': [4, 5, 6]}))
+            with patch.object(dataframe_mmap.np, 'frombuffer', frombuffer):
+                result = read_row_range(f, None, 1, 3)
+
+        self.assertEqual(len(mapped), 2)
+        self.assertTrue(np.shares_memory(result['A'].values, mapped[0]))
+        self.assertTrue(np.shares_memory(result['B'].values, mapped[1]))
+        assert_frame_equal(result, pd.DataFrame({'A': [2, 3], 'B': [5, 6]}))
+
+    def test_read_row_range_across_chunks(self):
+        dataframe = pd.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, dataframe, rows_per_chunk=2)
+            result = read_row_range(f, ['B', 'A'], 1, 4)
+        assert_frame_equal(result, pd.DataFrame({
+            'B': ['b', 'c', 'd'],
+            'A': [2, 3, 4],
+        }))
+
+    def test_read_row_range_out_of_bounds(self):
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, pd.DataFrame({'A': ['a']}))
+            result = read_row_range(f, None, 5, 10)
+        self.assertEqual(list(result.columns), ['A'])
+        self.assertEqual(len(result), 0)
+
+    def test_read_rows_across_chunks(self):
+        dataframe = pd.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+            'C': pd.Series(['x', 'y', 'x', 'y', 'x'], dtype='category'),
+        })
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, dataframe, rows_per_chunk=2)
+            result = read_rows(f, ['B', 'A', 'C'], np.array([4, 0, 3]))
+        assert_frame_equal(result, pd.DataFrame({
+            'B': ['e', 'a', 'd'],
+            'A': [5, 1, 4],
+            'C': pd.Series(['x', 'x', 'y'], dtype='category'),
+        }))
+
+    def test_read_rows_out_of_bounds(self):
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, pd.DataFrame({'A': ['a']}))
+            with self.assertRaises(IndexError):
+                read_rows(f, None, np.array([1]))
+
+    def test_text_unicode_and_nulls(self):
+        dataframe = pd.DataFrame({
+            'A': ['café', None, '', '\U0001f600', np.nan, 'x\0y'],
+        })
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, dataframe, rows_per_chunk=4)
+            result = read_dataframe(f)
+            self.assertEqual(list(result['A']),
+                             ['café', None, '', '\U0001f600', None, 'x\0y'])
+            self.assertEqual(
+                list(read_row_range(f, None, 1, 5)['A']),
+                [None, '', '\U0001f600', None]
+            )
+            rows = read_rows(f, None, np.array([4, 3, 1]))
+            self.assertEqual(list(rows['A']), [None, '\U0001f600', None])
+
+    def test_footer_is_json(self):
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, pd.DataFrame({'A': ['a'], 'B': [1]}))
+            f.seek(0)
+            data = f.read()
+        footer_end = len(data) - len(dataframe_mmap.Magic) - 8
+        footer_length = int.from_bytes(data[footer_end:footer_end + 8],
+                                       'little')
+        footer = json.loads(data[footer_end - footer_length:footer_end])
+        self.assertEqual([c['kind'] for c in footer['columns']],
+                         ['text', 'raw'])
+
+    def test_write_non_text_object_is_error(self):
+        with tempfile.TemporaryFile() as f:
+            with self.assertRaises(ValueError):
+                write_dataframe(f, pd.DataFrame({'A': ['a', 1]}))
+
+    def test_allow_pickle(self):
+        dataframe = pd.DataFrame({'A': ['a', 1]})
+        with tempfile.TemporaryFile() as f:
+            write_dataframe(f, dataframe, allow_pickle=True)
+            assert_frame_equal(read_dataframe(f, allow_pickle=True),
+                               dataframe)
+            # Files from elsewhere (e.g., S3) are never unpickled
+            with self.assertRaises(ValueError):
+                read_dataframe(f)
+            with self.assertRaises(ValueError):
+                read_rows(f, None, np.array([0]))
+
+    def test_read_wrong_format(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'PAR1' + b'\0' * 100 + b'PAR1')
+            f.flush()
+            with self.assertRaises(ValueError):
+                read_dataframe(f)
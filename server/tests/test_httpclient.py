@@ -0,0 +1,175 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+import aiohttp
+from aiohttp import web
+from django.test import override_settings
+from server import httpclient
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.app = web.Application()
+        self.runner = web.AppRunner(self.app)
+
+        # Each test gets fresh metrics and back-off times
+        self.metrics_patch = patch.object(httpclient, '_metrics', {})
+        self.metrics_patch.start()
+        self.retry_after_patch = patch.object(httpclient, '_retry_after', {})
+        self.retry_after_patch.start()
+
+    def tearDown(self):
+        self.loop.run_until_complete(httpclient.close())
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+        self.retry_after_patch.stop()
+        self.metrics_patch.stop()
+
+        super().tearDown()
+
+    def _start_server(self, **routes):
+        for path, handler in routes.items():
+            self.app.router.add_get('/' + path, handler)
+
+        async def start():
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, '127.0.0.1', 0)
+            await site.start()
+            return site._server.sockets[0].getsockname()[1]
+
+        port = self.loop.run_until_complete(start())
+        return f'http://127.0.0.1:{port}'
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_get(self):
+        async def hello(request):
+            return web.Response(body=b'hello')
+
+        url = self._start_server(hello=hello)
+
+        async def go():
+            response = await httpclient.get(url + '/hello')
+            async with response:
+                return response.status, await response.read()
+
+        self.assertEqual(self._run(go()), (200, b'hello'))
+        metrics = httpclient.host_metrics()['127.0.0.1']
+        self.assertEqual(metrics.n_requests, 1)
+        self.assertEqual(metrics.n_errors, 0)
+        self.assertEqual(metrics.n_bytes, 5)
+
+    def test_reuse_session(self):
+        async def go():
+            return httpclient._get_session(), httpclient._get_session()
+
+        session1, session2 = self._run(go())
+        self.assertIs(session1, session2)
+
+    def test_invalid_url(self):
+        with self.assertRaises(aiohttp.InvalidURL):
+            self._run(httpclient.get('ftp://example.org/'))
+
+    def test_url_is_not_canonicalized(self):
+        async def echo(request):
+            return web.Response(text=request.raw_path)
+
+        url = self._start_server(echo=echo)
+
+        async def go():
+            response = await httpclient.get(url + '/echo?a=%2F%3d')
+            async with response:
+                return await response.text()
+
+        self.assertEqual(self._run(go()), '/echo?a=%2F%3d')
+
+    def test_retry_after(self):
+        n_requests = 0
+
+        async def flaky(request):
+            nonlocal n_requests
+            n_requests += 1
+            if n_requests == 1:
+                return web.Response(status=429, headers={'Retry-After': '0'})
+            return web.Response(body=b'ok')
+
+        url = self._start_server(flaky=flaky)
+
+        async def go():
+            response = await httpclient.get(url + '/flaky')
+            async with response:
+                return response.status
+
+        self.assertEqual(self._run(go()), 200)
+        metrics = httpclient.host_metrics()['127.0.0.1']
+        self.assertEqual(metrics.n_requests, 2)
+        self.assertEqual(metrics.n_retries, 1)
+
+    @override_settings(HTTP_MAX_RETRY_AFTER=60)
+    def test_no_retry_on_long_retry_after(self):
+        async def down(request):
+            return web.Response(status=503, headers={'Retry-After': '3600'})
+
+        url = self._start_server(down=down)
+
+        async def go():
+            response = await httpclient.get(url + '/down')
+            async with response:
+                return response.status
+
+        self.assertEqual(self._run(go()), 503)
+        self.assertEqual(httpclient.host_metrics()['127.0.0.1'].n_retries, 0)
+
+    @override_settings(HTTP_MAX_RETRIES=2)
+    def test_raise_for_status_after_max_retries(self):
+        async def busy(request):
+            return web.Response(status=429, headers={'Retry-After': '0'})
+
+        url = self._start_server(busy=busy)
+
+        with self.assertRaises(aiohttp.ClientResponseError) as cm:
+            self._run(httpclient.get(url + '/busy', raise_for_status=True))
+        self.assertEqual(cm.exception.status, 429)
+        self.assertEqual(httpclient.host_metrics()['127.0.0.1'].n_requests, 3)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(httpclient._parse_retry_after('120'), 120.0)
+        self.assertEqual(httpclient._parse_retry_after(
+            'Wed, 21 Oct 2015 07:28:00 GMT'  # in the past
+        ), 0.0)
+        self.assertIsNone(httpclient._parse_retry_after('soon'))
+        self.assertIsNone(httpclient._parse_retry_after(None))
+
+    def test_iter_chunked_counts_bytes(self):
+        async def big(request):
+            return web.Response(body=b'x' * 10000)
+
+        url = self._start_server(big=big)
+
+        async def go():
+            response = await httpclient.get(url + '/big')
+            async with response:
+                return b''.join([
+                    chunk
+                    async for chunk in httpclient.iter_chunked(response, 1000)
+                ])
+
+        self.assertEqual(len(self._run(go())), 10000)
+        self.assertEqual(httpclient.host_metrics()['127.0.0.1'].n_bytes,
+                         10000)
+
+    def test_count_connection_errors(self):
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            # Port 1 is (almost certainly) closed
+            self._run(httpclient.get('http://127.0.0.1:1/'))
+        metrics = httpclient.host_metrics()['127.0.0.1']
+        self.assertEqual(metrics.n_requests, 1)
+        self.assertEqual(metrics.n_errors, 1)
@@ -1,7 +1,10 @@
 import io
-import unittest
+import os
+import time
 from unittest.mock import patch
+from django.test import override_settings
 from server import minio
+from server.tests.utils import EmptyCacheTestCase
 from botocore.response import StreamingBody
 from s3transfer.download import DownloadChunkIterator
 from urllib3.exceptions import ProtocolError
@@ -23,8 +26,9 @@ def _put(b: bytes) -> None:
     minio.put_bytes(Bucket, Key, b)
 
 
-class TemporarilyDownloadTest(unittest.TestCase):
+class TemporarilyDownloadTest(EmptyCacheTestCase):
     def setUp(self):
+        super().setUp()
         minio.ensure_bucket_exists(Bucket)
         _clear()
 
@@ -39,13 +43,134 @@ class TemporarilyDownloadTest(unittest.TestCase):
                 raise NotImplemented
 
 
-class RandomReadMinioFileTest(unittest.TestCase):
+@override_settings(MINIO_CACHE_MAX_BYTES=10)
+class OpenCachedTest(EmptyCacheTestCase):
     def setUp(self):
+        super().setUp()
+        minio.ensure_bucket_exists(Bucket)
+        _clear()
+
+    def test_download_once(self):
+        _put(b'1234')
+        with minio.open_cached(Bucket, Key) as f:
+            self.assertEqual(f.read(), b'1234')
+        with patch.object(minio.transfer, 'download_file') as download:
+            with minio.open_cached(Bucket, Key) as f:
+                self.assertEqual(f.read(), b'1234')
+            download.assert_not_called()
+
+    def test_no_request_when_cached(self):
+        _put(b'1234')
+        minio.open_cached(Bucket, Key).close()
+        with patch.object(minio, 'stat') as stat:
+            with minio.open_cached(Bucket, Key) as f:
+                self.assertEqual(f.read(), b'1234')
+            stat.assert_not_called()
+
+    def test_stat_again_when_cache_file_is_trimmed(self):
+        _put(b'1234')
+        minio.open_cached(Bucket, Key).close()
+        for name in self._cached_files():
+            os.unlink(os.path.join(self.cache_dir.name, name))
+        with minio.open_cached(Bucket, Key) as f:
+            self.assertEqual(f.read(), b'1234')
+
+    def test_cached_stat_keeps_metadata(self):
+        minio.client.put_object(Bucket=Bucket, Key=Key, Body=b'1234',
+                                Metadata={'format': 'mmap'})
+        minio.open_cached(Bucket, Key).close()
+        with patch.object(minio, 'stat') as stat:
+            file_stat = minio.cached_stat(Bucket, Key)
+            stat.assert_not_called()
+        self.assertEqual(file_stat.metadata, {'format': 'mmap'})
+
+    def test_trim_least_recently_used(self):
+        _put(b'123456')
+        minio.open_cached(Bucket, Key).close()
+        minio.put_bytes(Bucket, 'key2', b'abcdef')
+        try:
+            with minio.open_cached(Bucket, 'key2') as f:
+                self.assertEqual(f.read(), b'abcdef')
+        finally:
+            minio.remove(Bucket, 'key2')
+        # 12 bytes > MINIO_CACHE_MAX_BYTES: the older file is gone
+        self.assertEqual(len(self._cached_files()), 1)
+
+    def test_share_cache_file_between_copies(self):
+        _put(b'1234')
+        minio.copy(Bucket, 'key2', f'{Bucket}/{Key}')
+        try:
+            minio.open_cached(Bucket, Key).close()
+            with patch.object(minio.transfer, 'download_file') as download:
+                with minio.open_cached(Bucket, 'key2') as f:
+                    self.assertEqual(f.read(), b'1234')
+                download.assert_not_called()
+        finally:
+            minio.remove(Bucket, 'key2')
+
+    def test_file_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            minio.open_cached(Bucket, Key)
+
+    def test_download_again_when_file_changes_during_download(self):
+        _put(b'1234')
+        old_stat = minio.stat(Bucket, Key)
+        _put(b'5678')
+        # One lock file for all cache files: we must release it before
+        # downloading the new version.
+        with patch.object(minio, '_CacheLockStripes', 1):
+            with minio.open_cached(Bucket, Key, old_stat) as f:
+                self.assertEqual(f.read(), b'5678')
+        self.assertEqual(len(self._cached_files()), 1)
+        self.assertEqual(
+            [name for name in os.listdir(self.cache_dir.name)
+             if name.startswith('.download-')],
+            []
+        )
+
+    def test_trim_stale_temporary_files(self):
+        stale_path = os.path.join(self.cache_dir.name, '.download-stale')
+        fresh_path = os.path.join(self.cache_dir.name, '.download-fresh')
+        stale_dir = os.path.join(self.cache_dir.name, '.link-stale')
+        for path in (stale_path, fresh_path):
+            with open(path, 'wb') as f:
+                f.write(b'x')
+        os.mkdir(stale_dir)
+        old_time = time.time() - minio._CacheStaleTempSeconds - 1
+        os.utime(stale_path, (old_time, old_time))
+        os.utime(stale_dir, (old_time, old_time))
+
+        _put(b'1234')
+        minio.open_cached(Bucket, Key).close()  # trims
+
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertFalse(os.path.exists(stale_dir))
+        self.assertTrue(os.path.exists(fresh_path))
+
+    def test_temporarily_download_from_cache(self):
+        _put(b'1234')
+        with minio.temporarily_download(Bucket, Key) as path:
+            self.assertEqual(path.read_bytes(), b'1234')
+        self.assertEqual(len(self._cached_files()), 1)
+
+    def test_full_read_from_cache(self):
+        _put(b'1234')
+        minio.open_cached(Bucket, Key).close()
+        with patch.object(minio.transfer, 'download_file') as download:
+            with minio.FullReadMinioFile(Bucket, Key) as f:
+                self.assertEqual(f.read(), b'1234')
+            download.assert_not_called()
+
+
+class RandomReadMinioFileTest(EmptyCacheTestCase):
+    def setUp(self):
+        super().setUp()
         minio.ensure_bucket_exists(Bucket)
         _clear()
 
     def tearDown(self):
         _clear()
+        super().tearDown()
 
     def test_raise_file_not_found(self):
         with self.assertRaises(FileNotFoundError):
@@ -112,6 +237,25 @@ class RandomReadMinioFileTest(unittest.TestCase):
         file.seek(1)
         self.assertEqual(file.read(), b'23456')
 
+    def test_cache_file_when_all_blocks_are_read(self):
+        _put(b'123456')
+        with minio.RandomReadMinioFile(Bucket, Key, block_size=2) as file:
+            file.read()
+        self.assertEqual(len(self._cached_files()), 1)
+        _clear()
+        # The next reader reads from cache. It doesn't care that the file
+        # on S3 was deleted ... after it reads metadata. So mock that.
+        with patch.object(minio, 'stat') as stat:
+            stat.return_value = minio.Stat(6, file.file_stat.etag)
+            with minio.RandomReadMinioFile(Bucket, Key, block_size=2) as file:
+                self.assertEqual(file.read(), b'123456')
+
+    def test_do_not_cache_partially_read_file(self):
+        _put(b'123456')
+        with minio.RandomReadMinioFile(Bucket, Key, block_size=2) as file:
+            file.read(2)
+        self.assertEqual(self._cached_files(), [])
+
     @patch.object(StreamingBody, 'read')
     def test_recover_after_read_protocolerror(self, read_mock):
         # Patch DownloadChunkIterator: first attempt to stream bytes raises
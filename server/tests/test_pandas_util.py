@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+import pandas as pd
+from server.pandas_util import table_digest
+
+
+class TableDigestTest(unittest.TestCase):
+    def test_equal_tables(self):
+        self.assertEqual(
+            table_digest(pd.DataFrame({'A': ['a', None], 'B': [1, 2]})),
+            table_digest(pd.DataFrame({'A': ['a', np.nan], 'B': [1, 2]}))
+        )
+
+    def test_row_order(self):
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': [1, 2]})),
+            table_digest(pd.DataFrame({'A': [2, 1]}))
+        )
+
+    def test_dtype(self):
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': [1]})),
+            table_digest(pd.DataFrame({'A': [1.0]}))
+        )
+
+    def test_text_boundaries(self):
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': ['ab', 'c']})),
+            table_digest(pd.DataFrame({'A': ['a', 'bc']}))
+        )
+
+    def test_text_null_vs_empty(self):
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': ['a', None]})),
+            table_digest(pd.DataFrame({'A': ['a', '']}))
+        )
+
+    def test_categorical(self):
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': ['a', 'b']}, dtype='category')),
+            table_digest(pd.DataFrame({'A': ['b', 'a']}, dtype='category'))
+        )
+        self.assertNotEqual(
+            table_digest(pd.DataFrame({'A': ['a', 'b']}, dtype='category')),
+            table_digest(pd.DataFrame({'A': ['a', 'b']}))
+        )
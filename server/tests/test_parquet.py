@@ -1,7 +1,12 @@
 from contextlib import contextmanager
 from pathlib import Path
-import unittest
+from unittest.mock import patch
+from django.test import override_settings
+import numpy
+import pandas
+from pandas.testing import assert_frame_equal
 from server import minio, parquet
+from server.tests.utils import EmptyCacheTestCase
 
 
 bucket = minio.CachedRenderResultsBucket
@@ -9,7 +14,7 @@ key = 'key.par'
 minio.ensure_bucket_exists(bucket)
 
 
-class ParquetTest(unittest.TestCase):
+class ParquetTest(EmptyCacheTestCase):
     @contextmanager
     def _file_on_s3(self, relpath):
         path = Path(__file__).parent / 'test_data' / relpath
@@ -42,3 +47,155 @@ class ParquetTest(unittest.TestCase):
         with self._file_on_s3('fastparquet-issue-375-snappy.par'):
             with self.assertRaises(parquet.FastparquetIssue375):
                 parquet.read(bucket, key)
+
+    def test_read_row_range_across_row_groups(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        try:
+            parquet.write(bucket, key, dataframe, row_group_size=2)
+            result = parquet.read_row_range(bucket, key, ['B'], 1, 4)
+        finally:
+            minio.remove(bucket, key)
+        assert_frame_equal(result, pandas.DataFrame({'B': ['b', 'c', 'd']}))
+
+    def test_read_row_range_out_of_bounds(self):
+        dataframe = pandas.DataFrame({'A': [1, 2, 3]})
+        try:
+            parquet.write(bucket, key, dataframe, row_group_size=2)
+            result = parquet.read_row_range(bucket, key, None, 5, 10)
+        finally:
+            minio.remove(bucket, key)
+        self.assertEqual(list(result.columns), ['A'])
+        self.assertEqual(len(result), 0)
+
+    @override_settings(TABLE_FORMATS={})
+    def test_read_row_range_stats_once(self):
+        dataframe = pandas.DataFrame({'A': [1, 2, 3]})
+        try:
+            parquet.write(bucket, key, dataframe)
+            with patch.object(minio, 'stat', wraps=minio.stat) as stat:
+                parquet.read_row_range(bucket, key, None, 0, 2)
+                self.assertEqual(stat.call_count, 1)
+        finally:
+            minio.remove(bucket, key)
+
+    def test_read_rows_across_row_groups(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        try:
+            parquet.write(bucket, key, dataframe, row_group_size=2)
+            result = parquet.read_rows(bucket, key, ['B'],
+                                       numpy.array([4, 0, 1]))
+            empty = parquet.read_rows(bucket, key, ['B'], numpy.array([]))
+        finally:
+            minio.remove(bucket, key)
+        assert_frame_equal(result, pandas.DataFrame({'B': ['e', 'a', 'b']}))
+        self.assertEqual(list(empty.columns), ['B'])
+        self.assertEqual(len(empty), 0)
+
+    @override_settings(TABLE_FORMATS={})
+    def test_read_rows_out_of_bounds(self):
+        dataframe = pandas.DataFrame({'A': [1, 2, 3]})
+        try:
+            parquet.write(bucket, key, dataframe, row_group_size=2)
+            with self.assertRaises(IndexError):
+                parquet.read_rows(bucket, key, None, numpy.array([3]))
+        finally:
+            minio.remove(bucket, key)
+
+    @override_settings(TABLE_FORMATS={})
+    def test_iter_chunks_by_row_group(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        try:
+            parquet.write(bucket, key, dataframe, row_group_size=2)
+            chunks = list(parquet.iter_chunks(bucket, key, 1000))
+        finally:
+            minio.remove(bucket, key)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        assert_frame_equal(
+            pandas.concat(chunks, ignore_index=True),
+            dataframe
+        )
+
+    @override_settings(TABLE_FORMATS={})
+    def test_iter_chunks_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            next(parquet.iter_chunks(bucket, key, 1000))
+
+
+@override_settings(TABLE_FORMATS={'cached-render-results': 'mmap'})
+class MmapFormatTest(EmptyCacheTestCase):
+    def tearDown(self):
+        minio.remove(bucket, key)
+
+    def test_write_read(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3],
+            'B': pandas.Series(['a', 'b', 'a'], dtype='category'),
+            'C': ['x', None, 'z'],
+        })
+        parquet.write(bucket, key, dataframe)
+        stat = minio.stat(bucket, key)
+        self.assertEqual(stat.metadata, {'table-format': 'mmap'})
+        assert_frame_equal(parquet.read(bucket, key), dataframe)
+        assert_frame_equal(parquet.read(bucket, key, [['C', 'A']]),
+                           dataframe[['C', 'A']])
+
+    def test_read_row_range(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        parquet.write(bucket, key, dataframe, row_group_size=2)
+        result = parquet.read_row_range(bucket, key, ['B'], 1, 4)
+        assert_frame_equal(result, pandas.DataFrame({'B': ['b', 'c', 'd']}))
+
+    def test_read_rows(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4, 5],
+            'B': ['a', 'b', 'c', 'd', 'e'],
+        })
+        parquet.write(bucket, key, dataframe, row_group_size=2)
+        result = parquet.read_rows(bucket, key, ['B', 'A'],
+                                   numpy.array([3, 1]))
+        assert_frame_equal(result, pandas.DataFrame({'B': ['d', 'b'],
+                                                     'A': [4, 2]}))
+
+    def test_read_parquet_file(self):
+        # Files written before the format changed stay readable
+        dataframe = pandas.DataFrame({'A': [1, 2]})
+        with override_settings(TABLE_FORMATS={}):
+            parquet.write(bucket, key, dataframe)
+        assert_frame_equal(parquet.read(bucket, key), dataframe)
+        assert_frame_equal(parquet.read_row_range(bucket, key, None, 1, 2),
+                           pandas.DataFrame({'A': [2]}))
+
+    def test_read_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            parquet.read(bucket, key)
+
+    def test_iter_chunks(self):
+        dataframe = pandas.DataFrame({
+            'A': [1, 2, 3, 4],
+            'B': ['a', 'b', 'c', 'd'],
+        })
+        parquet.write(bucket, key, dataframe, row_group_size=2)
+        chunks = list(parquet.iter_chunks(bucket, key, 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+        assert_frame_equal(
+            pandas.concat(chunks, ignore_index=True),
+            dataframe
+        )
+
+    def test_iter_chunks_empty_table_yields_columns(self):
+        parquet.write(bucket, key, pandas.DataFrame({'A': []}))
+        chunks = list(parquet.iter_chunks(bucket, key, 2))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(list(chunks[0].columns), ['A'])
@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from cjworkbench.types import Column, ColumnType
+from server import table_query
+from server.table_query import ColumnIndex, Query, query_rows
+
+
+class FakeCachedRenderResult:
+    def __init__(self, dataframe, columns, hash='hash-1'):
+        self.wf_module_id = 123
+        self.hash = hash
+        self.dataframe = dataframe
+        self.columns = columns
+        self.nrows = len(dataframe)
+        self.n_reads = 0
+
+    def read_column(self, name):
+        self.n_reads += 1
+        return self.dataframe[name]
+
+
+class ColumnIndexTest(unittest.TestCase):
+    def test_sort_nulls_last_stable(self):
+        index = ColumnIndex(pd.Series(['b', None, 'a', 'b']),
+                            Column('A', ColumnType.TEXT()))
+        self.assertEqual(index.sort_permutation(True).tolist(), [2, 0, 3, 1])
+        self.assertEqual(index.sort_permutation(False).tolist(),
+                         [0, 3, 2, 1])
+
+    def test_sort_category_by_value(self):
+        series = pd.Series(['b', 'a', 'c'], dtype='category') \
+            .cat.reorder_categories(['c', 'b', 'a'])
+        index = ColumnIndex(series, Column('A', ColumnType.TEXT()))
+        self.assertEqual(index.sort_permutation(True).tolist(), [1, 0, 2])
+
+    def test_sort_numbers(self):
+        index = ColumnIndex(pd.Series([10, np.nan, 9, 100]),
+                            Column('A', ColumnType.NUMBER()))
+        self.assertEqual(index.sort_permutation(True).tolist(), [2, 0, 3, 1])
+
+    def test_rows_where_uses_formatted_values(self):
+        index = ColumnIndex(pd.Series([1.001, 2, 1.002, np.nan]),
+                            Column('A', ColumnType.NUMBER('{:.2f}')))
+        self.assertEqual(index.formatted_values.tolist(),
+                         ['1.00', '1.00', '2.00'])
+        mask = (index.formatted_values == '1.00').values
+        self.assertEqual(index.rows_where(mask).tolist(), [0, 2])
+
+
+class QueryRowsTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Each test gets fresh caches, with room for two entries each
+        self.indexes_patch = patch.object(table_query, '_column_indexes',
+                                          table_query._LruCache(2,
+                                                                lambda _: 1))
+        self.indexes_patch.start()
+        self.queries_patch = patch.object(table_query, '_query_results',
+                                          table_query._LruCache(2,
+                                                                lambda _: 1))
+        self.queries_patch.start()
+
+        self.cached_result = FakeCachedRenderResult(
+            pd.DataFrame({
+                'A': ['apple', 'Banana', None, 'cherry', 'grape'],
+                'B': [3, 1, 2, 5, 4],
+            }),
+            [Column('A', ColumnType.TEXT()), Column('B', ColumnType.NUMBER())]
+        )
+
+    def tearDown(self):
+        self.queries_patch.stop()
+        self.indexes_patch.stop()
+        super().tearDown()
+
+    def test_no_query_is_table_order(self):
+        rows = query_rows(self.cached_result, Query())
+        self.assertEqual(rows.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(self.cached_result.n_reads, 0)
+
+    def test_sort(self):
+        rows = query_rows(self.cached_result,
+                          Query(sort_column='B', sort_ascending=False))
+        self.assertEqual(rows.tolist(), [3, 4, 0, 2, 1])
+
+    def test_filter_substring_ignores_case(self):
+        rows = query_rows(self.cached_result,
+                          Query(filter_column='A', filter_substring='AN'))
+        self.assertEqual(rows.tolist(), [1])
+
+    def test_filter_value(self):
+        rows = query_rows(self.cached_result,
+                          Query(filter_column='B', filter_value='5'))
+        self.assertEqual(rows.tolist(), [3])
+
+    def test_filter_and_sort(self):
+        rows = query_rows(self.cached_result,
+                          Query(sort_column='B', filter_column='A',
+                                filter_substring='p'))
+        self.assertEqual(rows.tolist(), [0, 4])
+
+    def test_missing_column(self):
+        with self.assertRaises(KeyError):
+            query_rows(self.cached_result, Query(sort_column='X'))
+
+    def test_reuse_column_index(self):
+        query_rows(self.cached_result, Query(sort_column='A'))
+        query_rows(self.cached_result, Query(sort_column='A',
+                                             sort_ascending=False))
+        query_rows(self.cached_result, Query(filter_column='A',
+                                             filter_value='grape'))
+        self.assertEqual(self.cached_result.n_reads, 1)
+
+    def test_new_hash_builds_new_index(self):
+        query_rows(self.cached_result, Query(sort_column='A'))
+        self.cached_result.hash = 'hash-2'
+        query_rows(self.cached_result, Query(sort_column='A'))
+        self.assertEqual(self.cached_result.n_reads, 2)
+
+    def test_no_hash_is_not_cached(self):
+        self.cached_result.hash = None
+        query_rows(self.cached_result, Query(sort_column='A'))
+        query_rows(self.cached_result, Query(sort_column='A'))
+        self.assertEqual(self.cached_result.n_reads, 2)
+
+    def test_evict_least_recently_used(self):
+        query_rows(self.cached_result, Query(sort_column='A'))
+        query_rows(self.cached_result, Query(sort_column='B'))
+        self.cached_result.hash = 'hash-2'
+        query_rows(self.cached_result, Query(sort_column='A'))  # evicts
+        self.cached_result.hash = 'hash-1'
+        query_rows(self.cached_result, Query(sort_column='A',
+                                             sort_ascending=False))
+        self.assertEqual(self.cached_result.n_reads, 4)
+
+
+class LruCacheTest(unittest.TestCase):
+    def test_evict_by_nbytes(self):
+        cache = table_query._LruCache(100, lambda value: value.nbytes)
+        a = cache.get_or_build('a', lambda: np.zeros(5))  # 40 bytes
+        b = cache.get_or_build('b', lambda: np.zeros(5))
+        cache.get_or_build('a', lambda: np.zeros(5))  # now 'b' is oldest
+        cache.get_or_build('c', lambda: np.zeros(5))  # evicts 'b'
+        self.assertIs(cache.get_or_build('a', lambda: np.zeros(5)), a)
+        self.assertIsNot(cache.get_or_build('b', lambda: np.zeros(5)), b)
+
+    def test_skip_value_larger_than_cache(self):
+        cache = table_query._LruCache(8, lambda value: value.nbytes)
+        a = cache.get_or_build('a', lambda: np.zeros(2))
+        self.assertIsNot(cache.get_or_build('a', lambda: np.zeros(2)), a)
@@ -3,16 +3,17 @@ from concurrent.futures import ThreadPoolExecutor
 import functools
 import json
 import logging
+import unittest
 from unittest.mock import patch
 from channels.layers import get_channel_layer
 from channels.testing import WebsocketCommunicator
 from django.contrib.auth.models import AnonymousUser, User
 import django.db
 from cjworkbench.asgi import create_url_router
-from server import handlers
-from server.models import Workflow
+from server import handlers, websockets
+from server.models import Workflow, WorkflowViewers
 from server.websockets import ws_client_send_delta_async, \
-        queue_render_if_listening
+        queue_render_if_listening, _merge_two_deltas
 from server.tests.utils import DbTestCase
 
 
@@ -147,6 +148,54 @@ class ChannelTests(DbTestCase):
         self.assertEqual(data['data']['updateWorkflow']['name'],
                          self.workflow.name)
 
+    @async_test
+    async def test_reconnect_skips_fields_only_deltas_change(self,
+                                                             communicate):
+        wf_module = self.workflow.tabs.first().wf_modules.create(
+            order=0,
+            module_id_name='whatever',
+            notes='Some notes',
+            last_relevant_delta_id=self.workflow.last_delta_id
+        )
+        comm = communicate(
+            self.application,
+            f'/workflows/{self.workflow.id}/'
+            f'?last_delta_id={self.workflow.last_delta_id}'
+        )
+        connected, _ = await comm.connect()
+        self.assertTrue(connected)
+        data = json.loads(await comm.receive_from())['data']
+        self.assertEqual(data['updateWorkflow']['last_delta_id'],
+                         self.workflow.last_delta_id)
+        tab_data = data['updateTabs'][self.workflow.tabs.first().slug]
+        self.assertNotIn('name', tab_data)
+        self.assertIn('selected_wf_module_position', tab_data)
+        step_data = data['updateWfModules'][str(wf_module.id)]
+        self.assertNotIn('notes', step_data)
+        self.assertNotIn('params', step_data)
+        self.assertIn('output_status', step_data)
+        self.assertIn('output_columns', step_data)
+
+    @async_test
+    async def test_reconnect_after_new_delta_gets_everything(self,
+                                                             communicate):
+        wf_module = self.workflow.tabs.first().wf_modules.create(
+            order=0,
+            module_id_name='whatever',
+            notes='Some notes',
+            last_relevant_delta_id=self.workflow.last_delta_id
+        )
+        comm = communicate(
+            self.application,
+            f'/workflows/{self.workflow.id}/'
+            f'?last_delta_id={self.workflow.last_delta_id - 1}'
+        )
+        connected, _ = await comm.connect()
+        self.assertTrue(connected)
+        data = json.loads(await comm.receive_from())['data']
+        step_data = data['updateWfModules'][str(wf_module.id)]
+        self.assertEqual(step_data['notes'], 'Some notes')
+
     @async_test
     async def test_message(self, communicate):
         comm = communicate(self.application, f'/workflows/{self.workflow.id}/')
@@ -179,6 +228,62 @@ class ChannelTests(DbTestCase):
         self.assertEqual(json.loads(response2),
                          {'type': 'apply-delta', 'data': {}})
 
+    @async_test
+    async def test_coalesce_deltas(self, communicate):
+        comm = communicate(self.application, f'/workflows/{self.workflow.id}/')
+        connected, _ = await comm.connect()
+        self.assertTrue(connected)
+        await comm.receive_from()  # ignore initial workflow delta
+        await ws_client_send_delta_async(self.workflow.id, {
+            'updateWfModules': {'1': {'status': 'busy'}},
+        })
+        await ws_client_send_delta_async(self.workflow.id, {
+            'updateWfModules': {'1': {'status': 'ok'}},
+        })
+        await ws_client_send_delta_async(self.workflow.id, {
+            'updateWfModules': {'2': {'status': 'busy'}},
+        })
+        # The first delta goes out immediately
+        response1 = await comm.receive_from()
+        self.assertEqual(json.loads(response1)['data'], {
+            'updateWfModules': {'1': {'status': 'busy'}},
+        })
+        # The rest are merged
+        response2 = await comm.receive_from()
+        self.assertEqual(json.loads(response2)['data'], {
+            'updateWfModules': {
+                '1': {'status': 'ok'},
+                '2': {'status': 'busy'},
+            },
+        })
+        self.assertTrue(await comm.receive_nothing())
+
+    @async_test
+    async def test_count_viewers(self, communicate):
+        comm1 = communicate(self.application,
+                            f'/workflows/{self.workflow.id}/')
+        comm2 = communicate(self.application,
+                            f'/workflows/{self.workflow.id}/')
+        await comm1.connect()
+        await comm1.receive_from()  # ignore initial workflow delta
+        await comm2.connect()
+        await comm2.receive_from()  # ignore initial workflow delta
+        counter = websockets._viewer_counter()
+        self.assertEqual(counter.counts, {self.workflow.id: 2})
+
+        await counter.heartbeat()
+        self.assertEqual(
+            list(WorkflowViewers.objects.values_list('process_id',
+                                                     'workflow_id',
+                                                     'n_viewers')),
+            [(counter.process_id, self.workflow.id, 2)]
+        )
+
+        await comm1.disconnect()
+        self.assertEqual(counter.counts, {self.workflow.id: 1})
+        await comm2.disconnect()
+        self.assertEqual(counter.counts, {})
+
     @async_test
     async def test_after_disconnect_client_gets_no_message(self, communicate):
         comm = communicate(self.application, f'/workflows/{self.workflow.id}/')
@@ -345,3 +450,147 @@ class ChannelTests(DbTestCase):
         await comm.receive_from()  # ignore initial workflow delta
         args = await asyncio.wait_for(future_args, 0.005)
         self.assertEqual(args, (self.workflow.id, self.workflow.last_delta_id))
+
+
+class MergeDeltasTest(unittest.TestCase):
+    def test_merge_updates(self):
+        self.assertEqual(_merge_two_deltas(
+            {
+                'updateWorkflow': {'name': 'A', 'public': False},
+                'updateWfModules': {'1': {'status': 'busy', 'params': {}}},
+            },
+            {
+                'updateWorkflow': {'name': 'B'},
+                'updateWfModules': {
+                    '1': {'status': 'ok'},
+                    '2': {'status': 'busy'},
+                },
+            }
+        ), {
+            'updateWorkflow': {'name': 'B', 'public': False},
+            'updateWfModules': {
+                '1': {'status': 'ok', 'params': {}},
+                '2': {'status': 'busy'},
+            },
+        })
+
+    def test_merge_clears(self):
+        self.assertEqual(_merge_two_deltas(
+            {'updateWfModules': {'1': {}}, 'clearWfModuleIds': [2]},
+            {'clearWfModuleIds': [1, 2]}
+        ), {'updateWfModules': {'1': {}}, 'clearWfModuleIds': [2, 1]})
+
+    def test_no_merge_update_after_clear(self):
+        self.assertIsNone(_merge_two_deltas({'clearWfModuleIds': [1]},
+                                            {'updateWfModules': {'1': {}}}))
+        self.assertIsNone(_merge_two_deltas({'clearTabSlugs': ['t']},
+                                            {'updateTabs': {'t': {}}}))
+
+    def test_first_selected_wf_module_position_wins(self):
+        self.assertEqual(_merge_two_deltas(
+            {'updateTabs': {'t': {'selected_wf_module_position': 1}}},
+            {'updateTabs': {'t': {'selected_wf_module_position': 2,
+                                  'name': 'T'}}}
+        ), {
+            'updateTabs': {'t': {'selected_wf_module_position': 1,
+                                 'name': 'T'}},
+        })
+
+
+class DeltaCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        websockets.coalesce_deltas_on_this_loop()
+        self.sent = []
+
+        async def group_send(workflow_id, message):
+            # Record deltas as deltas, and other messages as-is
+            delta = websockets._delta_of(message)
+            self.sent.append((workflow_id,
+                              message if delta is None else delta))
+
+        self.send_patch = patch.object(websockets, '_workflow_group_send',
+                                       group_send)
+        self.send_patch.start()
+
+    def tearDown(self):
+        # Let open windows close
+        self._run(asyncio.sleep(websockets.DeltaCoalesceWindow * 1.5))
+        self.send_patch.stop()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        super().tearDown()
+
+    def _run(self, coroutine):
+        self.loop.run_until_complete(coroutine)
+
+    def test_send_first_delta_immediately(self):
+        self._run(ws_client_send_delta_async(1, {'updateWorkflow': {}}))
+        self.assertEqual(self.sent, [(1, {'updateWorkflow': {}})])
+
+    def test_one_message_per_window(self):
+        async def go():
+            for i in range(30):
+                await ws_client_send_delta_async(1, {
+                    'updateWfModules': {str(i): {'status': 'ok'}},
+                })
+            await asyncio.sleep(websockets.DeltaCoalesceWindow * 2.5)
+
+        self._run(go())
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(len(self.sent[1][1]['updateWfModules']), 29)
+
+    def test_workflows_are_independent(self):
+        async def go():
+            await ws_client_send_delta_async(1, {})
+            await ws_client_send_delta_async(2, {})
+
+        self._run(go())
+        self.assertEqual(self.sent, [(1, {}), (2, {})])
+
+    def test_keep_unmergeable_deltas_in_order(self):
+        async def go():
+            await ws_client_send_delta_async(1, {})
+            await ws_client_send_delta_async(1, {'clearWfModuleIds': [2]})
+            await ws_client_send_delta_async(1, {'updateWfModules': {'2': {}}})
+            await asyncio.sleep(websockets.DeltaCoalesceWindow * 2.5)
+
+        self._run(go())
+        self.assertEqual(self.sent, [
+            (1, {}),
+            (1, {'clearWfModuleIds': [2]}),
+            (1, {'updateWfModules': {'2': {}}}),
+        ])
+
+    def test_other_messages_wait_for_pending_deltas(self):
+        async def go():
+            await ws_client_send_delta_async(1, {})
+            await ws_client_send_delta_async(1, {'updateWorkflow': {}})
+            await queue_render_if_listening(1, 2)
+            await ws_client_send_delta_async(1, {'updateTabs': {}})
+            await asyncio.sleep(websockets.DeltaCoalesceWindow * 2.5)
+
+        self._run(go())
+        self.assertEqual(self.sent, [
+            (1, {}),
+            (1, {'updateWorkflow': {}}),
+            (1, {'type': 'queue_render',
+                 'data': {'workflow_id': 1, 'delta_id': 2}}),
+            (1, {'updateTabs': {}}),
+        ])
+
+    def test_no_coalescing_on_one_shot_loop(self):
+        # async_to_sync() in a view creates a loop like this. We must not
+        # leave deltas pending on it: it's closed right after we return.
+        async def go():
+            await ws_client_send_delta_async(1, {})
+            await ws_client_send_delta_async(1, {'updateWorkflow': {}})
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(go())
+        finally:
+            loop.close()
+        self.assertEqual(self.sent, [(1, {}), (1, {'updateWorkflow': {}})])
@@ -0,0 +1,86 @@
+from collections import namedtuple
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from server.models import WfModule, Workflow
+from server.serializers import TabSerializer, WfModuleSerializer, \
+        WorkflowSerializer
+from server.tests.utils import DbTestCase
+from server.workflow_snapshot import load_workflow_snapshot
+
+
+FakeRequest = namedtuple('FakeRequest', ('user', 'session'))
+
+
+class LoadWorkflowSnapshotTest(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='a', email='a@example.org')
+        self.request = FakeRequest(self.user, None)
+        self.workflow = Workflow.create_and_init(owner=self.user)
+        self.tab1 = self.workflow.tabs.first()
+        self.tab2 = self.workflow.tabs.create(position=1, slug='tab-2')
+
+    def _add_steps(self, n: int) -> None:
+        """Add `n` steps, alternating between tabs, each with a version."""
+        for i in range(n):
+            tab = self.tab1 if i % 2 == 0 else self.tab2
+            wf_module = tab.wf_modules.create(
+                order=tab.wf_modules.count(),
+                module_id_name='loadurl',
+                last_relevant_delta_id=self.workflow.last_delta_id,
+                params={'url': f'http://example.com/{i}'}
+            )
+            wf_module.stored_objects.create(stored_at=timezone.now(),
+                                            read=(i % 3 == 0))
+
+    def _count_queries(self) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            load_workflow_snapshot(self.workflow, self.request)
+        return len(queries)
+
+    def test_same_as_serializers(self):
+        self._add_steps(3)
+        self.tab1.wf_modules.create(order=2, module_id_name='loadurl',
+                                    is_deleted=True)
+
+        snapshot = load_workflow_snapshot(self.workflow, self.request)
+
+        self.assertEqual(
+            snapshot.workflow,
+            WorkflowSerializer(self.workflow,
+                               context={'request': self.request}).data
+        )
+        self.assertEqual(snapshot.tabs, {
+            tab.slug: TabSerializer(tab).data
+            for tab in self.workflow.live_tabs
+        })
+        self.assertEqual(snapshot.wf_modules, {
+            str(wfm.id): WfModuleSerializer(wfm).data
+            for wfm in WfModule.live_in_workflow(self.workflow)
+        })
+        self.assertEqual(snapshot.tabs[self.tab2.slug]['wf_module_ids'],
+                         list(self.tab2.live_wf_modules
+                              .values_list('id', flat=True)))
+
+    def test_constant_number_of_queries(self):
+        self._add_steps(2)
+        n_queries = self._count_queries()
+        self._add_steps(10)
+        self.assertEqual(self._count_queries(), n_queries)
+
+    def test_fields(self):
+        self._add_steps(1)
+        snapshot = load_workflow_snapshot(self.workflow, self.request,
+                                          tab_fields=['slug'],
+                                          wf_module_fields=['notes'])
+        self.assertEqual(snapshot.tabs[self.tab1.slug], {'slug': 'tab-1'})
+        self.assertEqual(list(snapshot.wf_modules.values())[0],
+                         {'notes': None})
+
+    def test_needs_render(self):
+        self._add_steps(1)
+        snapshot = load_workflow_snapshot(self.workflow, self.request)
+        self.assertTrue(snapshot.needs_render)
+        self.assertFalse(self.workflow.are_all_render_results_fresh())
@@ -1,13 +1,17 @@
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import pathlib
+import shutil
+import tempfile
 from typing import Dict, Iterable, List, Optional
+import unittest
 from django.db import connection, connections
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
 from cjworkbench.sync import WorkbenchDatabaseSyncToAsync
 from server import minio
+from server.models import module_version
 import os
 import io
 import pandas as pd
@@ -47,6 +51,7 @@ class DbTestCase(SimpleTestCase):
     def setUp(self):
         clear_db()
         clear_minio()
+        module_version.clear_caches()
 
     # Don't bother clearing data in tearDown(). The next test that needs the
     # database will be running setUp() anyway, so extra clearing will only cost
@@ -133,6 +138,31 @@ def clear_db():
         c.execute(sql)
 
 
+class EmptyCacheTestCase(unittest.TestCase):
+    """
+    Run each test with its own, initially-empty, MINIO_CACHE_DIR.
+
+    The cache assumes a key never names different contents. Tests that write
+    different contents to the same key need this.
+    """
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_settings = override_settings(
+            MINIO_CACHE_DIR=self.cache_dir.name
+        )
+        self.cache_settings.enable()
+
+    def tearDown(self):
+        self.cache_settings.disable()
+        self.cache_dir.cleanup()
+        super().tearDown()
+
+    def _cached_files(self):
+        return [name for name in os.listdir(self.cache_dir.name)
+                if not name.startswith('.')]
+
+
 def clear_minio():
     buckets = (
         minio.UserFilesBucket,
@@ -150,6 +180,9 @@ def clear_minio():
     for bucket in buckets:
         minio.remove_recursive(bucket, '/', force=True)
 
+    # The next test may write different contents to the same keys
+    shutil.rmtree(settings.MINIO_CACHE_DIR, ignore_errors=True)
+
 
 class MockPath(pathlib.PurePosixPath):
     """
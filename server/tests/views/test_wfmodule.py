@@ -9,8 +9,9 @@ from rest_framework.test import APIRequestFactory
 from rest_framework import status
 from rest_framework.test import force_authenticate
 from cjworkbench.types import Column, ColumnType, ProcessResult
-from server import minio
-from server.models import Workflow
+from django.db import connection
+from server import arrow_ipc, minio, parquet, table_query
+from server.models import CachedRenderResult, Workflow
 from server.views.WfModule import wfmodule_detail
 from server.tests.utils import LoggedInTestCase
 
@@ -145,6 +146,52 @@ class WfModuleTests(LoggedInTestCase):
         self.assertEqual(json.loads(response.content),
                          {'end_row': 0, 'rows': [], 'start_row': 0})
 
+    def test_wf_module_render_reads_without_lock(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        read_row_range = CachedRenderResult.read_dataframe_row_range
+
+        def read_outside_transaction(crr, *args, **kwargs):
+            # cooperative_lock() is a transaction
+            self.assertFalse(connection.in_atomic_block)
+            return read_row_range(crr, *args, **kwargs)
+
+        with patch.object(CachedRenderResult, 'read_dataframe_row_range',
+                          read_outside_transaction):
+            response = self.client.get('/api/wfmodules/%d/render'
+                                       % self.wf_module2.id)
+        self.assertEqual(json.loads(response.content), test_data_json)
+
+    def test_wf_module_render_retry_after_race(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [1]})
+        ))
+        self.wf_module2.save()
+
+        read_row_range = CachedRenderResult.read_dataframe_row_range
+        n_reads = 0
+
+        def read_during_render(crr, *args, **kwargs):
+            nonlocal n_reads
+            n_reads += 1
+            if n_reads == 1:
+                # Simulate a render that finishes just after we find the
+                # cached result but before we read it
+                self.wf_module2.last_relevant_delta_id = 3
+                self.wf_module2.save(update_fields=['last_relevant_delta_id'])
+                self.wf_module2.cache_render_result(3, ProcessResult(
+                    pd.DataFrame({'A': [2]})
+                ))
+            return read_row_range(crr, *args, **kwargs)
+
+        with patch.object(CachedRenderResult, 'read_dataframe_row_range',
+                          read_during_render):
+            response = self.client.get('/api/wfmodules/%d/render'
+                                       % self.wf_module2.id)
+        self.assertEqual(n_reads, 2)
+        self.assertEqual(json.loads(response.content)['rows'], [{'A': 2}])
+
     def test_wf_module_render_only_rows(self):
         self.wf_module2.cache_render_result(2, ProcessResult(test_data))
         self.wf_module2.save()
@@ -179,6 +226,99 @@ class WfModuleTests(LoggedInTestCase):
         )
         self.assertIs(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_wf_module_render_arrow(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            '/api/wfmodules/%d/render?startrow=1&endrow=3'
+            % self.wf_module2.id,
+            HTTP_ACCEPT='application/vnd.apache.arrow.stream'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.apache.arrow.stream')
+        self.assertEqual(response['Vary'], 'Accept')
+        self.assertEqual(
+            response.content,
+            arrow_ipc.encode_dataframe(
+                test_data[1:3].reset_index(drop=True),
+                {'start_row': '1', 'end_row': '3'}
+            )
+        )
+
+    def test_wf_module_render_arrow_error_is_json(self):
+        response = self.client.get(
+            '/api/wfmodules/%d/render?startrow=0&endrow=frog'
+            % self.wf_module2.id,
+            HTTP_ACCEPT='application/vnd.apache.arrow.stream'
+        )
+        self.assertIs(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['status_code'], 400)
+
+    def test_wf_module_tile(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get('/api/wfmodules/%d/tiles/v2/r0/c0.json'
+                                   % self.wf_module2.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), [
+            ['math', 10.0, 12],
+            ['english', None, 7],
+            ['history', 11.0, 13],
+            ['economics', 20.0, 20],
+        ])
+
+    def test_wf_module_tile_arrow(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            '/api/wfmodules/%d/tiles/v2/r0/c0.json' % self.wf_module2.id,
+            HTTP_ACCEPT='application/vnd.apache.arrow.stream'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.apache.arrow.stream')
+        self.assertEqual(response.content,
+                         arrow_ipc.encode_dataframe(test_data))
+
+    def test_wf_module_query(self):
+        table_query._column_indexes.clear()
+        table_query._query_results.clear()
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            '/api/wfmodules/%d/query?sort_column=F&sort_direction=desc'
+            '&filter_column=Class&filter_substring=IS&startrow=1'
+            % self.wf_module2.id
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {
+            'start_row': 1,
+            'end_row': 2,
+            'n_rows': 2,
+            'row_numbers': [1],
+            'rows': [{'Class': 'english', 'M': None, 'F': 7}],
+        })
+
+    def test_wf_module_query_missing_column(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get('/api/wfmodules/%d/query?sort_column=X'
+                                   % self.wf_module2.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_wf_module_query_invalid_filter(self):
+        response = self.client.get('/api/wfmodules/%d/query?filter_column=A'
+                                   % self.wf_module2.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # Test set/get update interval
     def test_wf_module_update_settings(self):
         settings = {'auto_update_data': True, 'update_interval': 5,
@@ -255,6 +395,7 @@ class WfModuleTests(LoggedInTestCase):
         # Simulate a race: we're overwriting the cache or deleting the WfModule
         # or some-such.
         minio.remove(minio.CachedRenderResultsBucket, crr.parquet_key)
+        minio.remove(minio.CachedRenderResultsBucket, crr.column_stats_key)
 
         response = self.client.get(
             f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
@@ -285,6 +426,80 @@ class WfModuleTests(LoggedInTestCase):
             {'values': {'1.00': 2, '2.00': 2, '3.00': 1}}
         )
 
+    def test_value_counts_from_column_stats(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': ['a', 'b', 'b']})
+        ))
+        self.wf_module2.save()
+
+        # Prove we don't read the table
+        with patch('server.parquet.read') as read:
+            response = self.client.get(
+                f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
+            )
+            read.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content),
+                         {'values': {'a': 1, 'b': 2}})
+
+    @patch('server.column_stats.MaxValueCounts', 2)
+    def test_value_counts_high_cardinality(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': ['a', 'b', 'b', 'c']})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content),
+                         {'values': {'a': 1, 'b': 2, 'c': 1}})
+
+    def test_value_counts_missing_column_stats(self):
+        # Results rendered before we computed column stats
+        crr = self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': ['a', 'b', 'b']})
+        ))
+        self.wf_module2.save()
+        minio.remove(minio.CachedRenderResultsBucket, crr.column_stats_key)
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/value-counts?column=A'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content),
+                         {'values': {'a': 1, 'b': 2}})
+
+    def test_column_summary(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [3, 1, np.nan, 1]})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/column-summary?column=A'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {
+            'n_nulls': 1,
+            'n_distinct': 2,
+            'min': 1.0,
+            'max': 3.0,
+        })
+
+    def test_column_summary_missing_column(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [1]})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/api/wfmodules/{self.wf_module2.id}/column-summary?column=B'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_value_counts_param_invalid(self):
         response = self.client.get(
             f'/api/wfmodules/{self.wf_module2.id}/value-counts'
@@ -312,3 +527,181 @@ class WfModuleTests(LoggedInTestCase):
         self.assertEqual(json.loads(response.content), {
             'error': 'column "C" not found'
         })
+
+    def test_public_output_csv(self):
+        crr = self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['ETag'], f'"{crr.hash}"')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         test_data.to_csv(index=False))
+
+    def test_public_output_json(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            json.loads(test_data.to_json(orient='records'))
+        )
+
+    def test_public_output_json_many_chunks(self):
+        dataframe = pd.DataFrame({'A': [1, 2, 3, 4, 5]})
+        self.wf_module2.cache_render_result(2, ProcessResult(dataframe))
+        self.wf_module2.save()
+
+        with patch('server.parquet.iter_chunks') as iter_chunks:
+            iter_chunks.return_value = iter([
+                dataframe[0:2],
+                dataframe[2:4],
+                dataframe[4:4],  # empty
+                dataframe[4:5],
+            ])
+            response = self.client.get(
+                f'/public/moduledata/live/{self.wf_module2.id}.json'
+            )
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'[{"A":1},{"A":2},{"A":3},{"A":4},{"A":5}]')
+
+    def test_public_output_csv_datetimes_many_chunks(self):
+        dataframe = pd.DataFrame({
+            'A': pd.to_datetime(['2019-01-01', '2019-01-02',
+                                 '2019-01-03T04:05:06', None]),
+        })
+        self.wf_module2.cache_render_result(2, ProcessResult(dataframe))
+        self.wf_module2.save()
+
+        def iter_chunks(bucket, key, nrows_per_chunk, columns=None):
+            # first chunk is all midnights; the second is not
+            chunks = [dataframe[0:2], dataframe[2:4]]
+            if columns is not None:
+                chunks = [chunk[columns] for chunk in chunks]
+            return iter(chunks)
+
+        with patch('server.parquet.iter_chunks', iter_chunks):
+            response = self.client.get(
+                f'/public/moduledata/live/{self.wf_module2.id}.csv'
+            )
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content, dataframe.to_csv(index=False))
+        self.assertEqual(content.split('\n')[1], '2019-01-01 00:00:00')
+
+    def test_public_output_not_modified(self):
+        crr = self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+        etag = f'"{crr.hash}"'
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A new render with the same output has the same ETag
+        self.wf_module2.last_relevant_delta_id = 3
+        self.wf_module2.cache_render_result(3, ProcessResult(test_data))
+        self.wf_module2.save()
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A new render with different output has a new ETag
+        self.wf_module2.last_relevant_delta_id = 4
+        crr = self.wf_module2.cache_render_result(
+            4,
+            ProcessResult(pd.DataFrame({'A': [1]}))
+        )
+        self.wf_module2.save()
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{crr.hash}"')
+
+    def test_public_output_range(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+        csv = test_data.to_csv(index=False).encode('utf-8')
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_RANGE='bytes=10-19'
+        )
+        self.assertEqual(response.status_code,
+                         status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(csv)}')
+        self.assertEqual(b''.join(response.streaming_content), csv[10:20])
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_RANGE='bytes=10-'
+        )
+        self.assertEqual(b''.join(response.streaming_content), csv[10:])
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_RANGE='bytes=-5'
+        )
+        self.assertEqual(b''.join(response.streaming_content), csv[-5:])
+
+    def test_public_output_range_reads_once(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        with patch('server.parquet.iter_chunks',
+                   wraps=parquet.iter_chunks) as iter_chunks:
+            response = self.client.get(
+                f'/public/moduledata/live/{self.wf_module2.id}.csv',
+                HTTP_RANGE='bytes=10-19'
+            )
+            b''.join(response.streaming_content)
+        self.assertEqual(iter_chunks.call_count, 1)
+
+    def test_public_output_range_if_range_mismatch(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_RANGE='bytes=10-19',
+            HTTP_IF_RANGE='"some-other-hash"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         test_data.to_csv(index=False))
+
+    def test_public_output_range_not_satisfiable(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+        csv = test_data.to_csv(index=False).encode('utf-8')
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv',
+            HTTP_RANGE='bytes=9999-'
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(csv)}')
+
+    def test_public_output_missing_parquet_file(self):
+        crr = self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        # Simulate a race: a render deleted the file after we unlocked
+        minio.remove(minio.CachedRenderResultsBucket, crr.parquet_key)
+
+        response = self.client.get(
+            f'/public/moduledata/live/{self.wf_module2.id}.csv'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
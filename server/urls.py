@@ -101,6 +101,8 @@ urlpatterns = [
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/output$', views.wfmodule_output),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/embeddata$', views.wfmodule_embeddata),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/value-counts$', views.wfmodule_value_counts),
+    url(r'^api/wfmodules/(?P<pk>[0-9]+)/column-summary$', views.wfmodule_column_summary),
+    url(r'^api/wfmodules/(?P<pk>[0-9]+)/query$', views.wfmodule_query),
     url(r'^api/wfmodules/(?P<pk>[0-9]+)/notifications', views.notifications_delete_by_wfmodule),
 
     url(r'^public/moduledata/live/(?P<pk>[0-9]+)\.(?P<type>(csv|json))?$', views.wfmodule_public_output),
@@ -1,22 +1,31 @@
 from datetime import timedelta
+import functools
+import itertools
 import json
 import re
+import tempfile
+from typing import BinaryIO, Callable, Dict, Iterator, Iterable, List, \
+        Optional, Tuple, TypeVar
+import numpy as np
 import pandas as pd
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.http import HttpRequest, HttpResponse, \
-        Http404, HttpResponseNotFound, JsonResponse
+        Http404, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, \
+        patch_vary_headers
 from django.views.decorators.clickjacking import xframe_options_exempt
 from rest_framework import status
 from rest_framework.decorators import api_view, renderer_classes
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
-from cjworkbench.types import ProcessResult
-from server.models import WfModule
-from server import rabbitmq
+from cjworkbench.types import Column
+from server.column_stats import compute_column_stats
+from server.models import CachedRenderResult, WfModule
+from server import arrow_ipc, parquet, rabbitmq, table_query
 import server.utils
 from server.utils import units_to_seconds
 from server.models.loaded_module import module_get_html_bytes
@@ -25,6 +34,9 @@ from server.models.loaded_module import module_get_html_bytes
 _MaxNRowsPerRequest = 300
 
 
+T = TypeVar('T')
+
+
 def _lookup_wf_module(pk: int) -> WfModule:
     """Find a Workflow and WfModule based on pk (no access control).
 
@@ -69,6 +81,42 @@ def _lookup_wf_module_for_write(pk: int, request: HttpRequest) -> WfModule:
     return wf_module
 
 
+_MaxSnapshotReadAttempts = 3
+
+
+def _read_cached_result_snapshot(
+    wf_module: WfModule,
+    read: Callable[[Optional[CachedRenderResult]], T]
+) -> T:
+    """
+    Return `read(cached_result)`, without locking the workflow while reading.
+
+    We lock only long enough to find `wf_module`'s current cached result. Its
+    files are named after its delta ID and never overwritten, so `read()`
+    needs no lock: parameter edits and renders don't wait for it. (`read()`
+    must not touch the database.)
+
+    A render may _delete_ the files, though. If `read()` raises
+    FileNotFoundError, we look up the cached result again and retry if it
+    changed. If it didn't change, the file is simply missing: we re-raise.
+    """
+    seen_delta_ids = set()
+    while True:
+        with wf_module.workflow.cooperative_lock():
+            wf_module.refresh_from_db()
+            cached_result = wf_module.cached_render_result
+
+        try:
+            return read(cached_result)
+        except FileNotFoundError:
+            if (
+                cached_result.delta_id in seen_delta_ids
+                or len(seen_delta_ids) + 1 >= _MaxSnapshotReadAttempts
+            ):
+                raise
+            seen_delta_ids.add(cached_result.delta_id)
+
+
 def patch_update_settings(wf_module, data, request):
     auto_update_data = data['auto_update_data']
 
@@ -142,23 +190,48 @@ def wfmodule_detail(request, pk, format=None):
 # ---- render / input / livedata ----
 # These endpoints return actual table data
 
-# Helper method that produces json output for a table + start/end row
+class _ArrowRenderer(BaseRenderer):
+    """
+    Let clients negotiate Arrow: `Accept: application/vnd.apache.arrow.stream`.
+
+    Views check `request.accepted_renderer.format` and build Arrow responses
+    themselves. Only DRF's own responses (errors) reach `render()`: we render
+    those as JSON.
+    """
+    media_type = arrow_ipc.MediaType
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+def _wants_arrow(request) -> bool:
+    return request.accepted_renderer.format == _ArrowRenderer.format
+
+
+def _arrow_response(dataframe: pd.DataFrame,
+                    metadata: Optional[dict] = None) -> HttpResponse:
+    response = HttpResponse(arrow_ipc.encode_dataframe(dataframe, metadata),
+                            content_type=arrow_ipc.MediaType)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+# Helper method that produces a table + start/end row
 # Also silently clips row indices
 # Now reading a maximum of 101 columns directly from cache parquet
 def _make_render_tuple(cached_result, startrow=None, endrow=None):
-    """Build (startrow, endrow, json_rows) data."""
+    """Build (startrow, endrow, table) data."""
     if not cached_result:
-        dataframe = pd.DataFrame()
+        nrows = 0
     else:
-        columns = cached_result.columns[
-            # Return one row more than configured, so the client knows there
-            # are "too many rows".
-            :(settings.MAX_COLUMNS_PER_CLIENT_REQUEST + 1)
-        ]
-        column_names = [c.name for c in columns]
-        dataframe = cached_result.read_dataframe(column_names)
+        nrows = cached_result.nrows
 
-    nrows = len(dataframe)
     if startrow is None:
         startrow = 0
     if endrow is None:
@@ -167,21 +240,50 @@ def _make_render_tuple(cached_result, startrow=None, endrow=None):
     startrow = max(0, startrow)
     endrow = min(nrows, endrow, startrow + _MaxNRowsPerRequest)
 
-    table = dataframe[startrow:endrow]
+    if not cached_result or endrow <= startrow:
+        table = pd.DataFrame()
+    else:
+        columns = cached_result.columns[
+            # Return one row more than configured, so the client knows there
+            # are "too many rows".
+            :(settings.MAX_COLUMNS_PER_CLIENT_REQUEST + 1)
+        ]
+        column_names = [c.name for c in columns]
+        # Read only the Parquet row groups that contain [startrow, endrow)
+        table = cached_result.read_dataframe_row_range(column_names,
+                                                       startrow, endrow)
 
-    # table.to_json() renders a JSON string. It can't render a dict that we
-    # encode later, so let's not even try. Just return the string.
-    rows = table.to_json(orient="records", date_format='iso')
-    return (startrow, endrow, rows)
+    return (startrow, endrow, table)
 
 
 def int_or_none(x):
     return int(x) if x is not None else None
 
 
+def _render_response(request, startrow: int, endrow: int,
+                     table: pd.DataFrame) -> HttpResponse:
+    if _wants_arrow(request):
+        return _arrow_response(table, {'start_row': str(startrow),
+                                       'end_row': str(endrow)})
+
+    # table.to_json() renders a JSON string. It can't render a dict that we
+    # encode later, so let's not even try. Just concatenate strings.
+    rows_string = table.to_json(orient="records", date_format='iso')
+    response = HttpResponse(
+        ''.join(['{"start_row":', str(startrow), ',"end_row":', str(endrow),
+                 ',"rows":', rows_string, '}']),
+        content_type='application/json'
+    )
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
 # /render: return output table of this module
+#
+# Clients may negotiate Arrow instead of JSON. The Arrow stream's schema
+# metadata holds "start_row" and "end_row".
 @api_view(['GET'])
-@renderer_classes((JSONRenderer,))
+@renderer_classes((JSONRenderer, _ArrowRenderer))
 def wfmodule_render(request, pk, format=None):
     wf_module = _lookup_wf_module_for_read(pk, request)
 
@@ -194,20 +296,21 @@ def wfmodule_render(request, pk, format=None):
         return Response({'message': 'bad row number', 'status_code': 400},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    with wf_module.workflow.cooperative_lock():
-        wf_module.refresh_from_db()
-        cached_result = wf_module.cached_render_result
+    def read(cached_result):
         if cached_result is None:
             # assume we'll get another request after execute finishes
-            return JsonResponse({'start_row': 0, 'end_row': 0, 'rows': []})
+            return _render_response(request, 0, 0, pd.DataFrame())
 
-        startrow, endrow, rows_string = _make_render_tuple(cached_result,
-                                                           startrow, endrow)
-        return HttpResponse(
-            ''.join(['{"start_row":', str(startrow), ',"end_row":',
-                     str(endrow), ',"rows":', rows_string, '}']),
-            content_type='application/json'
-        )
+        start, end, table = _make_render_tuple(cached_result, startrow,
+                                               endrow)
+        return _render_response(request, start, end, table)
+
+    try:
+        return _read_cached_result_snapshot(wf_module, read)
+    except FileNotFoundError:
+        # Cache has disappeared. We're probably going to make another request
+        # soon.
+        return _render_response(request, 0, 0, pd.DataFrame())
 
 
 _html_head_start_re = re.compile(rb'<\s*head[^>]*>', re.IGNORECASE)
@@ -240,6 +343,12 @@ def wfmodule_embeddata(request, pk):
     return JsonResponse(result_json, safe=False)
 
 
+def _find_column(cached_result: CachedRenderResult,
+                 colname: str) -> Optional[Column]:
+    return next((c for c in cached_result.columns if c.name == colname),
+                None)
+
+
 @api_view(['GET'])
 @renderer_classes((JSONRenderer,))
 def wfmodule_value_counts(request, pk):
@@ -257,47 +366,191 @@ def wfmodule_value_counts(request, pk):
         # User has not yet chosen a column. Empty response.
         return JsonResponse({'values': {}})
 
-    with wf_module.workflow.cooperative_lock():
-        wf_module.refresh_from_db()
-        cached_result = wf_module.cached_render_result
+    column_not_found = JsonResponse(
+        {'error': f'column "{colname}" not found'},
+        status=404
+    )
+
+    def read(cached_result):
         if cached_result is None:
             # assume we'll get another request after execute finishes
             return JsonResponse({'values': {}})
 
-        try:
-            column = next(c for c in cached_result.columns
-                          if c.name == colname)
-        except StopIteration:
-            return JsonResponse({'error': f'column "{colname}" not found'},
-                                status=404)
+        column = _find_column(cached_result, colname)
+        if column is None:
+            return column_not_found
+
+        # Usually, we counted values when we rendered
+        column_stats = cached_result.read_column_stats() or {}
+        stats = column_stats.get(colname)
+        if stats is not None and stats.value_counts is not None:
+            return JsonResponse({'values': stats.value_counts})
+
+        # Otherwise, the column has too many distinct values (or we rendered
+        # before we counted values). Count them now.
+        series = cached_result.read_column(column.name)
+
+        # We only handle string. If it's not string, convert to string.
+        # (Rationale: this is used in Refine and Filter by Value, which are
+        # both solely String-based for now. Excel and Google Sheets only
+        # filter by String values, so we're in good company.) Remember: in
+        # JavaScript, Object keys must be String.
+        series = column.type.format_series(series)
+        value_counts = series.value_counts().to_dict()
+
+        return JsonResponse({'values': value_counts})
+
+    try:
+        return _read_cached_result_snapshot(wf_module, read)
+    except FileNotFoundError:
+        # Cache has disappeared. We _could_ return an empty result set; but
+        # we assume the user has moved on and will ignore this response.
+        return column_not_found
+
+
+@api_view(['GET'])
+@renderer_classes((JSONRenderer,))
+def wfmodule_column_summary(request, pk):
+    """
+    Return `{n_nulls, n_distinct, min, max}` of the "column" GET parameter.
+    """
+    wf_module = _lookup_wf_module_for_read(pk, request)
+
+    try:
+        colname = request.GET['column']
+    except KeyError:
+        return JsonResponse(
+            {'error': 'Missing a "column" parameter'},
+            status=400
+        )
+
+    column_not_found = JsonResponse(
+        {'error': f'column "{colname}" not found'},
+        status=404
+    )
+
+    def read(cached_result):
+        if cached_result is None:
+            # assume we'll get another request after execute finishes
+            return JsonResponse({'error': 'no cached result'}, status=404)
+
+        column = _find_column(cached_result, colname)
+        if column is None:
+            return column_not_found
+
+        column_stats = cached_result.read_column_stats() or {}
+        stats = column_stats.get(colname)
+        if stats is None:
+            # We rendered before we computed stats. Compute them now.
+            series = cached_result.read_column(column.name)
+            stats = compute_column_stats(series, column)
+
+        return JsonResponse({
+            'n_nulls': stats.n_nulls,
+            'n_distinct': stats.n_distinct,
+            'min': stats.min,
+            'max': stats.max,
+        })
+
+    try:
+        return _read_cached_result_snapshot(wf_module, read)
+    except FileNotFoundError:
+        return column_not_found
+
+
+def _parse_query(params) -> table_query.Query:
+    """
+    Build a `table_query.Query` from GET params, or raise ValueError.
+    """
+    sort_direction = params.get('sort_direction', 'asc')
+    if sort_direction not in ('asc', 'desc'):
+        raise ValueError('sort_direction must be "asc" or "desc"')
+
+    filter_column = params.get('filter_column')
+    filter_value = params.get('filter_value')
+    filter_substring = params.get('filter_substring')
+    if filter_column is not None and (
+        (filter_value is None) == (filter_substring is None)
+    ):
+        raise ValueError('filter_column needs exactly one of filter_value '
+                         'and filter_substring')
+
+    return table_query.Query(
+        sort_column=params.get('sort_column'),
+        sort_ascending=(sort_direction == 'asc'),
+        filter_column=filter_column,
+        filter_value=filter_value if filter_column is not None else None,
+        filter_substring=(filter_substring if filter_column is not None
+                          else None)
+    )
+
+
+# /query: like /render, but sorted and/or filtered
+#
+# The first request that sorts or filters by a column reads that column in
+# full. Later pages (and other queries on the same column) reuse its index, so
+# they only read the rows they return.
+@api_view(['GET'])
+@renderer_classes((JSONRenderer,))
+def wfmodule_query(request, pk):
+    wf_module = _lookup_wf_module_for_read(pk, request)
+
+    try:
+        startrow = int_or_none(request.GET.get('startrow')) or 0
+        endrow = int_or_none(request.GET.get('endrow'))
+        query = _parse_query(request.GET)
+    except ValueError as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    def read(cached_result):
+        if cached_result is None:
+            # assume we'll get another request after execute finishes
+            return JsonResponse({'start_row': 0, 'end_row': 0, 'n_rows': 0,
+                                 'row_numbers': [], 'rows': []})
 
-        # Only load the one column
-        dataframe = cached_result.read_dataframe([colname])
         try:
-            series = dataframe[colname]
-        except KeyError:
-            # Cache has disappeared. (read_dataframe() returns empty DataFrame
-            # instead of throwing, as it maybe ought to.) We're probably going
-            # to make another request soon.
-            return JsonResponse({'error': f'column "{colname}" not found'},
+            rows = table_query.query_rows(cached_result, query)
+        except KeyError as err:
+            return JsonResponse({'error': f'column "{err.args[0]}" not found'},
                                 status=404)
 
-    # We only handle string. If it's not string, convert to string. (Rationale:
-    # this is used in Refine and Filter by Value, which are both solely
-    # String-based for now. Excel and Google Sheets only filter by String
-    # values, so we're in good company.) Remember: in JavaScript, Object keys
-    # must be String.
-    series = column.type.format_series(series)
-    value_counts = series.value_counts().to_dict()
+        start = max(0, startrow)
+        end = min(len(rows), start + _MaxNRowsPerRequest,
+                  endrow if endrow is not None else len(rows))
+        end = max(start, end)
+        row_numbers = rows[start:end]
+
+        columns = cached_result.columns[
+            # Like /render: one column more than the client will display
+            :(settings.MAX_COLUMNS_PER_CLIENT_REQUEST + 1)
+        ]
+        table = cached_result.read_dataframe_rows([c.name for c in columns],
+                                                  row_numbers)
+        rows_string = table.to_json(orient='records', date_format='iso')
+        return HttpResponse(
+            ''.join(['{"start_row":', str(start), ',"end_row":', str(end),
+                     ',"n_rows":', str(len(rows)),
+                     ',"row_numbers":', json.dumps(row_numbers.tolist()),
+                     ',"rows":', rows_string, '}']),
+            content_type='application/json'
+        )
 
-    return JsonResponse({'values': value_counts})
+    try:
+        return _read_cached_result_snapshot(wf_module, read)
+    except FileNotFoundError:
+        # Cache has disappeared. We're probably going to make another request
+        # soon.
+        return JsonResponse({'start_row': 0, 'end_row': 0, 'n_rows': 0,
+                             'row_numbers': [], 'rows': []})
 
 
 N_ROWS_PER_TILE = 200
 N_COLUMNS_PER_TILE = 50
 
 
+# Clients may negotiate Arrow instead of JSON (despite the ".json" URL).
 @api_view(['GET'])
+@renderer_classes((JSONRenderer, _ArrowRenderer))
 def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
     wf_module = _lookup_wf_module_for_read(pk, request)
 
@@ -330,19 +583,206 @@ def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
     cbegin = N_COLUMNS_PER_TILE * int(tile_column)
     cend = N_COLUMNS_PER_TILE * (int(tile_column) + 1)
 
-    # TODO handle races in the following file reads....
-    df = cached_result.read_dataframe(
-        columns=cached_result.column_names[cbegin:cend]
-    )
-
     rbegin = N_ROWS_PER_TILE * int(tile_row)
     rend = N_ROWS_PER_TILE * (int(tile_row) + 1)
 
-    df = df.iloc[rbegin:rend]
+    try:
+        df = cached_result.read_dataframe_row_range(
+            cached_result.column_names[cbegin:cend],
+            rbegin,
+            rend
+        )
+    except FileNotFoundError:
+        # A render deleted the file. The client asked for a specific delta,
+        # and it's gone.
+        return HttpResponseNotFound(
+            f'Delta {delta_id} was just replaced'
+        )
+
+    if _wants_arrow(request):
+        return _arrow_response(df)
 
     json_string = df.to_json(orient='values', date_format='iso')
 
-    return HttpResponse(json_string, content_type='application/json')
+    response = HttpResponse(json_string, content_type='application/json')
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+_NanosecondsPerDay = 86400 * 10**9
+
+
+def _csv_datetime_precision(values: np.array) -> int:
+    """
+    Return the precision `DataFrame.to_csv()` would print `values` with.
+
+    -1 means "dates only"; 0 means seconds; 3, 6 and 9 mean milli-, micro-
+    and nanoseconds. pandas picks the coarsest precision that loses nothing.
+    """
+    ns = values[~np.isnat(values)].view(np.int64)
+    if (ns % 10**9).any():
+        if (ns % 10**3).any():
+            return 9
+        elif (ns % 10**6).any():
+            return 6
+        else:
+            return 3
+    elif (ns % _NanosecondsPerDay).any():
+        return 0
+    else:
+        return -1
+
+
+def _read_csv_datetime_precisions(
+    cached_result: CachedRenderResult
+) -> Dict[str, int]:
+    """
+    Find each datetime column's `_csv_datetime_precision()`, over all chunks.
+
+    This reads only datetime columns, from the local copy of the file.
+    """
+    colnames = [c.name for c in cached_result.columns
+                if c.type.name == 'datetime']
+    if not colnames:
+        return {}
+
+    precisions = dict((colname, -1) for colname in colnames)
+    for dataframe in _open_dataframe_chunks(cached_result, colnames):
+        for colname in colnames:
+            if colname in dataframe:
+                precisions[colname] = max(
+                    precisions[colname],
+                    _csv_datetime_precision(dataframe[colname].values)
+                )
+    return precisions
+
+
+def _format_csv_datetimes(series: pd.Series, precision: int) -> pd.Series:
+    """Format `series` the way `to_csv()` would at `precision`."""
+    if precision < 0:
+        return series.dt.strftime('%Y-%m-%d')
+
+    text = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+    if precision > 0:
+        ns = series.values.view(np.int64)
+        fraction = pd.Series((ns % 10**9) // 10**(9 - precision),
+                             index=series.index)
+        text = text + '.' + fraction.astype(str).str.zfill(precision)
+    return text
+
+
+def _encode_csv(
+    dataframes: Iterable[pd.DataFrame],
+    datetime_precisions: Optional[Dict[str, int]] = None
+) -> Iterator[bytes]:
+    """
+    Encode like `pd.DataFrame.to_csv(index=False)`, in pieces.
+
+    `to_csv()` picks each datetime column's format from the values it sees.
+    Pass `datetime_precisions` (from `_read_csv_datetime_precisions()`) so
+    every chunk formats datetimes as the whole table would.
+    """
+    header = True
+    for dataframe in dataframes:
+        if datetime_precisions:
+            dataframe = dataframe.assign(**dict(
+                (colname, _format_csv_datetimes(dataframe[colname],
+                                                precision))
+                for colname, precision in datetime_precisions.items()
+                if colname in dataframe
+            ))
+        yield dataframe.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def _encode_json(dataframes: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    """Encode like `pd.DataFrame.to_json(orient='records')`, in pieces."""
+    yield b'['
+    first = True
+    for dataframe in dataframes:
+        if not len(dataframe):
+            continue
+        records = dataframe.to_json(orient='records')
+        if not first:
+            yield b','
+        yield records[1:-1].encode('utf-8')  # nix '[' and ']'
+        first = False
+    yield b']'
+
+
+_PublicOutputFormats = {
+    'csv': (_encode_csv, 'text/csv'),
+    'json': (_encode_json, 'application/json'),
+}
+
+
+_ByteRangeRegex = re.compile(r'\Abytes=(\d*)-(\d*)\Z')
+_RangeBlockSize = 64 * 1024
+
+
+def _open_dataframe_chunks(
+    cached_result: CachedRenderResult,
+    columns: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Open `cached_result`'s table (or just `columns`) for streaming.
+
+    Raise FileNotFoundError if the file is gone (a re-render deleted it).
+    Treat other errors as "empty table", like `read_dataframe()` does.
+    """
+    chunks = cached_result.iter_dataframe_chunks(columns)
+    try:
+        first = next(chunks)  # download (or raise)
+    except FileNotFoundError:
+        raise
+    except (OSError, parquet.FastparquetCouldNotHandleFile):
+        return iter([pd.DataFrame()])
+    return itertools.chain([first], chunks)
+
+
+def _parse_byte_range(request: HttpRequest,
+                      etag: str) -> Optional[Tuple[Optional[int],
+                                                   Optional[int]]]:
+    """
+    Return (first_byte, last_byte) from the Range header, or None.
+
+    Either may be None: `bytes=100-` means "from 100" and `bytes=-100` means
+    "the last 100 bytes". We ignore multiple ranges and invalid ranges (RFC
+    7233 allows that), and we ignore Range if If-Range names another version.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+
+    match = _ByteRangeRegex.match(header.strip())
+    if not match:
+        return None
+    first = int(match.group(1)) if match.group(1) else None
+    last = int(match.group(2)) if match.group(2) else None
+    if first is None and last is None:
+        return None
+    if first is not None and last is not None and last < first:
+        return None
+    return (first, last)
+
+
+def _read_file_range(f: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    """Yield bytes `start:end` of `f`, then close `f`."""
+    try:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            blob = f.read(min(remaining, _RangeBlockSize))
+            if not blob:
+                return
+            remaining -= len(blob)
+            yield blob
+    finally:
+        f.close()
 
 
 # Public access to wfmodule output. Basically just /render with different auth
@@ -351,27 +791,89 @@ def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
 @api_view(['GET'])
 @renderer_classes((JSONRenderer,))
 def wfmodule_public_output(request, pk, type, format=None):
+    try:
+        encode, content_type = _PublicOutputFormats[type]
+    except KeyError:
+        raise Http404()
+
     wf_module = _lookup_wf_module_for_read(pk, request)
     workflow = wf_module.workflow
 
-    with workflow.cooperative_lock():
-        wf_module.refresh_from_db()
-        cached_result = wf_module.cached_render_result
-        if cached_result:
-            result = cached_result.result  # slow! Reads from S3
-        else:
+    def read(cached_result):
+        if cached_result is None:
             # We don't have a cached result, and we don't know how long it'll
             # take to get one.
             async_to_sync(rabbitmq.queue_render)(workflow.id,
                                                  workflow.last_delta_id)
             # The user will simply need to try again....
-            result = ProcessResult()
-
-    if type == 'json':
-        d = result.dataframe.to_json(orient='records')
-        return HttpResponse(d, content_type="application/json")
-    elif type == 'csv':
-        d = result.dataframe.to_csv(index=False)
-        return HttpResponse(d, content_type="text/csv")
-    else:
-        raise Http404()
+            return HttpResponse(b''.join(encode([pd.DataFrame()])),
+                                content_type=content_type)
+
+        # Results rendered before we stored hashes have no ETag
+        etag = f'"{cached_result.hash}"' if cached_result.hash else None
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        # Raise FileNotFoundError if a render deleted the file. After this,
+        # the file is on local disk and we can stream it.
+        dataframes = _open_dataframe_chunks(cached_result)
+        if type == 'csv':
+            encode_chunks = functools.partial(
+                _encode_csv,
+                datetime_precisions=_read_csv_datetime_precisions(
+                    cached_result
+                )
+            )
+        else:
+            encode_chunks = encode
+
+        byte_range = _parse_byte_range(request, etag)
+        if byte_range is None:
+            response = StreamingHttpResponse(encode_chunks(dataframes),
+                                             content_type=content_type)
+        else:
+            # We can't know the output's length without encoding it. Encode
+            # it once, to a temporary file, then send the range from there.
+            # Range requests are rare (they resume downloads), and this uses
+            # constant memory.
+            f = tempfile.TemporaryFile()
+            try:
+                for blob in encode_chunks(dataframes):
+                    f.write(blob)
+            except BaseException:
+                f.close()
+                raise
+            total = f.tell()
+            first, last = byte_range
+            if first is None:
+                start, end = max(0, total - last), total
+            elif last is None:
+                start, end = first, total
+            else:
+                start, end = first, min(last + 1, total)
+            if start >= end:
+                f.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{total}'
+                return response
+
+            response = StreamingHttpResponse(
+                _read_file_range(f, start, end),
+                content_type=content_type,
+                status=206
+            )
+            response['Content-Range'] = f'bytes {start}-{end - 1}/{total}'
+            response['Content-Length'] = str(end - start)
+
+        if etag is not None:
+            response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    try:
+        return _read_cached_result_snapshot(wf_module, read)
+    except FileNotFoundError:
+        return HttpResponseNotFound('This output was just replaced. '
+                                    'Please try again.')
@@ -21,11 +21,11 @@ from server import minio, rabbitmq
 from server.models import ModuleVersion, Workflow, WfModule, Tab
 from server.models.course import CourseLookup
 from server.models.lesson import LessonLookup
-from server.serializers import WorkflowSerializer, ModuleSerializer, \
-        TabSerializer, WorkflowSerializerLite, WfModuleSerializer, \
+from server.serializers import ModuleSerializer, WorkflowSerializerLite, \
         UserSerializer
 import server.utils
 from server.settingsutils import workbench_user_display
+from server.workflow_snapshot import load_workflow_snapshot
 from .auth import lookup_workflow_for_write, loads_workflow_for_read
 
 
@@ -40,20 +40,11 @@ def make_init_state(request, workflow=None, modules=None):
     if workflow:
         try:
             with workflow.cooperative_lock():  # raise DoesNotExist on race
+                snapshot = load_workflow_snapshot(workflow, request)
                 ret['workflowId'] = workflow.id
-                ret['workflow'] = WorkflowSerializer(
-                    workflow,
-                    context={'request': request}
-                ).data
-
-                tabs = list(workflow.live_tabs)
-                ret['tabs'] = dict((str(tab.slug), TabSerializer(tab).data)
-                                   for tab in tabs)
-
-                wf_modules = list(WfModule.live_in_workflow(workflow))
-
-                ret['wfModules'] = {str(wfm.id): WfModuleSerializer(wfm).data
-                                    for wfm in wf_modules}
+                ret['workflow'] = snapshot.workflow
+                ret['tabs'] = snapshot.tabs
+                ret['wfModules'] = snapshot.wf_modules
         except Workflow.DoesNotExist:
             raise Http404('Workflow was recently deleted')
 
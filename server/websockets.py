@@ -1,24 +1,51 @@
 # Receive and send websockets messages.
 # Clients open a socket on a specific workflow, and all clients viewing that
 # workflow are a "group"
+import asyncio
 from collections import namedtuple
 import json
 import logging
-from typing import Dict, Any
+import os
+import socket
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+import uuid
+import weakref
 from django.core.serializers.json import DjangoJSONEncoder
 from channels.layers import get_channel_layer
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.exceptions import DenyConnection
 from cjworkbench.sync import database_sync_to_async
 from server import handlers, rabbitmq
-from server.models import WfModule, Workflow
-from server.serializers import WorkflowSerializer, TabSerializer, \
-        WfModuleSerializer
+from server.models import Workflow, WorkflowViewers
+from server.serializers import TabSerializer, WfModuleSerializer
+from server.workflow_snapshot import load_workflow_snapshot
 
 logger = logging.getLogger(__name__)
 RequestWrapper = namedtuple('RequestWrapper', ('user', 'session'))
 
 
+# Fields that only Deltas change. A client that has seen a Workflow's latest
+# Delta already has their current values, so we needn't send them when it
+# reconnects. (Other fields -- render results, fetch status, collapsed
+# steps -- change without Deltas.)
+#
+# Module imports can change params' migrated values without a Delta. A
+# connected client doesn't get new params then, either; nor does a
+# reconnecting one.
+_TabDeltaFields = frozenset(['name', 'wf_module_ids'])
+_WfModuleDeltaFields = frozenset(['module', 'tab_slug', 'params', 'notes'])
+
+
+def _parse_last_delta_id(query_string: bytes) -> Optional[int]:
+    """Read `last_delta_id` from a URL query string, or return None."""
+    values = parse_qs(query_string.decode('latin1')).get('last_delta_id')
+    try:
+        return int(values[0])
+    except (TypeError, ValueError):
+        return None
+
+
 def _workflow_channel_name(workflow_id: int) -> str:
     """Given a workflow ID, return a channel_layer channel name.
 
@@ -75,12 +102,26 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
         except Workflow.DoesNotExist:
             return False
 
+    @property
+    def client_last_delta_id(self) -> Optional[int]:
+        """
+        The `last_delta_id` the client says it has seen, or None.
+
+        A reconnecting client passes `?last_delta_id=123`: the value of
+        `updateWorkflow.last_delta_id` in the last delta it received.
+        """
+        return _parse_last_delta_id(self.scope.get('query_string', b''))
+
     @database_sync_to_async
     def get_workflow_as_delta_and_needs_render(self):
         """
         Return (apply-delta dict, needs_render), or raise Workflow.DoesNotExist
 
         needs_render is a (workflow_id, delta_id) pair.
+
+        If the client has seen the workflow's latest Delta, the apply-delta
+        dict omits the fields only Deltas change. The client merges what we
+        send into what it has.
         """
         with Workflow.authorized_lookup_and_cooperative_lock(
             'read',
@@ -90,29 +131,41 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
         ) as workflow:
             request = RequestWrapper(self.scope['user'],
                                      self.scope['session'])
+
+            if self.client_last_delta_id == workflow.last_delta_id:
+                tab_fields = set(TabSerializer.Meta.fields) - _TabDeltaFields
+                wf_module_fields = (
+                    set(WfModuleSerializer.Meta.fields)
+                    | WfModuleSerializer.CachedRenderResultFields
+                ) - _WfModuleDeltaFields
+            else:
+                tab_fields = None
+                wf_module_fields = None
+
+            snapshot = load_workflow_snapshot(
+                workflow,
+                request,
+                tab_fields=tab_fields,
+                wf_module_fields=wf_module_fields
+            )
             ret = {
-                'updateWorkflow': (
-                    WorkflowSerializer(workflow,
-                                       context={'request': request}).data
-                ),
+                'updateWorkflow': snapshot.workflow,
+                'updateTabs': snapshot.tabs,
+                'updateWfModules': snapshot.wf_modules,
             }
 
-            tabs = list(workflow.live_tabs)
-            ret['updateTabs'] = dict((tab.slug, TabSerializer(tab).data)
-                                     for tab in tabs)
-            wf_modules = list(WfModule.live_in_workflow(workflow.id))
-            ret['updateWfModules'] = dict((str(wfm.id),
-                                           WfModuleSerializer(wfm).data)
-                                          for wfm in wf_modules)
-
-            if workflow.are_all_render_results_fresh():
-                needs_render = None
-            else:
+            if snapshot.needs_render:
                 needs_render = (workflow.id, workflow.last_delta_id)
+            else:
+                needs_render = None
 
             return (ret, needs_render)
 
     async def connect(self):
+        # Channels runs every consumer on one loop, for the life of the
+        # process
+        coalesce_deltas_on_this_loop()
+
         if not await self.authorize('read'):
             raise DenyConnection()
 
@@ -120,6 +173,8 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
                                            self.channel_name)
         logger.debug('Added to channel %s', self.workflow_channel_name)
         await self.accept()
+        _viewer_counter().add(self.workflow_id, 1)
+        self.is_counted_as_viewer = True
 
         # Solve a race:
         #
@@ -132,6 +187,9 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
         await self.send_whole_workflow_to_client()
 
     async def disconnect(self, code):
+        if getattr(self, 'is_counted_as_viewer', False):
+            _viewer_counter().add(self.workflow_id, -1)
+            self.is_counted_as_viewer = False
         await self.channel_layer.group_discard(self.workflow_channel_name,
                                                self.channel_name)
         logger.debug('Discarded from channel %s', self.workflow_channel_name)
@@ -224,23 +282,267 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
 
 
 async def _workflow_group_send(workflow_id: int,
-                               message_dict: Dict[str, Any]) -> None:
-    """Send message_dict as JSON to all clients connected to the workflow."""
+                               message: Dict[str, Any]) -> None:
+    """Send `message` to all consumers connected to the workflow."""
     channel_name = _workflow_channel_name(workflow_id)
     channel_layer = get_channel_layer()
-    logger.debug('Queue %s to Workflow %d', message_dict['type'],
-                 workflow_id)
-    await channel_layer.group_send(channel_name, {
+    logger.debug('Queue %s to Workflow %d', message['type'], workflow_id)
+    await channel_layer.group_send(channel_name, message)
+
+
+DeltaCoalesceWindow = 0.05
+"""Seconds during which we merge a workflow's deltas into one message."""
+
+
+_MergeableDeltaKeys = frozenset(['updateWorkflow', 'updateWfModules',
+                                 'updateTabs', 'clearWfModuleIds',
+                                 'clearTabSlugs'])
+
+
+def _merge_two_deltas(a: Dict[str, Any],
+                      b: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Return a delta that has the effect of applying `a` and then `b`.
+
+    Return None if there is no such delta. The client applies all of a
+    delta's updates before its clears, so if `b` updates a tab or step that
+    `a` clears, the two must be sent separately.
+    """
+    if not (set(b) <= _MergeableDeltaKeys and set(a) <= _MergeableDeltaKeys):
+        return None
+    cleared_ids = set(str(id) for id in a.get('clearWfModuleIds', []))
+    if cleared_ids & set(str(id) for id in b.get('updateWfModules', {})):
+        return None
+    if set(a.get('clearTabSlugs', [])) & set(b.get('updateTabs', {})):
+        return None
+
+    ret = dict(a)
+    if 'updateWorkflow' in b:
+        ret['updateWorkflow'] = {**a.get('updateWorkflow', {}),
+                                 **b['updateWorkflow']}
+    for key in ('updateWfModules', 'updateTabs'):
+        if key in b:
+            updates = dict(a.get(key, {}))
+            for id, update in b[key].items():
+                updates[id] = {**updates.get(id, {}), **update}
+            ret[key] = updates
+    if 'updateTabs' in b:
+        # The client keeps its non-null selected_wf_module_position: if `a`
+        # sets one, `b` can't change it.
+        for tab_slug, update in a.get('updateTabs', {}).items():
+            if update.get('selected_wf_module_position') is not None:
+                ret['updateTabs'][tab_slug]['selected_wf_module_position'] = \
+                        update['selected_wf_module_position']
+    for key in ('clearWfModuleIds', 'clearTabSlugs'):
+        if key in b:
+            ret[key] = list(a.get(key, [])) \
+                    + [id for id in b[key] if id not in a.get(key, [])]
+    return ret
+
+
+def _apply_delta_message(delta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
         'type': 'send_data_to_workflow_client',
-        'data': message_dict,
-    })
+        'data': {'type': 'apply-delta', 'data': delta},
+    }
+
+
+def _delta_of(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return `message`'s delta if it's an apply-delta message, or None."""
+    if message['type'] != 'send_data_to_workflow_client':
+        return None
+    data = message['data']
+    if data['type'] != 'apply-delta':
+        return None
+    return data['data']
+
+
+def _append_message(messages: List[Dict[str, Any]],
+                    message: Dict[str, Any]) -> None:
+    """Merge `message` into the last of `messages`, or append it."""
+    if messages:
+        last_delta = _delta_of(messages[-1])
+        delta = _delta_of(message)
+        if last_delta is not None and delta is not None:
+            merged = _merge_two_deltas(last_delta, delta)
+            if merged is not None:
+                messages[-1] = _apply_delta_message(merged)
+                return
+    messages.append(message)
+
+
+class _WorkflowDeltaWindow:
+    """Messages for one workflow that arrived while a message was recent."""
+
+    def __init__(self):
+        self.pending = []
+        self.lock = asyncio.Lock()  # keeps messages in order
+
+
+class _DeltaCoalescer:
+    """
+    Merge each workflow's deltas into at most one message per window.
+
+    The first message goes out immediately, so a lone change costs no
+    latency. It opens a `DeltaCoalesceWindow`-second window: messages that
+    arrive during the window are queued -- consecutive deltas merged -- and
+    sent in order when it closes, which opens another window. So a 30-step
+    render sends a handful of messages, not 30.
+
+    Senders don't wait for queued messages to reach the channel layer. So a
+    coalescer only works on a loop that outlives its windows: see
+    `coalesce_deltas_on_this_loop()`.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.windows = {}  # workflow_id => _WorkflowDeltaWindow
+
+    async def send(self, workflow_id: int, message: Dict[str, Any]) -> None:
+        window = self.windows.get(workflow_id)
+        if window is not None:
+            _append_message(window.pending, message)
+            return
+
+        window = _WorkflowDeltaWindow()
+        self.windows[workflow_id] = window
+        self.loop.create_task(self._run_window(workflow_id, window))
+        async with window.lock:
+            await _workflow_group_send(workflow_id, message)
+
+    async def _run_window(self, workflow_id: int,
+                          window: _WorkflowDeltaWindow) -> None:
+        while True:
+            await asyncio.sleep(DeltaCoalesceWindow)
+            if not window.pending:
+                del self.windows[workflow_id]
+                return
+
+            messages = window.pending
+            window.pending = []  # messages arriving now wait for next loop
+            async with window.lock:
+                for message in messages:
+                    try:
+                        await _workflow_group_send(workflow_id, message)
+                    except Exception:
+                        logger.exception('Error sending %s to Workflow %d',
+                                         message['type'], workflow_id)
+
+
+# One coalescer per event loop: asyncio locks and tasks belong to a loop.
+_coalescers = weakref.WeakKeyDictionary()
+
+
+@database_sync_to_async
+def _write_workflow_viewers(process_id: str, counts: Dict[int, int]) -> None:
+    WorkflowViewers.heartbeat(process_id, counts)
+
+
+class _ViewerCounter:
+    """
+    Count this process's websockets per Workflow, in memory.
+
+    While anybody is connected, a task writes the counts to `WorkflowViewers`
+    every `WorkflowViewers.HeartbeatInterval` seconds. When the last viewer
+    leaves, it writes once more (deleting our rows) and stops.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.process_id = '%s:%d:%s' % (socket.gethostname(), os.getpid(),
+                                        uuid.uuid4().hex)
+        self.counts = {}  # workflow_id => n_viewers
+        self.emptied = asyncio.Event()
+        self.task = None
+
+    def add(self, workflow_id: int, n: int) -> None:
+        count = self.counts.get(workflow_id, 0) + n
+        if count > 0:
+            self.counts[workflow_id] = count
+        else:
+            self.counts.pop(workflow_id, None)
+
+        if not self.counts:
+            self.emptied.set()
+        elif self.task is None:
+            self.emptied.clear()
+            self.task = self.loop.create_task(self._heartbeat_while_viewed())
+
+    async def heartbeat(self) -> None:
+        await _write_workflow_viewers(self.process_id, dict(self.counts))
+
+    async def _heartbeat_while_viewed(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception('Error writing workflow viewers')
+
+            if not self.counts:
+                self.task = None
+                return
+
+            try:
+                await asyncio.wait_for(self.emptied.wait(),
+                                       WorkflowViewers.HeartbeatInterval)
+            except asyncio.TimeoutError:
+                pass
+            self.emptied.clear()
+
+
+# One counter per event loop, like coalescers. (Channels runs every consumer
+# on one loop.)
+_viewer_counters = weakref.WeakKeyDictionary()
+
+
+def _viewer_counter() -> _ViewerCounter:
+    loop = asyncio.get_event_loop()
+    counter = _viewer_counters.get(loop)
+    if counter is None:
+        counter = _viewer_counters[loop] = _ViewerCounter(loop)
+    return counter
+
+
+def coalesce_deltas_on_this_loop() -> None:
+    """
+    Merge deltas sent from the current event loop (see `_DeltaCoalescer`).
+
+    Call this only on a loop that lives as long as the process: the
+    worker's, cron's or channels'. Merged deltas wait in a task on the loop,
+    and a one-shot loop -- such as `async_to_sync()` creates in a view --
+    would destroy that task, and the deltas with it. On other loops, we send
+    each message immediately.
+    """
+    loop = asyncio.get_event_loop()
+    if loop not in _coalescers:
+        _coalescers[loop] = _DeltaCoalescer(loop)
+
+
+async def _send_workflow_message(workflow_id: int,
+                                 message: Dict[str, Any]) -> None:
+    """
+    Send `message` to the workflow's consumers, in order with other messages.
+
+    Every message to a workflow's group must go through here, so a message
+    can't overtake a delta that is waiting to be merged.
+    """
+    coalescer = _coalescers.get(asyncio.get_event_loop())
+    if coalescer is None:
+        await _workflow_group_send(workflow_id, message)
+    else:
+        await coalescer.send(workflow_id, message)
 
 
 async def ws_client_send_delta_async(workflow_id: int,
                                      delta: Dict[str, Any]) -> None:
-    """Tell clients how to modify their `workflow` and `wfModules` state."""
-    message = {'type': 'apply-delta', 'data': delta}
-    await _workflow_group_send(workflow_id, message)
+    """
+    Tell clients how to modify their `workflow` and `wfModules` state.
+
+    If this loop coalesces deltas and this workflow sent a message in the
+    past `DeltaCoalesceWindow` seconds, return immediately: `delta` will be
+    merged with others and sent when the window closes.
+    """
+    await _send_workflow_message(workflow_id, _apply_delta_message(delta))
 
 
 async def queue_render_if_listening(workflow_id: int, delta_id: int):
@@ -250,10 +552,8 @@ async def queue_render_if_listening(workflow_id: int, delta_id: int):
     In other words: "queue a render, but only if somebody has this workflow
     open in a web browser."
     """
-    channel_name = _workflow_channel_name(workflow_id)
-    channel_layer = get_channel_layer()
     logger.debug('Suggest render of Workflow %d v%d', workflow_id, delta_id)
-    await channel_layer.group_send(channel_name, {
+    await _send_workflow_message(workflow_id, {
         'type': 'queue_render',
         'data': {
             'workflow_id': workflow_id,
@@ -0,0 +1,96 @@
+"""
+Serialize a whole Workflow -- tabs and steps -- for page loads and websockets.
+
+Serializing step by step costs several queries per step: its Tab (for
+`tab_slug`), its ModuleVersion, its fetched data versions, and each Tab's
+step IDs. A 500-step workflow would cost thousands of queries. Here, we load
+each of those things in one query and hand the results to the serializers.
+The number of queries does not depend on the number of steps.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+from server.models import ModuleVersion, StoredObject, WfModule, Workflow
+from server.serializers import TabSerializer, WfModuleSerializer, \
+        WorkflowSerializer
+
+
+@dataclass(frozen=True)
+class WorkflowSnapshot:
+    workflow: Dict[str, Any]
+    """WorkflowSerializer data."""
+
+    tabs: Dict[str, Dict[str, Any]]
+    """TabSerializer data, keyed by tab slug."""
+
+    wf_modules: Dict[str, Dict[str, Any]]
+    """WfModuleSerializer data, keyed by str(wf_module.id)."""
+
+    needs_render: bool
+    """True if any step's cached render result is missing or stale."""
+
+
+def load_workflow_snapshot(
+    workflow: Workflow,
+    request: Any,
+    *,
+    tab_fields: Optional[Iterable[str]] = None,
+    wf_module_fields: Optional[Iterable[str]] = None
+) -> WorkflowSnapshot:
+    """
+    Serialize `workflow` and its live tabs and steps.
+
+    `request` is the serializer-context request (it needs `user` and
+    `session`). `tab_fields` and `wf_module_fields`, if set, limit which
+    fields we serialize (and so which queries we run).
+
+    Call this within `workflow.cooperative_lock()`, so the snapshot is
+    consistent.
+    """
+    tabs = list(workflow.live_tabs)
+    tabs_by_id = dict((tab.id, tab) for tab in tabs)
+    wf_modules = list(WfModule.live_in_workflow(workflow))
+
+    module_versions = dict((mv.id_name, mv)
+                           for mv in ModuleVersion.objects.get_all_latest())
+
+    tab_wf_module_ids = defaultdict(list)
+    for wf_module in wf_modules:  # sorted by order
+        tab_wf_module_ids[wf_module.tab_id].append(wf_module.id)
+        # Prime caches, so serializing doesn't query
+        wf_module.tab = tabs_by_id[wf_module.tab_id]
+        wf_module._module_version = \
+            module_versions.get(wf_module.module_id_name)
+
+    context = {
+        'request': request,
+        'tab_wf_module_ids': tab_wf_module_ids,
+    }
+    if wf_module_fields is None or 'versions' in wf_module_fields:
+        fetched_data_versions = defaultdict(list)
+        for wf_module_id, stored_at, read in (
+            StoredObject.objects
+            .filter(wf_module_id__in=[wfm.id for wfm in wf_modules])
+            .order_by('-stored_at')
+            .values_list('wf_module_id', 'stored_at', 'read')
+        ):
+            fetched_data_versions[wf_module_id].append((stored_at, read))
+        context['fetched_data_versions'] = fetched_data_versions
+
+    return WorkflowSnapshot(
+        workflow=WorkflowSerializer(workflow, context=context).data,
+        tabs=dict(
+            (tab.slug,
+             TabSerializer(tab, fields=tab_fields, context=context).data)
+            for tab in tabs
+        ),
+        wf_modules=dict(
+            (str(wfm.id),
+             WfModuleSerializer(wfm, fields=wf_module_fields,
+                                context=context).data)
+            for wfm in wf_modules
+        ),
+        needs_render=any(wfm.cached_render_result is None
+                         for wfm in wf_modules),
+    )
@@ -1,8 +1,10 @@
+from .result_cache import result_cache
 from .types import UnneededExecution
 from .workflow import execute_workflow
 
 
 __all__ = [
+    'result_cache',
     'UnneededExecution',
     'execute_workflow',
 ]
@@ -0,0 +1,388 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+import os
+import pickle
+import resource
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional, Tuple
+import pandas as pd
+from cjworkbench.types import ProcessResult
+from server import dataframe_mmap
+
+
+logger = logging.getLogger(__name__)
+
+
+_fork = multiprocessing.get_context('fork')
+
+_SharedMemoryDir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+"""
+Where we write tables for render processes: tmpfs when available.
+"""
+
+_MemoryErrorExitCode = 3
+"""
+Exit code of a render process that raised MemoryError.
+"""
+
+
+def _current_address_space_size() -> int:
+    """Virtual memory used by this process, in bytes (Linux-only)."""
+    with open('/proc/self/statm') as f:
+        npages = int(f.read().split()[0])
+    return npages * resource.getpagesize()
+
+
+class _TablePickler(pickle.Pickler):
+    """
+    Pickler that writes each DataFrame to its own file in `dirname`.
+
+    The pickle only holds the file's name. `_TableUnpickler` maps the file
+    into memory, so numeric columns are never pickled.
+    """
+
+    def __init__(self, f, dirname: str, prefix: str):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.dirname = dirname
+        self.prefix = prefix
+        self.n_tables = 0
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, pd.DataFrame):
+            return None  # pickle as usual
+
+        name = '%s-%d' % (self.prefix, self.n_tables)
+        self.n_tables += 1
+        with open(os.path.join(self.dirname, name), 'wb') as f:
+            dataframe_mmap.write_dataframe(f, obj, allow_pickle=True)
+        return name
+
+
+class _TableUnpickler(pickle.Unpickler):
+    """Unpickler that reads the DataFrames `_TablePickler` wrote."""
+
+    def __init__(self, f, dirname: str):
+        super().__init__(f)
+        self.dirname = dirname
+
+    def persistent_load(self, name):
+        with open(os.path.join(self.dirname, name), 'rb') as f:
+            return dataframe_mmap.read_dataframe(f, allow_pickle=True)
+
+
+def _child_main(dirname: str, memory_limit: Optional[int],
+                cpu_seconds: Optional[int]) -> None:
+    """
+    In a freshly-forked render process, run the call in `dirname`; exit.
+
+    `dirname/call` holds a pickled (fn, args, kwargs). We pickle `fn`'s
+    result to `dirname/result`. Tables go in their own files (see
+    `_TablePickler`).
+
+    Exit code 0 means `dirname/result` is ready.
+    """
+    try:
+        if memory_limit is not None:
+            # Only limit what we allocate _beyond_ what we inherited.
+            limit = _current_address_space_size() + memory_limit
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if cpu_seconds is not None:
+            # Soft limit sends SIGXCPU, which kills us. (Our CPU clock starts
+            # at 0 after fork.)
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (cpu_seconds, cpu_seconds + 1))
+
+        with open(os.path.join(dirname, 'call'), 'rb') as f:
+            fn, args, kwargs = _TableUnpickler(f, dirname).load()
+        result = fn(*args, **kwargs)
+        with open(os.path.join(dirname, 'result'), 'wb') as f:
+            _TablePickler(f, dirname, 'output').dump(result)
+    except MemoryError:
+        # Don't print a traceback: that may need memory, too.
+        os._exit(_MemoryErrorExitCode)
+    except BaseException:
+        traceback.print_exc()
+        os._exit(1)
+    os._exit(0)
+
+
+def _supervise(connection: Connection) -> None:
+    """
+    Fork a render process for the job on `connection`; reply with its fate.
+
+    A job is (dirname, memory_limit, cpu_seconds, wall_seconds). We reply
+    (pid, exitcode, timed_out). `exitcode` is negative if the render process
+    died of a signal, like `multiprocessing.Process.exitcode`.
+
+    We kill the render process if it runs past `wall_seconds`. It's our child
+    and we haven't reaped it, so its pid can't belong to another process.
+    """
+    try:
+        dirname, memory_limit, cpu_seconds, wall_seconds = connection.recv()
+    except (EOFError, ConnectionResetError):
+        return  # our executor is gone
+
+    # `exit_reader` reaches EOF when the render process exits.
+    exit_reader, exit_writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(exit_reader)
+        connection.close()
+        _child_main(dirname, memory_limit, cpu_seconds)  # never returns
+    os.close(exit_writer)
+
+    timed_out = not wait([exit_reader], wall_seconds)  # None => forever
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+    os.close(exit_reader)
+
+    if os.WIFSIGNALED(status):
+        exitcode = -os.WTERMSIG(status)
+    else:
+        exitcode = os.WEXITSTATUS(status)
+    connection.send((pid, exitcode, timed_out))
+
+
+def _fork_supervisors(listener: socket.socket,
+                      alive_recver: Connection) -> None:
+    """
+    Fork a supervisor (see `_supervise()`) for each connection to `listener`.
+
+    Return when `alive_recver` reaches EOF: that is, when every process that
+    could connect to us has exited.
+    """
+    # Let the kernel reap supervisors: nobody waits for them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        ready = wait([listener, alive_recver])
+        if alive_recver in ready:
+            return
+        sock, _ = listener.accept()
+        if os.fork() == 0:
+            listener.close()
+            alive_recver.close()
+            # We must reap our render process ourselves, to read its status
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _supervise(Connection(sock.detach()))
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        sock.close()
+
+
+def _zygote_main(socket_dir: str, listener: socket.socket,
+                 alive_recver: Connection, alive_sender: Connection) -> None:
+    """
+    Run `_fork_supervisors()` in a child; restart it if it dies.
+
+    Return when `alive_recver` reaches EOF: that is, when every process that
+    could connect to us has exited.
+    """
+    alive_sender.close()  # or we'd never see EOF
+
+    try:
+        while True:
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    _fork_supervisors(listener, alive_recver)
+                except BaseException:
+                    traceback.print_exc()
+                    os._exit(1)
+                os._exit(0)
+
+            _, status = os.waitpid(pid, 0)
+            if alive_recver.poll():
+                return  # EOF: nobody needs render processes any more
+            print('render process forker died (status %d); restarting'
+                  % status, file=sys.stderr)
+            time.sleep(1)  # don't spin if it dies at startup
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+class _Zygote:
+    """
+    A single-threaded process that forks render processes.
+
+    Why not fork from the worker? Because the worker has threads -- the
+    executor's, and its libraries' -- and a child forked from a
+    multi-threaded process inherits every lock those threads held at the
+    moment of fork(). It can deadlock on one before it renders anything. The
+    zygote is forked once, before the worker starts threads, and it never
+    starts any.
+
+    Each job connects to the zygote's Unix socket; the zygote forks a
+    supervisor to run it (see `_supervise()`).
+    """
+
+    def __init__(self):
+        socket_dir = tempfile.mkdtemp(prefix='render-process-')  # mode 0700
+        self.path = os.path.join(socket_dir, 'zygote')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(16)
+
+        # Our process keeps `alive_sender` open until it exits. When every
+        # process holding it has exited, the zygote sees EOF and exits.
+        alive_recver, self._alive_sender = _fork.Pipe(duplex=False)
+        self.process = _fork.Process(
+            target=_zygote_main,
+            args=(socket_dir, listener, alive_recver, self._alive_sender),
+            daemon=True
+        )
+        self.process.start()
+        listener.close()
+        alive_recver.close()
+
+    def close(self) -> None:
+        """Make the zygote exit. Running jobs finish."""
+        self._alive_sender.close()
+        self.process.join()
+
+    def run(self, job: Tuple[str, Optional[int], Optional[int],
+                             Optional[float]]) -> Tuple[int, int, bool]:
+        """
+        Run `job` in a render process; return (pid, exitcode, timed_out).
+
+        Raise OSError if the zygote is unreachable.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        connection = Connection(sock.detach())
+        try:
+            connection.send(job)
+            return connection.recv()
+        except EOFError:
+            raise OSError('render process supervisor died')
+        finally:
+            connection.close()
+
+
+class RenderProcessExecutor(Executor):
+    """
+    Executor that calls each render() in a freshly-forked child process.
+
+    Why fork per call, and not a pool of pre-forked processes? Because a
+    fresh child can't leak memory or state from one render to the next, and
+    forking is cheap: the child shares everything the zygote has imported,
+    copy-on-write. We fork from a single-threaded zygote, not from the worker
+    (see `_Zygote`), so construct this executor before starting threads.
+
+    Arguments are pickled, except DataFrames: we write them with
+    `server.dataframe_mmap` and the child maps them into memory, so numeric
+    columns are not pickled. The result comes back the same way. (`fn` must
+    be picklable; `LoadedModule` pickles as its name and version.)
+
+    Each child has its own limits, so one huge render can't starve the worker
+    (which must keep serving heartbeats and RabbitMQ):
+
+    * `memory_limit`: bytes the child may allocate beyond what it inherited.
+    * `cpu_seconds`: CPU time the child may use.
+    * `wall_seconds`: time the child may take, even if it's waiting (e.g.,
+      sleeping, or blocked on a socket) and not using CPU.
+
+    A child that breaches a limit dies (its supervisor kills it when it
+    exceeds `wall_seconds`); we return a ProcessResult error instead of
+    raising.
+
+    `fn` must return a ProcessResult. `max_workers` children run at once.
+    """
+
+    def __init__(self, max_workers: int, memory_limit: Optional[int] = None,
+                 cpu_seconds: Optional[int] = None,
+                 wall_seconds: Optional[float] = None):
+        self.memory_limit = memory_limit
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self._zygote = _Zygote()  # before we start threads
+        self._threads = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='workbench-render-process-'
+        )
+
+    # override
+    def submit(self, fn: Callable[..., ProcessResult], *args,
+               **kwargs) -> Future:
+        return self._threads.submit(self._call_in_child, fn, args, kwargs)
+
+    # override
+    def shutdown(self, wait=True):
+        self._threads.shutdown(wait=wait)
+        self._zygote.close()
+
+    def _call_in_child(self, fn: Callable[..., ProcessResult],
+                       args: Tuple[Any],
+                       kwargs: Dict[str, Any]) -> ProcessResult:
+        with tempfile.TemporaryDirectory(prefix='render-',
+                                         dir=_SharedMemoryDir) as dirname:
+            with open(os.path.join(dirname, 'call'), 'wb') as f:
+                _TablePickler(f, dirname, 'input').dump((fn, args, kwargs))
+
+            try:
+                pid, exitcode, timed_out = self._zygote.run(
+                    (dirname, self.memory_limit, self.cpu_seconds,
+                     self.wall_seconds)
+                )
+            except OSError as err:
+                logger.exception('Could not start render process')
+                return ProcessResult(
+                    error='Could not start render process: %s' % err
+                )
+
+            if timed_out:
+                return ProcessResult(error=self._describe_timeout(pid))
+            if exitcode != 0:
+                return ProcessResult(error=self._describe_crash(pid,
+                                                                exitcode))
+
+            # DataFrames stay mapped after we delete their files
+            with open(os.path.join(dirname, 'result'), 'rb') as f:
+                return _TableUnpickler(f, dirname).load()
+
+    def _describe_timeout(self, pid: int) -> str:
+        logger.warning('Killed render process %d after %r seconds',
+                       pid, self.wall_seconds)
+        return (
+            'This step took too long to compute: it ran for more than %r '
+            'seconds. Please try a smaller table.'
+        ) % self.wall_seconds
+
+    def _describe_crash(self, pid: int, exitcode: int) -> str:
+        logger.warning('Render process %d died with exit code %r',
+                       pid, exitcode)
+        if exitcode == -signal.SIGXCPU:
+            return (
+                'This step took too long to compute: it used more than %d '
+                'seconds of CPU time. Please try a smaller table.'
+            ) % self.cpu_seconds
+        elif exitcode == _MemoryErrorExitCode:
+            return 'This step ran out of memory. Please try a smaller table.'
+        elif exitcode == -signal.SIGKILL:
+            # Nobody but the kernel's out-of-memory killer sends this
+            return (
+                'This step was killed. It may have run out of memory. '
+                'Please try a smaller table.'
+            )
+        elif exitcode < 0:
+            return 'This step crashed (signal %s).' % (
+                signal.Signals(-exitcode).name
+            )
+        else:
+            return 'This step crashed (exit code %d).' % exitcode
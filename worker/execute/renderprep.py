@@ -3,6 +3,7 @@ from typing import Any, Dict, List, Optional, Union
 from cjworkbench.types import RenderColumn, StepResultShape, TabOutput
 from server.models import Params, Tab
 from server.models.param_spec import ParamDType
+from .result_cache import read_cached_render_result
 from .types import TabCycleError, TabOutputUnreachableError, \
         UnneededExecution, PromptingError
 
@@ -179,7 +180,8 @@ def _(dtype: ParamDType.Tab, value: str, context: RenderContext) -> TabOutput:
         # looks like that version must be stale.
         raise UnneededExecution
 
-    result = crr.result  # read Parquet file from disk (slow)
+    # read Parquet file from disk (slow) -- unless we rendered it recently
+    result = read_cached_render_result(crr)
     return TabOutput(
         tab_slug,
         tab.name,
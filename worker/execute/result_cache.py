@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import os
+import threading
+from typing import Optional
+from cjworkbench.types import ProcessResult
+from server.models import CachedRenderResult
+
+
+logger = logging.getLogger(__name__)
+
+
+# MaxBytes: number of bytes of DataFrame data to keep in RAM between renders.
+#
+# Renders that start mid-tab, and tabs read by other tabs (join, concat), read
+# their input from this cache instead of downloading and decoding Parquet.
+#
+# Default is 500MB: we expect to run on a machine with a few GB of RAM, and a
+# render of a large table can easily use 3x the table's size.
+MaxBytes = int(os.getenv('CJW_WORKER_RESULT_CACHE_BYTES', 500 * 1024 * 1024))
+
+
+def _copy_result(result: ProcessResult) -> ProcessResult:
+    """
+    Copy `result`, so modules can modify their input without harming us.
+
+    The copy is shallow except for `dataframe`, whose buffers are copied. (str
+    values in object columns are shared: they're immutable.)
+    """
+    return ProcessResult(
+        dataframe=result.dataframe.copy(),
+        error=result.error,
+        json=result.json,
+        quick_fixes=result.quick_fixes,
+        columns=result.columns
+    )
+
+
+@dataclass(frozen=True)
+class ResultCacheStats:
+    hits: int
+    """Number of `get()` calls that returned a result."""
+
+    misses: int
+    """Number of `get()` calls that returned `None`."""
+
+    evictions: int
+    """Number of results dropped to make room for others."""
+
+    n_results: int
+    """Number of results in the cache right now."""
+
+    nbytes: int
+    """Number of DataFrame bytes in the cache right now."""
+
+
+class ResultCache:
+    """
+    Least-recently-used ProcessResults, keyed by result hash.
+
+    The key is `server.models.CachedRenderResult.hash_process_result()`: two
+    results with the same hash are indistinguishable, so the cache needs no
+    invalidation. (A (wf_module_id, delta_id) pair would not do: after a
+    module is re-imported, the same step re-renders at the same delta_id, and
+    its output may differ.) Entries nobody requests any more are evicted as
+    new results come in.
+
+    Results are copied on the way in and on the way out, because render()
+    functions are allowed to modify their input tables.
+
+    This is thread-safe: `get()` and `put()` are called from database threads
+    and executor threads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # hash => (ProcessResult, nbytes)
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> ResultCacheStats:
+        with self._lock:
+            return ResultCacheStats(self._hits, self._misses, self._evictions,
+                                    len(self._entries), self._nbytes)
+
+    def get(self, key: str) -> Optional[ProcessResult]:
+        """
+        Return a copy of the result with hash `key`, or `None`.
+        """
+        with self._lock:
+            try:
+                result, _ = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return _copy_result(result)
+
+    def put(self, key: str, result: ProcessResult) -> None:
+        """
+        Store a copy of `result`, which has hash `key`, evicting old results.
+
+        No-op if `result` is larger than the entire cache.
+
+        This copies the whole table, so don't call it from the event loop.
+        """
+        nbytes = int(result.dataframe.memory_usage(index=False, deep=True)
+                     .sum())
+        if nbytes > self.max_bytes:
+            return
+
+        result = _copy_result(result)
+        with self._lock:
+            if key in self._entries:
+                _, old_nbytes = self._entries.pop(key)
+                self._nbytes -= old_nbytes
+            self._entries[key] = (result, nbytes)
+            self._nbytes += nbytes
+
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+result_cache = ResultCache(MaxBytes)
+"""The worker-wide cache of rendered results."""
+
+
+def read_cached_render_result(crr: CachedRenderResult) -> ProcessResult:
+    """
+    Return `crr.result`, from RAM if possible or from S3 otherwise.
+
+    Call this within a lock, as you would `crr.result`.
+    """
+    if crr.hash is None:
+        return crr.result  # rendered before we stored hashes
+
+    result = result_cache.get(crr.hash)
+    if result is None:
+        result = crr.result  # read Parquet file from S3 (slow)
+        result_cache.put(crr.hash, result)
+    return result
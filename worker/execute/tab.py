@@ -4,8 +4,12 @@ from typing import Dict, List, Optional, Set, Tuple
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import ProcessResult, StepResultShape
 from server.models import Params, WfModule, Workflow, Tab
+from server.models.CachedRenderResult import hash_process_result
 from server.models.param_spec import ParamDType
-from .wf_module import execute_wfmodule, locked_wf_module
+from .result_cache import read_cached_render_result
+from .types import UnneededExecution
+from .wf_module import execute_wfmodule, locked_wf_module, \
+        reuse_unchanged_wfmodule_result
 
 
 _memoize = lru_cache(maxsize=1)
@@ -95,30 +99,60 @@ class TabFlow:
         return ret
 
 
+EmptyResultHash = hash_process_result(ProcessResult())
+"""Hash of the input to the first step in a tab."""
+
+
 @database_sync_to_async
 def _load_input_from_cache(workflow: Workflow,
-                           flow: TabFlow) -> ProcessResult:
-    last_fresh_wfm = flow.last_fresh_wf_module
-    if last_fresh_wfm is None:
+                           wf_module: Optional[WfModule]) -> ProcessResult:
+    """
+    Read `wf_module`'s fresh cached result: the input to the step after it.
+
+    `wf_module=None` means "the step before the first step": its output is
+    empty.
+    """
+    if wf_module is None:
         return ProcessResult()
     else:
         # raises UnneededExecution
-        with locked_wf_module(workflow, last_fresh_wfm) as safe_wfm:
+        with locked_wf_module(workflow, wf_module) as safe_wfm:
             crr = safe_wfm.cached_render_result
-            assert crr is not None  # otherwise it's not fresh, see?
+            if crr is None:
+                # It was fresh when we started, so it must have changed.
+                raise UnneededExecution
+
+            # Read the entire input Parquet file (or recall it from RAM).
+            return read_cached_render_result(crr)
+
 
-            # Read the entire input Parquet file.
-            return crr.result
+@database_sync_to_async
+def _load_input_hash_from_cache(workflow: Workflow,
+                                wf_module: Optional[WfModule]) -> str:
+    """
+    Read the hash of `wf_module`'s fresh cached result (without its table).
+    """
+    if wf_module is None:
+        return EmptyResultHash
+    else:
+        # raises UnneededExecution
+        with locked_wf_module(workflow, wf_module) as safe_wfm:
+            crr = safe_wfm.cached_render_result
+            if crr is None:
+                raise UnneededExecution
+            return crr.hash
 
 
 async def execute_tab_flow(
     workflow: Workflow,
     flow: TabFlow,
     tab_shapes: Dict[str, Optional[StepResultShape]]
-) -> ProcessResult:
+) -> StepResultShape:
     """
     Ensure `flow.tab.live_wf_modules` all cache fresh render results.
 
+    Return the tab's output shape.
+
     `tab_shapes.keys()` must be ordered as the Workflow's tabs are.
 
     Raise `UnneededExecution` if something changes underneath us such that we
@@ -127,6 +161,12 @@ async def execute_tab_flow(
 
     WEBSOCKET NOTES: each wf_module is executed in turn. After each execution,
     we notify clients of its new columns and status.
+
+    SHORT-CIRCUIT NOTES: each step's cached result records the hash of its
+    inputs. When a step's inputs are unchanged since its last render -- for
+    instance, because the step before it re-rendered and produced identical
+    output -- we mark its stale result fresh instead of rendering. We only
+    read a step's output from disk when a later step needs to render it.
     """
     logger.debug('Rendering Tab(%d, %s - %s)', workflow.id, flow.tab_slug,
                  flow.tab.name)
@@ -136,9 +176,62 @@ async def execute_tab_flow(
     # We don't hold any lock throughout the loop: the loop can take a long
     # time; it might be run multiple times simultaneously (even on
     # different computers); and `await` doesn't work with locks.
-    last_result = await _load_input_from_cache(workflow, flow)
+    #
+    # `last_result` is the output of `last_wf_module`, or `None` if we haven't
+    # read it from the cache yet. `last_hash` is always set.
+    last_wf_module = flow.last_fresh_wf_module
+    last_result = None
+    last_hash = await _load_input_hash_from_cache(workflow, last_wf_module)
+    last_shape = None  # StepResultShape, when we skip reading `last_result`
     for wf_module, params in flow.stale_steps:
-        last_result = await execute_wfmodule(workflow, wf_module, params,
-                                             flow.tab_name, last_result,
-                                             tab_shapes)
-    return last_result
+        crr = await reuse_unchanged_wfmodule_result(workflow, wf_module,
+                                                    params, flow.tab_name,
+                                                    last_hash)
+        if crr is not None:
+            last_wf_module = wf_module
+            last_result = None
+            last_hash = crr.hash
+            last_shape = StepResultShape(crr.status, crr.table_shape)
+            continue
+
+        if last_result is None:
+            last_result = await _load_input_from_cache(workflow,
+                                                       last_wf_module)
+        last_result, last_hash = await execute_wfmodule(
+            workflow,
+            wf_module,
+            params,
+            flow.tab_name,
+            last_result,
+            last_hash,
+            tab_shapes
+        )
+        last_wf_module = wf_module
+
+    if last_result is not None:
+        return StepResultShape(last_result.status, last_result.table_shape)
+    elif last_shape is not None:
+        return last_shape
+    else:
+        # Entire flow was fresh: read its output shape without its data
+        return await _load_output_shape_from_cache(workflow, last_wf_module)
+
+
+@database_sync_to_async
+def _load_output_shape_from_cache(
+    workflow: Workflow,
+    wf_module: Optional[WfModule]
+) -> StepResultShape:
+    """
+    Read the shape of `wf_module`'s fresh cached result, without its table.
+    """
+    if wf_module is None:
+        result = ProcessResult()
+        return StepResultShape(result.status, result.table_shape)
+    else:
+        # raises UnneededExecution
+        with locked_wf_module(workflow, wf_module) as safe_wfm:
+            crr = safe_wfm.cached_render_result
+            if crr is None:
+                raise UnneededExecution
+            return StepResultShape(crr.status, crr.table_shape)
@@ -1,16 +1,66 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import datetime
+import hashlib
+import json
+import os
 from typing import Any, Dict, Optional, Tuple
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import ProcessResult, StepResultShape, TableShape
 from server import notifications
-from server.models import LoadedModule, Params, WfModule, Workflow
+from server.models import CachedRenderResult, LoadedModule, Params, \
+        WfModule, Workflow
+from server.models.CachedRenderResult import RenderResultDigest
+from server.models.param_dtype import ParamDType
 from server.notifications import OutputDelta
 from server import websockets
 from .types import TabCycleError, TabOutputUnreachableError, \
         UnneededExecution, PromptingError
 from . import renderprep
+from .render_process import RenderProcessExecutor
+from .result_cache import result_cache
+
+
+# RenderCpuBudget: number of render() calls this worker process may run at the
+# same time -- across all tabs and all workflows it is rendering.
+#
+# Default is 1: we expect to run on a 2-CPU machine, so 1 CPU for render and 1
+# for cron-render. Raise it to render a workflow's independent tabs in
+# parallel.
+RenderCpuBudget = int(os.getenv('CJW_WORKER_RENDER_CPU_BUDGET', 1))
+
+# RenderExecutor: 'thread' or 'process'.
+#
+# 'thread' (default) renders in this process. 'process' forks a child process
+# per render(), so a runaway module can't take the worker down with it; the
+# child is killed if it exceeds RenderMemoryLimit bytes of new allocations,
+# RenderCpuSeconds of CPU time or RenderWallSeconds of elapsed time. (0 means
+# "no limit".)
+RenderExecutor = os.getenv('CJW_WORKER_RENDER_EXECUTOR', 'thread')
+RenderMemoryLimit = int(os.getenv('CJW_WORKER_RENDER_MEMORY_LIMIT',
+                                  2 * 1024 * 1024 * 1024))
+RenderCpuSeconds = int(os.getenv('CJW_WORKER_RENDER_CPU_SECONDS', 300))
+RenderWallSeconds = int(os.getenv('CJW_WORKER_RENDER_WALL_SECONDS', 600))
+
+if RenderExecutor == 'process':
+    render_executor = RenderProcessExecutor(
+        max_workers=RenderCpuBudget,
+        memory_limit=RenderMemoryLimit or None,
+        cpu_seconds=RenderCpuSeconds or None,
+        wall_seconds=RenderWallSeconds or None
+    )
+elif RenderExecutor == 'thread':
+    render_executor = ThreadPoolExecutor(
+        max_workers=RenderCpuBudget,
+        thread_name_prefix='workbench-render-'
+    )
+else:
+    raise ValueError(
+        "CJW_WORKER_RENDER_EXECUTOR must be 'thread' or 'process'; got %r"
+        % RenderExecutor
+    )
+"""Executor that runs module render() calls."""
 
 
 @contextlib.contextmanager
@@ -48,6 +98,75 @@ def locked_wf_module(workflow, wf_module):
     return retval
 
 
+def build_render_input_hash(wf_module: WfModule, params: Params,
+                            tab_name: str,
+                            input_hash: Optional[str]) -> Optional[str]:
+    """
+    Build a hex digest of everything `wf_module`'s render() would be given.
+
+    `input_hash` is the hash of the input ProcessResult. Add to it the module
+    version, params, secrets, tab name and fetched data version: if two
+    renders have the same input hash, their outputs are the same.
+
+    Return `None` if we can't tell: for instance, when a Tab param means
+    render() depends on another tab's output, or when `input_hash` is `None`
+    because the input was cached before we started hashing.
+
+    Call this within a lock.
+    """
+    if input_hash is None:
+        return None
+
+    tab_slugs = params.schema.find_leaf_values_with_dtype(ParamDType.Tab,
+                                                          params.values)
+    if any(tab_slugs):
+        return None
+
+    module_version = wf_module.module_version
+    h = hashlib.sha1()
+    h.update(json.dumps({
+        'input': input_hash,
+        'is_first': wf_module.order == 0,
+        'module_version': (
+            None if module_version is None else str(module_version)
+        ),
+        'params': params.values,
+        'secrets': params.secrets,
+        'tab_name': tab_name,
+        'stored_data_version': wf_module.stored_data_version,
+        'fetch_error': wf_module.fetch_error,
+    }, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+@database_sync_to_async
+def _execute_wfmodule_reuse(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_hash: Optional[str]
+) -> Optional[CachedRenderResult]:
+    """
+    Mark `wf_module`'s stale result fresh if its inputs have not changed.
+
+    Return the fresh CachedRenderResult, or `None` if the caller must render.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    # raises UnneededExecution
+    with locked_wf_module(workflow, wf_module) as safe_wf_module:
+        render_input_hash = build_render_input_hash(safe_wf_module, params,
+                                                    tab_name, input_hash)
+        if render_input_hash is None:
+            return None
+
+        return safe_wf_module.reuse_stale_cached_render_result(
+            safe_wf_module.last_relevant_delta_id,
+            render_input_hash
+        )
+
+
 @database_sync_to_async
 def _execute_wfmodule_pre(
     workflow: Workflow,
@@ -93,11 +212,21 @@ def _execute_wfmodule_pre(
 
 
 @database_sync_to_async
-def _execute_wfmodule_save(workflow: Workflow, wf_module: WfModule,
-                           result: ProcessResult) -> OutputDelta:
+def _execute_wfmodule_save(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_hash: Optional[str],
+    result: ProcessResult,
+    digest: RenderResultDigest
+) -> Optional[OutputDelta]:
     """
     Call wf_module.cache_render_result() and build OutputDelta.
 
+    `digest` is `RenderResultDigest.of(result)`. Return `None` if there is
+    nothing to email.
+
     All this runs synchronously within a database lock. (It's a separate
     function so that when we're done awaiting it, we can continue executing in
     a context that doesn't use a database thread.)
@@ -118,14 +247,17 @@ def _execute_wfmodule_save(workflow: Workflow, wf_module: WfModule,
 
         safe_wf_module.cache_render_result(
             safe_wf_module.last_relevant_delta_id,
-            result
+            result,
+            build_render_input_hash(safe_wf_module, params, tab_name,
+                                    input_hash),
+            digest
         )
 
         if safe_wf_module.notifications and result != stale_result:
             safe_wf_module.has_unseen_notification = True
             safe_wf_module.save(update_fields=['has_unseen_notification'])
-            return notifications.OutputDelta(safe_wf_module,
-                                             stale_result, result)
+            return notifications.OutputDelta(safe_wf_module, stale_result,
+                                             result)
         else:
             return None  # nothing to email
 
@@ -168,24 +300,69 @@ async def _render_wfmodule(
         )
 
     # Render may take a while. run_in_executor to push that slowdown to a
-    # thread and keep our event loop responsive.
+    # thread and keep our event loop responsive. `render_executor` keeps us
+    # within our CPU budget even when we render several tabs at once.
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, loaded_module.render,
+    return await loop.run_in_executor(render_executor, loaded_module.render,
                                       input_result, param_values, tab_name,
                                       fetch_result)
 
 
+async def reuse_unchanged_wfmodule_result(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_hash: Optional[str]
+) -> Optional[CachedRenderResult]:
+    """
+    Skip rendering a WfModule whose inputs are the same as last render's.
+
+    If `wf_module`'s stale cached result was rendered from exactly the same
+    inputs -- input table (identified by `input_hash`), params, tab name,
+    module version and fetched data -- then render() would produce exactly the
+    same output. In that case, mark the stale result fresh, broadcast and
+    return it.
+
+    The common case: a fetch produces a new table; a filter produces the same
+    output as last time; every step after that filter can be skipped.
+
+    Return `None` if the caller must call execute_wfmodule().
+
+    Raises `UnneededExecution` when the input WfModule should not be rendered.
+    """
+    # may raise UnneededExecution
+    crr = await _execute_wfmodule_reuse(workflow, wf_module, params,
+                                        tab_name, input_hash)
+    if crr is None:
+        return None
+
+    await websockets.ws_client_send_delta_async(workflow.id, {
+        'updateWfModules': {
+            str(wf_module.id): build_cached_status_dict(crr)
+        }
+    })
+
+    return crr
+
+
 async def execute_wfmodule(
     workflow: Workflow,
     wf_module: WfModule,
     params: Params,
     tab_name: str,
     input_result: ProcessResult,
+    input_hash: Optional[str],
     tab_shapes: Dict[str, Optional[StepResultShape]]
-) -> ProcessResult:
+) -> Tuple[ProcessResult, str]:
     """
     Render a single WfModule; cache, broadcast and return output.
 
+    `input_hash` is the hash of `input_result` (see
+    `server.models.CachedRenderResult.hash_process_result()`). Return
+    `(result, result_hash)`: the caller passes `result_hash` along as the next
+    step's `input_hash`.
+
     CONCURRENCY NOTES: This function is reasonably concurrency-friendly:
 
     * It returns a valid cache result immediately.
@@ -218,8 +395,25 @@ async def execute_wfmodule(
     result = await _render_wfmodule(workflow, wf_module, params, tab_name,
                                     input_result, tab_shapes)
 
+    # Hash the result and compute its column stats before we lock the
+    # workflow: that reads the whole table. (Keep it off the event loop, too.)
+    loop = asyncio.get_event_loop()
+    digest = await loop.run_in_executor(None, RenderResultDigest.of, result)
+
     # may raise UnneededExecution
-    output_delta = await _execute_wfmodule_save(workflow, wf_module, result)
+    output_delta = await _execute_wfmodule_save(
+        workflow,
+        wf_module,
+        params,
+        tab_name,
+        input_hash,
+        result,
+        digest
+    )
+
+    # Keep the result in RAM: the next render may need it as input. (Copying
+    # it is slow: keep that off the event loop.)
+    await loop.run_in_executor(None, result_cache.put, digest.hash, result)
 
     await websockets.ws_client_send_delta_async(workflow.id, {
         'updateWfModules': {
@@ -231,14 +425,10 @@ async def execute_wfmodule(
     # lock, because SMTP can be slow, and Django's email backend is
     # synchronous.
     if output_delta:
-        loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, notifications.email_output_delta,
                                    output_delta, datetime.datetime.now())
 
-    # TODO if there's no change, is it possible for us to skip the render
-    # of future modules, setting their cached_render_result_delta_id =
-    # last_relevant_delta_id?  Investigate whether this is worthwhile.
-    return result
+    return (result, digest.hash)
 
 
 def build_status_dict(result: ProcessResult, delta_id: int) -> Dict[str, Any]:
@@ -252,3 +442,17 @@ def build_status_dict(result: ProcessResult, delta_id: int) -> Dict[str, Any]:
         'output_n_rows': len(result.dataframe),
         'cached_render_result_delta_id': delta_id,
     }
+
+
+def build_cached_status_dict(crr: CachedRenderResult) -> Dict[str, Any]:
+    """
+    Like `build_status_dict()`, but without reading the result's table.
+    """
+    return {
+        'quick_fixes': [qf.to_dict() for qf in crr.quick_fixes],
+        'output_columns': [c.to_dict() for c in crr.columns],
+        'output_error': crr.error,
+        'output_status': crr.status,
+        'output_n_rows': crr.nrows,
+        'cached_render_result_delta_id': crr.delta_id,
+    }
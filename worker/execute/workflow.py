@@ -1,9 +1,11 @@
+import asyncio
 from typing import Dict, List, Optional, Tuple
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import StepResultShape
 from server.models import Workflow
 from .tab import TabFlow, execute_tab_flow
 from .types import UnneededExecution
+from .wf_module import RenderCpuBudget
 
 
 @database_sync_to_async
@@ -51,6 +53,40 @@ def partition_ready_and_dependent(
     return (ready, dependent)
 
 
+async def _execute_tab_flows(
+    workflow: Workflow,
+    flows: List[TabFlow],
+    tab_shapes: Dict[str, Optional[StepResultShape]],
+    max_concurrency: int
+) -> List[StepResultShape]:
+    """
+    Execute `flows` -- which must not depend on one another -- concurrently.
+
+    At most `max_concurrency` flows run at once; flows start in the order
+    given. (With `max_concurrency=1`, flows execute one after another.)
+
+    Return each flow's output shape, in the order of `flows`.
+
+    If any flow raises (e.g., `UnneededExecution`), cancel the others and
+    re-raise.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def execute(flow):
+        async with semaphore:
+            return await execute_tab_flow(workflow, flow, tab_shapes)
+
+    tasks = [asyncio.ensure_future(execute(flow)) for flow in flows]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Wait for cancellation to finish, so no flow outlives this call
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
     """
     Ensure all `workflow.tabs[*].live_wf_modules` cache fresh render results.
@@ -58,8 +94,10 @@ async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
     Raise UnneededExecution if the inputs become stale (at which point we don't
     care about results any more).
 
-    WEBSOCKET NOTES: each wf_module is executed in turn. After each execution,
-    we notify clients of its new columns and status.
+    WEBSOCKET NOTES: within a tab, each wf_module is executed in turn. After
+    each execution, we notify clients of its new columns and status. Tabs that
+    don't depend on each other may execute concurrently, so their
+    notifications may interleave.
     """
     # raises UnneededExecution
     pending_tab_flows = await _load_tab_flows(workflow, delta_id)
@@ -77,11 +115,13 @@ async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
         for flow in pending_tab_flows
     )
 
-    # Execute one tab_flow at a time.
+    # Execute ready tab_flows in batches. Flows within a batch don't depend on
+    # one another, so we execute them concurrently -- up to our CPU budget.
     #
     # We don't hold a DB lock throughout the loop: the loop can take a long
     # time; it might be run multiple times simultaneously (even on different
-    # computers); and `await` doesn't work with locks.
+    # computers); and `await` doesn't work with locks. Each step locks the
+    # workflow as it reads and writes, as always.
 
     while pending_tab_flows:
         ready_flows, dependent_flows = partition_ready_and_dependent(
@@ -93,10 +133,9 @@ async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
             # them last; they can detect their cycles through `tab_shapes`.
             break
 
-        for tab_flow in ready_flows:
-            result = await execute_tab_flow(workflow, tab_flow, tab_shapes)
-            tab_shape = StepResultShape(result.status, result.table_shape)
-            del result  # recover ram
+        ready_shapes = await _execute_tab_flows(workflow, ready_flows,
+                                                tab_shapes, RenderCpuBudget)
+        for tab_flow, tab_shape in zip(ready_flows, ready_shapes):
             tab_shapes[tab_flow.tab_slug] = tab_shape
 
         pending_tab_flows = dependent_flows  # iterate
@@ -105,5 +144,5 @@ async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
     # but don't update `tab_shapes` because none of them should see the output
     # from any other. (If tab1 and tab 2 depend on each other, they should both
     # have the same error: "Cycle"; their order of execution shouldn't matter.)
-    for tab_flow in pending_tab_flows:
-        await execute_tab_flow(workflow, tab_flow, tab_shapes)
+    await _execute_tab_flows(workflow, pending_tab_flows, tab_shapes,
+                             RenderCpuBudget)
@@ -47,13 +47,13 @@ def _get_input_dataframe(tab_id: int, wf_module_position: int):
 
 
 @database_sync_to_async
-def _get_stored_dataframe(wf_module_id: int):
+def _get_stored_dataframe(wf_module_id: int, newest_segment: bool = False):
     try:
         wf_module = WfModule.objects.get(pk=wf_module_id)
     except WfModule.DoesNotExist:
         return None
 
-    return wf_module.retrieve_fetched_table()
+    return wf_module.retrieve_fetched_table(newest_segment=newest_segment)
 
 
 @database_sync_to_async
@@ -74,7 +74,12 @@ def _get_wf_module(wf_module_id: int) -> Tuple[int, WfModule]:
 
 @database_sync_to_async
 def _update_next_update_time(wf_module, now):
-    """Schedule next update, skipping missed updates if any."""
+    """
+    Schedule next update, skipping missed updates if any.
+
+    When the cron queues a fetch, it schedules the next update itself (with
+    jitter); then this only sets `last_update_check`.
+    """
     tick = timedelta(seconds=max(wf_module.update_interval, MinFetchInterval))
 
     next_update = wf_module.next_update
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 from cjworkbench import rabbitmq
+from server import httpclient, websockets
 from .pg_locker import PgLocker
 from .fetch import handle_fetch
 from .upload_DELETEME import handle_upload_DELETEME
@@ -34,17 +35,24 @@ NFetchers = int(os.getenv('CJW_WORKER_N_FETCHERS', 3))
 
 # NUploaders: number of uploaded files to process at a time. TODO turn these
 # into fetches - https://www.pivotaltracker.com/story/show/161509317. We handle
-# the occasional 1GB+ file, which will consume ~3GB of RAM, so let's keep this
-# number at 1
+# the occasional 1GB+ file. CSV parsing is streamed, so RAM use is roughly
+# proportional to the (truncated) output table; but Excel and JSON files are
+# still parsed all at once, so let's keep this number at 1
 #
 # Default is 1: we don't expect many uploads.
 NUploaders = int(os.getenv('CJW_WORKER_N_UPLOADERS', 1))
 
+# HttpMetricsInterval: seconds between logging fetch modules' per-host HTTP
+# metrics. (See server.httpclient.)
+HttpMetricsInterval = 3600
+
 
 async def main_loop():
     """
     Run fetchers and renderers, forever.
     """
+    websockets.coalesce_deltas_on_this_loop()
+
     async with PgLocker() as pg_locker:
         @rabbitmq.acking_callback_with_requeue
         async def render_callback(*args, **kwargs):
@@ -70,4 +78,5 @@ async def main_loop():
 
         # Run forever
         while True:
-            await asyncio.sleep(99999)
+            await asyncio.sleep(HttpMetricsInterval)
+            httpclient.log_host_metrics()
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 from django.core.management.base import BaseCommand
+from server.modules import pythoncode
 from worker.main import main_loop
 
 
@@ -48,4 +49,6 @@ class Command(BaseCommand):
     help = 'Continually delete expired anonymous workflows and fetch wfmodules'
 
     def handle(self, *args, **options):
+        # Fork pythoncode's sandbox-forker before we read any user data
+        pythoncode.start_zygote()
         asyncio.run(main())
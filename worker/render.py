@@ -75,6 +75,7 @@ async def render_or_requeue(
             task = execute.execute_workflow(workflow, delta_id)
             await benchmark(logger, task, 'execute_workflow(%d, %d)',
                             workflow_id, delta_id)
+            logger.info('Result cache: %r', execute.result_cache.stats)
 
     except WorkflowAlreadyLocked:
         logger.info('Workflow %d is being rendered elsewhere; rescheduling',
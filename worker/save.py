@@ -47,7 +47,12 @@ def _maybe_add_version(
                                            tab__is_deleted=False).exists():
                 return None
 
-            if maybe_result is not None:
+            if maybe_result is not None and maybe_result.stored_delta:
+                version_added = wf_module.store_fetched_delta(
+                    maybe_result.dataframe,
+                    metadata=json.dumps(stored_object_json)
+                )
+            elif maybe_result is not None:
                 version_added = wf_module.store_fetched_table_if_different(
                     maybe_result.dataframe,  # TODO store entire result
                     metadata=json.dumps(stored_object_json)
@@ -140,22 +145,37 @@ def enforce_storage_limits(wf_module: WfModule) -> None:
     """
     Delete old versions that bring us past MAX_STORAGE_PER_MODULE.
 
-    This is important on frequently-updating modules that add to the previous
-    table, such as Twitter search, because every version we store is an entire
-    table. Without deleting old versions, we'd grow too quickly.
+    This is important on frequently-updating modules that store entire
+    tables. (Modules that add to the previous table, such as Twitter search,
+    store delta segments; but those add up, too.)
+
+    A version we keep may be a delta segment atop a version we delete. We
+    compact the version we keep first, so it no longer needs its ancestors.
+    Its file grows to hold its whole table, so we may stay a bit over the
+    limit.
     """
     limit = settings.MAX_STORAGE_PER_MODULE
 
     # walk over this WfM's StoredObjects from newest to oldest, deleting all
     # that are over the limit
-    sos = wf_module.stored_objects.order_by('-stored_at')
+    sos = list(wf_module.stored_objects.order_by('-stored_at'))
+    keep = []
+    delete = []
     cumulative = 0
-    first = True
 
     for so in sos:
         cumulative += so.size
-        if cumulative > limit and not first:
-            # allow most recent version to be stored even if it is itself over
-            # limit
-            so.delete()
-        first = False
+        # allow most recent version to be stored even if it is itself over
+        # limit
+        if cumulative > limit and keep:
+            delete.append(so)
+        else:
+            keep.append(so)
+
+    delete_ids = frozenset(so.id for so in delete)
+    for so in keep:
+        if so.parent_id in delete_ids:
+            so.compact()
+
+    for so in delete:
+        so.delete()
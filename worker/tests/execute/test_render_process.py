@@ -0,0 +1,101 @@
+import ctypes
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from cjworkbench.types import ProcessResult
+from worker.execute.render_process import RenderProcessExecutor
+
+
+def render_ok(table, n):
+    return ProcessResult(table * n, error='warning', json={'x': n})
+
+
+def render_spin():
+    while True:
+        pass
+
+
+def render_sleep():
+    time.sleep(60)
+
+
+def render_alloc():
+    return ProcessResult(pd.DataFrame({'A': np.ones(100 * 1024 * 1024)}))
+
+
+def render_segfault():
+    ctypes.string_at(0)  # read from NULL
+
+
+def render_raise():
+    raise RuntimeError('bug')
+
+
+class RenderProcessExecutorTest(unittest.TestCase):
+    def test_return_result(self):
+        executor = RenderProcessExecutor(1)
+        try:
+            table = pd.DataFrame({'A': [1, 2], 'B': ['x', 'y']})
+            result = executor.submit(render_ok, table, 2).result()
+        finally:
+            executor.shutdown()
+        self.assertEqual(result.error, 'warning')
+        self.assertEqual(result.json, {'x': 2})
+        assert_frame_equal(result.dataframe,
+                           pd.DataFrame({'A': [2, 4], 'B': ['xx', 'yy']}))
+
+    def test_cpu_limit(self):
+        executor = RenderProcessExecutor(1, cpu_seconds=1)
+        try:
+            start = time.time()
+            result = executor.submit(render_spin).result()
+        finally:
+            executor.shutdown()
+        self.assertRegex(result.error, 'more than 1 seconds of CPU time')
+        self.assertLess(time.time() - start, 10)
+
+    def test_wall_clock_limit(self):
+        # Sleeping uses no CPU, so only the wall-clock limit stops it
+        executor = RenderProcessExecutor(1, cpu_seconds=1, wall_seconds=1)
+        try:
+            start = time.time()
+            result = executor.submit(render_sleep).result()
+        finally:
+            executor.shutdown()
+        self.assertRegex(result.error, 'ran for more than 1 seconds')
+        self.assertLess(time.time() - start, 10)
+
+    def test_memory_limit(self):
+        executor = RenderProcessExecutor(1, memory_limit=100 * 1024 * 1024)
+        try:
+            result = executor.submit(render_alloc).result()
+        finally:
+            executor.shutdown()
+        self.assertRegex(result.error, 'ran out of memory')
+
+    def test_segfault(self):
+        executor = RenderProcessExecutor(1)
+        try:
+            result = executor.submit(render_segfault).result()
+        finally:
+            executor.shutdown()
+        self.assertEqual(result.error, 'This step crashed (signal SIGSEGV).')
+
+    def test_exception(self):
+        executor = RenderProcessExecutor(1)
+        try:
+            result = executor.submit(render_raise).result()
+        finally:
+            executor.shutdown()
+        self.assertEqual(result.error, 'This step crashed (exit code 1).')
+
+    def test_tables_in_kwargs(self):
+        executor = RenderProcessExecutor(1)
+        try:
+            table = pd.DataFrame({'A': [1, 2]})
+            result = executor.submit(render_ok, table=table, n=3).result()
+        finally:
+            executor.shutdown()
+        assert_frame_equal(result.dataframe, pd.DataFrame({'A': [3, 6]}))
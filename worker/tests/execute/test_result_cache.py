@@ -0,0 +1,50 @@
+import unittest
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from cjworkbench.types import ProcessResult
+from worker.execute.result_cache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_miss(self):
+        cache = ResultCache(1024)
+        self.assertIsNone(cache.get('h1'))
+        self.assertEqual(cache.stats.misses, 1)
+        self.assertEqual(cache.stats.hits, 0)
+
+    def test_hit(self):
+        cache = ResultCache(1024)
+        result = ProcessResult(pd.DataFrame({'A': [1, 2]}), error='x')
+        cache.put('h1', result)
+        self.assertEqual(cache.get('h1'), result)
+        self.assertIsNone(cache.get('h2'))  # different hash
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.misses, 1)
+
+    def test_caller_cannot_modify_cached_table(self):
+        cache = ResultCache(1024)
+        result = ProcessResult(pd.DataFrame({'A': [1, 2]}))
+        cache.put('h1', result)
+        result.dataframe['A'] = [3, 4]  # modify after put
+        cache.get('h1').dataframe['A'] = [5, 6]  # modify after get
+        assert_frame_equal(cache.get('h1').dataframe,
+                           pd.DataFrame({'A': [1, 2]}))
+
+    def test_evict_least_recently_used(self):
+        cache = ResultCache(40)  # room for two 2-row int64 tables
+        cache.put('h1', ProcessResult(pd.DataFrame({'A': [1, 2]})))
+        cache.put('h2', ProcessResult(pd.DataFrame({'A': [1, 2]})))
+        cache.get('h1')  # now 'h2' is least recently used
+        cache.put('h3', ProcessResult(pd.DataFrame({'A': [1, 2]})))
+        self.assertIsNone(cache.get('h2'))
+        self.assertIsNotNone(cache.get('h1'))
+        self.assertIsNotNone(cache.get('h3'))
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertEqual(cache.stats.n_results, 2)
+        self.assertEqual(cache.stats.nbytes, 32)
+
+    def test_skip_result_larger_than_cache(self):
+        cache = ResultCache(8)
+        cache.put('h1', ProcessResult(pd.DataFrame({'A': [1, 2]})))
+        self.assertIsNone(cache.get('h1'))
+        self.assertEqual(cache.stats.evictions, 0)
@@ -4,13 +4,14 @@ import logging
 import unittest
 from unittest.mock import Mock, patch
 import pandas as pd
+from django.utils import timezone
 from cjworkbench.types import ProcessResult
 from server.models import LoadedModule, Workflow
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
 from worker.execute.types import UnneededExecution
 from worker.execute.workflow import execute_workflow, \
-        partition_ready_and_dependent
+        partition_ready_and_dependent, _execute_tab_flows
 
 
 table_csv = 'A,B\n1,2\n3,4'
@@ -203,6 +204,82 @@ class WorkflowTests(DbTestCase):
         self.assertEqual(actual, result2)
         fake_loaded_module.render.assert_called_once()  # only with module2
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_skip_render_when_input_unchanged(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module1 = tab.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta1.id
+        )
+        wf_module2 = tab.wf_modules.create(
+            order=1,
+            last_relevant_delta_id=delta1.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        result = ProcessResult(pd.DataFrame({'A': [1]}))
+        fake_loaded_module.render.return_value = result
+
+        self._execute(workflow)
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+
+        # Now simulate a new fetch: wf_module1 must re-render, but its output
+        # won't change -- so wf_module2 needn't re-render.
+        delta2 = InitWorkflowCommand.create(workflow)
+        wf_module1.stored_data_version = timezone.now()
+        wf_module1.last_relevant_delta_id = delta2.id
+        wf_module1.save(update_fields=['stored_data_version',
+                                       'last_relevant_delta_id'])
+        wf_module2.last_relevant_delta_id = delta2.id
+        wf_module2.save(update_fields=['last_relevant_delta_id'])
+
+        self._execute(workflow)
+        self.assertEqual(fake_loaded_module.render.call_count, 3)
+
+        wf_module2.refresh_from_db()
+        self.assertEqual(wf_module2.cached_render_result.delta_id, delta2.id)
+        self.assertEqual(wf_module2.cached_render_result.result, result)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_rerender_when_tab_name_changes(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0, name='Tab 1')
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module1 = tab.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta1.id
+        )
+        wf_module2 = tab.wf_modules.create(
+            order=1,
+            last_relevant_delta_id=delta1.id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.return_value = \
+            ProcessResult(pd.DataFrame({'A': [1]}))
+
+        self._execute(workflow)
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+
+        # render() is passed the tab name: wf_module2's input is unchanged,
+        # but it must re-render anyway.
+        tab.name = 'Tab 2'
+        tab.save(update_fields=['name'])
+        delta2 = InitWorkflowCommand.create(workflow)
+        for wf_module in (wf_module1, wf_module2):
+            wf_module.last_relevant_delta_id = delta2.id
+            wf_module.save(update_fields=['last_relevant_delta_id'])
+
+        self._execute(workflow)
+        self.assertEqual(fake_loaded_module.render.call_count, 4)
+        self.assertEqual(fake_loaded_module.render.call_args[0][2], 'Tab 2')
+
     @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
     @patch('server.websockets.ws_client_send_delta_async', fake_send)
     @patch('server.notifications.email_output_delta')
@@ -313,3 +390,41 @@ class PartitionReadyAndDependentTests(unittest.TestCase):
             self.MockTabFlow('t1', {'t1'})
         ]
         self.assertEqual(([], flows), partition_ready_and_dependent(flows))
+
+
+class ExecuteTabFlowsTests(unittest.TestCase):
+    MockTabFlow = namedtuple('MockTabFlow', ('tab_slug',))
+
+    def test_concurrency_limit_and_order(self):
+        running = set()
+        max_running = [0]
+
+        async def fake_execute_tab_flow(workflow, flow, tab_shapes):
+            running.add(flow.tab_slug)
+            max_running[0] = max(max_running[0], len(running))
+            await asyncio.sleep(0.01)
+            running.remove(flow.tab_slug)
+            return flow.tab_slug + '-shape'
+
+        flows = [self.MockTabFlow(f't{i}') for i in range(5)]
+        with patch('worker.execute.workflow.execute_tab_flow',
+                   fake_execute_tab_flow):
+            result = asyncio.run(_execute_tab_flows(None, flows, {}, 2))
+        self.assertEqual(result, [f't{i}-shape' for i in range(5)])
+        self.assertEqual(max_running[0], 2)
+
+    def test_unneeded_execution_cancels_other_flows(self):
+        finished = []
+
+        async def fake_execute_tab_flow(workflow, flow, tab_shapes):
+            if flow.tab_slug == 't1':
+                raise UnneededExecution
+            await asyncio.sleep(0.05)
+            finished.append(flow.tab_slug)
+
+        flows = [self.MockTabFlow('t1'), self.MockTabFlow('t2')]
+        with patch('worker.execute.workflow.execute_tab_flow',
+                   fake_execute_tab_flow):
+            with self.assertRaises(UnneededExecution):
+                asyncio.run(_execute_tab_flows(None, flows, {}, 2))
+        self.assertEqual(finished, [])
@@ -2,6 +2,7 @@ from unittest.mock import patch
 from django.conf import settings
 from django.test import override_settings
 import pandas as pd
+from pandas.testing import assert_frame_equal
 from cjworkbench.types import ProcessResult
 from server.models import StoredObject, Workflow
 from server.tests.utils import DbTestCase, mock_csv_table
@@ -63,6 +64,98 @@ class SaveTests(DbTestCase):
         # if not, increase table size/loop iterations, or decrease limit
         self.assertEqual(n_objects, 1)
 
+    def test_store_delta(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+        wf_module.stored_data_version = \
+            wf_module.store_fetched_table(pd.DataFrame({'A': [2, 3]}))
+        wf_module.save()
+
+        self.run_with_async_db(save_result_if_changed(
+            workflow.id,
+            wf_module,
+            ProcessResult(pd.DataFrame({'A': [1]}), stored_delta=True)
+        ))
+        self.assertEqual(StoredObject.objects.count(), 2)
+        so = wf_module.stored_objects.order_by('-stored_at').first()
+        self.assertEqual(so.depth, 1)
+        assert_frame_equal(so.get_table(), pd.DataFrame({'A': [1, 2, 3]}))
+
+    def test_store_empty_delta(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+        wf_module.stored_data_version = \
+            wf_module.store_fetched_table(pd.DataFrame({'A': [2, 3]}))
+        wf_module.save()
+
+        self.run_with_async_db(save_result_if_changed(
+            workflow.id,
+            wf_module,
+            ProcessResult(pd.DataFrame({'A': []}), stored_delta=True)
+        ))
+        self.assertEqual(StoredObject.objects.count(), 1)
+
+    def test_store_delta_without_stored_data(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+
+        self.run_with_async_db(save_result_if_changed(
+            workflow.id,
+            wf_module,
+            ProcessResult(pd.DataFrame({'A': [1]}), stored_delta=True)
+        ))
+        so = wf_module.stored_objects.get()
+        self.assertIsNone(so.parent)
+        assert_frame_equal(so.get_table(), pd.DataFrame({'A': [1]}))
+
+    @override_settings(MAX_STORAGE_PER_MODULE=1)
+    def test_storage_limits_compact_delta(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+        wf_module.stored_data_version = \
+            wf_module.store_fetched_table(pd.DataFrame({'A': [2, 3]}))
+        wf_module.save()
+
+        self.run_with_async_db(save_result_if_changed(
+            workflow.id,
+            wf_module,
+            ProcessResult(pd.DataFrame({'A': [1]}), stored_delta=True)
+        ))
+        # We're over the limit: the new version no longer needs its parent
+        so = wf_module.stored_objects.get()
+        self.assertIsNone(so.parent)
+        assert_frame_equal(so.get_table(), pd.DataFrame({'A': [1, 2, 3]}))
+
+    def test_storage_limits_long_delta_chain(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+        wf_module.stored_data_version = \
+            wf_module.store_fetched_table(pd.DataFrame({'A': [0]}))
+        wf_module.save()
+        segment_size = wf_module.stored_objects.get().size
+
+        # Room for about three segments; the chain grows far longer
+        with override_settings(MAX_STORAGE_PER_MODULE=segment_size * 3):
+            for i in range(1, 10):
+                self.run_with_async_db(save_result_if_changed(
+                    workflow.id,
+                    wf_module,
+                    ProcessResult(pd.DataFrame({'A': [i]}),
+                                  stored_delta=True)
+                ))
+                # ChangeDataVersionCommand set stored_data_version
+                wf_module.refresh_from_db()
+
+                self.assertLessEqual(wf_module.stored_objects.count(), 4)
+
+        assert_frame_equal(wf_module.retrieve_fetched_table(),
+                           pd.DataFrame({'A': list(range(9, -1, -1))}))
+
     def test_race_deleted_workflow(self):
         result = ProcessResult(pd.DataFrame({'A': [1]}))
 